@@ -0,0 +1,182 @@
+"""
+Buffered activity log writer
+============================
+The model signals, PersistenceManager and ChangeTracker each used to write
+their ActivityLog row with its own INSERT, so one repair order with a few
+material deductions cost a dozen or more extra queries.
+
+ActivityLogWriter.record() collects entries instead:
+
+- inside a transaction they are buffered per savepoint level, with one
+  on_commit callback for each level that handles them all; a savepoint
+  that rolls back drops its callback and with it the entries, along with
+  the rows they describe;
+- during a request (ActivityLogMiddleware) they are held until the
+  response is ready and written with one bulk_create;
+- anywhere else they are written straight away, or handed to a background
+  thread through a bounded queue when ACTIVITY_LOG_ASYNC is enabled.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+# Largest batch the background thread writes at once
+QUEUE_BATCH_SIZE = 200
+
+
+class _PendingBatch:
+    """Entries recorded at one savepoint level, handed over when it commits"""
+
+    def __init__(self):
+        self.entries = []
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        ActivityLogWriter._collect(self.entries)
+
+
+class ActivityLogWriter:
+    """
+    Collects ActivityLog entries and writes them in batches
+    """
+
+    _state = threading.local()
+    _queue = None
+    _worker = None
+    _worker_lock = threading.Lock()
+
+    @staticmethod
+    def record(**fields):
+        """Queue one ActivityLog entry; takes the same fields as ActivityLog.objects.create"""
+        entry = ActivityLog(**fields)
+        if connection.in_atomic_block:
+            ActivityLogWriter._hold(entry)
+        else:
+            ActivityLogWriter._collect([entry])
+
+    @staticmethod
+    def _hold(entry):
+        """Buffer an entry until its transaction, or the savepoint it is in, commits"""
+        batches = getattr(ActivityLogWriter._state, 'batches', None)
+        if batches is None:
+            batches = ActivityLogWriter._state.batches = {}
+        # The outermost block is (); each savepoint level adds its id
+        level = tuple(connection.savepoint_ids)
+        batch = batches[level]() if level in batches else None
+        if batch is None or batch.done:
+            # Batches are only referenced by the connection's commit hooks:
+            # a rollback discards the hook and the weak reference dies with it
+            for stale in [key for key, ref in batches.items() if ref() is None]:
+                del batches[stale]
+            batch = _PendingBatch()
+            batches[level] = weakref.ref(batch)
+            transaction.on_commit(batch)
+        batch.entries.append(entry)
+
+    @staticmethod
+    def _collect(entries):
+        buffer = getattr(ActivityLogWriter._state, 'request_buffer', None)
+        if buffer is not None:
+            buffer.extend(entries)
+        elif getattr(settings, 'ACTIVITY_LOG_ASYNC', False):
+            ActivityLogWriter._enqueue(entries)
+        else:
+            ActivityLogWriter.write(entries)
+
+    @staticmethod
+    def write(entries):
+        """Insert entries with one bulk_create, falling back to row-by-row on failure"""
+        if not entries:
+            return
+        try:
+            with transaction.atomic():
+                ActivityLog.objects.bulk_create(entries)
+            return
+        except Exception as e:
+            logger.warning(f"[ACTIVITY_LOG] Batch of {len(entries)} failed, writing one by one: {str(e)}")
+
+        # A single bad entry (e.g. its order was deleted before the flush)
+        # must not lose the rest of the batch
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    ActivityLog.objects.bulk_create([entry])
+            except Exception as e:
+                logger.warning(f"[ACTIVITY_LOG] Failed to log {entry.activity_type}: {str(e)}")
+
+    @staticmethod
+    def begin_request():
+        """Start holding entries for the current request"""
+        ActivityLogWriter._state.request_buffer = []
+
+    @staticmethod
+    def end_request():
+        """Write everything held for the current request"""
+        buffer = getattr(ActivityLogWriter._state, 'request_buffer', None)
+        ActivityLogWriter._state.request_buffer = None
+        if buffer:
+            ActivityLogWriter.write(buffer)
+
+    @staticmethod
+    def _enqueue(entries):
+        ActivityLogWriter._ensure_worker()
+        try:
+            ActivityLogWriter._queue.put_nowait(entries)
+        except queue.Full:
+            # Never drop entries: write in the caller's thread instead
+            logger.warning("[ACTIVITY_LOG] Queue full, writing synchronously")
+            ActivityLogWriter.write(entries)
+
+    @staticmethod
+    def _ensure_worker():
+        with ActivityLogWriter._worker_lock:
+            if ActivityLogWriter._worker and ActivityLogWriter._worker.is_alive():
+                return
+            ActivityLogWriter._queue = queue.Queue(
+                maxsize=getattr(settings, 'ACTIVITY_LOG_QUEUE_SIZE', 1000)
+            )
+            ActivityLogWriter._worker = threading.Thread(
+                target=ActivityLogWriter._run_worker,
+                args=(ActivityLogWriter._queue,),
+                name='activity-log-writer',
+                daemon=True,
+            )
+            ActivityLogWriter._worker.start()
+
+    @staticmethod
+    def _run_worker(entry_queue):
+        while True:
+            batches = [entry_queue.get()]
+            while sum(len(batch) for batch in batches) < QUEUE_BATCH_SIZE:
+                try:
+                    batches.append(entry_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                ActivityLogWriter.write([entry for batch in batches for entry in batch])
+            except Exception as e:
+                logger.error(f"[ACTIVITY_LOG] Background write failed: {str(e)}")
+            finally:
+                close_old_connections()
+                for _ in batches:
+                    entry_queue.task_done()
+
+    @staticmethod
+    def drain():
+        """Block until the background thread has written everything queued"""
+        if ActivityLogWriter._queue is not None and ActivityLogWriter._worker.is_alive():
+            ActivityLogWriter._queue.join()
+
+
+atexit.register(ActivityLogWriter.drain)
@@ -5,7 +5,7 @@ from django.utils.html import format_html
 from .models import (
     Category, Product, Customer, Order, OrderItem, 
     InventoryTransaction, Sales, QRCode, SMSNotification,
-    MaterialType, MaterialPricing, ActivityLog, LandingPageImage
+    MaterialType, MaterialPricing, ActivityLog, LandingPageImage, RentalStateTick
 )
 
 # Force unregister Order admin to clear any cached references
@@ -125,13 +125,15 @@ class SalesAdmin(admin.ModelAdmin):
 
 @admin.register(QRCode)
 class QRCodeAdmin(admin.ModelAdmin):
-    list_display = ['order', 'created_at']
+    list_display = ['order', 'payload_hash', 'created_at']
+    readonly_fields = ['payload_hash']
 
 
 @admin.register(SMSNotification)
 class SMSNotificationAdmin(admin.ModelAdmin):
-    list_display = ['order', 'phone_number', 'status', 'created_at']
+    list_display = ['order', 'phone_number', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
     list_filter = ['status', 'created_at']
+    readonly_fields = ['claimed_at', 'claim_token', 'last_error']
 
 
 @admin.register(MaterialType)
@@ -196,3 +198,10 @@ class LandingPageImageAdmin(admin.ModelAdmin):
             )
         return "No image uploaded yet"
     image_preview_large.short_description = 'Image Preview'
+
+
+@admin.register(RentalStateTick)
+class RentalStateTickAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'duration_ms', 'orders_changed', 'products_changed']
+    readonly_fields = ['started_at', 'duration_ms', 'orders_changed', 'products_changed', 'details']
+    ordering = ['-started_at']
@@ -7,3 +7,20 @@ class BusinessConfig(AppConfig):
     
     def ready(self):
         import business.signals
+
+        from django.conf import settings
+
+        interval = getattr(settings, 'RENTAL_STATE_INTERVAL', 0)
+        if interval:
+            from .rental_state_manager import RentalStateManager
+
+            if RentalStateManager.should_autostart():
+                RentalStateManager.start_scheduler(interval)
+
+        if getattr(settings, 'SMS_OUTBOX_WORKER', False):
+            from .rental_state_manager import RentalStateManager
+            from .sms_outbox_manager import SMSOutbox
+
+            # Resume messages queued before a restart
+            if RentalStateManager.should_autostart():
+                SMSOutbox.start_worker()
@@ -0,0 +1,180 @@
+"""
+View benchmarks
+===============
+ViewBenchmark requests the main pages and APIs through the Django test
+client as a logged-in user, several times each, and reports per view the
+p50/p95 latency and the query count (from QueryRecorder). Reports are
+plain JSON carrying the commit they were taken at, so two runs - before
+and after a change, on the same dataset from ``generate_dataset`` - can be
+compared with ``compare``.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+import math
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from .models import ActivityLog, Customer, InventoryTransaction, Order, Product, Sales
+from .query_stats_manager import QueryRecorder
+
+# (label, url name, query string) of each benchmarked request
+BENCHMARK_TARGETS = [
+    ('dashboard', 'dashboard', {}),
+    ('orders', 'orders', {}),
+    ('orders_search', 'orders', {'search': 'Santos'}),
+    ('inventory', 'inventory', {}),
+    ('rental_management', 'rental_management', {}),
+    ('materials_management', 'materials_management', {}),
+    ('sales', 'sales', {}),
+    ('reports', 'reports', {}),
+    ('staff_management', 'staff_management', {}),
+    ('activity_log', 'activity_log', {}),
+    ('api_products_list', 'api_products_list', {}),
+    ('api_customers_list', 'api_customers_list', {}),
+    ('api_customer_typeahead', 'api_customer_typeahead', {'q': 'mar'}),
+    ('customers_search', 'customer_list', {'search': 'Santos'}),
+    ('api_rental_status', 'api_rental_status', {}),
+    ('api_inventory_status', 'api_inventory_status', {}),
+]
+
+# Relative p50 change reported as a regression / improvement by compare()
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def current_commit():
+    """Short hash of the checked-out commit, '+dirty' with uncommitted changes"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+    return f'{commit}+dirty' if dirty else commit
+
+
+def dataset_size():
+    """Row counts the timings depend on, recorded with each report"""
+    return {
+        'orders': Order.objects.count(),
+        'customers': Customer.objects.count(),
+        'products': Product.objects.count(),
+        'sales': Sales.objects.count(),
+        'inventory_transactions': InventoryTransaction.objects.count(),
+        'activity_logs': ActivityLog.objects.count(),
+    }
+
+
+class ViewBenchmark:
+    """
+    Times views through the test client and reports latency percentiles and query counts
+    """
+
+    def __init__(self, user, targets=None, repeat=20, warmup=2, host='localhost'):
+        self.user = user
+        self.targets = targets or BENCHMARK_TARGETS
+        self.repeat = max(1, repeat)
+        self.warmup = max(0, warmup)
+        self.client = Client(HTTP_HOST=host)
+        self.client.force_login(user)
+
+    def _request(self, url, params):
+        """One GET, body included; return (status, ms, QueryRecorder)"""
+        with QueryRecorder() as recorder:
+            started = time.perf_counter()
+            response = self.client.get(url, params)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            else:
+                response.content
+            elapsed = (time.perf_counter() - started) * 1000
+        return response.status_code, elapsed, recorder
+
+    def measure(self, label, url_name, params):
+        url = reverse(url_name)
+        for _ in range(self.warmup):
+            self._request(url, params)
+
+        timings, sql_timings, queries, statuses = [], [], [], set()
+        for _ in range(self.repeat):
+            status, elapsed, recorder = self._request(url, params)
+            statuses.add(status)
+            timings.append(elapsed)
+            sql_timings.append(recorder.total_ms)
+            queries.append(recorder.count)
+        return {
+            'url': url,
+            'params': params,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'sql_p50_ms': round(percentile(sql_timings, 50), 2),
+            'queries': max(queries),
+        }
+
+    def run(self, progress=None):
+        """Benchmark every target and return the JSON-ready report"""
+        views = {}
+        for label, url_name, params in self.targets:
+            views[label] = self.measure(label, url_name, params)
+            if progress:
+                progress(label, views[label])
+        return {
+            'commit': current_commit(),
+            'taken_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'repeat': self.repeat,
+            'warmup': self.warmup,
+            'dataset': dataset_size(),
+            'views': views,
+        }
+
+
+def compare(previous, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Per-view differences between two reports: p50/p95 and query counts,
+    with a verdict of 'slower', 'faster' or '' against ``threshold``
+    """
+    rows = []
+    for label, after in current['views'].items():
+        before = previous.get('views', {}).get(label)
+        if not before:
+            continue
+        change = (after['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0.0
+        verdict = ''
+        if change > threshold or after['queries'] > before['queries']:
+            verdict = 'slower'
+        elif change < -threshold:
+            verdict = 'faster'
+        rows.append({
+            'view': label,
+            'p50_before': before['p50_ms'],
+            'p50_after': after['p50_ms'],
+            'p95_before': before['p95_ms'],
+            'p95_after': after['p95_ms'],
+            'change': round(change, 3),
+            'queries_before': before['queries'],
+            'queries_after': after['queries'],
+            'verdict': verdict,
+        })
+    return rows
@@ -0,0 +1,113 @@
+"""
+Material picker cache
+=====================
+The material picker APIs (zippers, buttons, patches, locks, garters and
+thread availability) rebuilt their lists from the database on every call,
+and the order form calls them again and again while an order is entered.
+
+CatalogCache keeps each rendered JSON body in the Django cache under a
+versioned key, ``catalog:<version>:<name>:<variant hash>``. Saving or deleting
+a material Product, a MaterialType or a MaterialPricing bumps the version
+(see ``business.signals``), so every cached body goes stale at once and the
+next call rebuilds it; CATALOG_CACHE_TIMEOUT only bounds how long an entry
+lives if nothing changes. The signals bump again once the write commits: a
+list rebuilt from the old rows between the save and the commit would
+otherwise be cached under the new version. Code that changes material
+stock with ``QuerySet.update()`` - which sends no signals - must call
+``CatalogCache.changed()`` itself.
+
+Responses carry an ETag, and a request whose ``If-None-Match`` matches gets
+a bodyless 304, so a browser that already holds the list downloads nothing.
+"""
+
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version'
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+class CatalogCache:
+    """
+    Versioned cache of the material picker API responses
+    """
+
+    @staticmethod
+    def version():
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # Start from the clock, not 1: if the version key is evicted while
+            # older entries survive, a restarted counter could reach them again
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    @staticmethod
+    def bump():
+        """Invalidate every cached catalog response"""
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            # No version yet: nothing is cached under one either
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+    @staticmethod
+    def changed():
+        """Bump now and again when the current transaction commits"""
+        CatalogCache.bump()
+        transaction.on_commit(CatalogCache.bump)
+
+    @staticmethod
+    def key(name, variant=''):
+        # Variants are user input (a thread colour); hash them into a safe key
+        digest = hashlib.sha1(variant.encode('utf-8')).hexdigest()[:16] if variant else ''
+        return f'catalog:{CatalogCache.version()}:{name}:{digest}'
+
+    @staticmethod
+    def get_or_build(name, build, variant=''):
+        """
+        Return (etag, body) of a catalog response, calling ``build`` for its
+        payload dict only on a miss. Payloads with ``success: False`` are
+        returned but not cached.
+        """
+        key = CatalogCache.key(name, variant)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+
+        payload = build()
+        body = json.dumps(payload).encode('utf-8')
+        entry = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        if payload.get('success', True):
+            cache.set(key, entry, timeout=_timeout())
+        else:
+            logger.warning(f"[CATALOG_CACHE] Not caching failed {name} response: {payload.get('error')}")
+        return entry
+
+    @staticmethod
+    def response(request, name, build, variant=''):
+        """JSON response for a catalog endpoint, or 304 if the client's copy is current"""
+        etag, body = CatalogCache.get_or_build(name, build, variant)
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        # Stock changes while the order form is open: always revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,233 @@
+"""
+Change feed
+===========
+The offline app could only bring its cached products, customers and
+orders up to date by downloading the complete lists again (customers had
+an ``updated_since`` filter, but that cannot see deletions), so a few
+edits at the counter cost every device the whole catalog.
+
+Every write of a product, customer or order now appends a ChangeLogEntry
+(model, id, upsert or delete) in the same transaction: the model signals
+record saves and deletes, and code that writes with ``QuerySet.update()``
+- which sends no signals - calls ``ChangeFeed.record`` with the ids it
+changed. Entry ids only grow, so the last id a client has seen is its
+cursor, and ``ChangeFeed.changes(since)`` returns what changed after it:
+each row once, in the order of its latest change, with its current
+compact payload, or a tombstone when it is gone.
+
+Ids are taken at insert but become visible at commit, so an entry can be
+read while one with a lower id is still uncommitted - a long transaction
+such as a full sync batch or the rental tick can hold its id for many
+seconds. A page therefore stops before a gap in the ids until the gap is
+known to be a rolled-back write. How long the gap has been open decides,
+not the age of the entries around it: the first page to meet a gap notes
+the time in the cache. On PostgreSQL the gap is skipped once every
+transaction that was running then has ended; elsewhere once it has been
+open CHANGE_FEED_GAP_TIMEOUT seconds (SQLite takes the write lock at
+BEGIN, so a lower id cannot still be committing there). Entries older than CHANGE_FEED_RETENTION_DAYS are
+removed by ``prune_change_feed``; a client whose cursor is older than the
+history kept (or that has none) is told to ``reset``: reload its lists
+and continue from the cursor returned with it.
+"""
+
+from datetime import timedelta
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .image_rendition_manager import ImageRenditions
+from .keyset_manager import page_size
+from .models import ChangeLogEntry, Customer, Order, Product
+
+logger = logging.getLogger(__name__)
+
+# Entries a client may ask for per page: default and most
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+# How long the time a gap was first seen is remembered
+GAP_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _gap_closed(missing_id):
+    """Whether the gap at entry ``missing_id`` can no longer be filled by a commit"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # Database clock on both sides, so app servers' clocks do not matter
+            cursor.execute(
+                "SELECT EXTRACT(EPOCH FROM clock_timestamp()), EXTRACT(EPOCH FROM min(xact_start)) "
+                "FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            )
+            now, oldest = cursor.fetchone()
+    else:
+        now, oldest = time.time(), None
+    key = f'change_feed:gap:{missing_id}'
+    cache.add(key, float(now), timeout=GAP_CACHE_TIMEOUT)
+    opened = cache.get(key, float(now))
+
+    if connection.vendor == 'postgresql':
+        # Every transaction running when the gap was seen has committed or rolled back
+        return oldest is None or float(oldest) > opened
+    return float(now) - opened >= getattr(settings, 'CHANGE_FEED_GAP_TIMEOUT', 300)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _product_payloads(pks):
+    products = Product.objects.filter(pk__in=pks).select_related('category').only(
+        'id', 'name', 'product_type', 'category__name', 'price', 'quantity', 'rental_status',
+        'is_active', 'is_archived', 'image', 'updated_at',
+    )
+    return {
+        product.pk: {
+            'id': product.pk,
+            'name': product.name,
+            'product_type': product.product_type,
+            'category': product.category.name if product.category else 'Uncategorized',
+            'price': float(product.price) if product.price else 0.0,
+            'quantity': product.quantity,
+            'rental_status': product.rental_status,
+            'is_active': product.is_active,
+            'is_archived': product.is_archived,
+            'image_url': ImageRenditions.url(product.image, 'medium'),
+            'updated_at': _iso(product.updated_at),
+        }
+        for product in products
+    }
+
+
+def _customer_payloads(pks):
+    # The same fields as the customers API, so both fill the same cache
+    rows = Customer.objects.filter(pk__in=pks).annotate(order_count=Count('order')).values(
+        'id', 'name', 'phone', 'email', 'address', 'created_at', 'updated_at', 'order_count',
+    )
+    return {
+        row['id']: {**row, 'created_at': _iso(row['created_at']), 'updated_at': _iso(row['updated_at'])}
+        for row in rows
+    }
+
+
+def _order_payloads(pks):
+    rows = Order.objects.filter(pk__in=pks).values(
+        'id', 'order_identifier', 'customer_id', 'order_type', 'status', 'total_amount', 'paid_amount',
+        'balance', 'due_date', 'is_archived', 'created_at', 'updated_at',
+    )
+    return {
+        row['id']: {
+            **row,
+            'total_amount': float(row['total_amount']),
+            'paid_amount': float(row['paid_amount']),
+            'balance': float(row['balance']),
+            'due_date': _iso(row['due_date']),
+            'created_at': _iso(row['created_at']),
+            'updated_at': _iso(row['updated_at']),
+        }
+        for row in rows
+    }
+
+
+# Feed name of each model, and how to build the payloads of its rows
+FEEDS = {
+    'product': (Product, _product_payloads),
+    'customer': (Customer, _customer_payloads),
+    'order': (Order, _order_payloads),
+}
+LABELS = {model: label for label, (model, _) in FEEDS.items()}
+
+
+class ChangeFeed:
+    """
+    Ordered log of product, customer and order changes for offline clients
+    """
+
+    @staticmethod
+    def record(model, pks, action='upsert'):
+        """Log ``pks`` of ``model`` as changed (or deleted); for writes that send no signals"""
+        label = LABELS[model]
+        now = timezone.now()
+        ChangeLogEntry.objects.bulk_create([
+            ChangeLogEntry(model=label, object_id=pk, action=action, created_at=now)
+            for pk in dict.fromkeys(pks)
+        ])
+
+    @staticmethod
+    def head():
+        """The newest entry id, 0 for an empty log"""
+        return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    @staticmethod
+    def changes(since, limit=None):
+        """
+        Changes after cursor ``since`` (None for a client without one): a
+        dict with ``changes`` (``{"model", "id", "op": "upsert", "data"}`` or
+        ``{"model", "id", "op": "delete"}``), the ``cursor`` to pass next
+        time, ``has_more`` and ``reset``.
+        """
+        limit = page_size(limit, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        head = ChangeFeed.head()
+        oldest = ChangeLogEntry.objects.order_by('id').values_list('id', flat=True).first()
+        if since is None or since < 0 or since > head or (oldest is not None and since < oldest - 1):
+            # No cursor, one from another database, or history since pruned
+            return {'changes': [], 'cursor': head, 'has_more': False, 'reset': True}
+
+        entries = list(
+            ChangeLogEntry.objects.filter(id__gt=since).order_by('id').values_list(
+                'id', 'model', 'object_id', 'action'
+            )[:limit + 1]
+        )
+        has_more = len(entries) > limit
+        expected = since + 1
+        taken = []
+        for entry in entries[:limit]:
+            if entry[0] != expected and not _gap_closed(expected):
+                # An earlier entry may still be committing; continue from here next time
+                has_more = False
+                break
+            taken.append(entry)
+            expected = entry[0] + 1
+
+        # Each row once, where its latest change puts it
+        latest = {}
+        for entry_id, label, object_id, action in taken:
+            latest.pop((label, object_id), None)
+            latest[(label, object_id)] = action
+
+        payloads = {}
+        for label, (_, build) in FEEDS.items():
+            pks = [object_id for (model, object_id), action in latest.items() if model == label and action == 'upsert']
+            payloads[label] = build(pks) if pks else {}
+
+        changes = []
+        for (label, object_id), action in latest.items():
+            data = payloads[label].get(object_id) if action == 'upsert' else None
+            if data is None:
+                # Deleted, now or by a later write the page did not reach
+                changes.append({'model': label, 'id': object_id, 'op': 'delete'})
+            else:
+                changes.append({'model': label, 'id': object_id, 'op': 'upsert', 'data': data})
+
+        return {
+            'changes': changes,
+            'cursor': taken[-1][0] if taken else since,
+            'has_more': has_more,
+            'reset': False,
+        }
+
+    @staticmethod
+    def prune(days=None):
+        """Delete entries older than ``days`` (CHANGE_FEED_RETENTION_DAYS); the newest is always kept"""
+        if days is None:
+            days = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', 30)
+        cutoff = timezone.now() - timedelta(days=days)
+        # The newest entry stays, so the head cursor survives an idle spell
+        deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff, id__lt=ChangeFeed.head()).delete()
+        if deleted:
+            logger.info(f"[CHANGE_FEED] Pruned {deleted} entries older than {days} day(s)")
+        return deleted
@@ -0,0 +1,266 @@
+"""
+Customer search
+===============
+The customer list filtered with ``icontains`` on name, phone and email -
+a full table scan per keystroke - and order entry matched customers on the
+raw phone string, so "0917 123 4567" and "+639171234567" became two
+customers.
+
+Every Customer now stores ``phone_normalized``, the E.164 form produced by
+``normalize_phone_number``, in an indexed column set by ``Customer.save()``
+(code that writes ``phone`` with ``QuerySet.update()`` or ``bulk_create()``
+must fill it in itself). Phone searches become range scans on that index,
+and ``CustomerSearch.by_phone`` is how order entry finds an existing
+customer.
+
+Names and emails are searched through a backend-specific index:
+
+* SQLite: an FTS5 table ``business_customer_fts`` over ``name`` and
+  ``email``, kept in step with ``business_customer`` by triggers and queried
+  with prefix terms, so "mar san" finds "Maria Santos".
+* PostgreSQL: trigram GIN indexes (``pg_trgm``) on ``UPPER(name)`` and
+  ``UPPER(email)``, which serve the ``icontains`` lookups Django emits.
+* Anything else: ``istartswith`` on the name and email.
+
+SQLite drops a table's triggers when a migration rebuilds the table, so the
+index is (re)installed after every ``migrate`` (see ``business.signals``)
+and rebuilt from the customer rows whenever something had to be recreated.
+"""
+
+import logging
+import re
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Customer
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'business_customer_fts'
+
+# Typeahead result sizes: default, and the most a client may ask for
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_MAX_LIMIT = 20
+
+# Shortest search term the typeahead answers
+TYPEAHEAD_MIN_LENGTH = 2
+
+SQLITE_INDEX = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, email, content='business_customer', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON business_customer BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON business_customer BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, email ON business_customer BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+]
+
+POSTGRES_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS business_customer_name_trgm ON business_customer USING gin (UPPER(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS business_customer_email_trgm ON business_customer USING gin (UPPER(email) gin_trgm_ops)",
+]
+
+
+def normalize_phone_number(raw_phone: str) -> str:
+    """Convert common phone formats to E.164 (+countrycode) when possible."""
+    if not raw_phone:
+        return ''
+
+    cleaned = ''.join(ch for ch in raw_phone.strip() if ch.isdigit() or ch == '+')
+    if not cleaned:
+        return ''
+
+    if cleaned.startswith('+'):
+        return cleaned
+
+    if cleaned.startswith('00'):
+        return '+' + cleaned[2:]
+
+    if cleaned.startswith('63'):
+        return '+' + cleaned
+
+    if cleaned.startswith('0') and len(cleaned) in (10, 11):
+        # Assume PH local format (09XXXXXXXXX)
+        return '+63' + cleaned.lstrip('0')
+
+    if not cleaned.startswith('+'):
+        return '+' + cleaned
+
+    return cleaned
+
+
+def phone_prefixes(term):
+    """
+    Normalized phone prefixes a partly typed number can stand for, or [] if
+    ``term`` is not a phone number. "0917" is "+63917"; bare digits such as
+    "917" may be a local number typed without its 0, so they give both
+    "+917" and "+63917".
+    """
+    if not re.fullmatch(r'\+?[\d\s().-]+', term.strip()):
+        return []
+    digits = re.sub(r'\D', '', term)
+    if len(digits) < 3:
+        return []
+    if term.strip().startswith('+'):
+        return ['+' + digits]
+    if digits.startswith('00'):
+        return ['+' + digits[2:]]
+    if digits.startswith('63'):
+        return ['+' + digits]
+    if digits.startswith('0'):
+        return ['+63' + digits.lstrip('0')]
+    return ['+' + digits, '+63' + digits]
+
+
+def _prefix_q(field, prefix):
+    """``field`` starts with ``prefix``, as a range the column's b-tree index can serve"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+def fts_query(term):
+    """FTS5 query matching rows with a word starting with each word of ``term``, or ''"""
+    words = re.findall(r'\w+', term.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class CustomerSearch:
+    """
+    Indexed customer lookup by phone, name and email
+    """
+
+    # Database aliases known to have the FTS5 table
+    _fts_ready = {}
+
+    @staticmethod
+    def install(using='default'):
+        """
+        Create the backend's search index if it is missing. Returns True if
+        anything was created, in which case the SQLite index has been rebuilt
+        from the customer rows.
+        """
+        connection = connections[using]
+        if connection.vendor == 'sqlite':
+            return CustomerSearch._install_sqlite(connection)
+        if connection.vendor == 'postgresql':
+            return CustomerSearch._install_postgres(connection)
+        return False
+
+    @staticmethod
+    def _install_sqlite(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+                [FTS_TABLE, f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'],
+            )
+            present = cursor.fetchone()[0]
+            if present >= len(SQLITE_INDEX):
+                CustomerSearch._fts_ready[connection.alias] = True
+                return False
+            try:
+                with transaction.atomic(using=connection.alias):
+                    for statement in SQLITE_INDEX:
+                        cursor.execute(statement)
+                    cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            except DatabaseError as e:
+                # SQLite built without FTS5: searches fall back to istartswith
+                logger.warning(f"[CUSTOMER_SEARCH] FTS5 index not available: {str(e)}")
+                CustomerSearch._fts_ready[connection.alias] = False
+                return False
+        CustomerSearch._fts_ready[connection.alias] = True
+        logger.info("[CUSTOMER_SEARCH] Customer name index installed and rebuilt")
+        return True
+
+    @staticmethod
+    def _install_postgres(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM pg_indexes WHERE indexname IN "
+                "('business_customer_name_trgm', 'business_customer_email_trgm')"
+            )
+            if cursor.fetchone()[0] == 2:
+                return False
+            try:
+                with transaction.atomic(using=connection.alias):
+                    for statement in POSTGRES_INDEX:
+                        cursor.execute(statement)
+            except DatabaseError as e:
+                # Usually missing rights to create the extension; icontains still works, unindexed
+                logger.warning(f"[CUSTOMER_SEARCH] Trigram index not created: {str(e)}")
+                return False
+        logger.info("[CUSTOMER_SEARCH] Customer trigram indexes created")
+        return True
+
+    @staticmethod
+    def uninstall(using='default'):
+        """Drop the search index again (reverse of the migration that added it)"""
+        connection = connections[using]
+        CustomerSearch._fts_ready.pop(connection.alias, None)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                for trigger in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+                cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('DROP INDEX IF EXISTS business_customer_name_trgm')
+                cursor.execute('DROP INDEX IF EXISTS business_customer_email_trgm')
+
+    @staticmethod
+    def _has_fts(connection):
+        ready = CustomerSearch._fts_ready.get(connection.alias)
+        if ready is None:
+            ready = CustomerSearch._fts_ready[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+        return ready
+
+    @staticmethod
+    def text_q(term, using='default'):
+        """Q matching customers whose name or email has words starting like ``term``"""
+        connection = connections[using]
+        if connection.vendor == 'sqlite' and CustomerSearch._has_fts(connection):
+            query = fts_query(term)
+            if not query:
+                return Q(pk__in=[])
+            return Q(pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query]))
+        if connection.vendor == 'postgresql':
+            return Q(name__icontains=term) | Q(email__icontains=term)
+        return Q(name__istartswith=term) | Q(email__istartswith=term)
+
+    @staticmethod
+    def filter(queryset, term, using='default'):
+        """Narrow a Customer queryset to the customers matching a search term"""
+        term = (term or '').strip()
+        if not term:
+            return queryset
+        prefixes = phone_prefixes(term)
+        if prefixes:
+            condition = Q()
+            for prefix in prefixes:
+                condition |= _prefix_q('phone_normalized', prefix)
+            return queryset.filter(condition)
+        return queryset.filter(CustomerSearch.text_q(term, using=using))
+
+    @staticmethod
+    def typeahead(term, limit=TYPEAHEAD_LIMIT):
+        """Up to ``limit`` (at most TYPEAHEAD_MAX_LIMIT) matches for order entry, as dicts"""
+        term = (term or '').strip()
+        if len(term) < TYPEAHEAD_MIN_LENGTH:
+            return []
+        limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+        customers = CustomerSearch.filter(Customer.objects.all(), term)
+        ordering = ('phone_normalized', 'pk') if phone_prefixes(term) else ('name', 'pk')
+        return list(customers.order_by(*ordering).values('id', 'name', 'phone', 'email')[:limit])
+
+    @staticmethod
+    def by_phone(phone):
+        """
+        The existing customer with this phone number in any format, oldest
+        first, or None. Numbers that do not normalize match on the raw value.
+        """
+        normalized = normalize_phone_number(phone or '')
+        customers = Customer.objects.filter(phone_normalized=normalized) if normalized else Customer.objects.filter(phone=phone or '')
+        return customers.order_by('pk').first()
@@ -1,18 +1,34 @@
 """
 Backend manager for customize products to prevent and handle duplicates
+
+Image fingerprints are computed once, when an image is attached to a
+product (``Product.save`` calls ``apply_image_fingerprints``), and stored
+in indexed columns: ``image_hash`` is the SHA-256 of the file and
+``image_phash`` a 64-bit difference hash of the picture, equal for
+re-encoded or resized copies of the same image. Duplicate checks group or
+look up those columns instead of re-reading every image from storage;
+``backfill_image_fingerprints`` hashes images stored before the columns
+existed.
 """
+import io
 import os
 from django.db.models import Q, Count
 from django.db import transaction
 from business.models import Product
 import hashlib
+import logging
 from django.core.files.base import ContentFile
 
+logger = logging.getLogger(__name__)
 
-def get_image_hash(image_field):
+# Side of the grayscale thumbnail the difference hash compares (hash bits = side * side)
+PHASH_SIZE = 8
+
+
+def read_image_bytes(image_field):
     """
-    Get a hash of the image file to compare duplicates
-    Returns None if image doesn't exist
+    Read the whole content of an image field, a fresh upload or a stored
+    file. Returns None if there is no image or it cannot be read.
     """
     if not image_field or not image_field.name:
         return None
@@ -92,20 +108,89 @@ def get_image_hash(image_field):
             except (IOError, OSError, AttributeError):
                 return None
         
-        # Calculate hash if we have content
-        if file_content:
-            file_hash = hashlib.md5(file_content).hexdigest()
-            return file_hash
-        
-        return None
+        return file_content or None
     except Exception as e:
         # Log error for debugging but don't fail
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.warning(f"Error getting image hash: {e}")
+        logger.warning(f"Error reading image: {e}")
         return None
 
 
+def get_image_hash(image_field):
+    """
+    Get a hash of the image file to compare duplicates
+    Returns None if image doesn't exist
+    """
+    file_content = read_image_bytes(image_field)
+    if file_content:
+        return hashlib.md5(file_content).hexdigest()
+    return None
+
+
+def perceptual_hash(file_content):
+    """
+    Difference hash of an image as 16 hex digits, or '' if the content is
+    not a readable image. Each bit says whether a pixel of a small grayscale
+    thumbnail is brighter than its right neighbour.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(file_content)) as image:
+            thumbnail = image.convert('L').resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.LANCZOS)
+            pixels = list(thumbnail.getdata())
+    except Exception as e:
+        logger.warning(f"[IMAGE_FINGERPRINT] Not an image, no perceptual hash: {e}")
+        return ''
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for column in range(PHASH_SIZE):
+            left = pixels[row * (PHASH_SIZE + 1) + column]
+            right = pixels[row * (PHASH_SIZE + 1) + column + 1]
+            bits = (bits << 1) | (left > right)
+    if not bits:
+        # Flat images (any single colour) all hash to zero; that says nothing
+        return ''
+    return f'{bits:0{PHASH_SIZE * PHASH_SIZE // 4}x}'
+
+
+def image_fingerprints(image_field):
+    """(SHA-256 hex, perceptual hash) of an image field, or ('', '') if it cannot be read"""
+    file_content = read_image_bytes(image_field)
+    if not file_content:
+        return '', ''
+    return hashlib.sha256(file_content).hexdigest(), perceptual_hash(file_content)
+
+
+def apply_image_fingerprints(product):
+    """
+    Set a product's image fingerprints before it is saved: computed for a
+    newly attached upload or a different stored file, and cleared when the
+    image is removed. An unchanged image is never read again - those stored
+    without fingerprints are left to ``backfill_image_fingerprints``.
+    """
+    if not product.image or not product.image.name:
+        product.image_hash = product.image_phash = ''
+        return
+    uploaded = not getattr(product.image, '_committed', True)
+    # Product.from_db notes the stored name; a row loaded without it counts as unchanged
+    stored = getattr(product, '_loaded_image_name', None if product._state.adding else product.image.name)
+    if not uploaded and product.image.name == stored:
+        return
+    product.image_hash, product.image_phash = image_fingerprints(product.image)
+
+
+def _duplicate_groups(products, field):
+    """Products sharing a non-empty value of ``field``, grouped by it with one GROUP BY"""
+    shared = (
+        products.exclude(**{field: ''}).order_by().values(field)
+        .annotate(count=Count('id')).filter(count__gt=1).values(field)
+    )
+    groups = {}
+    for product in products.filter(**{f'{field}__in': shared}):
+        groups.setdefault(getattr(product, field), []).append(product)
+    return groups
+
+
 def get_image_filename(image_field):
     """
     Extract just the filename from the image field
@@ -134,9 +219,12 @@ def find_duplicate_customize_products():
     
     # Group by image filename (base name)
     duplicates_by_filename = {}
-    duplicates_by_hash = {}
     duplicates_by_name_category = {}
     
+    # Same file content, and the same picture re-encoded or resized
+    duplicates_by_hash = _duplicate_groups(customize_products, 'image_hash')
+    duplicates_by_phash = _duplicate_groups(customize_products, 'image_phash')
+    
     for product in customize_products:
         # Check by image filename
         if product.image:
@@ -146,13 +234,6 @@ def find_duplicate_customize_products():
                 if base_name not in duplicates_by_filename:
                     duplicates_by_filename[base_name] = []
                 duplicates_by_filename[base_name].append(product)
-            
-            # Check by image hash
-            image_hash = get_image_hash(product.image)
-            if image_hash:
-                if image_hash not in duplicates_by_hash:
-                    duplicates_by_hash[image_hash] = []
-                duplicates_by_hash[image_hash].append(product)
         
         # Check by name + category
         key = f"{product.name.lower().strip()}_{product.category.id if product.category else 'none'}"
@@ -183,6 +264,16 @@ def find_duplicate_customize_products():
                     'products': products
                 }
     
+    hashed_groups = {frozenset(p.id for p in products) for products in duplicates_by_hash.values()}
+    for phash, products in duplicates_by_phash.items():
+        # Skip groups the content hash already reported as they are
+        if len(products) > 1 and frozenset(p.id for p in products) not in hashed_groups:
+            all_duplicates[f"phash_{phash}"] = {
+                'method': 'perceptual_hash',
+                'identifier': phash,
+                'products': products
+            }
+    
     for name_cat_key, products in duplicates_by_name_category.items():
         if len(products) > 1:
             key = f"name_cat_{name_cat_key}"
@@ -281,6 +372,7 @@ def get_unique_customize_products():
     
     seen_images = {}
     seen_hashes = {}
+    seen_phashes = {}
     seen_name_category = {}
     unique_products = []
     seen_product_ids = set()  # Track product IDs to prevent any duplicates
@@ -292,15 +384,20 @@ def get_unique_customize_products():
             
         is_duplicate = False
         
-        # PRIORITY 1: Check by image hash first (most reliable)
+        # PRIORITY 1: Check by stored image fingerprints first (most reliable)
         if product.image:
-            image_hash = get_image_hash(product.image)
-            if image_hash:
-                if image_hash in seen_hashes:
+            if product.image_hash:
+                if product.image_hash in seen_hashes:
                     # This is a duplicate by hash - same image file
                     is_duplicate = True
                 else:
-                    seen_hashes[image_hash] = product
+                    seen_hashes[product.image_hash] = product
+            if not is_duplicate and product.image_phash:
+                if product.image_phash in seen_phashes:
+                    # Same picture, re-encoded or resized
+                    is_duplicate = True
+                else:
+                    seen_phashes[product.image_phash] = product
             
             # PRIORITY 2: Check by image filename (if hash check didn't find duplicate)
             if not is_duplicate:
@@ -345,37 +442,31 @@ def ensure_no_duplicates(product):
     
     # Check by image if image exists
     if product.image:
+        existing = Product.objects.filter(
+            product_type='service',
+            is_archived=False,
+            image__isnull=False
+        ).exclude(image='').exclude(id=product.id if product.id else None)
+        
         filename = get_image_filename(product.image)
         if filename:
             base_name = os.path.splitext(filename)[0].lower()
-            existing = Product.objects.filter(
-                product_type='service',
-                is_archived=False,
-                image__isnull=False
-            ).exclude(image='').exclude(id=product.id if product.id else None)
-            
-            for existing_product in existing:
-                if existing_product.image:
-                    existing_filename = get_image_filename(existing_product.image)
-                    if existing_filename:
-                        existing_base_name = os.path.splitext(existing_filename)[0].lower()
-                        if base_name == existing_base_name:
-                            return (True, existing_product)
+            for existing_id, existing_name in existing.values_list('id', 'image'):
+                existing_base_name = os.path.splitext(os.path.basename(existing_name))[0].lower()
+                if base_name == existing_base_name:
+                    return (True, existing.get(id=existing_id))
         
-        # Check by image hash
-        image_hash = get_image_hash(product.image)
-        if image_hash:
-            existing = Product.objects.filter(
-                product_type='service',
-                is_archived=False,
-                image__isnull=False
-            ).exclude(image='').exclude(id=product.id if product.id else None)
-            
-            for existing_product in existing:
-                if existing_product.image:
-                    existing_hash = get_image_hash(existing_product.image)
-                    if existing_hash and image_hash == existing_hash:
-                        return (True, existing_product)
+        # Check by image fingerprints: one indexed lookup on the stored hashes
+        apply_image_fingerprints(product)
+        fingerprint = Q()
+        if product.image_hash:
+            fingerprint |= Q(image_hash=product.image_hash)
+        if product.image_phash:
+            fingerprint |= Q(image_phash=product.image_phash)
+        if fingerprint:
+            duplicate = existing.filter(fingerprint).order_by('created_at', 'id').first()
+            if duplicate:
+                return (True, duplicate)
     
     # Check by name + category
     existing = Product.objects.filter(
@@ -0,0 +1,507 @@
+"""
+Synthetic datasets
+==================
+DatasetGenerator fills the database with a seeded, realistic shop history
+- customers, rental/material/service products, staff, and orders of every
+type spread over the last few years with their items, inventory
+transactions, sales and activity logs - so views can be measured against
+10k, 100k or 1M orders instead of the handful a developer database holds.
+
+Everything is written with ``bulk_create`` in batches of one transaction
+each; only lists of primary keys are kept between batches, so memory stays
+flat whatever the scale. ``bulk_create`` skips ``save()`` and the signals,
+so the generator sets what they would have set itself: order and sales
+identifiers (and moves their IdentifierSequence rows past them), category
+summaries, rental product state, and finally the daily rollups.
+
+The same seed and options always produce the same rows.
+"""
+
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+import logging
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.utils import timezone
+
+from .customer_search_manager import normalize_phone_number
+from .material_catalog_manager import MaterialCatalogManager
+from .models import (
+    ActivityLog, Category, Customer, IdentifierSequence, InventoryTransaction,
+    Order, OrderItem, Product, Sales, StaffProfile,
+)
+from .order_category_manager import OrderCategoryManager
+from .order_tracking_manager import tracking_key
+from .rollup_manager import SalesRollupManager
+
+logger = logging.getLogger(__name__)
+
+ORDER_PREFIXES = {'rent': 'TS01RENT', 'repair': 'TS01REP', 'customize': 'TS01CUST'}
+
+# Share of each order type among generated orders
+ORDER_TYPE_WEIGHTS = {'rent': 5, 'repair': 3, 'customize': 2}
+
+RENTAL_FEE = Decimal('1500.00')
+RENTAL_DEPOSIT = Decimal('1000.00')
+RENTAL_DAYS = 3
+
+FIRST_NAMES = [
+    'Maria', 'Jose', 'Ana', 'Juan', 'Rosa', 'Carlo', 'Liza', 'Mark', 'Grace', 'Paolo',
+    'Joy', 'Miguel', 'Kristine', 'Rafael', 'Angelica', 'Noel', 'Camille', 'Ramon', 'Bea', 'Luis',
+]
+LAST_NAMES = [
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Villanueva', 'Ramos',
+    'Castillo', 'Aquino', 'Navarro', 'Dela Cruz', 'Gonzales', 'Lopez', 'Rivera', 'Soriano', 'Domingo', 'Pascual',
+]
+
+RENTAL_CATEGORIES = ['Gowns', 'Barong', 'Suits', 'Filipiniana', 'Costumes']
+RENTAL_COLORS = ['Ivory', 'Black', 'Navy', 'Maroon', 'Gold', 'Silver', 'Emerald', 'Blush']
+
+# (name, unit, description attributes) of each material line
+MATERIALS = [
+    ('Thread', 'pcs', {'Brand': ['Coats', 'Gutermann'], 'Color': ['White', 'Black', 'Red', 'Navy', 'Beige']}),
+    ('Zipper', 'inches', {'Type': ['Nylon', 'Metal', 'Invisible'], 'Color': ['Black', 'White', 'Gray']}),
+    ('Button', 'pcs', {'Button Type': ['4-hole', '2-hole', 'Shank'], 'Color': ['White', 'Black', 'Brown']}),
+    ('Garter', 'inches', {'Size': ['1 inch', '2 inch'], 'Color': ['White', 'Black']}),
+    ('Locks', 'groups', {'Type': ['Hook and eye', 'Kawit'], 'Color': ['Silver', 'Black']}),
+    ('Patch', 'pcs', {'Type': ['Iron-on', 'Sew-on'], 'Color': ['Blue', 'Denim', 'Black']}),
+    ('Fabric', 'yards', {'Type of Fabric': ['Cotton', 'Polyester', 'Linen'], 'Color': ['White', 'Navy', 'Khaki']}),
+]
+
+# Service types and the material kind each one mostly uses
+REPAIR_TYPES = [
+    ('Zipper', 'zipper'), ('Buttons', 'button'), ('Patch', 'patch'), ('Lock', 'locks'),
+    ('Bewang', 'garter'), ('Elastic', 'garter'), ('Putol', 'thread'), ('Pasada', 'thread'),
+]
+CUSTOMIZE_TYPES = [
+    ('Polo', 'fabric'), ('Blouse', 'fabric'), ('Pants', 'fabric'), ('Shorts', 'fabric'),
+    ('Skirt', 'fabric'), ('Uniform', 'fabric'), ('PE', 'fabric'),
+]
+
+PAYMENT_METHODS = ['cash', 'cash', 'cash', 'gcash', 'bank_transfer']
+
+OPEN_SERVICE_STATUSES = ['pending', 'in_progress', 'repair_done', 'ready_to_pick_up']
+
+
+@contextmanager
+def backdating(*model_classes):
+    """
+    Let ``created_at``/``updated_at`` values set on instances through to the
+    database: ``bulk_create`` would otherwise stamp them with now
+    """
+    switched = []
+    for model in model_classes:
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add):
+                switched.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in switched:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    """
+    Seeded bulk generator of a shop's history
+    """
+
+    def __init__(self, orders, seed=1, customers=None, rental_products=200, material_products=60,
+                 staff=8, years=3, batch_size=2000, now=None, progress=None):
+        self.order_count = orders
+        self.customer_count = customers if customers is not None else max(10, orders // 8)
+        self.rental_product_count = max(1, rental_products)
+        self.material_product_count = max(len(MATERIALS), material_products)
+        self.staff_count = max(1, staff)
+        self.span = timedelta(days=365 * years)
+        self.batch_size = batch_size
+        self.now = now or timezone.now()
+        self.progress = progress
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        self.counts = {}
+        self._order_numbers = {}
+        self._sales_numbers = {}
+        # rental product pk -> (order pk, start, due) of its rental still out
+        self._rented = {}
+
+    def generate(self):
+        """Write the dataset and return the number of rows created per kind"""
+        started = time.perf_counter()
+        with backdating(Customer, Order, InventoryTransaction, Sales, ActivityLog):
+            self._create_reference_data()
+            self._create_customers()
+            for start in range(0, self.order_count, self.batch_size):
+                with transaction.atomic():
+                    self._create_orders(start, min(start + self.batch_size, self.order_count))
+                self._report(f'{min(start + self.batch_size, self.order_count)}/{self.order_count} orders')
+
+        self._finish_rentals()
+        self._finish_ledger()
+        self._sync_sequences()
+        order_rows, sales_rows = SalesRollupManager.rebuild_all()
+        self.counts['rollup_rows'] = order_rows + sales_rows
+        logger.info(f"[DATASET] Seed {self.seed}: {self.counts} in {time.perf_counter() - started:.1f}s")
+        return self.counts
+
+    def _report(self, message):
+        if self.progress:
+            self.progress(message)
+
+    def _add(self, kind, number):
+        self.counts[kind] = self.counts.get(kind, 0) + number
+
+    def _created_at(self, index, total):
+        """Timestamps rise with the index, so identifiers follow creation order"""
+        return self.now - self.span + self.span * ((index + self.rng.random()) / total)
+
+    # Reference data ---------------------------------------------------
+
+    def _create_reference_data(self):
+        rng = self.rng
+
+        self.staff_ids = []
+        for i in range(self.staff_count):
+            first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[(i * 7) % len(LAST_NAMES)]
+            user, created = User.objects.get_or_create(
+                username=f'dataset_staff_{i + 1}',
+                defaults={'first_name': first, 'last_name': last, 'is_staff': True},
+            )
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+                StaffProfile.objects.create(user=user, phone=f'0917{(i + 1) * 7919:07d}')
+                self._add('staff', 1)
+            self.staff_ids.append(user.pk)
+
+        categories = [Category.objects.get_or_create(name=name)[0] for name in RENTAL_CATEGORIES]
+        products = []
+        for i in range(self.rental_product_count):
+            category = categories[i % len(categories)]
+            products.append(Product(
+                name=f'{rng.choice(RENTAL_COLORS)} {category.name} #{i + 1}',
+                category=category,
+                product_type='rental',
+                price=RENTAL_FEE,
+                quantity=1,
+            ))
+
+        for i in range(self.material_product_count):
+            name, unit, attributes = MATERIALS[i % len(MATERIALS)]
+            description = '; '.join(f'{label}: {rng.choice(values)}' for label, values in attributes.items())
+            stock = rng.randrange(200, 5000)
+            product = Product(
+                name=f'{name} {i // len(MATERIALS) + 1}',
+                description=description,
+                product_type='material',
+                price=Decimal(rng.randrange(5, 120)),
+                cost=Decimal(rng.randrange(2, 60)),
+                quantity=stock,
+                current_quantity_in_stock=stock,
+                min_quantity=50,
+                unit_of_measurement=unit,
+            )
+            MaterialCatalogManager.apply_attributes(product)
+            products.append(product)
+
+        for prefix, types in (('Repair', REPAIR_TYPES), ('Customize', CUSTOMIZE_TYPES)):
+            for service_type, _ in types:
+                products.append(Product(
+                    name=f'{prefix} - {service_type}',
+                    product_type='service',
+                    price=Decimal(rng.randrange(150, 1200, 50)),
+                ))
+
+        products = Product.objects.bulk_create(products, batch_size=self.batch_size)
+        MaterialCatalogManager.invalidate()
+        self._add('products', len(products))
+
+        self.rental_products = [p.pk for p in products if p.product_type == 'rental']
+        self.materials_by_kind = {}
+        for product in products:
+            if product.product_type == 'material':
+                self.materials_by_kind.setdefault(product.material_kind, []).append(product.pk)
+        self.services = {
+            product.name: (product.pk, product.price)
+            for product in products if product.product_type == 'service'
+        }
+
+    def _create_customers(self):
+        rng = self.rng
+        self.customers = []
+        for start in range(0, self.customer_count, self.batch_size):
+            batch = []
+            for index in range(start, min(start + self.batch_size, self.customer_count)):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                phone = f'09{rng.randrange(10 ** 9):09d}'
+                created_at = self._created_at(index, self.customer_count) - timedelta(days=1)
+                batch.append(Customer(
+                    name=f'{first} {last}',
+                    phone=phone,
+                    phone_normalized=normalize_phone_number(phone),
+                    email=f'{first}.{last.replace(" ", "")}{index}@example.com'.lower() if rng.random() < 0.6 else '',
+                    address=f'{rng.randrange(1, 999)} Rizal St., Barangay {rng.randrange(1, 80)}',
+                    created_at=created_at,
+                    updated_at=created_at,
+                ))
+            batch = Customer.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.customers.extend((customer.pk, customer.name) for customer in batch)
+        self._add('customers', len(self.customers))
+
+    # Orders -----------------------------------------------------------
+
+    def _next_identifier(self, order_type):
+        prefix = ORDER_PREFIXES[order_type]
+        if prefix not in self._order_numbers:
+            self._order_numbers[prefix] = IdentifierSequence.highest_number(
+                Order.objects.filter(order_identifier__startswith=f'{prefix}-').values_list(
+                    'order_identifier', flat=True
+                ).iterator(),
+                prefix,
+            )
+        self._order_numbers[prefix] += 1
+        return f'{prefix}-O{self._order_numbers[prefix]:02d}'
+
+    def _next_sales_identifier(self, when):
+        prefix = f'TSRT-{when.year}'
+        if prefix not in self._sales_numbers:
+            self._sales_numbers[prefix] = IdentifierSequence.highest_number(
+                Sales.objects.filter(sales_identifier__startswith=f'{prefix}-').values_list(
+                    'sales_identifier', flat=True
+                ).iterator(),
+                prefix,
+            )
+        self._sales_numbers[prefix] += 1
+        return f'{prefix}-{self._sales_numbers[prefix]:02d}'
+
+    def _rental_status(self, age):
+        """Rentals still out are recent; most older ones came back and were settled"""
+        roll = self.rng.random()
+        if age < timedelta(days=RENTAL_DAYS):
+            return 'rented'
+        if age < timedelta(days=10) and roll < 0.15:
+            return 'overdue'
+        if roll < 0.85:
+            return 'completed'
+        return 'returned' if roll < 0.95 else 'cancelled'
+
+    def _service_status(self, age):
+        roll = self.rng.random()
+        if age < timedelta(days=7):
+            return OPEN_SERVICE_STATUSES[int(roll * len(OPEN_SERVICE_STATUSES))]
+        return 'completed' if roll < 0.9 else 'cancelled'
+
+    def _create_orders(self, start, stop):
+        rng = self.rng
+        types = list(ORDER_TYPE_WEIGHTS)
+        weights = list(ORDER_TYPE_WEIGHTS.values())
+
+        orders = []
+        plans = []
+        for index in range(start, stop):
+            created_at = self._created_at(index, self.order_count)
+            age = self.now - created_at
+            order_type = rng.choices(types, weights)[0]
+            # Customers join over time too; an order only goes to one who already has
+            customer_id, customer_name = self.customers[
+                rng.randrange(max(1, (index + 1) * len(self.customers) // self.order_count))
+            ]
+            identifier = self._next_identifier(order_type)
+            order = Order(
+                order_id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                order_identifier=identifier,
+                tracking_key=tracking_key(identifier),
+                customer_id=customer_id,
+                order_type=order_type,
+                payment_method=rng.choice(PAYMENT_METHODS),
+                created_at=created_at,
+            )
+
+            if order_type == 'rent':
+                order.status = self._rental_status(age)
+                order.rental_fee, order.deposit_amount = RENTAL_FEE, RENTAL_DEPOSIT
+                order.total_amount = RENTAL_FEE + RENTAL_DEPOSIT
+                order.due_date = created_at + timedelta(days=RENTAL_DAYS)
+                product_id = rng.choice(self.rental_products)
+                if order.status in ['rented', 'overdue']:
+                    free = [pk for pk in self.rental_products if pk not in self._rented]
+                    if free:
+                        product_id = rng.choice(free)
+                        self._rented[product_id] = None
+                    else:
+                        order.status = 'returned'
+                lines = [(product_id, 1, RENTAL_FEE)]
+                service = None
+            else:
+                order.status = self._service_status(age)
+                prefix, service_types = ('Repair', REPAIR_TYPES) if order_type == 'repair' else ('Customize', CUSTOMIZE_TYPES)
+                service = rng.choice(service_types)
+                product_id, price = self.services[f'{prefix} - {service[0]}']
+                quantity = rng.choices([1, 2, 3], [6, 3, 1])[0]
+                lines = [(product_id, quantity, price)]
+                order.total_amount = price * quantity
+                order.due_date = created_at + timedelta(days=rng.randrange(3, 15))
+                order.assigned_staff_id = rng.choice(self.staff_ids)
+                order.staff_assigned_at = created_at + timedelta(minutes=rng.randrange(5, 240))
+
+            finished_at = None
+            if order.status in ['completed', 'returned', 'cancelled']:
+                finished_at = min(created_at + timedelta(hours=rng.randrange(24, 24 * 14)), self.now)
+            if order.status == 'completed':
+                order.paid_amount = order.total_amount
+                if order.assigned_staff_id:
+                    order.staff_completed_at = finished_at
+                order.is_archived = age > timedelta(days=180) and rng.random() < 0.7
+            elif order.status != 'cancelled':
+                order.paid_amount = (order.total_amount * Decimal(rng.choice(['0', '0.5', '1']))).quantize(Decimal('0.01'))
+            order.balance = order.total_amount - order.paid_amount
+            order.updated_at = finished_at or created_at
+            orders.append(order)
+            plans.append((lines, service, finished_at, customer_name))
+
+        orders = Order.objects.bulk_create(orders, batch_size=self.batch_size)
+
+        items, transactions, sales, logs = [], [], [], []
+        for order, (lines, service, finished_at, customer_name) in zip(orders, plans):
+            for product_id, quantity, unit_price in lines:
+                items.append(OrderItem(
+                    order=order, product_id=product_id, quantity=quantity,
+                    unit_price=unit_price, total_price=unit_price * quantity,
+                ))
+
+            if order.order_type == 'rent':
+                product_id = lines[0][0]
+                transactions.append(InventoryTransaction(
+                    product_id=product_id, transaction_type='rental_out', quantity=1, reference_order=order,
+                    notes=f'Rental item rented for order {order.order_identifier}', created_at=order.created_at,
+                ))
+                if order.status in ['rented', 'overdue']:
+                    self._rented[product_id] = (order.pk, order.created_at, order.due_date)
+                elif finished_at and order.status != 'cancelled':
+                    transactions.append(InventoryTransaction(
+                        product_id=product_id, transaction_type='rental_in', quantity=1, reference_order=order,
+                        notes=f'Rental item returned for order {order.order_identifier}', created_at=finished_at,
+                    ))
+            elif order.status != 'cancelled':
+                service_type, kind = service
+                for _ in range(rng.randrange(1, 3)):
+                    material_id = rng.choice(self.materials_by_kind.get(kind) or self.materials_by_kind['thread'])
+                    used = rng.randrange(1, 12)
+                    transactions.append(InventoryTransaction(
+                        product_id=material_id, transaction_type='out', quantity=-used, reference_order=order,
+                        notes=f'Used {used} {kind} for {service_type.lower()} - Order {order.order_identifier}',
+                        created_at=order.created_at + timedelta(minutes=rng.randrange(10, 600)),
+                    ))
+
+            logs.append(ActivityLog(
+                activity_type='order_created',
+                description=f"New {order.get_order_type_display()} order created for {customer_name}",
+                order=order, customer_id=order.customer_id, created_at=order.created_at,
+                metadata={'order_identifier': order.order_identifier, 'order_type': order.order_type,
+                          'total_amount': float(order.total_amount), 'status': order.status},
+            ))
+            if order.paid_amount:
+                logs.append(ActivityLog(
+                    activity_type='payment_received',
+                    description=f"Payment of {order.paid_amount} received for order {order.order_identifier}",
+                    order=order, customer_id=order.customer_id, user_id=order.assigned_staff_id,
+                    created_at=finished_at or order.created_at,
+                    metadata={'amount': float(order.paid_amount), 'payment_method': order.payment_method},
+                ))
+            if order.status == 'completed':
+                sale = Sales(
+                    order=order, sales_identifier=self._next_sales_identifier(finished_at),
+                    amount=order.total_amount, payment_method=order.payment_method, created_at=finished_at,
+                )
+                sales.append(sale)
+                logs.append(ActivityLog(
+                    activity_type='order_completed',
+                    description=f"Order {order.order_identifier} completed",
+                    order=order, customer_id=order.customer_id, user_id=order.assigned_staff_id,
+                    created_at=finished_at, metadata={'order_identifier': order.order_identifier},
+                ))
+                logs.append(ActivityLog(
+                    activity_type='sales_created',
+                    description=f"Sale {sale.sales_identifier} created for order {order.order_identifier}",
+                    order=order, customer_id=order.customer_id, created_at=finished_at,
+                    metadata={'sales_identifier': sale.sales_identifier, 'amount': float(sale.amount),
+                              'payment_method': sale.payment_method},
+                ))
+            elif order.status == 'cancelled':
+                logs.append(ActivityLog(
+                    activity_type='order_cancelled',
+                    description=f"Order {order.order_identifier} cancelled",
+                    order=order, customer_id=order.customer_id, created_at=finished_at,
+                    metadata={'order_identifier': order.order_identifier},
+                ))
+
+        OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+        InventoryTransaction.objects.bulk_create(transactions, batch_size=self.batch_size)
+        Sales.objects.bulk_create(sales, batch_size=self.batch_size)
+        ActivityLog.objects.bulk_create(logs, batch_size=self.batch_size)
+        OrderCategoryManager.refresh_many(
+            Order.objects.filter(pk__in=[order.pk for order in orders]).prefetch_related('items__product__category')
+        )
+
+        self._add('orders', len(orders))
+        self._add('order_items', len(items))
+        self._add('inventory_transactions', len(transactions))
+        self._add('sales', len(sales))
+        self._add('activity_logs', len(logs))
+
+    # Finishing --------------------------------------------------------
+
+    def _finish_rentals(self):
+        """Mark the products of rentals still out as rented, as the rental signals would"""
+        products = []
+        for product_id, rental in self._rented.items():
+            if rental is None:
+                continue
+            order_id, started, due = rental
+            products.append(Product(
+                pk=product_id, rental_status='rented', current_rental_order_id=order_id,
+                rental_start_date=started, rental_due_date=due,
+            ))
+        Product.objects.bulk_update(
+            products,
+            ['rental_status', 'current_rental_order', 'rental_start_date', 'rental_due_date'],
+            batch_size=self.batch_size,
+        )
+        self.counts['rented_products'] = len(products)
+
+    def _finish_ledger(self):
+        """
+        Give the material stock entries their balance_after, replayed back
+        from current stock as migration 0049 does, so InventoryLedger.stock_at
+        reads the ledger instead of falling back to current stock
+        """
+        stock = dict(Product.objects.filter(product_type='material').values_list('pk', 'quantity'))
+        entries = (
+            InventoryTransaction.objects
+            .filter(product_id__in=list(stock), transaction_type__in=['in', 'out', 'adjustment'])
+            .only('pk', 'product_id', 'quantity')
+            .order_by('product_id', '-created_at', '-pk')
+        )
+        batch, filled = [], 0
+        for entry in entries.iterator(chunk_size=self.batch_size):
+            entry.balance_after = stock[entry.product_id]
+            stock[entry.product_id] = entry.balance_after - entry.quantity
+            batch.append(entry)
+            if len(batch) == self.batch_size:
+                InventoryTransaction.objects.bulk_update(batch, ['balance_after'])
+                filled += len(batch)
+                batch = []
+        InventoryTransaction.objects.bulk_update(batch, ['balance_after'])
+        self.counts['ledger_balances'] = filled + len(batch)
+
+    def _sync_sequences(self):
+        """Move the identifier sequences past the numbers handed out here"""
+        for key, highest in {**self._order_numbers, **self._sales_numbers}.items():
+            IdentifierSequence.sync(key, highest)
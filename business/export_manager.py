@@ -0,0 +1,281 @@
+"""
+Streaming report exports
+========================
+The sales and staff reports used to load every row, look up each sale's
+order and customer one query at a time, and build the whole openpyxl
+Workbook or reportlab document in memory before sending a byte.
+
+An export is now described as sheets of sections whose rows are lazy
+iterators (usually ``queryset.iterator()`` with ``select_related``), and
+ExportManager renders it as CSV, XLSX or PDF straight into a
+StreamingHttpResponse:
+
+- CSV rows are written out as they are read;
+- XLSX uses openpyxl's write-only mode, which spools each sheet to a
+  temporary file instead of keeping cells in memory;
+- PDF is laid out row by row on a reportlab canvas with page breaks and a
+  repeated table header, spooled to a temporary file.
+
+Only one chunk of rows is held at a time, so memory stays flat however
+many rows the report has.
+"""
+
+from itertools import chain
+import csv
+import logging
+import tempfile
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Bytes sent per chunk when streaming a spooled XLSX or PDF file
+STREAM_BLOCK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+
+
+def export_rows(queryset, row, chunk_size=EXPORT_CHUNK_SIZE):
+    """Lazily map ``row`` over a queryset fetched in chunks"""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield row(obj)
+
+
+def export_section(title=None, headers=None, rows=(), info=None, widths=None):
+    """
+    One block of a sheet:
+        title   - heading above the block
+        info    - (label, value) pairs shown as a key/value list
+        headers - column headers of the table
+        rows    - iterable of row lists, consumed once
+        widths  - relative column widths (XLSX characters / PDF proportions)
+    """
+    return {
+        'title': title,
+        'headers': headers or [],
+        'rows': rows,
+        'info': info or [],
+        'widths': widths,
+    }
+
+
+class _Echo:
+    """File-like object whose write() returns the line csv.writer formats"""
+
+    def write(self, value):
+        return value
+
+
+class ExportManager:
+    """
+    Renders lazily built report sheets as streaming CSV, XLSX or PDF responses
+    """
+
+    @staticmethod
+    def response(export_format, filename, title, sheets):
+        """
+        StreamingHttpResponse for ``sheets``, an iterable of (sheet_name, sections).
+
+        Sheets and their rows are only consumed while the response is sent.
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported export format: {export_format}')
+        content_type, extension = EXPORT_FORMATS[export_format]
+        renderer = getattr(ExportManager, f'_render_{export_format}')
+
+        logger.info(f"[EXPORT] Streaming {export_format} export {filename}")
+        response = StreamingHttpResponse(renderer(title, sheets), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+        return response
+
+    @staticmethod
+    def _generated_on():
+        return f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}"
+
+    @staticmethod
+    def _render_csv(title, sheets):
+        writer = csv.writer(_Echo())
+        # BOM so Excel opens the file as UTF-8 (peso signs, names)
+        yield '\ufeff'
+        yield writer.writerow([title])
+        yield writer.writerow([ExportManager._generated_on()])
+        for sheet_name, sections in sheets:
+            yield writer.writerow([])
+            yield writer.writerow([sheet_name])
+            for section in sections:
+                if section['title']:
+                    yield writer.writerow([section['title']])
+                for label, value in section['info']:
+                    yield writer.writerow([label, value])
+                if section['headers']:
+                    yield writer.writerow(section['headers'])
+                for row in section['rows']:
+                    yield writer.writerow(row)
+                yield writer.writerow([])
+
+    @staticmethod
+    def _stream_file(handle):
+        handle.seek(0)
+        try:
+            while True:
+                block = handle.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+        finally:
+            handle.close()
+
+    @staticmethod
+    def _render_xlsx(title, sheets):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill
+        from openpyxl.utils import get_column_letter
+
+        wb = Workbook(write_only=True)
+        title_font = Font(bold=True, size=14)
+        bold = Font(bold=True)
+        header_font = Font(bold=True, color='FFFFFF')
+        header_fill = PatternFill(start_color='2c3e50', end_color='2c3e50', fill_type='solid')
+
+        def styled(ws, value, font=None, fill=None):
+            cell = WriteOnlyCell(ws, value=value)
+            if font:
+                cell.font = font
+            if fill:
+                cell.fill = fill
+            return cell
+
+        generated_on = ExportManager._generated_on()
+        for sheet_name, sections in sheets:
+            ws = wb.create_sheet(title=str(sheet_name)[:31])  # Excel sheet name limit
+            sections = iter(sections)
+            first = next(sections, None)
+            # Column widths must be set before the first row is written
+            for col, width in enumerate((first or {}).get('widths') or [], 1):
+                ws.column_dimensions[get_column_letter(col)].width = width
+
+            ws.append([styled(ws, title if sheet_name == title else f'{title} - {sheet_name}', title_font)])
+            ws.append([generated_on])
+            for section in chain([first] if first else [], sections):
+                ws.append([])
+                if section['title']:
+                    ws.append([styled(ws, section['title'], Font(bold=True, size=12))])
+                for label, value in section['info']:
+                    ws.append([styled(ws, label, bold), value])
+                if section['headers']:
+                    ws.append([styled(ws, header, header_font, header_fill) for header in section['headers']])
+                for row in section['rows']:
+                    ws.append(row)
+
+        if not wb.worksheets:
+            wb.create_sheet(title=title[:31]).append([title])
+
+        handle = tempfile.TemporaryFile()
+        wb.save(handle)
+        yield from ExportManager._stream_file(handle)
+
+    @staticmethod
+    def _render_pdf(title, sheets):
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.pdfgen import canvas
+
+        handle = tempfile.TemporaryFile()
+        page_width, page_height = A4
+        margin = 36
+        line_height = 14
+        font, bold_font, font_size = 'Helvetica', 'Helvetica-Bold', 8
+        usable_width = page_width - 2 * margin
+
+        pdf = canvas.Canvas(handle, pagesize=A4, pageCompression=1)
+        pdf.setTitle(title)
+        state = {'y': 0, 'page': 0}
+
+        def new_page():
+            if state['page']:
+                pdf.showPage()
+            state['page'] += 1
+            pdf.setFont(font, 7)
+            pdf.setFillColor(colors.grey)
+            pdf.drawRightString(page_width - margin, margin / 2, f"{title} - Page {state['page']}")
+            pdf.setFillColor(colors.black)
+            state['y'] = page_height - margin
+
+        def fit(text, width, face):
+            text = '' if text is None else str(text)
+            if stringWidth(text, face, font_size) <= width:
+                return text
+            while text and stringWidth(text + '...', face, font_size) > width:
+                text = text[:-1]
+            return text + '...'
+
+        def draw_line(cells, x_positions, widths, face, header=False):
+            if header:
+                pdf.setFillColor(colors.HexColor('#2c3e50'))
+                pdf.rect(margin, state['y'] - 4, usable_width, line_height, stroke=0, fill=1)
+                pdf.setFillColor(colors.white)
+            pdf.setFont(face, font_size)
+            for value, x, width in zip(cells, x_positions, widths):
+                pdf.drawString(x + 2, state['y'], fit(value, width - 4, face))
+            pdf.setFillColor(colors.black)
+            state['y'] -= line_height
+
+        def ensure_room(lines=1):
+            if state['y'] - lines * line_height < margin:
+                new_page()
+                return True
+            return False
+
+        new_page()
+        pdf.setFont(bold_font, 16)
+        pdf.drawString(margin, state['y'], title)
+        state['y'] -= 20
+        pdf.setFont(font, 9)
+        pdf.drawString(margin, state['y'], ExportManager._generated_on())
+        state['y'] -= 24
+
+        for sheet_index, (sheet_name, sections) in enumerate(sheets):
+            if sheet_index and sheet_name != title:
+                # Each sheet (e.g. each staff member) starts on its own page
+                new_page()
+            if sheet_name != title:
+                pdf.setFont(bold_font, 13)
+                pdf.drawString(margin, state['y'], str(sheet_name))
+                state['y'] -= 22
+
+            for section in sections:
+                ensure_room(3)
+                if section['title']:
+                    pdf.setFont(bold_font, 11)
+                    pdf.drawString(margin, state['y'], section['title'])
+                    state['y'] -= 18
+                for label, value in section['info']:
+                    ensure_room()
+                    draw_line([label, value], [margin, margin + 160], [160, usable_width - 160], font)
+
+                headers = section['headers']
+                if headers:
+                    weights = section['widths'] or [1] * len(headers)
+                    total = float(sum(weights))
+                    widths = [usable_width * weight / total for weight in weights]
+                    x_positions = [margin + sum(widths[:i]) for i in range(len(widths))]
+                    draw_line(headers, x_positions, widths, bold_font, header=True)
+                    for row in section['rows']:
+                        if ensure_room():
+                            # Repeat the table header on every page
+                            draw_line(headers, x_positions, widths, bold_font, header=True)
+                        draw_line(row, x_positions, widths, font)
+                state['y'] -= 10
+
+        pdf.save()
+        yield from ExportManager._stream_file(handle)
@@ -0,0 +1,128 @@
+"""
+Form drafts
+===========
+``api_autosave_sync`` turned every key of every auto-save payload into a
+``ChangeTracker.track_change`` call: one ActivityLog row per form per
+sync - every 30 seconds while a page is open - with the whole form in its
+metadata, filed as a product update. The activity log filled with drafts
+nobody reads, and its pagination and stats slowed down with it.
+
+Drafts now live in FormDraft, one row per (user, key) with the latest
+contents. ``FormDrafts.sync`` takes a whole auto-save payload at once: one
+SELECT reads the stored content hashes of its keys, drafts whose hash did
+not change are skipped, and the rest are written with a single upsert
+(INSERT ... ON CONFLICT (user, key) DO UPDATE). Password fields and CSRF
+tokens are dropped before anything is stored.
+
+Drafts expire FORM_DRAFT_TTL_DAYS after their last change. Every sync
+deletes the user's expired drafts along with the ones the page cleared;
+``prune_form_drafts`` removes those of users who do not come back.
+"""
+
+from datetime import timedelta
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ActivityLog, FormDraft
+
+logger = logging.getLogger(__name__)
+
+KEY_LENGTH = FormDraft._meta.get_field('key').max_length
+
+# Form fields never stored in a draft (matched as substrings of the field name)
+SENSITIVE_FIELDS = ['password', 'csrfmiddlewaretoken']
+
+# Drafts of the staff modals are thrown away when the modal closes
+TRANSIENT_KEYS = ['addStaffForm', 'editStaffForm']
+
+
+def content_hash(value):
+    """SHA-256 of ``value`` serialized canonically"""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _scrub(value):
+    if not isinstance(value, dict):
+        return value
+    return {
+        name: field for name, field in value.items()
+        if not any(sensitive in name.lower() for sensitive in SENSITIVE_FIELDS)
+    }
+
+
+class FormDrafts:
+    """
+    Latest auto-saved form data per user and form, upserted in batches
+    """
+
+    @staticmethod
+    def ttl():
+        return timedelta(days=getattr(settings, 'FORM_DRAFT_TTL_DAYS', 7))
+
+    @staticmethod
+    def sync(user, drafts, deleted=()):
+        """
+        Store ``drafts`` (form key -> data) for ``user`` and delete the
+        ``deleted`` keys. Returns counts: ``saved``, ``unchanged``,
+        ``skipped`` (transient or over-long keys) and ``deleted`` (including
+        the user's expired drafts).
+        """
+        now = timezone.now()
+        hashes, data, skipped = {}, {}, 0
+        for key, value in drafts.items():
+            key = str(key)
+            if not key or len(key) > KEY_LENGTH or any(transient in key for transient in TRANSIENT_KEYS):
+                skipped += 1
+                continue
+            data[key] = _scrub(value)
+            hashes[key] = content_hash(data[key])
+
+        stored = dict(FormDraft.objects.filter(
+            user=user, key__in=list(hashes), expires_at__gt=now
+        ).values_list('key', 'content_hash')) if hashes else {}
+        changed = [
+            FormDraft(user=user, key=key, data=data[key], content_hash=digest, updated_at=now, expires_at=now + FormDrafts.ttl())
+            for key, digest in hashes.items() if stored.get(key) != digest
+        ]
+
+        with transaction.atomic():
+            if changed:
+                FormDraft.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=['user', 'key'],
+                    update_fields=['data', 'content_hash', 'updated_at', 'expires_at'],
+                )
+            removed, _ = FormDraft.objects.filter(user=user).filter(
+                Q(key__in=[str(key) for key in deleted]) | Q(expires_at__lte=now)
+            ).delete()
+
+        return {
+            'saved': len(changed),
+            'unchanged': len(hashes) - len(changed),
+            'skipped': skipped,
+            'deleted': removed,
+        }
+
+    @staticmethod
+    def prune():
+        """Delete every expired draft; returns how many"""
+        deleted, _ = FormDraft.objects.filter(expires_at__lte=timezone.now()).delete()
+        if deleted:
+            logger.info(f"[FORM_DRAFTS] Pruned {deleted} expired draft(s)")
+        return deleted
+
+    @staticmethod
+    def purge_activity_log():
+        """Delete the activity log rows earlier auto-save syncs wrote; returns how many"""
+        deleted, _ = ActivityLog.objects.filter(metadata__model_name='AutoSave', metadata__action='sync').delete()
+        if deleted:
+            logger.info(f"[FORM_DRAFTS] Removed {deleted} auto-save activity log row(s)")
+        return deleted
@@ -0,0 +1,331 @@
+"""
+Image renditions
+================
+Product, customize order, staff profile and landing page images were
+served exactly as uploaded - often several megabytes of camera JPEG - to
+pages that show them as 56px table thumbnails, 160px cards or 80px
+avatars, so the inventory and order-entry pages downloaded every
+original on each visit.
+
+Each source image now gets a set of smaller renditions, stored next to
+each other under ``derived/<source name>/``:
+
+- WebP copies at each width in RENDITION_WIDTHS (never upscaled: widths
+  beyond the source's own collapse into one at the source width);
+- a JPEG (PNG for images with transparency) at FALLBACK_WIDTH for
+  browsers without WebP or ``srcset`` support;
+- ``manifest.json`` recording the source size and every rendition, so
+  pages can build ``srcset`` without opening the image.
+
+Renditions are generated when an image is uploaded (see
+``business.signals``), by the ``generate_image_renditions`` command for
+images uploaded before, and otherwise lazily the first time a page asks
+for them (set IMAGE_RENDITIONS_LAZY = False to serve the original
+instead). Manifests are remembered per process, so rendering a list of
+images reads each manifest once. Uploads never overwrite an existing file
+name, so a manifest stays valid for as long as its source exists; the
+command's ``--prune`` removes renditions whose source is gone.
+
+Templates use ``{% responsive_image %}`` and the ``rendition_url`` filter
+from the ``image_tags`` library; JSON APIs use ``ImageRenditions.url``.
+"""
+
+import io
+import json
+import logging
+import posixpath
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'derived'
+MANIFEST_NAME = 'manifest.json'
+
+# Bump to regenerate every rendition on next use (changed sizes or quality)
+MANIFEST_VERSION = 1
+
+# Rendition widths by name: table thumbnails and avatars, cards and
+# previews, landing page banners
+RENDITION_WIDTHS = {
+    'thumb': 160,
+    'medium': 480,
+    'large': 1200,
+}
+
+# Width of the JPEG/PNG rendition used as ``src`` fallback
+FALLBACK_WIDTH = 480
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+# Manifests remembered per process before the memo is cleared
+MEMO_LIMIT = 10000
+
+
+def rendition_dir(source_name):
+    return posixpath.join(RENDITION_DIR, source_name)
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _resized(image, width):
+    from PIL import Image
+
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def _encode(image, format):
+    buffer = io.BytesIO()
+    if format == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif format == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_renditions(data):
+    """
+    Encode the renditions of an image: a list of (file name, bytes) and the
+    manifest describing them (names relative to the rendition directory).
+    Raises if ``data`` is not an image Pillow can read.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as opened:
+        # Camera photos are often stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+
+    alpha = _has_alpha(image)
+    image = image.convert('RGBA' if alpha else 'RGB')
+    files = []
+    renditions = {}
+    encoded = {}
+    for label, width in RENDITION_WIDTHS.items():
+        width = min(width, image.width)
+        name = f'{width}w.webp'
+        if name not in encoded:
+            resized = _resized(image, width)
+            encoded[name] = (resized.width, resized.height)
+            files.append((name, _encode(resized, 'WEBP')))
+        renditions[label] = [name, *encoded[name]]
+
+    fallback_image = _resized(image, FALLBACK_WIDTH)
+    fallback_name = f'{fallback_image.width}w.png' if alpha else f'{fallback_image.width}w.jpg'
+    files.append((fallback_name, _encode(fallback_image, 'PNG' if alpha else 'JPEG')))
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'width': image.width,
+        'height': image.height,
+        'renditions': renditions,
+        'fallback': [fallback_name, fallback_image.width, fallback_image.height],
+    }
+    return files, manifest
+
+
+class ImageRenditions:
+    """
+    Lookup and generation of image renditions, keyed by source file name
+    """
+
+    _memo = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _remember(name, manifest):
+        with ImageRenditions._lock:
+            if len(ImageRenditions._memo) >= MEMO_LIMIT:
+                ImageRenditions._memo.clear()
+            ImageRenditions._memo[name] = manifest
+        return manifest
+
+    @staticmethod
+    def forget(name=None):
+        """Drop remembered manifests (one source's, or all)"""
+        with ImageRenditions._lock:
+            if name is None:
+                ImageRenditions._memo.clear()
+            else:
+                ImageRenditions._memo.pop(name, None)
+
+    @staticmethod
+    def _read_manifest(name, storage):
+        path = posixpath.join(rendition_dir(name), MANIFEST_NAME)
+        try:
+            with storage.open(path, 'rb') as handle:
+                manifest = json.loads(handle.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    @staticmethod
+    def generate(field):
+        """
+        (Re)build the renditions of an image field's file. Returns the
+        manifest, or None if the source is missing or not a readable image.
+        """
+        name = getattr(field, 'name', None)
+        if not name:
+            return None
+        storage = field.storage
+        try:
+            with storage.open(name, 'rb') as handle:
+                data = handle.read()
+            files, manifest = render_renditions(data)
+        except Exception as e:
+            logger.warning(f"[IMAGE_RENDITIONS] Cannot render {name}: {str(e)}")
+            return ImageRenditions._remember(name, None)
+
+        directory = rendition_dir(name)
+        for file_name, content in files + [(MANIFEST_NAME, json.dumps(manifest).encode('utf-8'))]:
+            path = posixpath.join(directory, file_name)
+            # Rendition names are fixed, so replace rather than let storage rename
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(content))
+        logger.debug(f"[IMAGE_RENDITIONS] Rendered {len(files)} file(s) for {name}")
+        return ImageRenditions._remember(name, manifest)
+
+    @staticmethod
+    def manifest(field, generate=None):
+        """
+        The rendition manifest of an image field's file, generating it on
+        first use when IMAGE_RENDITIONS_LAZY is on (or ``generate`` is True).
+        None if there is no usable image.
+        """
+        name = getattr(field, 'name', None)
+        if not name:
+            return None
+        if name in ImageRenditions._memo:
+            return ImageRenditions._memo[name]
+        manifest = ImageRenditions._read_manifest(name, field.storage)
+        if manifest is not None:
+            return ImageRenditions._remember(name, manifest)
+        if generate is None:
+            generate = getattr(settings, 'IMAGE_RENDITIONS_LAZY', True)
+        if not generate:
+            return None
+        return ImageRenditions.generate(field)
+
+    @staticmethod
+    def _url(field, file_name):
+        return field.storage.url(posixpath.join(rendition_dir(field.name), file_name))
+
+    @staticmethod
+    def url(field, label='medium'):
+        """
+        URL of the named WebP rendition of an image field, the original's
+        URL if it has none, or None for an empty field
+        """
+        if not field:
+            return None
+        manifest = ImageRenditions.manifest(field)
+        if manifest is None:
+            try:
+                return field.url
+            except ValueError:
+                return None
+        name = manifest['renditions'].get(label, manifest['renditions']['medium'])[0]
+        return ImageRenditions._url(field, name)
+
+    @staticmethod
+    def attributes(field, label='large'):
+        """
+        ``src``, ``srcset``, ``width`` and ``height`` for an <img> showing
+        an image field, with ``srcset`` listing the WebP renditions up to
+        ``label``; just ``src`` (the original) if it has no renditions.
+        Empty for an empty field.
+        """
+        if not field:
+            return {}
+        manifest = ImageRenditions.manifest(field)
+        if manifest is None:
+            try:
+                return {'src': field.url}
+            except ValueError:
+                return {}
+
+        largest = RENDITION_WIDTHS.get(label, RENDITION_WIDTHS['large'])
+        candidates = {}
+        for rendition_label, (name, width, height) in manifest['renditions'].items():
+            if RENDITION_WIDTHS[rendition_label] <= largest:
+                candidates[name] = width
+        srcset = ', '.join(
+            f'{ImageRenditions._url(field, name)} {width}w'
+            for name, width in sorted(candidates.items(), key=lambda item: item[1])
+        )
+        fallback_name, width, height = manifest['fallback']
+        return {
+            'src': ImageRenditions._url(field, fallback_name),
+            'srcset': srcset,
+            'width': width,
+            'height': height,
+        }
+
+    @staticmethod
+    def delete(name, storage=None):
+        """Remove every rendition of a source file name"""
+        storage = storage or default_storage
+        directory = rendition_dir(name)
+        try:
+            _, files = storage.listdir(directory)
+        except (OSError, NotImplementedError):
+            files = []
+        for file_name in files:
+            storage.delete(posixpath.join(directory, file_name))
+        ImageRenditions.forget(name)
+        return len(files)
+
+    @staticmethod
+    def rendered_sources(storage=None):
+        """Source names that have a rendition directory"""
+        storage = storage or default_storage
+
+        def walk(directory):
+            try:
+                directories, files = storage.listdir(directory)
+            except (OSError, NotImplementedError):
+                return
+            if MANIFEST_NAME in files:
+                yield directory[len(RENDITION_DIR) + 1:]
+            for sub in directories:
+                yield from walk(posixpath.join(directory, sub))
+
+        return list(walk(RENDITION_DIR))
+
+    @staticmethod
+    def prune(storage=None):
+        """Delete renditions whose source file no longer exists; returns how many sources were pruned"""
+        storage = storage or default_storage
+        pruned = 0
+        for name in ImageRenditions.rendered_sources(storage):
+            if not storage.exists(name):
+                ImageRenditions.delete(name, storage)
+                pruned += 1
+        return pruned
+
+
+def image_fields():
+    """(model, field name) of every image the renditions serve"""
+    from .models import LandingPageImage, Order, Product, StaffProfile
+
+    return [
+        (Product, 'image'),
+        (Order, 'customize_image'),
+        (StaffProfile, 'profile_image'),
+        (LandingPageImage, 'image'),
+    ]
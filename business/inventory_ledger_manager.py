@@ -0,0 +1,278 @@
+"""
+Inventory ledger
+================
+Stock changes read ``product.quantity`` into Python, changed it, saved the
+whole product row and then inserted an InventoryTransaction on its own.
+Two counters deducting the same thread both read the old quantity and one
+deduction was lost; a product instance loaded earlier in the request
+wrote its stale quantity back; a failure between the save and the insert
+left stock and history disagreeing; and fractional amounts were cut
+differently in each place (2.5 cm took 3 cm off the stock but was logged
+as 2).
+
+``InventoryLedger.adjust`` changes stock with one conditional statement,
+
+    UPDATE business_product SET quantity = quantity + <delta> ...
+    WHERE id = <pk> AND quantity >= <-delta> RETURNING quantity
+
+and appends the InventoryTransaction in the same database transaction.
+The database serializes concurrent updates of a row, so no change is lost
+and stock never goes below zero: when too little is on hand nothing is
+written and None comes back. Amounts are whole units (the quantity column
+is an integer); deductions are rounded up, which is what the saved stock
+always reflected.
+
+Every entry written here records ``balance_after``, the stock right after
+it, so ``stock_at`` answers "how much was on hand at T" from the one entry
+before T instead of replaying the history. Migration 0049 gave earlier
+entries their balance by replaying them back from the stock at the time.
+Entries are never updated; corrections are new entries. Setting a quantity
+outright (the product forms) bypasses the ledger, so balances only cover
+changes made through it.
+
+``deduct_many`` takes stock from several products at once - one UPDATE
+with a CASE over the products, one bulk INSERT of the entries - for the
+material deduction planner, which deducts all materials of an order
+together.
+"""
+
+from decimal import ROUND_CEILING, Decimal
+import logging
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .change_feed_manager import ChangeFeed
+from .models import InventoryTransaction, Product
+
+logger = logging.getLogger(__name__)
+
+# How often a clamped deduction retries when others change the stock meanwhile
+CLAMP_ATTEMPTS = 5
+
+
+def whole_units(amount):
+    """``amount`` rounded up to whole stock units"""
+    return int(Decimal(str(amount)).to_integral_value(rounding=ROUND_CEILING))
+
+
+def _supports_update_returning():
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+    )
+
+
+def _apply(pk, delta):
+    """Add ``delta`` to product ``pk``'s stock unless that takes it below zero; the new stock or None"""
+    now = timezone.now()
+    if _supports_update_returning():
+        # One round trip: conditional change and read back in the same statement
+        qn = connection.ops.quote_name
+        column = {name: qn(Product._meta.get_field(name).column) for name in (
+            'id', 'quantity', 'current_quantity_in_stock', 'updated_at',
+        )}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(Product._meta.db_table)} SET {column['quantity']} = {column['quantity']} + %s, "
+                f"{column['current_quantity_in_stock']} = {column['quantity']} + %s, {column['updated_at']} = %s "
+                f"WHERE {column['id']} = %s AND {column['quantity']} >= %s RETURNING {column['quantity']}",
+                [delta, delta, now, pk, -delta]
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    updated = Product.objects.filter(pk=pk, quantity__gte=-delta).update(
+        quantity=F('quantity') + delta,
+        current_quantity_in_stock=F('quantity') + delta,
+        updated_at=now,
+    )
+    if not updated:
+        return None
+    # The update holds the row lock until commit, so this reads our own result
+    return Product.objects.filter(pk=pk).values_list('quantity', flat=True).get()
+
+
+def _apply_many(deltas):
+    """
+    ``_apply`` for several products in one statement; ``deltas`` maps pk to
+    change. Returns the new stock of the products changed (those whose
+    change would not take them below zero).
+    """
+    if not _supports_update_returning():
+        balances = {}
+        for pk, delta in deltas.items():
+            balance = _apply(pk, delta)
+            if balance is not None:
+                balances[pk] = balance
+        return balances
+
+    qn = connection.ops.quote_name
+    column = {name: qn(Product._meta.get_field(name).column) for name in (
+        'id', 'quantity', 'current_quantity_in_stock', 'updated_at',
+    )}
+    pks = list(deltas)
+    case = f"CASE {column['id']} " + ' '.join(['WHEN %s THEN %s'] * len(pks)) + ' END'
+    case_params = [value for pk in pks for value in (pk, deltas[pk])]
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {qn(Product._meta.db_table)} SET {column['quantity']} = {column['quantity']} + {case}, "
+            f"{column['current_quantity_in_stock']} = {column['quantity']} + {case}, {column['updated_at']} = %s "
+            f"WHERE {column['id']} IN ({placeholders}) AND {column['quantity']} + {case} >= 0 "
+            f"RETURNING {column['id']}, {column['quantity']}",
+            case_params + case_params + [timezone.now()] + pks + case_params
+        )
+        return dict(cursor.fetchall())
+
+
+class InventoryLedger:
+    """
+    Atomic stock changes, each recorded as an InventoryTransaction
+    """
+
+    @staticmethod
+    def adjust(product, delta, transaction_type, reference_order=None, notes='', clamp=False):
+        """
+        Change ``product``'s stock by ``delta`` whole units and record it.
+
+        Returns the new InventoryTransaction, or None if nothing changed:
+        ``delta`` is 0, or a deduction exceeds the stock on hand. With
+        ``clamp`` such a deduction takes whatever is left instead (the entry
+        records what was actually taken). ``product.quantity`` is refreshed
+        either way the change goes through.
+        """
+        delta = int(delta)
+        if not delta:
+            return None
+
+        requested = delta
+        with transaction.atomic():
+            balance = _apply(product.pk, delta)
+            attempts = 0
+            while balance is None and clamp and delta < 0 and attempts < CLAMP_ATTEMPTS:
+                attempts += 1
+                on_hand = Product.objects.filter(pk=product.pk).values_list('quantity', flat=True).first()
+                if not on_hand:
+                    break
+                # Conditional again: another writer may take stock in between
+                delta = -min(on_hand, -requested)
+                balance = _apply(product.pk, delta)
+            if balance is None:
+                logger.warning(f"[INVENTORY_LEDGER] Insufficient stock for {product.name}: change of {requested} refused")
+                return None
+
+            # The conditional UPDATE sends no signals
+            ChangeFeed.record(Product, [product.pk])
+            entry = InventoryTransaction.objects.create(
+                product=product,
+                transaction_type=transaction_type,
+                quantity=delta,
+                balance_after=balance,
+                reference_order=reference_order,
+                notes=notes,
+            )
+
+        product.quantity = product.current_quantity_in_stock = balance
+        if product.product_type == 'material':
+            # The pickers list stock; drop them once the change is visible
+            from .catalog_cache_manager import CatalogCache
+            transaction.on_commit(CatalogCache.bump)
+        return entry
+
+    @staticmethod
+    def deduct(product, amount, reference_order=None, notes='', transaction_type='out'):
+        """Take ``amount`` (rounded up to whole units) out of stock if that much is on hand"""
+        units = whole_units(amount)
+        if units <= 0:
+            return None
+        return InventoryLedger.adjust(product, -units, transaction_type, reference_order=reference_order, notes=notes)
+
+    @staticmethod
+    def deduct_many(deductions, reference_order=None, transaction_type='out'):
+        """
+        Take several amounts out of stock with one UPDATE and record them
+        with one INSERT.
+
+        ``deductions`` is a list of (product, amount, notes); amounts are
+        rounded up to whole units like ``deduct``. Amounts of the same
+        product are taken together, or not at all when their total exceeds
+        the stock. Returns the entries in ``deductions`` order, None where
+        nothing was taken.
+        """
+        wanted = [whole_units(amount) for _, amount, _ in deductions]
+        totals = {}
+        for (product, _, _), units in zip(deductions, wanted):
+            if units > 0:
+                totals[product.pk] = totals.get(product.pk, 0) + units
+        if not totals:
+            return [None] * len(deductions)
+
+        with transaction.atomic():
+            balances = _apply_many({pk: -units for pk, units in totals.items()})
+            ChangeFeed.record(Product, balances)
+            # Walk each product's balance down through its entries in order
+            running = {pk: balance + totals[pk] for pk, balance in balances.items()}
+            entries = []
+            for (product, _, notes), units in zip(deductions, wanted):
+                if units <= 0 or product.pk not in balances:
+                    entries.append(None)
+                    continue
+                running[product.pk] -= units
+                entries.append(InventoryTransaction(
+                    product=product,
+                    transaction_type=transaction_type,
+                    quantity=-units,
+                    balance_after=running[product.pk],
+                    reference_order=reference_order,
+                    notes=notes,
+                ))
+            created = [entry for entry in entries if entry is not None]
+            InventoryTransaction.objects.bulk_create(created)
+            for entry in created:
+                # bulk_create sends no post_save; the activity log and the
+                # order category summaries listen for new entries
+                post_save.send(
+                    sender=InventoryTransaction, instance=entry, created=True,
+                    update_fields=None, raw=False, using=entry._state.db,
+                )
+
+        refused = set()
+        for (product, _, _), units in zip(deductions, wanted):
+            if product.pk in balances:
+                product.quantity = product.current_quantity_in_stock = balances[product.pk]
+            elif units > 0 and product.pk not in refused:
+                refused.add(product.pk)
+                logger.warning(
+                    f"[INVENTORY_LEDGER] Insufficient stock for {product.name}: deduction of {totals[product.pk]} refused"
+                )
+        if any(entry.product.product_type == 'material' for entry in created):
+            from .catalog_cache_manager import CatalogCache
+            transaction.on_commit(CatalogCache.bump)
+        return entries
+
+    @staticmethod
+    def add(product, amount, reference_order=None, notes='', transaction_type='in'):
+        """Put ``amount`` whole units back into stock"""
+        return InventoryLedger.adjust(product, int(amount), transaction_type, reference_order=reference_order, notes=notes)
+
+    @staticmethod
+    def stock_at(product, when):
+        """
+        Stock of ``product`` at ``when``, from the nearest ledger balance:
+        the last entry up to then, else the balance before its first later
+        entry, else (no ledger history) the current stock.
+        """
+        entries = InventoryTransaction.objects.filter(product=product, balance_after__isnull=False)
+        before = entries.filter(created_at__lte=when).order_by('-created_at', '-pk').values_list(
+            'balance_after', flat=True
+        ).first()
+        if before is not None:
+            return before
+        after = entries.filter(created_at__gt=when).order_by('created_at', 'pk').values_list(
+            'balance_after', 'quantity'
+        ).first()
+        if after is not None:
+            return max(0, after[0] - after[1])
+        return Product.objects.filter(pk=product.pk).values_list('quantity', flat=True).get()
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from business.customize_product_manager import image_fingerprints
+from business.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Store content and perceptual hashes for product images saved before fingerprints existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Images read and hashed in parallel (default 8)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Products written per update (default 200)')
+        parser.add_argument('--all', action='store_true', help='Rehash every image, not only those without a hash')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image')
+        if not options['all']:
+            products = products.filter(image_hash='')
+        total = products.count()
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Every product image already has fingerprints'))
+            return
+
+        self.stdout.write(f'Hashing {total} image(s) with {options["workers"]} worker(s)...')
+        ids = list(products.order_by('pk').values_list('pk', flat=True))
+        size = max(1, options['batch_size'])
+        hashed = missing = 0
+
+        def fingerprint(product):
+            # Storage reads and hashing release the GIL, so threads overlap them
+            product.image_hash, product.image_phash = image_fingerprints(product.image)
+            return product
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for start in range(0, len(ids), size):
+                chunk = Product.objects.filter(pk__in=ids[start:start + size]).only('pk', 'image')
+                batch = [product for product in pool.map(fingerprint, chunk) if product.image_hash]
+                Product.objects.bulk_update(batch, ['image_hash', 'image_phash'])
+                hashed += len(batch)
+                missing += len(chunk) - len(batch)
+                self.stdout.write(f'  {min(start + size, len(ids))}/{len(ids)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Stored fingerprints for {hashed} image(s)'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} image file(s) could not be read and were left unhashed'))
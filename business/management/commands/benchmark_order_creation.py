@@ -0,0 +1,109 @@
+from decimal import Decimal
+import json
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+
+from business.benchmark_manager import percentile
+from business.models import Order, Product
+from business.query_stats_manager import QueryRecorder
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order creation through the order-entry API: throughput, latency and queries per order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200, help='Orders to create (default 200)')
+        parser.add_argument('--items', type=int, default=10, help='Items per order (default 10)')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--keep', action='store_true', help='Keep the created orders and products')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(max(1, options['orders']), max(1, options['items']), options['host'])
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back')
+
+    def _seed(self, item_count):
+        run = uuid.uuid4().hex[:6]
+        names = [f'Bench {run} {i}' for i in range(item_count)]
+        Product.objects.bulk_create([
+            Product(name=f'Repair - {name}', product_type='service', price=Decimal('150.00'), quantity=0)
+            for name in names
+        ])
+        user = User.objects.create_user(username=f'bench-{run}', password=uuid.uuid4().hex)
+        return names, user
+
+    def _payload(self, names, number):
+        return {
+            'customerName': f'Benchmark Customer {number % 50}',
+            'mobileNumber': f'0917{number % 50:07d}',
+            'orderType': 'repair',
+            'totalCost': 150 * len(names),
+            'items': [{'name': name, 'quantity': 1, 'cost': 150, 'class': 'standard'} for name in names],
+            'idempotencyKey': uuid.uuid4().hex,
+        }
+
+    def _post(self, client, payload):
+        """One create request; return (ms, queries, response JSON)"""
+        with QueryRecorder() as recorder:
+            started = time.perf_counter()
+            response = client.post('/api/orders/create/', data=json.dumps(payload), content_type='application/json')
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, recorder.count, response.json()
+
+    def _run(self, order_count, item_count, host):
+        names, user = self._seed(item_count)
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        before = Order.objects.count()
+
+        # Untimed first order: builds the catalogs and caches the rest rely on
+        self._post(client, self._payload(names, 0))
+
+        payloads = [self._payload(names, number) for number in range(1, order_count + 1)]
+        timings, queries, failures = [], [], []
+        started = time.perf_counter()
+        for payload in payloads:
+            elapsed, count, result = self._post(client, payload)
+            timings.append(elapsed)
+            queries.append(count)
+            if not result.get('success'):
+                failures.append(result.get('error'))
+        wall = time.perf_counter() - started
+
+        # Replays of the same submissions return the orders already created
+        retry_timings = []
+        for payload in payloads[:max(1, order_count // 10)]:
+            elapsed, _, result = self._post(client, payload)
+            retry_timings.append(elapsed)
+            if not result.get('duplicate'):
+                failures.append(f'Retry created order {result.get("order_identifier")}')
+
+        created = Order.objects.count() - before - 1
+        self.stdout.write(f'{order_count} order(s) of {item_count} item(s) in {wall:.2f}s')
+        self.stdout.write(f'  Throughput:      {order_count / wall:8.1f} orders/s')
+        self.stdout.write(
+            f'  Latency:         p50 {percentile(timings, 50):.1f}ms, p95 {percentile(timings, 95):.1f}ms, '
+            f'mean {statistics.fmean(timings):.1f}ms'
+        )
+        self.stdout.write(f'  Queries/order:   {max(queries)} (min {min(queries)})')
+        self.stdout.write(f'  Retried (dup):   p50 {percentile(retry_timings, 50):.1f}ms over {len(retry_timings)} replay(s)')
+        if failures or created != order_count:
+            self.stdout.write(self.style.ERROR(
+                f'{len(failures)} failure(s), {created} order(s) created for {order_count}: {failures[:3]}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{created} orders created once each; retries returned them'))
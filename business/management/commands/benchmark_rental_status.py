@@ -0,0 +1,147 @@
+from datetime import timedelta
+from decimal import Decimal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from business.models import Customer, Order, OrderItem, Product
+from business.rental_manager import RentalStatusResolver
+from business.rental_state_manager import ACTIVE_RENTAL_STATUSES, RENTAL_ORDER_TYPES
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rental status resolution against the old per-product lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Rental products to create')
+        parser.add_argument('--rentals', type=int, default=50000, help='Historical rental orders to create')
+        parser.add_argument(
+            '--active-share',
+            type=float,
+            default=0.3,
+            help='Share of products currently out on an active rental',
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the generated data')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options['products'], options['rentals'], options['active_share'])
+                self._run()
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back')
+
+    def _seed(self, product_count, rental_count, active_share):
+        started = time.perf_counter()
+        now = timezone.now()
+        customer = Customer.objects.create(name='Benchmark Customer', phone='09000000000')
+
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Benchmark Gown {i}',
+                product_type='rental',
+                price=Decimal('1500.00'),
+                quantity=1,
+            )
+            for i in range(product_count)
+        ], batch_size=1000)
+
+        active_products = int(product_count * active_share)
+        orders = []
+        order_products = []
+        for i in range(rental_count):
+            product_index = i % product_count
+            # The last rental of the first active_products products is still out
+            is_active = i >= rental_count - product_count and product_index < active_products
+            created_at = now - timedelta(days=(rental_count - i) // product_count * 7 + 3)
+            orders.append(Order(
+                order_identifier=f'BENCH-{i}',
+                customer=customer,
+                order_type='rental',
+                status='rented' if is_active else 'returned',
+                total_amount=Decimal('1500.00'),
+                # Spread active due dates over overdue, almost due and rented
+                due_date=now + timedelta(hours=(product_index % 6) * 24 - 36) if is_active else created_at,
+            ))
+            order_products.append(products[product_index])
+
+        orders = Order.objects.bulk_create(orders, batch_size=1000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, unit_price=order.total_amount,
+                      total_price=order.total_amount)
+            for order, product in zip(orders, order_products)
+        ], batch_size=1000)
+
+        self.stdout.write(
+            f'Seeded {product_count} rental products and {rental_count} rentals '
+            f'({active_products} active) in {time.perf_counter() - started:.1f}s'
+        )
+
+    def _run(self):
+        products = Product.objects.filter(product_type='rental', is_active=True, is_archived=False)
+
+        resolver_time, resolver_queries, resolved = self._measure(RentalStatusResolver.resolve, products)
+        baseline_time, baseline_queries, baseline = self._measure(self._per_product_baseline, products)
+
+        mismatched = [pk for pk, is_rented in baseline.items() if resolved[pk]['is_rented'] != is_rented]
+        states = {}
+        for info in resolved.values():
+            state = 'almost_due' if info['is_almost_due'] else info['rental_status']
+            states[state] = states.get(state, 0) + 1
+
+        self.stdout.write(f'Resolved {len(resolved)} products: {states}')
+        self.stdout.write(
+            f'  Resolver:            {resolver_time * 1000:8.1f}ms, {resolver_queries} query(ies)'
+        )
+        self.stdout.write(
+            f'  Per-product lookups: {baseline_time * 1000:8.1f}ms, {baseline_queries} query(ies)'
+        )
+        if mismatched:
+            self.stdout.write(
+                self.style.ERROR(f'{len(mismatched)} product(s) resolved differently, e.g. {mismatched[:5]}')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Results match; {baseline_time / max(resolver_time, 1e-9):.1f}x faster')
+            )
+
+    def _measure(self, func, *args):
+        """Return (seconds, queries, result) of one call"""
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            result = func(*args)
+        return time.perf_counter() - started, len(queries), result
+
+    def _per_product_baseline(self, products):
+        """The lookups RentalStatusManager made before the resolver: up to two queries per product"""
+        rented = {}
+        for product in products:
+            item = OrderItem.objects.filter(
+                product=product,
+                order__order_type__in=RENTAL_ORDER_TYPES,
+                order__status__in=ACTIVE_RENTAL_STATUSES,
+            ).select_related('order').order_by('-order__created_at').first()
+            if item is None:
+                item = Order.objects.filter(
+                    items__product=product,
+                    order_type__in=RENTAL_ORDER_TYPES,
+                    status__in=ACTIVE_RENTAL_STATUSES,
+                ).first()
+            rented[product.pk] = bool(
+                item or product.current_rental_order_id or product.rental_status == 'rented'
+            )
+        return rented
@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from business.benchmark_manager import BENCHMARK_TARGETS, REGRESSION_THRESHOLD, ViewBenchmark, compare
+
+
+class Command(BaseCommand):
+    help = 'Time the main views and APIs (p50/p95 latency, query counts) and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per view (default 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view first (default 2)')
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            default=None,
+            help=f'Only these views, from: {", ".join(label for label, _, _ in BENCHMARK_TARGETS)}',
+        )
+        parser.add_argument('--user', default=None, help='Username to log in as (default: first superuser)')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='JSON file to write (default: benchmarks/views-<commit>.json)',
+        )
+        parser.add_argument('--compare', default=None, help='Earlier JSON report to compare against')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=REGRESSION_THRESHOLD,
+            help='Relative p50 change that counts as slower/faster (default 0.10)',
+        )
+
+    def handle(self, *args, **options):
+        user = self._user(options['user'])
+
+        targets = BENCHMARK_TARGETS
+        if options['views']:
+            unknown = set(options['views']) - {label for label, _, _ in BENCHMARK_TARGETS}
+            if unknown:
+                raise CommandError(f'Unknown view(s): {", ".join(sorted(unknown))}')
+            targets = [target for target in BENCHMARK_TARGETS if target[0] in options['views']]
+
+        benchmark = ViewBenchmark(
+            user, targets=targets, repeat=options['repeat'], warmup=options['warmup'], host=options['host']
+        )
+        self.stdout.write(f'{"view":<24}{"p50 ms":>10}{"p95 ms":>10}{"queries":>9}  status')
+        report = benchmark.run(progress=self._print_row)
+
+        output = Path(options['output'] or f'benchmarks/views-{report["commit"] or "unknown"}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
+
+        if options['compare']:
+            previous = json.loads(Path(options['compare']).read_text())
+            self._print_comparison(previous, report, options['threshold'])
+
+    def _user(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = users.filter(is_superuser=True).order_by('pk').first() or users.filter(is_staff=True).order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to log in as; pass --user or create a superuser')
+        return user
+
+    def _print_row(self, label, result):
+        status = ','.join(str(code) for code in result['status'])
+        style = self.style.SUCCESS if result['status'] == [200] else self.style.WARNING
+        self.stdout.write(
+            f'{label:<24}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}{result["queries"]:>9}  '
+            + style(status)
+        )
+
+    def _print_comparison(self, previous, report, threshold):
+        self.stdout.write(f'\nAgainst {previous.get("commit") or "previous run"}:')
+        slower = 0
+        for row in compare(previous, report, threshold=threshold):
+            line = (
+                f'{row["view"]:<24}{row["p50_before"]:>9.1f} -> {row["p50_after"]:<9.1f}'
+                f'{row["change"]:>+8.0%}   queries {row["queries_before"]} -> {row["queries_after"]}'
+            )
+            if row['verdict'] == 'slower':
+                slower += 1
+                self.stdout.write(self.style.WARNING(line))
+            elif row['verdict'] == 'faster':
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(line)
+        if slower:
+            self.stdout.write(self.style.WARNING(f'{slower} view(s) slower or running more queries'))
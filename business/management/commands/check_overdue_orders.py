@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from business.views import check_and_update_overdue_orders
+from business.rental_state_manager import RentalStateManager
 
 
 class Command(BaseCommand):
@@ -7,12 +7,16 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         try:
-            updated_count = check_and_update_overdue_orders()
-            
-            if updated_count > 0:
+            stats = RentalStateManager.run_tick()
+
+            if stats is None:
+                self.stdout.write(
+                    self.style.WARNING('Another rental status update is running, skipped')
+                )
+            elif stats['orders_overdue'] > 0:
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f'Successfully updated {updated_count} overdue order(s)'
+                        f'Successfully updated {stats["orders_overdue"]} overdue order(s)'
                     )
                 )
             else:
@@ -24,5 +28,3 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.ERROR(f'Error checking overdue orders: {str(e)}')
             )
-
-
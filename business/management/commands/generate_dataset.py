@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from business.dataset_manager import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generate a seeded synthetic shop history (orders, items, stock, sales, activity) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000, help='Orders to generate (default 10000)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed gives the same data')
+        parser.add_argument(
+            '--customers',
+            type=int,
+            default=None,
+            help='Customers to generate (default: one per 8 orders)',
+        )
+        parser.add_argument('--rental-products', type=int, default=200, help='Rental items to generate')
+        parser.add_argument('--material-products', type=int, default=60, help='Material products to generate')
+        parser.add_argument('--staff', type=int, default=8, help='Staff accounts orders are assigned to')
+        parser.add_argument('--years', type=int, default=3, help='Years of history the orders span')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Orders written per transaction')
+
+    def handle(self, *args, **options):
+        generator = DatasetGenerator(
+            orders=options['orders'],
+            seed=options['seed'],
+            customers=options['customers'],
+            rental_products=options['rental_products'],
+            material_products=options['material_products'],
+            staff=options['staff'],
+            years=options['years'],
+            batch_size=options['batch_size'],
+            progress=self.stdout.write,
+        )
+        try:
+            counts = generator.generate()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error generating dataset: {str(e)}'))
+            return
+
+        for kind, count in counts.items():
+            self.stdout.write(f'  {kind}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset with seed {options["seed"]}'))
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from business.image_rendition_manager import ImageRenditions, image_fields
+
+
+class Command(BaseCommand):
+    help = 'Render thumbnails and WebP copies of product, customize, staff and landing page images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Images rendered in parallel (default 4)')
+        parser.add_argument('--all', action='store_true', help='Re-render images that already have renditions')
+        parser.add_argument('--prune', action='store_true', help='Also delete renditions whose source image is gone')
+
+    def handle(self, *args, **options):
+        fields = []
+        for model, field_name in image_fields():
+            names = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .order_by().values_list(field_name, flat=True).distinct()
+            )
+            field = model._meta.get_field(field_name)
+            fields.extend(field.attr_class(None, field, name) for name in names)
+        if not fields:
+            self.stdout.write(self.style.SUCCESS('No images to render'))
+        else:
+            self.stdout.write(f'Checking {len(fields)} image(s) with {options["workers"]} worker(s)...')
+
+        def render(field):
+            # Pillow releases the GIL while decoding and encoding, so threads overlap
+            if not options['all'] and ImageRenditions.manifest(field, generate=False) is not None:
+                return 'current'
+            return 'rendered' if ImageRenditions.generate(field) is not None else 'failed'
+
+        counts = {'current': 0, 'rendered': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for outcome in pool.map(render, fields):
+                counts[outcome] += 1
+
+        if fields:
+            self.stdout.write(self.style.SUCCESS(
+                f'Rendered {counts["rendered"]} image(s); {counts["current"]} already up to date'
+            ))
+        if counts['failed']:
+            self.stdout.write(self.style.WARNING(f'{counts["failed"]} image file(s) are missing or unreadable'))
+
+        if options['prune']:
+            pruned = ImageRenditions.prune()
+            self.stdout.write(self.style.SUCCESS(f'Pruned renditions of {pruned} removed image(s)'))
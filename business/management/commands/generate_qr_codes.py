@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from business.models import Order
+from business.qr_code_manager import QRCodeManager
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or outdated order QR codes in bulk, encoding images in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=None,
+            help='Worker processes for encoding images (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--include-archived',
+            action='store_true',
+            help='Also generate codes for archived orders',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Delete QR images no order uses any more',
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.select_related('customer').order_by('pk')
+        if not options['include_archived']:
+            orders = orders.filter(is_archived=False)
+
+        try:
+            updated, written = QRCodeManager.ensure_many(
+                orders.iterator(chunk_size=500),
+                processes=options['processes'],
+            )
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error generating QR codes: {str(e)}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Updated {updated} QR code(s), encoded {written} new image(s)')
+        )
+
+        if options['prune']:
+            pruned = QRCodeManager.prune()
+            self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} unused QR image(s)'))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from business.sms_outbox_manager import SMSOutbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued SMS messages through the gateway (run from cron, or with --loop as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep draining the outbox instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=10,
+            help='Seconds between drains with --loop (default 10)',
+        )
+
+    def handle(self, *args, **options):
+        if not SMSOutbox.configured():
+            self.stdout.write(self.style.ERROR(
+                'SMS gateway not configured: set SMS_GATEWAY_URL and SMS_GATEWAY_PASSWORD. Messages stay queued.'
+            ))
+            return
+
+        while True:
+            try:
+                stats = SMSOutbox.drain()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Error processing SMS outbox: {str(e)}'))
+                stats = None
+
+            if stats is not None:
+                if stats['claimed']:
+                    self.stdout.write(
+                        f'Sent {stats["sent"]}, retrying {stats["retried"]}, failed {stats["failed"]} '
+                        f'of {stats["claimed"]} message(s)'
+                    )
+                if stats['failed']:
+                    self.stdout.write(self.style.WARNING(f'{stats["failed"]} message(s) gave up, see last_error'))
+                elif not options['loop']:
+                    self.stdout.write(self.style.SUCCESS('SMS outbox drained'))
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
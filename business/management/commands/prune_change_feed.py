@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from business.change_feed_manager import ChangeFeed
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than CHANGE_FEED_RETENTION_DAYS (run daily from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Keep this many days instead of CHANGE_FEED_RETENTION_DAYS',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            deleted = ChangeFeed.prune(options['days'])
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error pruning the change feed: {str(e)}'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change feed entr{"y" if deleted == 1 else "ies"}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from business.form_draft_manager import FormDrafts
+
+
+class Command(BaseCommand):
+    help = 'Delete expired auto-save form drafts (run daily from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activity-log',
+            action='store_true',
+            help='Also delete the activity log rows written by auto-save syncs before form drafts existed',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            deleted = FormDrafts.prune()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired draft(s)'))
+            if options['activity_log']:
+                purged = FormDrafts.purge_activity_log()
+                self.stdout.write(self.style.SUCCESS(f'Deleted {purged} auto-save activity log row(s)'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error pruning form drafts: {str(e)}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from business.rollup_manager import SalesRollupManager
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily order and sales rollup tables from scratch'
+
+    def handle(self, *args, **options):
+        try:
+            order_rows, sales_rows = SalesRollupManager.rebuild_all()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Rebuilt {order_rows} daily order row(s) and {sales_rows} daily sales row(s)'
+                )
+            )
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error rebuilding rollups: {str(e)}')
+            )
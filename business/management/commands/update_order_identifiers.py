@@ -5,7 +5,7 @@ Management command to update all existing order identifiers to the new format:
 - Customize: TS01CUST-O1, TS01CUST-O2, etc.
 """
 from django.core.management.base import BaseCommand
-from business.models import Order
+from business.models import IdentifierSequence, Order
 from collections import defaultdict
 
 
@@ -102,6 +102,15 @@ class Command(BaseCommand):
         # Count skipped orders
         total_skipped = all_orders.count() - total_updated
         
+        # Keep the identifier sequences ahead of the renumbered identifiers
+        if not dry_run:
+            for prefix in set(prefix_map.values()):
+                highest = IdentifierSequence.highest_number(
+                    Order.objects.filter(order_identifier__startswith=f"{prefix}-").values_list('order_identifier', flat=True),
+                    prefix
+                )
+                IdentifierSequence.sync(prefix, highest)
+        
         self.stdout.write('')
         self.stdout.write('=' * 60)
         if dry_run:
@@ -0,0 +1,272 @@
+"""
+Material attribute catalog
+==========================
+Material products describe themselves in free text - the material form
+writes descriptions like ``"Brand: Coats; Color: Red; Length: 500m; ..."``
+- and the repair/customize deduction code used to find "red Coats thread"
+by loading every thread product and substring-matching that text.
+
+Product.save() now parses the description once into the structured,
+indexed ``material_kind/subtype/color/brand/size`` columns, and
+MaterialCatalogManager answers attribute lookups from an in-process index
+of those columns, so finding a material is a dict lookup plus one
+primary-key fetch instead of a scan of the inventory.
+"""
+
+import logging
+import re
+import threading
+import time
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Canonical material kinds and the MaterialType / product name keywords
+# that identify them, checked in order
+MATERIAL_KIND_KEYWORDS = [
+    ('fabric', ['fabric']),
+    ('thread', ['thread']),
+    ('button', ['button']),
+    ('garter', ['garter', 'elastic']),
+    ('locks', ['lock', 'kawit']),
+    ('zipper', ['zipper']),
+    ('needle', ['needle']),
+    ('patch', ['patch']),
+]
+
+# Description labels written by MaterialProductForm, per attribute column
+ATTRIBUTE_LABELS = {
+    'material_subtype': ['type of fabric', 'button type', 'type'],
+    'material_color': ['color'],
+    'material_brand': ['brand'],
+    'material_size': ['size'],
+}
+
+CATALOG_FIELDS = ['material_kind', 'material_subtype', 'material_color', 'material_brand']
+
+# Attribute combinations the lookups index
+INDEXED_COMBINATIONS = [
+    (),
+    ('material_color',),
+    ('material_subtype', 'material_color'),
+    ('material_brand', 'material_color'),
+    ('material_subtype',),
+    ('material_brand',),
+]
+
+# Other processes' product saves are only seen after this many seconds
+CATALOG_TTL = 60
+
+
+def normalize_attribute(value):
+    """Lower-case an attribute value and fold '-', '_' and repeated spaces"""
+    if not value:
+        return ''
+    value = re.sub(r'[-_\s]+', ' ', str(value)).strip().lower()
+    return '' if value in ['n/a', 'none'] else value
+
+
+def material_kind(type_name, product_name=''):
+    """Canonical kind for a MaterialType name, falling back to the product name"""
+    for text in (type_name, product_name):
+        text = (text or '').lower()
+        for kind, keywords in MATERIAL_KIND_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return kind
+    return ''
+
+
+def parse_material_attributes(description):
+    """Pull the subtype/color/brand/size values out of a material description"""
+    labelled = {}
+    for part in (description or '').split(';'):
+        label, sep, value = part.partition(':')
+        if sep:
+            labelled.setdefault(label.strip().lower(), value.strip())
+
+    attributes = {}
+    for field, labels in ATTRIBUTE_LABELS.items():
+        value = next((labelled[label] for label in labels if labelled.get(label)), '')
+        attributes[field] = normalize_attribute(value)[:Product._meta.get_field(field).max_length]
+    return attributes
+
+
+class MaterialCatalogManager:
+    """
+    In-process index of active material products by kind and attributes
+    """
+
+    _lock = threading.Lock()
+    _index = None
+    _signatures = None
+    _built_at = 0
+
+    @staticmethod
+    def apply_attributes(product):
+        """Set a product's structured material columns from its type, name and description"""
+        if product.product_type != 'material':
+            product.material_kind = ''
+            for field in ATTRIBUTE_LABELS:
+                setattr(product, field, '')
+            return
+        type_name = product.material_type.name if product.material_type_id else ''
+        product.material_kind = material_kind(type_name, product.name)
+        for field, value in parse_material_attributes(product.description).items():
+            setattr(product, field, value)
+
+    @staticmethod
+    def _build():
+        index = {}
+        signatures = {}
+        rows = Product.objects.filter(
+            product_type='material',
+            is_active=True,
+            is_archived=False,
+        ).exclude(material_kind='').order_by('pk').values_list('pk', *CATALOG_FIELDS)
+
+        for pk, *values in rows:
+            attributes = dict(zip(CATALOG_FIELDS, values))
+            signatures[pk] = tuple(values)
+            for combination in INDEXED_COMBINATIONS:
+                key = (attributes['material_kind'],) + tuple(
+                    (field, attributes[field]) for field in combination
+                )
+                index.setdefault(key, pk)
+        return index, signatures
+
+    @staticmethod
+    def _catalog():
+        with MaterialCatalogManager._lock:
+            expired = time.monotonic() - MaterialCatalogManager._built_at > CATALOG_TTL
+            if MaterialCatalogManager._index is None or expired:
+                index, signatures = MaterialCatalogManager._build()
+                MaterialCatalogManager._index = index
+                MaterialCatalogManager._signatures = signatures
+                MaterialCatalogManager._built_at = time.monotonic()
+            return MaterialCatalogManager._index
+
+    @staticmethod
+    def material_type_changed(material_type):
+        """Re-derive the kind of a renamed MaterialType's products"""
+        products = list(Product.objects.filter(material_type=material_type).only(
+            'pk', 'name', 'product_type', 'material_kind'
+        ))
+        for product in products:
+            if product.product_type == 'material':
+                product.material_kind = material_kind(material_type.name, product.name)
+        Product.objects.bulk_update(products, ['material_kind'])
+        MaterialCatalogManager.invalidate()
+
+    @staticmethod
+    def invalidate():
+        """Drop the index; the next lookup rebuilds it"""
+        with MaterialCatalogManager._lock:
+            MaterialCatalogManager._index = None
+            MaterialCatalogManager._signatures = None
+
+    @staticmethod
+    def product_changed(product, deleted=False):
+        """Invalidate the index if a saved or deleted product changes what it holds"""
+        signatures = MaterialCatalogManager._signatures
+        if signatures is None:
+            return
+        listed = (
+            not deleted
+            and product.product_type == 'material'
+            and product.is_active
+            and not product.is_archived
+            and product.material_kind
+        )
+        if listed:
+            signature = tuple(getattr(product, field) for field in CATALOG_FIELDS)
+            if signatures.get(product.pk) == signature:
+                # Stock-only changes (deductions) keep the index valid
+                return
+        elif product.pk not in signatures:
+            return
+        MaterialCatalogManager.invalidate()
+
+    @staticmethod
+    def _fetch(pk):
+        return Product.objects.filter(
+            pk=pk,
+            product_type='material',
+            is_active=True,
+            is_archived=False,
+        ).select_related('material_type').first()
+
+    @staticmethod
+    def _keys(kind, subtype=None, color=None, brand=None, fallback=True):
+        # Same field order as INDEXED_COMBINATIONS
+        wanted = [
+            (field, normalize_attribute(value))
+            for field, value in (
+                ('material_subtype', subtype),
+                ('material_brand', brand),
+                ('material_color', color),
+            )
+            if normalize_attribute(value)
+        ]
+        if tuple(field for field, _ in wanted) not in INDEXED_COMBINATIONS:
+            # Subtype + brand (+ color) is not indexed; brand is the weaker hint
+            wanted = [item for item in wanted if item[0] != 'material_brand']
+
+        keys = [(kind,) + tuple(wanted)]
+        if fallback and wanted:
+            keys.append((kind,))
+        return keys
+
+    @staticmethod
+    def candidates(kind, subtype=None, color=None, brand=None, fallback=True):
+        """
+        Primary keys ``find`` would try, best match first, without fetching
+        them - for callers that load many materials in one query. The index
+        may be stale: a missing or archived row means ``invalidate`` and ask again.
+        """
+        catalog = MaterialCatalogManager._catalog()
+        keys = MaterialCatalogManager._keys(kind, subtype, color, brand, fallback)
+        return [catalog[key] for key in keys if key in catalog]
+
+    @staticmethod
+    def find(kind, subtype=None, color=None, brand=None, fallback=True):
+        """
+        Find an active material of ``kind`` matching the given attributes.
+
+        Empty attributes match anything. With ``fallback`` the first
+        material of the kind is returned when nothing matches exactly.
+        """
+        keys = MaterialCatalogManager._keys(kind, subtype, color, brand, fallback)
+        for _ in range(2):
+            for key in keys:
+                pk = MaterialCatalogManager._catalog().get(key)
+                if pk is None:
+                    continue
+                product = MaterialCatalogManager._fetch(pk)
+                if product:
+                    return product
+                # Archived or deleted by another process: rebuild and retry
+                break
+            else:
+                return None
+            MaterialCatalogManager.invalidate()
+        return None
+
+    @staticmethod
+    def _kind_queryset(kind):
+        return Product.objects.filter(
+            material_kind=kind,
+            product_type='material',
+            is_active=True,
+            is_archived=False,
+        )
+
+    @staticmethod
+    def best_stocked(kind):
+        """The active material of ``kind`` with the most stock"""
+        return MaterialCatalogManager._kind_queryset(kind).order_by('-quantity', 'pk').first()
+
+    @staticmethod
+    def in_stock(kind):
+        """Whether any active material of ``kind`` has stock left"""
+        return MaterialCatalogManager._kind_queryset(kind).filter(quantity__gt=0).exists()
@@ -0,0 +1,523 @@
+"""
+Material deduction planner
+==========================
+Creating a repair or customize order deducted its materials one at a
+time: the selected zipper or garter was loaded by pk, its thread was
+looked up again by colour, each amount was converted to the product's
+unit in one of three places and taken out with its own UPDATE and
+InventoryTransaction INSERT - up to a dozen round trips per order, spread
+over two long view functions, while the availability check before
+submitting re-implemented the rules a third time (and disagreed: it
+compared button pieces with stock kept in groups).
+
+The planner splits the work into steps over one description of what an
+order uses:
+
+- ``needs`` turns the order form data into MaterialNeed objects (which
+  material, how much of it in which unit) without touching the database;
+- ``resolve`` finds the products of all needs with one query - selected
+  products by pk together with MaterialCatalogManager's index hits and
+  the candidates for "best stocked" - and converts each amount to its
+  product's unit in memory;
+- ``apply`` deducts everything through ``InventoryLedger.deduct_many``
+  (one conditional UPDATE for all products, one INSERT of the ledger
+  entries) in a transaction, and ``check`` is the dry run behind the
+  availability API, comparing the same amounts with the stock ``resolve``
+  read.
+
+Thread is only taken when the material it sews on was, so needs that
+follow another are deducted in a second round once the first went
+through.
+"""
+
+from decimal import Decimal, InvalidOperation
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+
+from .inventory_ledger_manager import InventoryLedger, whole_units
+from .material_catalog_manager import MaterialCatalogManager
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Display name and shortage wording per material kind
+MATERIAL_LABELS = {
+    'zipper': ('Zipper', 'zipper length'),
+    'button': ('Button', 'buttons'),
+    'locks': ('Lock/Kawit', 'lock/kawit groups'),
+    'garter': ('Garter', 'garter length'),
+    'patch': ('Patch', 'patches'),
+    'fabric': ('Fabric', 'fabric'),
+    'thread': ('Thread', 'thread'),
+}
+
+# Placeholder amount and message when nothing is selected and the kind is out of stock
+UNSELECTED_MESSAGES = {
+    'zipper': (1, 'No zippers available in inventory. Please select a zipper or mark as provided.'),
+    'button': (4, 'No buttons available in inventory. Please select a button or mark as provided.'),
+    'locks': (1, 'No locks/kawit available in inventory. Please select a lock/kawit.'),
+    'garter': (0.85, 'No garters available in inventory. Please select a garter.'),
+}
+
+# Conversions from the unit an amount is given in to the product's unit:
+# (amount unit, words in the product unit, factor), first match wins
+UNIT_CONVERSIONS = [
+    ('meters', ('cm', 'centimeter'), Decimal('100')),
+    ('meters', ('yard',), Decimal('1.09361')),
+    ('yards', ('meter',), Decimal('0.9144')),
+    ('inches', ('cm', 'centimeter'), Decimal('2.54')),
+    ('cm', ('inch',), Decimal('0.393701')),
+    # 1 group = 8 pieces
+    ('pieces', ('group',), Decimal('0.125')),
+]
+
+# Repairs that always use thread, with the usual meters (min, max) when the form has none
+THREAD_METERS_RANGES = {
+    'ambel': (1.5, 3.0),
+    'baston': (2.0, 4.0),
+    'baston_suklot': (3.0, 5.0),
+    'baston_putol': (4.0, 6.0),
+    'putol': (0.5, 3.0),
+    'suklot': (2.0, 4.0),
+    'pasada': (2.0, 4.0),
+    'bewang': (3.0, 6.0),
+    'elastic': (4.0, 6.0),
+    'general_repair': (1.0, 3.0),
+    'general_tshirt_repair': (1.0, 2.0),
+}
+DEFAULT_THREAD_METERS = 2.0
+
+
+def calculate_thread_for_zipper(zipper_inches):
+    """
+    Calculate thread needed for zipper repair.
+    Thread needed = 2.5 × zipper length in meters
+    """
+    # Convert inches to meters (1 inch = 0.0254 meters)
+    zipper_meters = Decimal(str(zipper_inches)) * Decimal('0.0254')
+    return float(zipper_meters * Decimal('2.5'))
+
+
+def convert_amount(amount, unit, product_unit):
+    """``amount`` given in ``unit`` expressed in ``product_unit`` (unchanged when no conversion applies)"""
+    amount = Decimal(str(amount))
+    product_unit = (product_unit or '').lower()
+    for source, words, factor in UNIT_CONVERSIONS:
+        if unit == source and any(word in product_unit for word in words):
+            return amount * factor
+    return amount
+
+
+def _number(value):
+    if value in (None, '', 'N/A'):
+        return None
+    try:
+        return float(Decimal(str(value)))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _text(data, *keys):
+    for key in keys:
+        value = data.get(key)
+        if value and str(value).strip():
+            return str(value).strip()
+    return ''
+
+
+class MaterialNeed:
+    """
+    One material an order uses: how to find the product and how much of it
+    """
+
+    def __init__(self, kind, amount, unit, note='', summary='', pk=None, attributes=None,
+                 best_stocked=False, follows=None, required=True, unselected_message=None):
+        self.kind = kind
+        self.amount = amount
+        self.unit = unit
+        self.note = note  # ledger entry notes
+        self.summary = summary  # "Zipper: 7 inches" in the order's deduction log
+        self.pk = pk  # product selected in the order form
+        self.attributes = attributes  # subtype/color/brand for a catalog lookup
+        self.best_stocked = best_stocked
+        self.follows = follows  # only deducted if this other need was
+        self.required = required  # reported by the dry run when short
+        # Nothing selected: the dry run only checks that the kind has stock
+        self.unselected_message = unselected_message
+        self.product = None
+        self.units = 0  # amount in the product's unit, whole units
+
+    @property
+    def check_only(self):
+        return self.unselected_message is not None
+
+    @property
+    def title(self):
+        return MATERIAL_LABELS.get(self.kind, (self.kind.title(), self.kind))[0]
+
+
+def _selected(kind, data, id_keys, amount_keys, unit, note, summary, check_unselected=True):
+    """Need for the product picked in the order form; a stock check when nothing is picked"""
+    pk = _text(data, *id_keys)
+    amount = _number(_text(data, *amount_keys))
+    if pk and amount:
+        return MaterialNeed(kind, amount, unit, note=note(amount), summary=summary(amount), pk=pk)
+    if not pk and check_unselected and kind in UNSELECTED_MESSAGES:
+        placeholder, message = UNSELECTED_MESSAGES[kind]
+        return MaterialNeed(kind, placeholder, unit, unselected_message=message)
+    return None
+
+
+def _thread(meters, color, repair_type, reference, follows=None):
+    if not meters or meters <= 0 or not color:
+        return None
+    return MaterialNeed(
+        'thread', meters, 'meters',
+        note=f'Used {meters:.2f}m {color} thread for {repair_type} - Order {reference}',
+        summary=f'Thread: {meters:.2f}m ({color})',
+        attributes={'color': color},
+        follows=follows,
+        required=False,
+    )
+
+
+def _repair_needs(data, reference):
+    repair_type = data.get('repair_type')
+    if not repair_type:
+        return []
+
+    primary = None
+    thread = None
+    thread_meters = _number(data.get('thread_meters'))
+
+    if repair_type == 'zipper_replacement' and data.get('zipper_provided', 'no') != 'yes':
+        primary = _selected(
+            'zipper', data, ['selected_zipper_id'], ['selected_zipper_inches_used'], 'inches',
+            lambda inches: f'Used {inches:g} inches zipper for repair - Order {reference}',
+            lambda inches: f'Zipper: {inches:g} inches',
+        )
+        if primary and not primary.check_only:
+            meters = thread_meters if thread_meters is not None else calculate_thread_for_zipper(primary.amount)
+            color = _text(data, 'thread_color', 'selected_thread_color', 'threadColor')
+            thread = _thread(meters, color, repair_type, reference, follows=primary)
+
+    elif repair_type == 'lock_repair':
+        primary = _selected(
+            'locks', data, ['selected_lock_id'], ['selected_lock_groups_used'], 'groups',
+            lambda groups: f'Used {groups:g} groups locks/kawit for repair - Order {reference}',
+            lambda groups: f'Lock/Kawit: {groups:g} groups',
+        )
+        if primary and not primary.check_only:
+            # 0.25 m × 8 = 2 meters per group
+            meters = thread_meters if thread_meters is not None else primary.amount * 2.0
+            color = _text(data, 'thread_color', 'threadColor', 'selected_thread_color_locks')
+            thread = _thread(meters, color, repair_type, reference, follows=primary)
+
+    elif repair_type == 'buttons' and data.get('buttons_provided', 'no') != 'yes':
+        primary = _selected(
+            'button', data, ['selected_button_id'], ['selected_button_quantity_used'], 'pieces',
+            lambda pieces: f'Used {pieces:g} pieces ({pieces / 8.0:.1f} groups) buttons for repair - Order {reference}',
+            lambda pieces: f'Buttons: {pieces:g} pieces ({pieces / 8.0:.1f} groups)',
+        )
+        if primary and not primary.check_only:
+            # 2–2.4 meters per 8 pieces (1 group), average 2.2
+            meters = thread_meters if thread_meters is not None else primary.amount / 8.0 * 2.2
+            color = _text(data, 'thread_color', 'threadColor', 'selected_thread_color_buttons')
+            thread = _thread(meters, color, repair_type, reference, follows=primary)
+
+    elif repair_type in ('bewang', 'elastic'):
+        suffix = '_elastic' if repair_type == 'elastic' else None
+        primary = _selected(
+            'garter', data,
+            ['selected_garter_id'] + ([f'selected_garter_id{suffix}'] if suffix else []),
+            ['selected_garter_inches_used'] + ([f'selected_garter_inches_used{suffix}'] if suffix else []),
+            'inches',
+            lambda inches: f'Used {inches:g} inches garter for {repair_type} repair - Order {reference}',
+            lambda inches: f'Garter: {inches:g} inches',
+            check_unselected=repair_type == 'bewang',
+        )
+        # Thread comes from the thread-only rules below
+
+    elif repair_type == 'patches' and data.get('patch_provided', 'no') != 'yes':
+        primary = _selected(
+            'patch', data, ['selected_patch_id'], ['selected_patch_quantity_used'], 'pieces',
+            lambda qty: f'Used {qty:g} pieces patches for repair - Order {reference}',
+            lambda qty: f'Patches: {qty:g} pieces',
+            check_unselected=False,
+        )
+        if primary:
+            color = _text(data, 'thread_color', 'selected_thread_color_patches')
+            if color == 'other':
+                color = _text(data, 'thread_color_other', 'selected_thread_color_other_patches')
+            length = _number(_text(data, 'thread_length', 'selected_patch_thread_length')) or 0
+            thread = _thread(length, color, repair_type, reference, follows=primary)
+
+    if repair_type in THREAD_METERS_RANGES:
+        meters = _number(data.get('thread_meters') or data.get('threadMeters'))
+        if meters is None:
+            low, high = THREAD_METERS_RANGES[repair_type]
+            meters = (low + high) / 2.0
+        color = _text(data, 'thread_color', 'threadColor')
+        if color == 'other':
+            color = _text(data, 'thread_color_other', 'threadColorOther')
+        thread = _thread(meters, color, repair_type, reference)
+
+    return [need for need in (primary, thread) if need]
+
+
+def _customize_type(order, data):
+    customize_type = data.get('customize_type') or (data.get('type_of_customize') or '').lower()
+    if customize_type or order is None:
+        return customize_type or 'polo'
+
+    # Not in the form data: take it from the service item
+    for item in order.items.select_related('product', 'product__category'):
+        product = item.product
+        if product.product_type != 'service':
+            continue
+        name = (product.name or '').lower()
+        category = product.category.name.lower() if product.category and product.category.name else ''
+        if any(x in category for x in ['polo', 'polo_shirt']) or any(x in name for x in ['polo', 'polo shirt']):
+            customize_type = 'polo' if 'polo_shirt' not in category and 'polo shirt' not in name else 'polo_shirt'
+        elif 'blouse' in category or 'blouse' in name:
+            customize_type = 'blouse'
+        elif any(x in category for x in ['pants', 'pe_pants']) or 'pants' in name:
+            customize_type = 'pants'
+        elif 'short' in category or 'short' in name:
+            customize_type = 'shorts'
+        elif 'skirt' in category or 'palda' in category or 'skirt' in name or 'palda' in name:
+            customize_type = 'skirt_palda'
+        break
+    return customize_type or 'polo'
+
+
+def _customize_needs(data, order, reference):
+    customize_type = _customize_type(order, data)
+    qty = max(1, int(_number(data.get('customize_quantity')) or 1))
+    needs = []
+
+    fabric_type = _text(data, 'customize_fabric')
+    fabric_color = _text(data, 'customize_fabric_color')
+    yards = (_number(data.get('customize_fabric_yards')) or 0) * qty
+    if fabric_type and yards > 0:
+        needs.append(MaterialNeed(
+            'fabric', yards, 'yards',
+            note=f'Fabric ({fabric_type} {fabric_color}) used for customize {customize_type} - {yards:g} yards - Order {reference}',
+            summary=f'Fabric: {yards:g} yards ({fabric_type} {fabric_color})',
+            attributes={'subtype': fabric_type, 'color': fabric_color},
+        ))
+
+    thread_brand = _text(data, 'customize_thread_brand', 'thread_brand')
+    thread_color = _text(data, 'customize_thread_color', 'thread_color')
+    meters = (_number(data.get('customize_thread_meters') or data.get('thread_meters')) or 0) * qty
+    if thread_color and meters > 0:
+        needs.append(MaterialNeed(
+            'thread', meters, 'meters',
+            note=f'Used {meters:.2f}m {thread_brand} {thread_color} thread for customize {customize_type} - Order {reference}',
+            summary=f'Thread: {meters:.2f}m ({thread_brand} {thread_color})',
+            attributes={'brand': thread_brand, 'color': thread_color},
+            required=False,
+        ))
+
+    button_type = _text(data, 'uniform_button_type')
+    button_color = _text(data, 'uniform_button_color')
+    pieces = (_number(data.get('uniform_buttons_needed')) or 0) * qty
+    if customize_type in ['polo', 'polo_shirt', 'blouse'] and button_type and pieces > 0:
+        needs.append(MaterialNeed(
+            'button', pieces, 'pieces',
+            note=f'Buttons ({button_type} {button_color}) used for customize {customize_type} - {pieces:g} pieces - Order {reference}',
+            summary=f'Buttons: {pieces:g} pieces ({button_type} {button_color})',
+            attributes={'subtype': button_type, 'color': button_color},
+        ))
+
+    garter = _number(data.get('selected_garter_inches_used') or data.get('garter_cm')) or 0
+    if garter > 100:
+        # Likely given in cm
+        garter *= 0.393701
+    if customize_type in ['pants', 'shorts', 'skirt_palda'] and garter > 0:
+        needs.append(MaterialNeed(
+            'garter', garter, 'inches',
+            note=f'Garter used for customize {customize_type} - {garter:.2f} inches - Order {reference}',
+            summary=f'Garter: {garter:.2f} inches',
+            best_stocked=True,
+        ))
+
+    groups = _number(data.get('selected_lock_groups_used') or data.get('lock_groups')) or 0
+    if customize_type == 'skirt_palda' and groups > 0:
+        # 1 group = 5 locks
+        needs.append(MaterialNeed(
+            'locks', int(groups), 'groups',
+            note=f'Locks/Kawit used for customize {customize_type} - {int(groups)} groups ({int(groups) * 5} pieces) - Order {reference}',
+            summary=f'Locks/Kawit: {int(groups)} groups ({int(groups) * 5} pieces)',
+            best_stocked=True,
+        ))
+    return needs
+
+
+def _pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MaterialDeductionPlanner:
+    """
+    Plans, checks and applies the material deductions of repair and customize orders
+    """
+
+    @staticmethod
+    def needs(order_type, data, order=None):
+        """What an order of ``order_type`` with form ``data`` uses, as MaterialNeeds"""
+        data = data or {}
+        reference = order.order_identifier if order is not None else ''
+        if order_type == 'repair':
+            return _repair_needs(data, reference)
+        if order_type == 'customize':
+            return _customize_needs(data, order, reference)
+        return []
+
+    @staticmethod
+    def resolve(needs):
+        """
+        Find each need's product (``need.product``, None when there is
+        none) and its amount in that product's unit (``need.units``), with
+        one query for all of them. Returns the products of the kinds that
+        were looked up as a whole, by kind.
+        """
+        for attempt in range(2):
+            candidates = {}
+            pks = set()
+            kinds = set()
+            for need in needs:
+                if need.pk:
+                    pks.add(_pk(need.pk))
+                elif need.attributes is not None:
+                    candidates[id(need)] = MaterialCatalogManager.candidates(need.kind, **need.attributes)
+                    pks.update(candidates[id(need)][:1])
+                else:
+                    kinds.add(need.kind)
+            pks.discard(None)
+
+            rows = {}
+            by_kind = {}
+            if pks or kinds:
+                query = Q(pk__in=pks) | Q(material_kind__in=kinds, is_active=True)
+                for product in Product.objects.filter(query, product_type='material', is_archived=False):
+                    rows[product.pk] = product
+                    if product.material_kind in kinds and product.is_active:
+                        by_kind.setdefault(product.material_kind, []).append(product)
+
+            stale = False
+            for need in needs:
+                if need.pk:
+                    need.product = rows.get(_pk(need.pk))
+                elif need.attributes is not None:
+                    found = candidates[id(need)][:1]
+                    need.product = rows.get(found[0]) if found else None
+                    if found and (need.product is None or not need.product.is_active):
+                        # Archived or deleted by another process
+                        need.product = None
+                        stale = True
+                elif need.best_stocked and by_kind.get(need.kind):
+                    need.product = max(by_kind[need.kind], key=lambda product: (product.quantity, -product.pk))
+                else:
+                    need.product = None
+            if not stale or attempt:
+                break
+            MaterialCatalogManager.invalidate()
+
+        for need in needs:
+            if need.product is not None:
+                need.units = whole_units(convert_amount(need.amount, need.unit, need.product.unit_of_measurement))
+        return by_kind
+
+    @staticmethod
+    def check(order_type, data):
+        """
+        Dry run: the materials an order could not get, as dicts with
+        ``material``, ``needed``, ``available`` and ``message``; empty if
+        everything it requires is in stock. Writes nothing.
+        """
+        needs = MaterialDeductionPlanner.needs(order_type, data)
+        by_kind = MaterialDeductionPlanner.resolve(needs)
+
+        totals = {}
+        for need in needs:
+            if need.product is not None and not need.check_only:
+                totals[need.product.pk] = totals.get(need.product.pk, 0) + need.units
+
+        unavailable = []
+        reported = set()
+        for need in needs:
+            if not need.required:
+                continue
+            if need.check_only:
+                if not any(product.quantity > 0 for product in by_kind.get(need.kind, [])):
+                    unavailable.append({
+                        'material': need.title,
+                        'needed': need.amount,
+                        'available': 0,
+                        'message': need.unselected_message,
+                    })
+                continue
+            if need.product is None:
+                unavailable.append({
+                    'material': f'Selected {need.title}' if need.pk else need.title,
+                    'needed': need.amount,
+                    'available': 0,
+                    'message': f'{"Selected " if need.pk else ""}{need.title.lower()} not found in inventory.'.capitalize(),
+                })
+                continue
+            product = need.product
+            available = product.quantity or 0
+            if totals[product.pk] > available and product.pk not in reported:
+                reported.add(product.pk)
+                unit = product.unit_of_measurement or need.unit
+                label = MATERIAL_LABELS.get(need.kind, (need.title, need.kind))[1]
+                unavailable.append({
+                    'material': f'{need.title} - {product.name}',
+                    'needed': totals[product.pk],
+                    'available': available,
+                    'message': f'Insufficient {label}. Need {totals[product.pk]} {unit}, but only {available} {unit} available.',
+                })
+        return unavailable
+
+    @staticmethod
+    def apply(order, data):
+        """
+        Deduct the materials of ``order`` in one transaction; returns the
+        summaries of what was deducted. Needs without a product, or with
+        too little stock, are skipped (and logged).
+        """
+        needs = [need for need in MaterialDeductionPlanner.needs(order.order_type, data, order) if not need.check_only]
+        if not needs:
+            return []
+        MaterialDeductionPlanner.resolve(needs)
+        for need in needs:
+            if need.product is None:
+                logger.warning(
+                    f"[MATERIAL_DEDUCTION] No {need.kind} found for {need.summary} - Order {order.order_identifier}"
+                )
+
+        deducted = set()
+        with transaction.atomic():
+            # Primary materials first, then what is only used with them (thread)
+            for ready in (lambda need: need.follows is None, lambda need: id(need.follows) in deducted):
+                batch = [
+                    need for need in needs
+                    if need.product is not None and need.units > 0 and id(need) not in deducted and ready(need)
+                ]
+                if not batch:
+                    continue
+                entries = InventoryLedger.deduct_many(
+                    [(need.product, need.units, need.note) for need in batch], reference_order=order
+                )
+                deducted.update(id(need) for need, entry in zip(batch, entries) if entry is not None)
+
+        summaries = [need.summary for need in needs if id(need) in deducted]
+        if summaries:
+            logger.info(f'Materials deducted for {order.order_type} order {order.order_identifier}: {", ".join(summaries)}')
+        return summaries
@@ -0,0 +1,24 @@
+"""
+ACTIVITY LOG MIDDLEWARE
+=======================
+Holds the ActivityLog entries recorded while a request is processed and
+writes them with a single INSERT once the view has returned.
+"""
+
+from ..activity_log_manager import ActivityLogWriter
+
+
+class ActivityLogMiddleware:
+    """
+    Opens an activity log buffer per request and flushes it at the end.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        ActivityLogWriter.begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            ActivityLogWriter.end_request()
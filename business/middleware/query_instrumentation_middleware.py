@@ -0,0 +1,60 @@
+"""
+QUERY INSTRUMENTATION MIDDLEWARE
+================================
+Records the SQL each request runs, reports it in a Server-Timing header
+(to staff, or to everyone with DEBUG on - query timings are not for the
+public pages) and adds it to the rolling per-view QueryStats.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+
+from ..query_stats_manager import QueryRecorder, QueryStats
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Counts and times the queries of every request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_INSTRUMENTATION', True)
+        self.log_threshold = getattr(settings, 'QUERY_LOG_THRESHOLD', 100)
+        self.skip_prefixes = tuple(
+            prefix for prefix in (settings.STATIC_URL, settings.MEDIA_URL) if prefix
+        )
+
+    def __call__(self, request):
+        if not self.enabled or request.path.startswith(self.skip_prefixes):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        # Streaming responses run more queries while they are sent; only
+        # the ones made before the response was returned are counted
+        summary = recorder.summary()
+        match = getattr(request, 'resolver_match', None)
+        # Unresolved paths share one bucket so the stats stay bounded
+        view = match.view_name if match else '<unresolved>'
+        QueryStats.add(view, summary, duration_ms)
+
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response['Server-Timing'] = (
+                f'sql;dur={summary["sql_ms"]:.2f};desc="{summary["queries"]} queries", '
+                f'app;dur={duration_ms:.2f}'
+            )
+        if summary['queries'] > self.log_threshold:
+            logger.warning(
+                f"[QUERY_STATS] {request.method} {request.path} ran {summary['queries']} queries "
+                f"({summary['sql_ms']}ms), most repeated: {summary['duplicates'][:1]}"
+            )
+        return response
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:40
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    """Seed the rollup tables from existing orders and sales"""
+    Order = apps.get_model('business', 'Order')
+    Sales = apps.get_model('business', 'Sales')
+    DailyOrderRollup = apps.get_model('business', 'DailyOrderRollup')
+    DailySalesRollup = apps.get_model('business', 'DailySalesRollup')
+
+    DailyOrderRollup.objects.bulk_create([
+        DailyOrderRollup(
+            date=bucket['day'],
+            order_type=bucket['order_type'],
+            status=bucket['status'],
+            is_archived=bucket['is_archived'],
+            order_count=bucket['order_count'],
+            total_amount=bucket['amount'] or 0,
+        )
+        for bucket in Order.objects.annotate(day=TruncDate('created_at')).values(
+            'day', 'order_type', 'status', 'is_archived'
+        ).annotate(order_count=Count('id'), amount=Sum('total_amount')).order_by()
+    ], batch_size=1000)
+
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            date=bucket['day'],
+            order_type=bucket['order__order_type'],
+            sales_count=bucket['sales_count'],
+            revenue=bucket['amount'] or 0,
+        )
+        for bucket in Sales.objects.filter(order__status='completed').annotate(
+            day=TruncDate('created_at')
+        ).values('day', 'order__order_type').annotate(
+            sales_count=Count('id'), amount=Sum('amount')
+        ).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0037_alter_landingpageimage_image_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('order_type', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('is_archived', models.BooleanField(default=False)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Daily Order Rollup',
+                'verbose_name_plural': 'Daily Order Rollups',
+                'ordering': ['-date', 'order_type', 'status'],
+                'unique_together': {('date', 'order_type', 'status', 'is_archived')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('order_type', models.CharField(max_length=20)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Daily Sales Rollup',
+                'verbose_name_plural': 'Daily Sales Rollups',
+                'ordering': ['-date', 'order_type'],
+                'unique_together': {('date', 'order_type')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0038_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCategorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categories_display', models.CharField(blank=True, max_length=500)),
+                ('quantity_display', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='category_summary', to='business.order')),
+            ],
+            options={
+                'verbose_name': 'Order Category Summary',
+                'verbose_name_plural': 'Order Category Summaries',
+            },
+        ),
+    ]
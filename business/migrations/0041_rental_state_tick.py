@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0040_identifier_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentalStateTick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('duration_ms', models.PositiveIntegerField(default=0)),
+                ('orders_changed', models.PositiveIntegerField(default=0)),
+                ('products_changed', models.PositiveIntegerField(default=0)),
+                ('details', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'verbose_name': 'Rental State Tick',
+                'verbose_name_plural': 'Rental State Ticks',
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
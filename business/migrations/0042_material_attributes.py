@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:54
+
+from django.db import migrations, models
+
+
+def populate_material_attributes(apps, schema_editor):
+    """Parse the structured attributes of existing material products"""
+    from business.material_catalog_manager import material_kind, parse_material_attributes
+
+    Product = apps.get_model('business', 'Product')
+    products = list(Product.objects.filter(product_type='material').select_related('material_type'))
+    for product in products:
+        type_name = product.material_type.name if product.material_type_id else ''
+        product.material_kind = material_kind(type_name, product.name)
+        for field, value in parse_material_attributes(product.description).items():
+            setattr(product, field, value)
+    Product.objects.bulk_update(
+        products,
+        ['material_kind', 'material_subtype', 'material_color', 'material_brand', 'material_size'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0041_rental_state_tick'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='material_brand',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_color',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_kind',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_size',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='material_subtype',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['material_kind', 'material_color'], name='product_material_color_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['material_kind', 'material_subtype', 'material_color'], name='product_material_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['material_kind', 'material_brand', 'material_color'], name='product_material_brand_idx'),
+        ),
+        migrations.RunPython(populate_material_attributes, migrations.RunPython.noop),
+    ]
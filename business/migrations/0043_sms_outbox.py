@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:09
+
+from django.db import migrations, models
+
+
+def close_legacy_pending(apps, schema_editor):
+    """
+    Rows left 'pending' by the old synchronous sender never got an answer
+    from the gateway; fail them rather than send stale messages now
+    """
+    SMSNotification = apps.get_model('business', 'SMSNotification')
+    SMSNotification.objects.filter(status='pending').update(
+        status='failed',
+        last_error='Left pending by the synchronous sender',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0042_material_attributes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smsnotification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, help_text='Delivery attempts made so far'),
+        ),
+        migrations.AddField(
+            model_name='smsnotification',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='smsnotification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When a worker took the message in flight', null=True),
+        ),
+        migrations.AddField(
+            model_name='smsnotification',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='smsnotification',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, help_text='Earliest time of the next attempt', null=True),
+        ),
+        migrations.AlterField(
+            model_name='smsnotification',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='smsnotification',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='sms_outbox_due_idx'),
+        ),
+        migrations.RunPython(close_legacy_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0043_sms_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qrcode',
+            name='payload_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the payload the image encodes; the image is named after it', max_length=64),
+        ),
+    ]
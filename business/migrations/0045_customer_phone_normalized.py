@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+def populate_phone_normalized(apps, schema_editor):
+    from business.customer_search_manager import normalize_phone_number
+
+    Customer = apps.get_model('business', 'Customer')
+    batch = []
+    for customer in Customer.objects.only('pk', 'phone').iterator(chunk_size=2000):
+        customer.phone_normalized = normalize_phone_number(customer.phone)[:20]
+        batch.append(customer)
+        if len(batch) == 2000:
+            Customer.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['phone_normalized'])
+
+
+def install_search_index(apps, schema_editor):
+    """FTS5 table and triggers on SQLite, trigram indexes on PostgreSQL"""
+    from business.customer_search_manager import CustomerSearch
+
+    CustomerSearch.install(using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    from business.customer_search_manager import CustomerSearch
+
+    CustomerSearch.uninstall(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0044_qr_code_payload_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='E.164 form of the phone number, used to look customers up', max_length=20),
+        ),
+        migrations.RunPython(populate_phone_normalized, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def populate_updated_at(apps, schema_editor):
+    """Existing customers count as last changed when they were created"""
+    Customer = apps.get_model('business', 'Customer')
+    Customer.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0045_customer_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Last change to the customer or their order count; drives delta fetches of the customers API'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['name', 'id'], name='customer_name_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['updated_at', 'id'], name='customer_updated_keyset_idx'),
+        ),
+    ]
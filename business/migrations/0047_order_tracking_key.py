@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:45
+
+from django.db import migrations, models
+
+
+def populate_tracking_keys(apps, schema_editor):
+    from business.order_tracking_manager import tracking_key
+
+    Order = apps.get_model('business', 'Order')
+    batch = []
+    for order in Order.objects.only('pk', 'order_identifier').iterator(chunk_size=2000):
+        order.tracking_key = tracking_key(order.order_identifier)
+        batch.append(order)
+        if len(batch) == 2000:
+            Order.objects.bulk_update(batch, ['tracking_key'])
+            batch = []
+    Order.objects.bulk_update(batch, ['tracking_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0046_customer_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='tracking_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Canonical spelling of the identifier used by the tracking lookup', max_length=20),
+        ),
+        migrations.RunPython(populate_tracking_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0047_order_tracking_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the image file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_phash',
+            field=models.CharField(blank=True, db_index=True, help_text='Perceptual (difference) hash of the image', max_length=16),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:00
+
+from django.db import migrations, models
+
+
+def populate_balances(apps, schema_editor):
+    """Replay each product's stock entries backwards from its current stock"""
+    InventoryTransaction = apps.get_model('business', 'InventoryTransaction')
+    Product = apps.get_model('business', 'Product')
+
+    # Older rental entries are a mix: the order item views moved the stock
+    # with theirs, the rental manager only recorded custody. Nothing tells
+    # them apart, so products with any are not replayed and keep NULL.
+    unknown = InventoryTransaction.objects.filter(transaction_type__startswith='rental_').values('product_id')
+    stock = dict(Product.objects.values_list('pk', 'quantity'))
+    entries = (
+        InventoryTransaction.objects
+        .exclude(product_id__in=unknown)
+        .only('pk', 'product_id', 'quantity')
+        .order_by('product_id', '-created_at', '-pk')
+    )
+    batch = []
+    for entry in entries.iterator(chunk_size=2000):
+        entry.balance_after = stock.get(entry.product_id, 0)
+        stock[entry.product_id] = entry.balance_after - entry.quantity
+        batch.append(entry)
+        if len(batch) == 2000:
+            InventoryTransaction.objects.bulk_update(batch, ['balance_after'])
+            batch = []
+    InventoryTransaction.objects.bulk_update(batch, ['balance_after'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0048_product_image_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='balance_after',
+            field=models.IntegerField(blank=True, editable=False, help_text='Product stock right after this transaction (see InventoryLedger)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['product', 'created_at'], name='inventory_tx_product_time_idx'),
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0049_inventory_transaction_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='Key the client sent with the create request; a retry with it returns this order', max_length=64, null=True, unique=True),
+        ),
+    ]
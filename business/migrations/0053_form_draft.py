@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0052_change_log_entry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormDraft',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the data, to skip unchanged syncs', max_length=64)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='form_drafts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Form Draft',
+                'verbose_name_plural': 'Form Drafts',
+                'ordering': ['-updated_at'],
+                'unique_together': {('user', 'key')},
+            },
+        ),
+    ]
@@ -78,6 +78,9 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField(default=0)
     min_quantity = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Fingerprints of the image, set on save (see customize_product_manager)
+    image_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text='SHA-256 of the image file')
+    image_phash = models.CharField(max_length=16, blank=True, db_index=True, help_text='Perceptual (difference) hash of the image')
     is_active = models.BooleanField(default=True)
     is_archived = models.BooleanField(default=False)
     # Material specific fields
@@ -109,9 +112,23 @@ class Product(models.Model):
     current_rental_order = models.ForeignKey('Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='rented_products')
     rental_start_date = models.DateTimeField(null=True, blank=True)
     rental_due_date = models.DateTimeField(null=True, blank=True)
+    # Structured material attributes parsed from the description on save
+    # (see material_catalog_manager), normalized to lower case
+    material_kind = models.CharField(max_length=20, blank=True, db_index=True)
+    material_subtype = models.CharField(max_length=100, blank=True)
+    material_color = models.CharField(max_length=50, blank=True)
+    material_brand = models.CharField(max_length=100, blank=True)
+    material_size = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['material_kind', 'material_color'], name='product_material_color_idx'),
+            models.Index(fields=['material_kind', 'material_subtype', 'material_color'], name='product_material_type_idx'),
+            models.Index(fields=['material_kind', 'material_brand', 'material_color'], name='product_material_brand_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -166,24 +183,151 @@ class Product(models.Model):
     def is_low_stock(self):
         return self.quantity <= self.min_quantity
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored image, so save() only fingerprints a different one
+        if 'image' in field_names:
+            instance._loaded_image_name = values[field_names.index('image')] or None
+        return instance
+
     def save(self, *args, **kwargs):
-        """Override save to set rental product pricing"""
+        """Override save to set rental product pricing, material attributes and image fingerprints"""
+        from .customize_product_manager import apply_image_fingerprints
+        from .material_catalog_manager import MaterialCatalogManager
+
         if self.product_type == 'rental':
             # Set base price to 500 for all rental products
             self.price = Decimal('500.00')
+        MaterialCatalogManager.apply_attributes(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'image' in update_fields:
+            apply_image_fingerprints(self)
+        if update_fields is not None and 'image' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'image_hash', 'image_phash'}
         super().save(*args, **kwargs)
+        self._loaded_image_name = self.image.name if self.image else None
 
 
 class Customer(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20)
+    phone_normalized = models.CharField(
+        max_length=20, blank=True, db_index=True, editable=False,
+        help_text='E.164 form of the phone number, used to look customers up',
+    )
     address = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text='Last change to the customer or their order count; drives delta fetches of the customers API',
+    )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        from .customer_search_manager import normalize_phone_number
+
+        self.phone_normalized = normalize_phone_number(self.phone)[:20]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+            if 'phone' in update_fields:
+                update_fields.add('phone_normalized')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the customers API, by name and by change time
+            models.Index(fields=['name', 'id'], name='customer_name_keyset_idx'),
+            models.Index(fields=['updated_at', 'id'], name='customer_updated_keyset_idx'),
+        ]
+
+
+class IdentifierSequence(models.Model):
+    """Per-prefix counters for order and sales identifiers.
+
+    ``next_value`` increments a counter with a single ``UPDATE ... RETURNING``
+    statement, so concurrent order entry never hands out the same number twice.
+    """
+    key = models.CharField(max_length=30, unique=True, help_text='Identifier prefix, e.g. TS01REP or TSRT-2025')
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.last_value}"
+
+    class Meta:
+        verbose_name = 'Identifier Sequence'
+        verbose_name_plural = 'Identifier Sequences'
+
+    @staticmethod
+    def highest_number(identifiers, prefix):
+        """Return the highest trailing number among identifiers starting with prefix"""
+        highest = 0
+        for identifier in identifiers:
+            suffix = identifier[len(prefix):].lstrip('-Oo')
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
+
+    @classmethod
+    def next_value(cls, key, seed=None):
+        """
+        Allocate the next number for a sequence key.
+
+        Args:
+            key: Sequence key (identifier prefix)
+            seed: Callable returning the highest number already in use; only
+                called the first time a key is seen
+
+        Returns:
+            The allocated number
+        """
+        from django.db import IntegrityError, connection, transaction
+
+        supports_update_returning = connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+        )
+        if supports_update_returning:
+            # One round trip: increment and read back in the same statement
+            qn = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {qn(cls._meta.db_table)} SET {qn('last_value')} = {qn('last_value')} + 1, "
+                    f"{qn('updated_at')} = %s WHERE {qn('key')} = %s RETURNING {qn('last_value')}",
+                    [timezone.now(), key]
+                )
+                row = cursor.fetchone()
+            if row:
+                return row[0]
+        else:
+            with transaction.atomic():
+                sequence = cls.objects.select_for_update().filter(key=key).first()
+                if sequence:
+                    sequence.last_value = models.F('last_value') + 1
+                    sequence.save(update_fields=['last_value', 'updated_at'])
+                    sequence.refresh_from_db(fields=['last_value'])
+                    return sequence.last_value
+
+        # First allocation for this key: start after the highest existing number
+        try:
+            with transaction.atomic():
+                return cls.objects.create(key=key, last_value=(seed() if seed else 0) + 1).last_value
+        except IntegrityError:
+            # Another writer created the row first; allocate from it
+            return cls.next_value(key)
+
+    @classmethod
+    def sync(cls, key, highest):
+        """Move a sequence forward so the next value is above ``highest``"""
+        sequence, _ = cls.objects.get_or_create(key=key, defaults={'last_value': highest})
+        if sequence.last_value < highest:
+            cls.objects.filter(key=key, last_value__lt=highest).update(last_value=highest)
+
 
 class Order(models.Model):
     ORDER_STATUS = [
@@ -208,6 +352,14 @@ class Order(models.Model):
 
     order_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     order_identifier = models.CharField(max_length=20, unique=True, blank=True)
+    tracking_key = models.CharField(
+        max_length=20, blank=True, db_index=True, editable=False,
+        help_text='Canonical spelling of the identifier used by the tracking lookup',
+    )
+    idempotency_key = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False,
+        help_text='Key the client sent with the create request; a retry with it returns this order',
+    )
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     order_type = models.CharField(max_length=20, choices=ORDER_TYPES)
     status = models.CharField(max_length=20, choices=ORDER_STATUS, default='pending')
@@ -344,32 +496,15 @@ class Order(models.Model):
             }
             prefix = prefix_map.get(self.order_type, 'TS01UNK')
             
-            # Get the next sequence number for this order type
-            # Filter by prefix to get the latest order of this type
-            queryset = Order.objects.filter(order_identifier__startswith=prefix)
-            if self.pk:  # Only exclude current order if it already exists
-                queryset = queryset.exclude(id=self.pk)
-            last_order = queryset.order_by('-order_identifier').first()
-            
-            if last_order and last_order.order_identifier:
-                # Extract the number part after "-O" (e.g., TS01RENT-O1 -> 1)
-                try:
-                    # Split by "-O" to get the number part
-                    parts = last_order.order_identifier.split('-O')
-                    if len(parts) == 2:
-                        last_number = int(parts[1])
-                        next_number = last_number + 1
-                    else:
-                        # Fallback: try to extract from last part after dash
-                        last_part = last_order.order_identifier.split('-')[-1]
-                        # Remove 'O' if present (handle both -O01 and -01 formats)
-                        last_part = last_part.replace('O', '').replace('o', '')
-                        last_number = int(last_part)
-                        next_number = last_number + 1
-                except (IndexError, ValueError):
-                    next_number = 1
-            else:
-                next_number = 1
+            # Allocate the next number for this prefix from its sequence row;
+            # the first allocation starts after the highest existing identifier
+            next_number = IdentifierSequence.next_value(
+                prefix,
+                seed=lambda: IdentifierSequence.highest_number(
+                    Order.objects.filter(order_identifier__startswith=f"{prefix}-").values_list('order_identifier', flat=True),
+                    prefix
+                )
+            )
             
             # Format with leading zeros (e.g., O01, O02, O03)
             self.order_identifier = f"{prefix}-O{next_number:02d}"
@@ -422,9 +557,15 @@ class Order(models.Model):
         return self.balance <= 0
     
     def save(self, *args, **kwargs):
+        from .order_tracking_manager import tracking_key
+
         self.balance = self.total_amount - self.paid_amount
         if not self.order_identifier:
             self.generate_order_identifier()
+        self.tracking_key = tracking_key(self.order_identifier)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'order_identifier' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'tracking_key'}
         super().save(*args, **kwargs)
 
 
@@ -458,6 +599,10 @@ class InventoryTransaction(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     quantity = models.IntegerField()  # Can be negative for stock out
+    balance_after = models.IntegerField(
+        null=True, blank=True, editable=False,
+        help_text='Product stock right after this transaction (see InventoryLedger)',
+    )
     reference_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True)
     # REMOVED: created_by field as requested
@@ -466,6 +611,11 @@ class InventoryTransaction(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.transaction_type} - {self.quantity}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='inventory_tx_product_time_idx'),
+        ]
+
 
 class Sales(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
@@ -479,41 +629,20 @@ class Sales(models.Model):
         if not self.sales_identifier or self.sales_identifier.strip() == '':
             # Get current year
             current_year = timezone.now().year
+            prefix = f'TSRT-{current_year}'
             
-            # Get the last sales record for this year
-            # Use a more robust query to find the highest number
-            last_sales = Sales.objects.filter(
-                sales_identifier__startswith=f'TSRT-{current_year}-'
-            ).exclude(sales_identifier='').order_by('-sales_identifier').first()
-            
-            if last_sales and last_sales.sales_identifier:
-                # Extract the number part and increment
-                try:
-                    parts = last_sales.sales_identifier.split('-')
-                    if len(parts) == 3 and parts[1] == str(current_year):
-                        last_number = int(parts[2])
-                        next_number = last_number + 1
-                    else:
-                        next_number = 1
-                except (IndexError, ValueError):
-                    next_number = 1
-            else:
-                next_number = 1
+            # Allocate the next number for this year from its sequence row;
+            # the first allocation starts after the highest existing identifier
+            next_number = IdentifierSequence.next_value(
+                prefix,
+                seed=lambda: IdentifierSequence.highest_number(
+                    Sales.objects.filter(sales_identifier__startswith=f'{prefix}-').values_list('sales_identifier', flat=True),
+                    prefix
+                )
+            )
             
             # Format with leading zeros (e.g., 01, 02, 03)
-            # But first check if this identifier already exists and increment if needed
-            max_attempts = 100
-            for attempt in range(max_attempts):
-                candidate_identifier = f"TSRT-{current_year}-{next_number:02d}"
-                if not Sales.objects.filter(sales_identifier=candidate_identifier).exists():
-                    self.sales_identifier = candidate_identifier
-                    break
-                next_number += 1
-            else:
-                # If we've exhausted all attempts, use a timestamp-based fallback
-                import time
-                timestamp_suffix = int(time.time()) % 10000
-                self.sales_identifier = f"TSRT-{current_year}-{timestamp_suffix:04d}"
+            self.sales_identifier = f"{prefix}-{next_number:02d}"
         
         return self.sales_identifier
 
@@ -529,6 +658,11 @@ class Sales(models.Model):
 class QRCode(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
     qr_code_image = models.ImageField(upload_to='qr_codes/')
+    payload_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text='SHA-256 of the payload the image encodes; the image is named after it'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -536,13 +670,31 @@ class QRCode(models.Model):
 
 
 class SMSNotification(models.Model):
+    """An outgoing SMS; queued rows form the outbox drained by SMSOutbox"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=20)
     message = models.TextField()
-    status = models.CharField(max_length=20, default='pending')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0, help_text='Delivery attempts made so far')
+    next_attempt_at = models.DateTimeField(null=True, blank=True, help_text='Earliest time of the next attempt')
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text='When a worker took the message in flight')
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='sms_outbox_due_idx'),
+        ]
+
     def __str__(self):
         return f"SMS - {self.order} - {self.phone_number}"
 
@@ -729,12 +881,167 @@ class LandingPageImage(models.Model):
         ordering = ['image_type']
 
 
+class OrderCategorySummary(models.Model):
+    """Denormalized "Type" / "Quantity" display data for the orders list.
+
+    Computed by order_category_manager when an order, its items or its
+    material deductions change; backfilled by ``update_order_categories``.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='category_summary')
+    categories_display = models.CharField(max_length=500, blank=True)
+    quantity_display = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.order.order_identifier}: {self.categories_display}"
+
+    class Meta:
+        verbose_name = 'Order Category Summary'
+        verbose_name_plural = 'Order Category Summaries'
+
+
+class DailyOrderRollup(models.Model):
+    """Pre-summed order counts and totals per day, order type and status.
+
+    Maintained by the Order signals in signals.py and rebuilt from scratch
+    with the ``rebuild_rollups`` management command.
+    """
+    date = models.DateField(db_index=True)
+    order_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    is_archived = models.BooleanField(default=False)
+    order_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date} {self.order_type}/{self.status}: {self.order_count}"
+
+    class Meta:
+        verbose_name = 'Daily Order Rollup'
+        verbose_name_plural = 'Daily Order Rollups'
+        unique_together = [('date', 'order_type', 'status', 'is_archived')]
+        ordering = ['-date', 'order_type', 'status']
+
+
+class DailySalesRollup(models.Model):
+    """Pre-summed sales of completed orders per day and order type"""
+    date = models.DateField(db_index=True)
+    order_type = models.CharField(max_length=20)
+    sales_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date} {self.order_type}: ₱{self.revenue}"
+
+    class Meta:
+        verbose_name = 'Daily Sales Rollup'
+        verbose_name_plural = 'Daily Sales Rollups'
+        unique_together = [('date', 'order_type')]
+        ordering = ['-date', 'order_type']
+
+
+class RentalStateTick(models.Model):
+    """One run of the rental state engine and how many rows it moved.
+
+    Written by rental_state_manager after every scheduled tick so the
+    admin can see that the scheduler is alive and how much work it does.
+    """
+    started_at = models.DateTimeField(db_index=True)
+    duration_ms = models.PositiveIntegerField(default=0)
+    orders_changed = models.PositiveIntegerField(default=0)
+    products_changed = models.PositiveIntegerField(default=0)
+    details = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M:%S} ({self.orders_changed} orders, {self.products_changed} products)"
+
+    class Meta:
+        verbose_name = 'Rental State Tick'
+        verbose_name_plural = 'Rental State Ticks'
+        ordering = ['-started_at']
+
+
+class SyncReceipt(models.Model):
+    """Result of one offline operation applied through the batch sync API.
+
+    Written by offline_sync_manager in the same savepoint as the operation,
+    keyed by the idempotency key the app sent with it, so a batch sent again
+    answers from here instead of applying anything twice.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    operation = models.CharField(max_length=20)
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.operation} {self.key}"
+
+    class Meta:
+        verbose_name = 'Sync Receipt'
+        verbose_name_plural = 'Sync Receipts'
+        ordering = ['-created_at']
+
+
+class ChangeLogEntry(models.Model):
+    """One product, customer or order written or deleted, in commit order.
+
+    Appended by change_feed_manager from the model signals and from the
+    bulk updates that bypass them; the id is the cursor offline clients
+    pass to ``api/changes/`` to fetch what changed since their last pull.
+    """
+    ACTIONS = [
+        ('upsert', 'Created or updated'),
+        ('delete', 'Deleted'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS, default='upsert')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_id}"
+
+    class Meta:
+        verbose_name = 'Change Log Entry'
+        verbose_name_plural = 'Change Log Entries'
+        ordering = ['id']
+
+
+class FormDraft(models.Model):
+    """The latest auto-saved contents of one form or page state of a user.
+
+    Upserted by form_draft_manager when the auto-save service syncs, and
+    removed once ``expires_at`` has passed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='form_drafts')
+    key = models.CharField(max_length=200)
+    data = models.JSONField(default=dict, blank=True)
+    content_hash = models.CharField(max_length=64, help_text='SHA-256 of the data, to skip unchanged syncs')
+    updated_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user} {self.key}"
+
+    class Meta:
+        verbose_name = 'Form Draft'
+        verbose_name_plural = 'Form Drafts'
+        unique_together = [('user', 'key')]
+        ordering = ['-updated_at']
+
+
 # Django Signals to automatically log activities
 @receiver(post_save, sender=Order)
 def log_order_activity(sender, instance, created, **kwargs):
     """Log when orders are created or updated"""
+    from .activity_log_manager import ActivityLogWriter
+
     if created:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='order_created',
             description=f"New {instance.get_order_type_display()} order created for {instance.customer.name}",
             user=None,  # REMOVED: created_by field no longer exists
@@ -748,7 +1055,7 @@ def log_order_activity(sender, instance, created, **kwargs):
             }
         )
     else:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='order_updated',
             description=f"Order {instance.order_identifier} updated - Status: {instance.get_status_display()}",
             user=None,  # REMOVED: created_by field no longer exists
@@ -765,8 +1072,10 @@ def log_order_activity(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Product)
 def log_product_activity(sender, instance, created, **kwargs):
     """Log when products are created or updated"""
+    from .activity_log_manager import ActivityLogWriter
+
     if created:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='product_added',
             description=f"New product '{instance.name}' added to inventory",
             product=instance,
@@ -779,7 +1088,7 @@ def log_product_activity(sender, instance, created, **kwargs):
             }
         )
     else:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='product_updated',
             description=f"Product '{instance.name}' updated",
             product=instance,
@@ -795,8 +1104,10 @@ def log_product_activity(sender, instance, created, **kwargs):
 @receiver(post_save, sender=InventoryTransaction)
 def log_inventory_transaction(sender, instance, created, **kwargs):
     """Log inventory transactions"""
+    from .activity_log_manager import ActivityLogWriter
+
     if created:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='inventory_transaction',
             description=f"Inventory transaction: {instance.get_transaction_type_display()} - {instance.product.name} (Qty: {instance.quantity})",
             product=instance.product,
@@ -813,8 +1124,10 @@ def log_inventory_transaction(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Sales)
 def log_sales_activity(sender, instance, created, **kwargs):
     """Log when sales are created"""
+    from .activity_log_manager import ActivityLogWriter
+
     if created:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='sales_created',
             description=f"Sale {instance.sales_identifier} created for order {instance.order.order_identifier}",
             order=instance.order,
@@ -830,8 +1143,10 @@ def log_sales_activity(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Customer)
 def log_customer_activity(sender, instance, created, **kwargs):
     """Log when customers are created or updated"""
+    from .activity_log_manager import ActivityLogWriter
+
     if created:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='customer_created',
             description=f"New customer '{instance.name}' added",
             customer=instance,
@@ -842,7 +1157,7 @@ def log_customer_activity(sender, instance, created, **kwargs):
             }
         )
     else:
-        ActivityLog.objects.create(
+        ActivityLogWriter.record(
             activity_type='customer_updated',
             description=f"Customer '{instance.name}' updated",
             customer=instance,
@@ -0,0 +1,244 @@
+"""
+Offline sync
+============
+The offline app keeps what it could not send in IndexedDB - orders,
+customers, products and queued form posts - and replayed it one request
+at a time on reconnect: a round trip, session lookup and CSRF check per
+entry, so a shop that was offline for a morning sent hundreds of requests
+at once. Customer and product replays went to GET-only endpoints and were
+never applied, and a replay whose response was lost was applied again on
+the next attempt.
+
+``BatchSync.apply`` takes the queue as an ordered list of operations,
+
+    {"id": <client id>, "type": "order" | "customer" | "product" | "request",
+     "key": <idempotency key>, "data": {...}}
+
+and applies them in order in one transaction, each in its own savepoint:
+an operation that fails is rolled back alone and reported, the others go
+through. Every applied operation with a key leaves a SyncReceipt in the
+same savepoint, so a batch sent again gets the recorded results back
+instead of applying anything twice.
+
+Orders go through OrderCreationService with the key as the order's
+idempotency key, customers are matched on their phone number, products
+are validated with the product form, and ``request`` operations replay a
+queued form post through the view it was meant for - the batch request
+has passed the login and CSRF checks on behalf of all of them.
+"""
+
+import json
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, QueryDict
+from django.template.response import SimpleTemplateResponse
+from django.urls import Resolver404, resolve, reverse
+from django.utils.http import urlencode
+
+from .customer_search_manager import CustomerSearch
+from .forms import CustomerForm, ProductForm
+from .models import SyncReceipt
+from .order_creation_manager import OrderCreationError, OrderCreationService
+
+logger = logging.getLogger(__name__)
+
+KEY_LENGTH = SyncReceipt._meta.get_field('key').max_length
+
+# Request attributes the replayed views rely on, shared with the batch request
+SHARED_REQUEST_ATTRIBUTES = ['user', 'session', '_messages']
+
+
+class BatchSyncError(ValueError):
+    """The batch as a whole cannot be applied"""
+
+
+class OperationFailed(Exception):
+    """One operation was refused; its savepoint is rolled back"""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+def _form_errors(form):
+    return '; '.join(f"{field}: {' '.join(errors)}" for field, errors in form.errors.items())
+
+
+def _apply_order(request, data, key):
+    try:
+        order, created = OrderCreationService.create(data, idempotency_key=key or data.get('idempotencyKey'))
+    except OrderCreationError as e:
+        raise OperationFailed(str(e), {'missing_products': e.missing_products} if e.missing_products else None)
+    return {'order_id': order.id, 'order_identifier': order.order_identifier}, created
+
+
+def _apply_customer(request, data, key):
+    # The same number typed differently is the same customer
+    form = CustomerForm(data, instance=CustomerSearch.by_phone(data.get('phone')))
+    if not form.is_valid():
+        raise OperationFailed(_form_errors(form))
+    created = form.instance.pk is None
+    customer = form.save()
+    return {'customer_id': customer.id, 'created': created}, True
+
+
+def _apply_product(request, data, key):
+    form = ProductForm(data)
+    if not form.is_valid():
+        raise OperationFailed(_form_errors(form))
+    return {'product_id': form.save().id}, True
+
+
+def _replayed_request(request, data):
+    """An HttpRequest for the queued ``data`` carrying the batch request's user and session"""
+    url = urlsplit(str(data.get('url') or ''))
+    if url.netloc and url.netloc != request.get_host():
+        raise OperationFailed('Only requests to this site can be replayed.')
+    if url.path == reverse('api_sync_batch'):
+        raise OperationFailed('Batches cannot be nested.')
+
+    replayed = HttpRequest()
+    replayed.method = str(data.get('method') or 'POST').upper()
+    replayed.path = replayed.path_info = url.path
+    replayed.GET = QueryDict(url.query)
+    replayed.COOKIES = request.COOKIES
+
+    body = data.get('body')
+    content_type = str(data.get('content_type') or 'application/json')
+    if content_type.startswith('application/x-www-form-urlencoded') and isinstance(body, dict):
+        raw = urlencode(body, doseq=True)
+        replayed.POST = QueryDict(raw)
+    elif isinstance(body, str):
+        raw = body
+    else:
+        raw = json.dumps(body) if body is not None else ''
+    replayed._body = raw.encode()
+    replayed.META = {
+        **request.META,
+        'REQUEST_METHOD': replayed.method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(replayed._body)),
+    }
+    for attribute in SHARED_REQUEST_ATTRIBUTES:
+        if hasattr(request, attribute):
+            setattr(replayed, attribute, getattr(request, attribute))
+    # The batch request passed the CSRF check for every request it carries
+    replayed._dont_enforce_csrf_checks = True
+    return replayed
+
+
+def _apply_request(request, data, key):
+    replayed = _replayed_request(request, data)
+    try:
+        match = resolve(replayed.path_info)
+    except Resolver404:
+        raise OperationFailed(f'Unknown URL {replayed.path_info}')
+
+    response = match.func(replayed, *match.args, **match.kwargs)
+    result = {'status_code': response.status_code}
+    payload = None
+    # Pages are not rendered: only their status matters here
+    if not isinstance(response, SimpleTemplateResponse) and response.get('Content-Type', '').startswith('application/json'):
+        try:
+            payload = json.loads(response.content)
+        except ValueError:
+            payload = None
+    if payload is not None:
+        result['response'] = payload
+    if response.status_code >= 400 or (isinstance(payload, dict) and payload.get('success') is False):
+        error = payload.get('error') if isinstance(payload, dict) else None
+        raise OperationFailed(error or f'HTTP {response.status_code}', result)
+    return result, True
+
+
+APPLIERS = {
+    'order': _apply_order,
+    'customer': _apply_customer,
+    'product': _apply_product,
+    'request': _apply_request,
+}
+
+
+class BatchSync:
+    """
+    Applies the offline app's queued operations in order, each in its own savepoint
+    """
+
+    @staticmethod
+    def limit():
+        return getattr(settings, 'OFFLINE_SYNC_BATCH_LIMIT', 50)
+
+    @staticmethod
+    def apply(request, operations):
+        """
+        Apply ``operations`` for ``request.user``. Returns one result per
+        operation, in order: ``{"id", "status", ...}`` with status
+        ``applied``, ``duplicate`` (applied by an earlier batch) or
+        ``failed`` (with ``error``; nothing of it was kept). Raises
+        BatchSyncError when ``operations`` is not a list or is too long.
+        """
+        if not isinstance(operations, list):
+            raise BatchSyncError('Operations must be a list.')
+        if len(operations) > BatchSync.limit():
+            raise BatchSyncError(f'At most {BatchSync.limit()} operations can be sent at once.')
+
+        keys = {
+            str(operation.get('key')).strip() for operation in operations
+            if isinstance(operation, dict) and operation.get('key')
+        }
+        # One query answers every operation an earlier batch already applied
+        receipts = {receipt.key: receipt.result for receipt in SyncReceipt.objects.filter(key__in=keys)}
+
+        results = []
+        with transaction.atomic():
+            for operation in operations:
+                results.append(BatchSync._apply_one(request, operation, receipts))
+
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        logger.info(f"[OFFLINE_SYNC] {request.user} synced {len(results) - failed} of {len(results)} operation(s)")
+        return results
+
+    @staticmethod
+    def _apply_one(request, operation, receipts):
+        if not isinstance(operation, dict):
+            return {'id': None, 'status': 'failed', 'error': 'Operation must be an object.'}
+        operation_id = operation.get('id')
+        kind = operation.get('type')
+        key = str(operation.get('key') or '').strip() or None
+        data = operation.get('data')
+        if kind not in APPLIERS:
+            return {'id': operation_id, 'status': 'failed', 'error': f'Unknown operation type {kind!r}.'}
+        if not isinstance(data, dict):
+            return {'id': operation_id, 'status': 'failed', 'error': 'Operation data must be an object.'}
+        if key and len(key) > KEY_LENGTH:
+            return {'id': operation_id, 'status': 'failed', 'error': f'Key is longer than {KEY_LENGTH} characters.'}
+        if key in receipts:
+            return {'id': operation_id, 'status': 'duplicate', **receipts[key]}
+
+        try:
+            with transaction.atomic():
+                result, applied = APPLIERS[kind](request, data, key)
+                if key:
+                    SyncReceipt.objects.create(key=key, operation=kind, result=result)
+        except OperationFailed as e:
+            return {'id': operation_id, 'status': 'failed', 'error': str(e), **e.details}
+        except IntegrityError:
+            # Another batch carrying the same operation got there first
+            receipt = SyncReceipt.objects.filter(key=key).first() if key else None
+            if receipt is None:
+                logger.exception(f"[OFFLINE_SYNC] {kind} operation {operation_id} failed")
+                return {'id': operation_id, 'status': 'failed', 'error': 'The operation conflicts with existing data.'}
+            receipts[key] = receipt.result
+            return {'id': operation_id, 'status': 'duplicate', **receipt.result}
+        except Exception as e:
+            logger.exception(f"[OFFLINE_SYNC] {kind} operation {operation_id} failed: {e}")
+            return {'id': operation_id, 'status': 'failed', 'error': f'The {kind} could not be applied.'}
+
+        if key:
+            receipts[key] = result
+        return {'id': operation_id, 'status': 'applied' if applied else 'duplicate', **result}
@@ -0,0 +1,434 @@
+"""
+Order category summaries
+========================
+Works out the "Type" / "Quantity" columns shown on the orders list
+(repair types, customize types, rental categories) once, when an order,
+its items or its material deductions change, and stores the result on
+OrderCategorySummary. The orders list then reads one row per order on
+the current page instead of parsing notes and product names per request.
+"""
+
+from collections import defaultdict
+import logging
+import threading
+import weakref
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import InventoryTransaction, Order, OrderCategorySummary
+
+logger = logging.getLogger(__name__)
+
+
+REPAIR_TYPE_KEYWORDS = [
+    'zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang',
+    'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada',
+    'general_repair', 'general_tshirt_repair',
+]
+
+REPAIR_TYPE_MAP = {
+    'zipper': 'Zipper',
+    'zipper_repair': 'Zipper',
+    'zipper_replacement': 'Zipper',
+    'buttons': 'Buttons',
+    'button': 'Buttons',
+    'buttons_repair': 'Buttons',
+    'patch': 'Patch',
+    'patches': 'Patch',
+    'patch_repair': 'Patch',
+    'lock': 'Lock',
+    'locks': 'Lock',
+    'lock_repair': 'Lock',
+    'garter': 'Garter',
+    'garter_repair': 'Garter',
+    'elastic': 'Elastic',
+    'elastic_repair': 'Elastic',
+    'bewang': 'Bewang',
+    'bewang_repair': 'Bewang',
+    'putol': 'Putol',
+    'baston': 'Baston',
+    'suklot': 'Suklot',
+    'baston_suklot': 'Baston Suklot',
+    'baston_putol': 'Baston Putol',
+    'ambel': 'Ambel',
+    'pasada': 'Pasada',
+}
+
+CUSTOMIZE_TYPE_KEYWORDS = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
+
+CUSTOMIZE_TYPE_MAP = {
+    'polo': 'Polo',
+    'polo_shirt': 'Polo Shirt',
+    'blouse': 'Blouse',
+    'pants': 'Pants',
+    'shorts': 'Shorts',
+    'skirt_palda': 'Skirt/Palda',
+    'skirt': 'Skirt/Palda',
+    'palda': 'Skirt/Palda',
+    'uniform': 'Uniform',
+    'pe': 'PE',
+}
+
+# Number of most recent material deductions inspected for a repair type
+TRANSACTION_NOTES_LIMIT = 5
+
+
+def _strip_timestamp(value):
+    """Remove a trailing " - 20251117 121237" style timestamp"""
+    if " - " in value and len(value.split(" - ")[-1]) > 10:
+        return value.split(" - ")[0].strip()
+    return value
+
+
+def format_repair_type(repair_type_str):
+    """Format repair type from snake_case to Title Case"""
+    if not repair_type_str:
+        return None
+    # Remove "Repair - " prefix if present
+    if "Repair - " in repair_type_str:
+        repair_type_str = repair_type_str[10:].strip()
+    # Remove "repair - " prefix if present (lowercase)
+    if "repair - " in repair_type_str.lower():
+        repair_type_str = repair_type_str[repair_type_str.lower().find("repair - ") + 9:].strip()
+    # Remove "Repair Service" if present (shouldn't be, but just in case)
+    repair_type_str = repair_type_str.replace("Repair Service", "").replace("repair service", "").strip()
+    # Remove class suffix like "(Class standard)"
+    if " (Class " in repair_type_str:
+        repair_type_str = repair_type_str.split(" (Class ")[0].strip()
+    repair_type_lower = repair_type_str.lower().strip()
+    if not repair_type_lower:
+        return None
+    if repair_type_lower in REPAIR_TYPE_MAP:
+        return REPAIR_TYPE_MAP[repair_type_lower]
+    # Check if it contains any of the repair types
+    for key, value in REPAIR_TYPE_MAP.items():
+        if key in repair_type_lower:
+            return value
+    # Replace underscores with spaces and title case
+    formatted = repair_type_str.replace('_', ' ').title().strip()
+    # Don't return "Repair Service" - that's the fallback
+    if formatted and formatted.lower() not in ("repair service", "service"):
+        return formatted
+    return None
+
+
+def format_customize_type(customize_type_str):
+    """Format customize type name"""
+    if not customize_type_str:
+        return None
+    # Remove "Customize - " prefix if present
+    if "Customize - " in customize_type_str:
+        customize_type_str = customize_type_str[11:].strip()
+    # Remove "customize - " prefix if present (lowercase)
+    if "customize - " in customize_type_str.lower():
+        customize_type_str = customize_type_str[customize_type_str.lower().find("customize - ") + 12:].strip()
+    # Remove "Customize Service" if present (shouldn't be, but just in case)
+    customize_type_str = customize_type_str.replace("Customize Service", "").replace("customize service", "").strip()
+    # Remove class suffix like "(Class standard)"
+    if " (Class " in customize_type_str:
+        customize_type_str = customize_type_str.split(" (Class ")[0].strip()
+    customize_type_str = _strip_timestamp(customize_type_str)
+    customize_type_lower = customize_type_str.lower().strip()
+    if not customize_type_lower:
+        return None
+    if customize_type_lower in CUSTOMIZE_TYPE_MAP:
+        return CUSTOMIZE_TYPE_MAP[customize_type_lower]
+    # Check if it contains any of the customize types
+    for key, value in CUSTOMIZE_TYPE_MAP.items():
+        if key in customize_type_lower:
+            return value
+    # Replace underscores with spaces and title case
+    formatted = customize_type_str.replace('_', ' ').title().strip()
+    # Don't return "Customize Service" - that's the fallback
+    if formatted and formatted.lower() not in ("customize service", "service"):
+        return formatted
+    return None
+
+
+def _match_keyword(text, keywords, formatter):
+    """Return the formatted first keyword contained in text, if any"""
+    if not text:
+        return None
+    text_lower = text.lower()
+    for keyword in keywords:
+        if keyword in text_lower:
+            return formatter(keyword)
+    return None
+
+
+def _extract_after_prefix(product_name, prefix):
+    """Return what follows "<Prefix> - " in a product name, without class/timestamp suffixes"""
+    lower_prefix = f"{prefix.lower()} - "
+    if f"{prefix} - " in product_name:
+        part = product_name.split(f"{prefix} - ")[1].strip()
+    elif lower_prefix in product_name.lower():
+        part = product_name.lower().split(lower_prefix)[1].strip()
+    else:
+        return None
+    if " (Class " in part:
+        part = part.split(" (Class ")[0].strip()
+    if " (class " in part:
+        part = part.split(" (class ")[0].strip()
+    return _strip_timestamp(part)
+
+
+def _format_from_product_name(product_name, prefix, keywords, formatter):
+    """Work out a category from a service product's name"""
+    extracted = _extract_after_prefix(product_name, prefix)
+    if extracted is not None:
+        return formatter(extracted)
+    category_name = _match_keyword(product_name, keywords, formatter)
+    if category_name:
+        return category_name
+    # Maybe the product name is just the type, e.g. "Zipper Service"
+    cleaned_name = product_name.strip()
+    cleaned_name = cleaned_name.replace(f"{prefix} Service", "").replace(f"{prefix.lower()} service", "").strip()
+    if cleaned_name.lower().endswith(" service"):
+        cleaned_name = cleaned_name[:-8].strip()
+    return formatter(cleaned_name or product_name)
+
+
+def _group(categories):
+    """Group (category, quantity) pairs, keeping first-seen order"""
+    grouped = {}
+    for category_name, quantity in categories:
+        grouped[category_name] = grouped.get(category_name, 0) + quantity
+    return grouped
+
+
+def _format_grouped(grouped):
+    """Format grouped categories as "Category1 (qty), Category2" """
+    return ", ".join(f"{cat} ({qty})" if qty > 1 else cat for cat, qty in grouped.items())
+
+
+def summarize_repair(order, items, transaction_notes):
+    """Return (display, quantity) for a repair order"""
+    fallback = "Repair Service"
+
+    # FIRST: repair type from inventory transaction notes (most reliable for historical data)
+    from_transactions = None
+    for notes in transaction_notes:
+        from_transactions = _match_keyword(notes, REPAIR_TYPE_KEYWORDS, lambda keyword: keyword)
+        if from_transactions:
+            from_transactions = format_repair_type(from_transactions)
+            break
+
+    # SECOND: repair type from order notes
+    from_notes = _match_keyword(order.notes, REPAIR_TYPE_KEYWORDS, format_repair_type)
+
+    categories = []
+    for item in items:
+        product = item.product
+        category_name = from_transactions or from_notes
+        if not category_name and product:
+            if product.name:
+                category_name = _format_from_product_name(product.name, "Repair", REPAIR_TYPE_KEYWORDS, format_repair_type)
+            if not category_name or category_name == fallback:
+                category_name = _match_keyword(product.description, REPAIR_TYPE_KEYWORDS, format_repair_type) or category_name
+            if (not category_name or category_name == fallback) and product.category:
+                cat_name = product.category.name
+                category_name = _match_keyword(cat_name, REPAIR_TYPE_KEYWORDS, format_repair_type) or format_repair_type(cat_name)
+        categories.append((category_name or fallback, item.quantity))
+
+    if not categories:
+        return fallback, 1
+    grouped = _group(categories)
+    return _format_grouped(grouped), sum(grouped.values())
+
+
+def summarize_customize(order, items):
+    """Return (display, quantity) for a customize order"""
+    fallback = "Customize Service"
+    from_notes = _match_keyword(order.notes, CUSTOMIZE_TYPE_KEYWORDS, format_customize_type)
+
+    categories = []
+    for item in items:
+        product = item.product
+        category_name = from_notes
+        if not category_name and product:
+            if product.name:
+                category_name = _format_from_product_name(product.name, "Customize", CUSTOMIZE_TYPE_KEYWORDS, format_customize_type)
+            if (not category_name or category_name == fallback) and product.description:
+                desc = product.description.lower()
+                if "type:" in desc:
+                    if "type: uniform" in desc:
+                        category_name = "Uniform"
+                    elif "type: pe" in desc or "type:pe" in desc:
+                        category_name = "PE"
+                    else:
+                        category_name = _match_keyword(desc, CUSTOMIZE_TYPE_KEYWORDS, format_customize_type) or category_name
+            if (not category_name or category_name == fallback) and product.category:
+                cat_name = product.category.name
+                category_name = _match_keyword(cat_name, CUSTOMIZE_TYPE_KEYWORDS, format_customize_type) or format_customize_type(cat_name)
+        categories.append((category_name or fallback, item.quantity))
+
+    if not categories:
+        return fallback, 1
+    grouped = _group(categories)
+    return _format_grouped(grouped), sum(grouped.values())
+
+
+def summarize_rental(order, items):
+    """Return (display, quantity) for a rental order"""
+    fallback = "Rental Service"
+    categories = []
+    for item in items:
+        product = item.product
+        if product and product.category:
+            category_name = product.category.name
+        elif product and product.name and product.product_type == 'rental':
+            category_name = product.name
+        else:
+            category_name = fallback
+        if not category_name or category_name.strip() == '' or category_name == 'N/A':
+            category_name = fallback
+        categories.append((category_name, item.quantity))
+
+    if not categories:
+        return fallback, 1
+    grouped = _group(categories)
+    return _format_grouped(grouped), sum(grouped.values())
+
+
+class OrderCategoryManager:
+    """
+    Computes, stores and applies order category summaries
+    """
+
+    _pending = threading.local()
+
+    @staticmethod
+    def build_summary(order, items=None, transaction_notes=None):
+        """
+        Compute the (display, quantity) pair for an order.
+
+        Args:
+            order: Order instance
+            items: Pre-fetched order items (fetched if omitted)
+            transaction_notes: Notes of the order's latest material deductions,
+                newest first (fetched for repair orders if omitted)
+        """
+        if items is None:
+            items = list(order.items.select_related('product__category'))
+        if order.order_type == 'repair':
+            if transaction_notes is None:
+                transaction_notes = list(
+                    InventoryTransaction.objects.filter(reference_order=order)
+                    .order_by('-created_at')
+                    .values_list('notes', flat=True)[:TRANSACTION_NOTES_LIMIT]
+                )
+            return summarize_repair(order, items, transaction_notes)
+        if order.order_type == 'customize':
+            return summarize_customize(order, items)
+        if order.order_type in ['rent', 'rental']:
+            return summarize_rental(order, items)
+        return '', sum(item.quantity for item in items)
+
+    @staticmethod
+    def refresh(order):
+        """Recompute and store the summary for one order"""
+        display, quantity = OrderCategoryManager.build_summary(order)
+        OrderCategorySummary.objects.update_or_create(
+            order=order,
+            defaults={'categories_display': display[:500], 'quantity_display': quantity},
+        )
+        return display, quantity
+
+    @staticmethod
+    def schedule_refresh(order_id):
+        """
+        Refresh an order's summary once the current transaction commits.
+
+        Several item saves inside one transaction only trigger one refresh.
+        """
+        pending = getattr(OrderCategoryManager._pending, 'callbacks', None)
+        if pending is None:
+            pending = OrderCategoryManager._pending.callbacks = {}
+        # Only the connection's commit hooks hold the callback, so one dropped
+        # by a rollback is gone from the weak reference too
+        queued = pending.get(order_id)
+        if queued is not None and queued() is not None:
+            return
+
+        def _run():
+            pending.pop(order_id, None)
+            try:
+                order = Order.objects.filter(pk=order_id).first()
+                if order:
+                    OrderCategoryManager.refresh(order)
+            except Exception as e:
+                logger.error(f"[ORDER_CATEGORIES] Failed to refresh summary for order {order_id}: {e}")
+
+        pending[order_id] = weakref.ref(_run)
+        transaction.on_commit(_run)
+
+    @staticmethod
+    def refresh_many(orders, dry_run=False):
+        """
+        Recompute and upsert summaries for many orders in batched queries.
+
+        Args:
+            orders: Iterable of Order instances with items__product__category prefetched
+            dry_run: Compute without writing
+
+        Returns:
+            List of OrderCategorySummary instances (unsaved when dry_run)
+        """
+        orders = list(orders)
+        notes_by_order = defaultdict(list)
+        repair_ids = [order.id for order in orders if order.order_type == 'repair']
+        if repair_ids:
+            for order_id, notes in InventoryTransaction.objects.filter(
+                reference_order_id__in=repair_ids
+            ).order_by('reference_order_id', '-created_at').values_list('reference_order_id', 'notes'):
+                if len(notes_by_order[order_id]) < TRANSACTION_NOTES_LIMIT:
+                    notes_by_order[order_id].append(notes)
+
+        now = timezone.now()
+        summaries = []
+        for order in orders:
+            display, quantity = OrderCategoryManager.build_summary(
+                order,
+                items=list(order.items.all()),
+                transaction_notes=notes_by_order.get(order.id, []),
+            )
+            summaries.append(OrderCategorySummary(
+                order=order,
+                categories_display=display[:500],
+                quantity_display=quantity,
+                updated_at=now,
+            ))
+
+        if not dry_run and summaries:
+            OrderCategorySummary.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=['order'],
+                update_fields=['categories_display', 'quantity_display', 'updated_at'],
+            )
+        return summaries
+
+    @staticmethod
+    def apply(order):
+        """
+        Set the repair/customize/rental *_display attributes used by orders.html.
+
+        Falls back to computing the summary in memory when none is stored yet.
+        """
+        try:
+            summary = order.category_summary
+            display, quantity = summary.categories_display, summary.quantity_display
+        except OrderCategorySummary.DoesNotExist:
+            display, quantity = OrderCategoryManager.build_summary(order, items=list(order.items.all()))
+
+        if order.order_type == 'repair':
+            order.repair_categories_display = display
+            order.repair_quantity_display = quantity
+        elif order.order_type == 'customize':
+            order.customize_categories_display = display
+            order.customize_quantity_display = quantity
+        elif order.order_type in ['rent', 'rental']:
+            order.rental_categories_display = display
+            order.rental_quantity_display = quantity
+        return order
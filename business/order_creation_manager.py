@@ -0,0 +1,370 @@
+"""
+Order creation service
+======================
+``create_order_from_session`` - the order-entry submit, and the offline
+queue's replay of it - created the order first and then, item by item,
+walked a cascade of up to a dozen ``Product.objects.get`` name guesses,
+creating service products along the way, before saving the order a
+second time with its real total. None of it ran in a transaction: a
+failure on the third item left an order with two items, gowns already
+marked rented and materials deducted; and a submission retried after a
+dropped connection (or a reload of the receipt page) created the order
+again.
+
+OrderCreationService.create does the same work as one unit:
+
+- the products the items can refer to are loaded up front - all active
+  service products, or the rentals named by id or name - and each item is
+  matched in memory with the old order of preference; service products
+  are only created for items that match nothing;
+- customer, order (saved once, with its final total), items (one
+  bulk_create), rental hand-outs and material deductions are written in
+  one transaction, so a failure leaves nothing behind;
+- a client-generated idempotency key (``Idempotency-Key`` header or
+  ``idempotencyKey`` field) is stored on the order under a unique index,
+  so a retry - even one racing the original - gets the order created the
+  first time instead of a second one.
+
+``benchmark_order_creation`` measures the throughput for 10-item orders.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .change_feed_manager import ChangeFeed
+from .customer_search_manager import CustomerSearch
+from .material_deduction_manager import MaterialDeductionPlanner
+from .models import Customer, InventoryTransaction, Order, OrderItem, Product
+from .order_category_manager import OrderCategoryManager
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_LENGTH = Order._meta.get_field('idempotency_key').max_length
+
+RENTAL_ORDER_TYPES = ('rent', 'rental')
+
+# Generic products a repair item falls back to, in order
+GENERIC_REPAIR_NAMES = [
+    'Repair Service',
+    'repair service',
+    'Repair - General',
+    'repair - general',
+    'General Repair Service',
+    'general repair service',
+]
+
+
+class OrderCreationError(ValueError):
+    """The order cannot be created; the message is shown to the user"""
+
+    def __init__(self, message, missing_products=None):
+        super().__init__(message)
+        self.missing_products = missing_products
+
+
+class _ServiceCatalog:
+    """Active service products, matched by exact name or substring in memory"""
+
+    def __init__(self):
+        self.products = list(
+            Product.objects.filter(product_type='service', is_archived=False, is_active=True).order_by('pk')
+        )
+
+    def by_id(self, pk):
+        return next((product for product in self.products if str(product.pk) == str(pk)), None)
+
+    def named(self, *names):
+        for name in names:
+            product = next((product for product in self.products if product.name == name), None)
+            if product:
+                return product
+        return None
+
+    def containing(self, text):
+        text = text.lower()
+        return [product for product in self.products if text in product.name.lower()]
+
+    def first_containing(self, text):
+        return next(iter(self.containing(text)), None)
+
+    def create(self, name, category_name, category_description, description):
+        from .reference_data_manager import ReferenceData
+
+        product = Product.objects.create(
+            name=name,
+            product_type='service',
+            category=ReferenceData.category(category_name, category_description),
+            description=description,
+            price=Decimal('0'),
+            cost=Decimal('0'),
+            quantity=0,
+            is_active=True,
+            is_archived=False,
+        )
+        self.products.append(product)
+        return product
+
+
+def _repair_service(catalog, product_name, item_class, order_type):
+    repair_type = product_name.lower().strip()
+    product = catalog.named(
+        f"Repair - {repair_type.title()} (Class {item_class})",
+        f"repair - {repair_type.title()} (Class {item_class})",
+        f"Repair - {repair_type.title()}",
+        f"repair - {repair_type.title()}",
+        f"Repair - {repair_type} (Class {item_class})",
+        f"repair - {repair_type} (Class {item_class})",
+        f"{order_type} - {product_name} (Class {item_class})",
+        product_name,
+    )
+    if not product:
+        # A single "Repair - <type>" product, else any naming the repair type
+        matches = catalog.containing(f"Repair - {repair_type}")
+        product = matches[0] if len(matches) == 1 else catalog.first_containing(repair_type)
+    return (
+        product
+        or catalog.named(*GENERIC_REPAIR_NAMES)
+        or catalog.first_containing('repair service')
+        or catalog.first_containing('repair')
+        or catalog.create(
+            f"Repair - {product_name.title()}", 'Repair Services', 'Repair service products',
+            f"Repair service: {product_name}",
+        )
+    )
+
+
+def _customize_service(catalog, product_name, item_class, order_data):
+    product = catalog.named(
+        f"customize - {product_name} (Class {item_class})",
+        f"Customize - {product_name.title()} (Class {item_class})",
+        f"customize - {product_name.title()} (Class {item_class})",
+        f"Customize - {product_name.title()}",
+        f"customize - {product_name.title()}",
+        product_name,
+    ) or catalog.first_containing(f"Customize - {product_name}")
+    if not product and order_data.get('type_of_customize') == 'pe' and order_data.get('pe_type'):
+        product = catalog.first_containing(f"PE - {order_data['pe_type'].title()}")
+    return (
+        product
+        or catalog.first_containing('customize')
+        or catalog.create(product_name, 'Customize Services', 'Customize service products', f"Customize Service: {product_name}")
+    )
+
+
+def _service_product(catalog, item, order_data):
+    order_type = order_data['orderType']
+    product_name = item.get('name', f"{order_type} Service")
+    item_class = item.get('class', 'standard')
+
+    if order_type == 'customize' and order_data.get('customize_product_id'):
+        product = catalog.by_id(order_data['customize_product_id'])
+        if product:
+            return product
+    if order_type == 'repair':
+        return _repair_service(catalog, product_name, item_class, order_type)
+    if order_type == 'customize':
+        return _customize_service(catalog, product_name, item_class, order_data)
+    return catalog.named(f"{order_type} - {product_name} (Class {item_class})", product_name) or catalog.create(
+        product_name, 'Services', 'Service products', f"Service: {product_name}"
+    )
+
+
+def _rental_products(items):
+    """The rental product of each item, from one query for every id and name they give"""
+    ids, names = set(), set()
+    for item in items:
+        product_id = item.get('id') or item.get('product_id')
+        try:
+            ids.add(int(product_id))
+        except (TypeError, ValueError):
+            pass
+        name = item.get('name', 'rent Service')
+        names.update([name, f"Rental - {name} (Class {item.get('class', 'standard')})"])
+    rentals = list(
+        Product.objects.filter(product_type='rental').filter(Q(pk__in=ids) | Q(name__in=names)).order_by('pk')
+    )
+
+    resolved = []
+    for item in items:
+        product_id = str(item.get('id') or item.get('product_id') or '')
+        name = item.get('name', 'rent Service')
+        alternative = f"Rental - {name} (Class {item.get('class', 'standard')})"
+        product = (
+            next((p for p in rentals if str(p.pk) == product_id and p.is_active), None)
+            or next((p for p in rentals if p.name == name and p.is_active), None)
+            # Partial name match as last resort, the rare case worth its own query
+            or Product.objects.filter(
+                product_type='rental', name__icontains=name, rental_status='available', is_active=True,
+            ).order_by('pk').first()
+            or next((p for p in rentals if p.name == alternative and p.is_active and not p.is_archived), None)
+        )
+        if not product:
+            raise OrderCreationError(
+                f'Rental product "{name}" not found in database. Please add it to inventory first.',
+                missing_products=[name],
+            )
+        if product.rental_status != 'available':
+            raise OrderCreationError(
+                f'Product {product.name} is not available for rental (status: {product.rental_status})'
+            )
+        resolved.append(product)
+    return resolved
+
+
+def _order_notes(order_data):
+    notes = []
+    if order_data['orderType'] == 'repair':
+        if order_data.get('repair_urgency'):
+            notes.append(f"Urgency: {'Urgent' if order_data['repair_urgency'] == 'urgent' else 'Not Urgent'}")
+        if order_data.get('sewing_style'):
+            style = 'Straight Stitch' if order_data['sewing_style'] == 'straight_stitch' else 'Zigzag Stitch'
+            notes.append(f'Sewing Style: {style}')
+    return '; '.join(notes)
+
+
+def _customer(order_data):
+    # Match on the normalized phone, so the same number typed differently
+    # does not create a duplicate customer
+    customer = CustomerSearch.by_phone(order_data['mobileNumber'])
+    if not customer:
+        return Customer.objects.create(
+            phone=order_data['mobileNumber'],
+            name=order_data['customerName'],
+            email=f"{order_data['customerName'].lower().replace(' ', '')}@example.com",
+        )
+    if customer.name != order_data['customerName']:
+        customer.name = order_data['customerName']
+        customer.save()
+    return customer
+
+
+class OrderCreationService:
+    """
+    Creates an order with its items, rentals and material deductions as one transaction
+    """
+
+    @staticmethod
+    def clean_key(key):
+        """The idempotency key as stored, None when none was sent"""
+        key = str(key or '').strip()
+        if not key:
+            return None
+        if len(key) > IDEMPOTENCY_KEY_LENGTH:
+            raise OrderCreationError(f'Idempotency key is longer than {IDEMPOTENCY_KEY_LENGTH} characters.')
+        return key
+
+    @staticmethod
+    def validate(order_data):
+        if not order_data.get('customerName'):
+            raise OrderCreationError('Customer name is required.')
+        if not order_data.get('mobileNumber'):
+            raise OrderCreationError('Customer mobile number is required.')
+        if not order_data.get('orderType'):
+            raise OrderCreationError('Order type is required.')
+        if not order_data.get('items'):
+            raise OrderCreationError('At least one item is required to create an order.')
+
+    @staticmethod
+    def create(order_data, idempotency_key=None):
+        """
+        Create the order described by ``order_data`` (the order-entry
+        payload). Returns ``(order, created)``: with an ``idempotency_key``
+        already used, the order created then and False. Raises
+        OrderCreationError for invalid data, unknown or unavailable rentals.
+        """
+        key = OrderCreationService.clean_key(idempotency_key)
+        if key:
+            existing = Order.objects.filter(idempotency_key=key).first()
+            if existing:
+                return existing, False
+        OrderCreationService.validate(order_data)
+
+        try:
+            with transaction.atomic():
+                order = OrderCreationService._create(order_data, key)
+        except IntegrityError:
+            # A retry racing the original: its insert lost on the unique key
+            existing = Order.objects.filter(idempotency_key=key).first() if key else None
+            if existing is None:
+                raise
+            return existing, False
+        logger.info(f"[ORDER_CREATION] Created {order.order_identifier} with {len(order_data['items'])} item(s)")
+        return order, True
+
+    @staticmethod
+    def _create(order_data, key):
+        order_type = order_data['orderType']
+        items = order_data['items']
+        rental = order_type in RENTAL_ORDER_TYPES
+
+        # Every product first, so nothing is written for an order that cannot be made
+        if rental:
+            products = _rental_products(items)
+        else:
+            catalog = _ServiceCatalog()
+            products = [_service_product(catalog, item, order_data) for item in items]
+
+        lines = []
+        for item, product in zip(items, products):
+            # The product's own price; the page's cost for products without one
+            unit_price = product.price if product.price and product.price > 0 else Decimal(str(item.get('cost', 0)))
+            quantity = int(item.get('quantity', 1))
+            line_total = unit_price * quantity
+            # A customize item's page cost includes extras (fabric, customization) on top of the base price
+            frontend_cost = Decimal(str(item.get('cost', 0)))
+            if order_type == 'customize' and product.price and product.price > 0 and frontend_cost > line_total:
+                line_total = frontend_cost
+            lines.append((product, quantity, unit_price, line_total))
+        total = sum((line[3] for line in lines), Decimal('0'))
+
+        order = Order.objects.create(
+            idempotency_key=key,
+            customer=_customer(order_data),
+            order_type=order_type,
+            status='pending',
+            total_amount=total,
+            paid_amount=total,
+            payment_method=order_data.get('payment_method', order_data.get('paymentMethod', 'cash')),
+            notes=_order_notes(order_data),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, unit_price=unit_price, total_price=line_total)
+            for product, quantity, unit_price, line_total in lines
+        ])
+        # bulk_create skips the item signal that refreshes the orders-list summary
+        OrderCategoryManager.schedule_refresh(order.pk)
+
+        if rental:
+            now = timezone.now()
+            for product in products:
+                # Conditional, so two counters cannot rent out the same gown
+                taken = Product.objects.filter(pk=product.pk, rental_status='available').update(
+                    rental_status='rented',
+                    current_rental_order=order,
+                    rental_start_date=now,
+                    rental_due_date=now + timedelta(days=3),
+                    updated_at=now,
+                )
+                if not taken:
+                    raise OrderCreationError(f'Product {product.name} is not available for rental (status: rented)')
+                ChangeFeed.record(Product, [product.pk])
+                InventoryTransaction.objects.create(
+                    product=product,
+                    transaction_type='rental_out',
+                    quantity=1,  # Rental is always 1 item
+                    reference_order=order,
+                    notes=f'Rented out for order {order.order_identifier}',
+                )
+        elif order_type in ('repair', 'customize'):
+            try:
+                with transaction.atomic():
+                    MaterialDeductionPlanner.apply(order, order_data)
+            except Exception as e:
+                # Missing materials never block the order, as before
+                logger.error(f"[ORDER_CREATION] Material deduction failed for {order.order_identifier}: {e}")
+        return order
@@ -0,0 +1,143 @@
+"""
+Order tracking lookup
+=====================
+The tracking views resolved a typed order identifier by trying one
+``Order.objects.get`` per spelling variant ("TS01REP-037", "TS01REP-O37",
+...), then case-insensitive variants, the UUID, the primary key and finally
+an ``icontains`` scan - up to a dozen queries and a full-table LIKE for a
+single mistyped id, on a page anyone can reach without logging in.
+
+Every Order now stores ``tracking_key``, its identifier folded to one
+canonical spelling by ``tracking_key()`` (upper case, no spaces, no "O"
+before the number, no leading zeros: "ts01rep-o037" -> "TS01REP-37"). It
+is set by ``Order.save()`` and indexed, so ``OrderTracking.find`` resolves
+any accepted spelling - or the order's UUID - with one indexed query.
+
+The public page additionally goes through ``OrderTracking.throttled``, a
+fixed-window per-IP request counter, and ``find_cached``, which remembers
+each IP's recent answers (found or not) so a client repeating a lookup
+does not reach the database. Both live in the Django cache; with the
+default per-process cache every worker counts separately.
+"""
+
+import hashlib
+import logging
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+# Most candidate rows one lookup reads; several only when legacy
+# identifiers differ just in zero padding
+MAX_CANDIDATES = 5
+
+
+def tracking_key(identifier):
+    """Canonical lookup spelling of an order identifier"""
+    text = re.sub(r'\s+', '', identifier or '').upper()
+    match = re.fullmatch(r'([A-Z0-9]+)-O?(\d+)', text)
+    if match:
+        return f'{match[1]}-{int(match[2])}'
+    return text
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class OrderTracking:
+    """
+    Indexed order lookup for the tracking pages, with per-IP throttling
+    """
+
+    @staticmethod
+    def find(raw, include_pk=False):
+        """
+        The order a typed identifier or UUID refers to, or None. With
+        ``include_pk`` a bare number also matches the primary key (staff
+        views only: on the public page it would let anyone walk the orders).
+        """
+        raw = (raw or '').strip()
+        if not raw:
+            return None
+
+        condition = Q(tracking_key=tracking_key(raw))
+        try:
+            condition |= Q(order_id=uuid.UUID(raw))
+        except ValueError:
+            pass
+        if include_pk and raw.isdigit():
+            condition |= Q(pk=int(raw))
+
+        candidates = list(Order.objects.filter(condition).order_by('pk')[:MAX_CANDIDATES])
+        if not candidates:
+            return None
+        # Prefer the identifier exactly as typed over other paddings of the same number
+        return next(
+            (order for order in candidates if order.order_identifier.upper() == raw.upper()),
+            candidates[0],
+        )
+
+    @staticmethod
+    def client_ip(request):
+        """
+        The client address the limits apply to. Behind a proxy set
+        TRACKING_CLIENT_IP_HEADER (e.g. HTTP_X_FORWARDED_FOR). Proxies append
+        to that list and anything before their entries is what the client
+        sent, so the address is taken TRACKING_TRUSTED_PROXIES entries from
+        the right.
+        """
+        header = _setting('TRACKING_CLIENT_IP_HEADER', 'REMOTE_ADDR')
+        value = request.META.get(header) or request.META.get('REMOTE_ADDR') or 'unknown'
+        addresses = [address.strip() for address in value.split(',') if address.strip()] or ['unknown']
+        trusted = max(1, _setting('TRACKING_TRUSTED_PROXIES', 1))
+        # A shorter list than expected was not padded by the client
+        return addresses[max(len(addresses) - trusted, 0)]
+
+    @staticmethod
+    def throttled(request):
+        """
+        Count a lookup against the client's window; True if it is over
+        TRACKING_RATE_LIMIT lookups per TRACKING_RATE_WINDOW seconds
+        """
+        limit = _setting('TRACKING_RATE_LIMIT', 20)
+        window = _setting('TRACKING_RATE_WINDOW', 60)
+        ip = OrderTracking.client_ip(request)
+        key = f'order_tracking:rate:{ip}:{int(time.time() // window)}'
+        cache.add(key, 0, timeout=window)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(key, 1, timeout=window)
+            count = 1
+        if count > limit:
+            if count == limit + 1:
+                logger.warning(f"[ORDER_TRACKING] {ip} exceeded {limit} lookups in {window}s")
+            return True
+        return False
+
+    @staticmethod
+    def find_cached(request, raw):
+        """
+        ``find`` for the public page, remembering this client's answers for
+        TRACKING_RESULT_CACHE_TIMEOUT seconds. Returns the order's pk or None.
+        """
+        key = tracking_key(raw)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        cache_key = f'order_tracking:result:{OrderTracking.client_ip(request)}:{digest}'
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached or None
+
+        order = OrderTracking.find(raw)
+        pk = order.pk if order else None
+        cache.set(cache_key, pk or 0, timeout=_setting('TRACKING_RESULT_CACHE_TIMEOUT', 60))
+        return pk
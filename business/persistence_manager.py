@@ -185,7 +185,7 @@ class PersistenceManager:
     def _log_changes(instance: Model, original_state: Optional[Dict[str, Any]] = None) -> None:
         """Log changes to ActivityLog if model supports it."""
         try:
-            from .models import ActivityLog
+            from .activity_log_manager import ActivityLogWriter
             
             # Map to valid activity types based on model class
             model_name = instance.__class__.__name__
@@ -221,7 +221,7 @@ class PersistenceManager:
                 'object_id': str(instance.pk) if instance.pk else None
             }
             
-            ActivityLog.objects.create(
+            ActivityLogWriter.record(
                 activity_type=activity_type,
                 description=description,
                 metadata=metadata
@@ -233,7 +233,7 @@ class PersistenceManager:
     def _log_deletion(model_class: type, deleted_state: Dict[str, Any]) -> None:
         """Log deletion to ActivityLog."""
         try:
-            from .models import ActivityLog
+            from .activity_log_manager import ActivityLogWriter
             
             # Store model_name in metadata
             metadata = {
@@ -241,7 +241,7 @@ class PersistenceManager:
                 'deleted_state': deleted_state
             }
             
-            ActivityLog.objects.create(
+            ActivityLogWriter.record(
                 activity_type='product_archived',  # Use valid activity type
                 description=f"Deleted {model_class.__name__}: {json.dumps(deleted_state, default=str)}",
                 metadata=metadata
@@ -348,7 +348,7 @@ class ChangeTracker:
             user: User who made the change (optional)
         """
         try:
-            from .models import ActivityLog
+            from .activity_log_manager import ActivityLogWriter
             
             # Map action to valid activity_type
             action_type_map = {
@@ -373,7 +373,7 @@ class ChangeTracker:
                 'changes': changes
             }
             
-            ActivityLog.objects.create(
+            ActivityLogWriter.record(
                 activity_type=activity_type,
                 description=description,
                 user=user,
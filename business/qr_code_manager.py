@@ -0,0 +1,199 @@
+"""
+Content-addressed order QR codes
+================================
+``generate_qr_code`` used to encode a high error-correction QR image and
+rewrite it through ``QRCode.qr_code_image.save`` on every call, even when
+nothing it encodes had changed.
+
+A QR image is now stored as ``qr_codes/<sha256 of its JSON payload>.png``
+and QRCode.payload_hash records which payload the order's image shows:
+
+- same payload as stored -> nothing is encoded or written;
+- a file for the payload already exists -> the row is pointed at it;
+- otherwise the image is encoded once and written under its hash.
+
+Invalidation rule: the payload holds the order identifier, type, customer
+name, date and balance, so any change to those - a payment changing the
+balance above all - changes the hash. The stale image is then replaced
+the next time the code is needed (the receipt renders it lazily), and
+the ``generate_qr_codes`` command refreshes codes in bulk and prunes
+image files no order points to any more.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import hashlib
+import io
+import json
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import QRCode
+
+logger = logging.getLogger(__name__)
+
+QR_CODE_DIR = 'qr_codes'
+
+
+def qr_payload(order):
+    """JSON encoded in an order's QR code (short keys keep the code easy to scan)"""
+    balance = order.balance
+    if balance is None:
+        balance = order.total_amount - order.paid_amount
+    created = order.created_at or timezone.now()
+    return json.dumps({
+        'id': str(order.order_identifier) if order.order_identifier else str(order.order_id),
+        'type': order.get_order_type_display(),
+        'customer': order.customer.name if order.customer else 'N/A',
+        'date': created.strftime('%Y-%m-%d'),
+        'balance': float(balance),
+    })
+
+
+def payload_hash(payload):
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_qr_png(payload):
+    """PNG bytes of a QR code for ``payload``; runs in worker processes too"""
+    import qrcode
+
+    qr = qrcode.QRCode(
+        version=None,  # Auto-select version based on data size
+        box_size=12,  # Slightly larger for better scanning
+        border=4,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,  # High error correction for reliability
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCodeManager:
+    """
+    Order QR codes stored under the hash of their payload
+    """
+
+    @staticmethod
+    def image_name(digest):
+        return f'{QR_CODE_DIR}/{digest}.png'
+
+    @staticmethod
+    def is_current(qr_code, digest):
+        return bool(qr_code and qr_code.payload_hash == digest and qr_code.qr_code_image)
+
+    @staticmethod
+    def _store(digest, png):
+        """Write an image under its hash unless it is already there; return its name"""
+        name = QRCodeManager.image_name(digest)
+        if default_storage.exists(name):
+            return name
+        return default_storage.save(name, ContentFile(png))
+
+    @staticmethod
+    def ensure(order):
+        """Return the order's up-to-date QRCode, encoding and writing only if needed"""
+        payload = qr_payload(order)
+        digest = payload_hash(payload)
+        qr_code = QRCode.objects.filter(order=order).first()
+        if QRCodeManager.is_current(qr_code, digest):
+            return qr_code
+
+        name = QRCodeManager.image_name(digest)
+        if not default_storage.exists(name):
+            name = QRCodeManager._store(digest, render_qr_png(payload))
+
+        if qr_code is None:
+            qr_code = QRCode(order=order)
+        qr_code.qr_code_image.name = name
+        qr_code.payload_hash = digest
+        qr_code.save()
+        return qr_code
+
+    @staticmethod
+    def ensure_many(orders, processes=None, chunk_size=200):
+        """
+        Bring the QR codes of many orders up to date.
+
+        Missing images are encoded in a process pool; database rows are
+        written in bulk. Returns (rows_updated, images_written).
+        """
+        updated = 0
+        written = 0
+        chunk = []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for order in orders:
+                chunk.append(order)
+                if len(chunk) >= chunk_size:
+                    counts = QRCodeManager._ensure_chunk(chunk, pool)
+                    updated, written = updated + counts[0], written + counts[1]
+                    chunk = []
+            if chunk:
+                counts = QRCodeManager._ensure_chunk(chunk, pool)
+                updated, written = updated + counts[0], written + counts[1]
+        return updated, written
+
+    @staticmethod
+    def _ensure_chunk(orders, pool):
+        existing = {qr.order_id: qr for qr in QRCode.objects.filter(order__in=orders)}
+        stale = []
+        to_render = {}
+        for order in orders:
+            payload = qr_payload(order)
+            digest = payload_hash(payload)
+            qr_code = existing.get(order.pk)
+            if QRCodeManager.is_current(qr_code, digest):
+                continue
+            stale.append((order, qr_code, digest))
+            if digest not in to_render and not default_storage.exists(QRCodeManager.image_name(digest)):
+                to_render[digest] = payload
+
+        digests = list(to_render)
+        for digest, png in zip(digests, pool.map(render_qr_png, [to_render[d] for d in digests])):
+            QRCodeManager._store(digest, png)
+
+        to_create, to_update = [], []
+        for order, qr_code, digest in stale:
+            if qr_code is None:
+                qr_code = QRCode(order=order)
+                to_create.append(qr_code)
+            else:
+                to_update.append(qr_code)
+            qr_code.qr_code_image.name = QRCodeManager.image_name(digest)
+            qr_code.payload_hash = digest
+        QRCode.objects.bulk_create(to_create)
+        QRCode.objects.bulk_update(to_update, ['qr_code_image', 'payload_hash'])
+        return len(stale), len(to_render)
+
+    @staticmethod
+    def orphaned_images(min_age=3600):
+        """
+        Images in the QR code directory no QRCode row points to, including
+        legacy per-order files; recent files are skipped so an image being
+        stored right now is not mistaken for an orphan
+        """
+        try:
+            _, files = default_storage.listdir(QR_CODE_DIR)
+        except FileNotFoundError:
+            return []
+        in_use = set(QRCode.objects.values_list('qr_code_image', flat=True))
+        cutoff = timezone.now() - timedelta(seconds=min_age)
+        return [
+            name for name in (f'{QR_CODE_DIR}/{filename}' for filename in files)
+            if name not in in_use and default_storage.get_modified_time(name) < cutoff
+        ]
+
+    @staticmethod
+    def prune(min_age=3600):
+        """Delete orphaned QR images; return how many"""
+        orphans = QRCodeManager.orphaned_images(min_age=min_age)
+        for name in orphans:
+            default_storage.delete(name)
+        if orphans:
+            logger.info(f"[QR_CODE] Pruned {len(orphans)} unused QR image(s)")
+        return len(orphans)
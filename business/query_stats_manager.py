@@ -0,0 +1,145 @@
+"""
+Per-request SQL instrumentation
+===============================
+QueryRecorder hooks the database connections with ``execute_wrapper`` for
+the length of one request and records every statement with its duration.
+From that it reports the query count, total SQL time, the slowest
+statements and the statements that ran more than once with the same SQL
+(the usual sign of a per-row lookup in a loop).
+
+QueryStats keeps a rolling window of those reports per view in memory,
+for the staff-only ``api/query-stats/`` endpoint; the middleware in
+``business.middleware.query_instrumentation_middleware`` ties the two to
+each request and adds a ``Server-Timing`` header.
+"""
+
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+import re
+import threading
+import time
+
+from django.db import connections
+
+# Statements listed as slowest / duplicated per request
+TOP_STATEMENTS = 5
+
+# Statement text kept per entry
+SQL_PREVIEW_LENGTH = 300
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Group key of a statement: placeholders in IN lists collapse, whitespace folds"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(%s, ...)', sql)).strip()
+
+
+class QueryRecorder:
+    """
+    Records the statements run on all database connections inside ``with``
+    """
+
+    def __init__(self):
+        self.statements = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        return False
+
+    def _record(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, (time.perf_counter() - started) * 1000))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, duration in self.statements)
+
+    def slowest(self, limit=TOP_STATEMENTS):
+        ranked = sorted(self.statements, key=lambda statement: statement[1], reverse=True)[:limit]
+        return [
+            {'sql': sql[:SQL_PREVIEW_LENGTH], 'ms': round(duration, 2)}
+            for sql, duration in ranked
+        ]
+
+    def duplicates(self, limit=TOP_STATEMENTS):
+        groups = Counter(normalize_sql(sql) for sql, _ in self.statements)
+        return [
+            {'sql': sql[:SQL_PREVIEW_LENGTH], 'count': count}
+            for sql, count in groups.most_common(limit)
+            if count > 1
+        ]
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.total_ms, 2),
+            'slowest': self.slowest(),
+            'duplicates': self.duplicates(),
+        }
+
+
+class QueryStats:
+    """
+    Rolling in-memory window of per-request query summaries, per view
+    """
+
+    _lock = threading.Lock()
+    _requests = defaultdict(deque)
+    window = 200
+
+    @staticmethod
+    def add(view, summary, duration_ms):
+        with QueryStats._lock:
+            history = QueryStats._requests[view]
+            history.append({**summary, 'total_ms': round(duration_ms, 2), 'at': time.time()})
+            while len(history) > QueryStats.window:
+                history.popleft()
+
+    @staticmethod
+    def reset():
+        with QueryStats._lock:
+            QueryStats._requests.clear()
+
+    @staticmethod
+    def snapshot():
+        """Per-view aggregates over the window, heaviest views first"""
+        with QueryStats._lock:
+            history = {view: list(entries) for view, entries in QueryStats._requests.items()}
+
+        views = []
+        for view, entries in history.items():
+            counts = sorted(entry['queries'] for entry in entries)
+            latest = entries[-1]
+            views.append({
+                'view': view,
+                'requests': len(entries),
+                'avg_queries': round(sum(counts) / len(counts), 1),
+                'p95_queries': counts[min(len(counts) - 1, int(len(counts) * 0.95))],
+                'max_queries': counts[-1],
+                'avg_sql_ms': round(sum(entry['sql_ms'] for entry in entries) / len(entries), 2),
+                'avg_total_ms': round(sum(entry['total_ms'] for entry in entries) / len(entries), 2),
+                'latest': {
+                    'queries': latest['queries'],
+                    'sql_ms': latest['sql_ms'],
+                    'slowest': latest['slowest'],
+                    'duplicates': latest['duplicates'],
+                },
+            })
+        views.sort(key=lambda item: item['avg_queries'], reverse=True)
+        return views
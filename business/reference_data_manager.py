@@ -0,0 +1,207 @@
+"""
+Reference data snapshot
+=======================
+System settings, landing page images, categories and material types are
+small tables that change a few times a month, yet every rendered page
+queried SystemSettings (``dark_mode_context``), the landing page ran one
+query per image slot, and order entry looked categories and material types
+up again for each item.
+
+ReferenceData keeps the four tables in a process-wide snapshot shared by
+every request and thread; each table is loaded with one query the first
+time it is needed. The snapshot carries the version stamp it was built
+at; saving or deleting a row of any of these models bumps the stamp (see
+``business.signals``) and the next access starts a new snapshot. The stamp
+lives in the Django cache, so with a shared cache backend a save in one
+worker process reaches the others; with the default per-process cache,
+REFERENCE_DATA_TTL bounds how long another process serves old data.
+
+Snapshot objects are shared: read them, assign them to foreign keys, but
+do not modify and save them - fetch the row instead. A thread that has
+changed reference rows inside a transaction gets a snapshot of its own
+until the transaction ends, so uncommitted or rolled-back rows never reach
+the shared one.
+"""
+
+from functools import cached_property
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Category, LandingPageImage, MaterialType, SystemSettings
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'reference_data:version'
+
+# Material types the material pickers and forms leave out
+HIDDEN_MATERIAL_TYPES = ['locks', 'elastic']
+
+
+def _still_open(blocks):
+    """Whether the given atomic blocks of the default connection are all still open"""
+    if not blocks:
+        return False
+    current = connection.atomic_blocks
+    return len(current) >= len(blocks) and all(a is b for a, b in zip(current, blocks))
+
+
+class _Snapshot:
+    """One version of the reference tables; each table loads on first use"""
+
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+
+    @cached_property
+    def system_settings(self):
+        return SystemSettings.objects.filter(is_active=True).first()
+
+    @cached_property
+    def landing_images(self):
+        return {image.image_type: image for image in LandingPageImage.objects.filter(is_active=True)}
+
+    @cached_property
+    def categories(self):
+        return list(Category.objects.order_by('pk'))
+
+    @cached_property
+    def categories_by_name(self):
+        by_name = {}
+        for category in self.categories:
+            by_name.setdefault(category.name, category)
+        return by_name
+
+    @cached_property
+    def material_types(self):
+        return list(MaterialType.objects.order_by('name'))
+
+
+class ReferenceData:
+    """
+    Process-wide snapshot of the rarely changing reference tables
+    """
+
+    _lock = threading.Lock()
+    _snapshot = None
+    _local = threading.local()
+
+    @staticmethod
+    def version():
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    @staticmethod
+    def _bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        ReferenceData.invalidate()
+
+    @staticmethod
+    def _committed():
+        ReferenceData._local.pending = None
+        ReferenceData._bump()
+
+    @staticmethod
+    def bump():
+        """Invalidate the snapshot in every process sharing the cache"""
+        ReferenceData._bump()
+        if connection.in_atomic_block and not _still_open(ReferenceData._pending()):
+            ReferenceData._local.pending = list(connection.atomic_blocks)
+        # Again once the change is visible: a rebuild between the save and
+        # the commit would otherwise keep the old rows under the new stamp
+        transaction.on_commit(ReferenceData._committed)
+
+    @staticmethod
+    def invalidate():
+        """Drop this process's snapshot, e.g. after the tables were flushed"""
+        with ReferenceData._lock:
+            ReferenceData._snapshot = None
+        ReferenceData._local.snapshot = None
+
+    @staticmethod
+    def _pending():
+        """Atomic blocks open when this thread last changed reference rows, until that commits"""
+        pending = getattr(ReferenceData._local, 'pending', None)
+        if pending and not _still_open(pending[:1]):
+            # The transaction ended without committing
+            pending = ReferenceData._local.pending = None
+        return pending
+
+    @staticmethod
+    def snapshot():
+        version = ReferenceData.version()
+
+        if ReferenceData._pending():
+            # This thread holds uncommitted reference changes: build a
+            # snapshot only it sees, valid while its transaction is open
+            snapshot = getattr(ReferenceData._local, 'snapshot', None)
+            if snapshot is None or snapshot.version != version or not _still_open(snapshot.atomic_blocks):
+                snapshot = _Snapshot(version)
+                snapshot.atomic_blocks = list(connection.atomic_blocks)
+                ReferenceData._local.snapshot = snapshot
+            return snapshot
+
+        ttl = getattr(settings, 'REFERENCE_DATA_TTL', 300)
+        with ReferenceData._lock:
+            snapshot = ReferenceData._snapshot
+            if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.built_at <= ttl:
+                return snapshot
+            snapshot = ReferenceData._snapshot = _Snapshot(version)
+        logger.debug(f"[REFERENCE_DATA] Snapshot {version} built")
+        return snapshot
+
+    @staticmethod
+    def system_settings():
+        """The active SystemSettings, or None"""
+        return ReferenceData.snapshot().system_settings
+
+    @staticmethod
+    def landing_images():
+        """Active landing page images by image type; missing types map to None"""
+        images = ReferenceData.snapshot().landing_images
+        return {image_type: images.get(image_type) for image_type, _ in LandingPageImage.IMAGE_TYPE_CHOICES}
+
+    @staticmethod
+    def categories():
+        return list(ReferenceData.snapshot().categories)
+
+    @staticmethod
+    def category(name, description=''):
+        """The category called ``name``, created on first use like get_or_create"""
+        category = ReferenceData.snapshot().categories_by_name.get(name)
+        if category is None:
+            category, _ = Category.objects.get_or_create(name=name, defaults={'description': description})
+        return category
+
+    @staticmethod
+    def material_types():
+        """All material types by name"""
+        return list(ReferenceData.snapshot().material_types)
+
+    @staticmethod
+    def picker_material_types():
+        """Material types offered in the material forms, by name"""
+        return [
+            material_type for material_type in ReferenceData.snapshot().material_types
+            if material_type.name.lower() not in HIDDEN_MATERIAL_TYPES
+        ]
+
+    @staticmethod
+    def material_type_containing(fragment):
+        """First material type by name whose name contains ``fragment`` (case-insensitive)"""
+        fragment = fragment.lower()
+        return next(
+            (material_type for material_type in ReferenceData.snapshot().material_types
+             if fragment in material_type.name.lower()),
+            None,
+        )
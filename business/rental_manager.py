@@ -1,11 +1,113 @@
+from datetime import timedelta
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import BooleanField, Case, CharField, F, OuterRef, Q, Subquery, Value, When
 from django.contrib.auth.models import User
 from .models import Product, Order, OrderItem, InventoryTransaction
+from .rental_state_manager import ACTIVE_RENTAL_STATUSES, RENTAL_ORDER_TYPES
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class RentalStatusResolver:
+    """
+    Derives rented / almost-due / overdue state for rental products in one query
+
+    The state comes from, in order of trust: the latest active rental order
+    holding the product, the product's current_rental_order, and finally its
+    own rental_status field. A rental is almost due when less than two days
+    are left (Order.days_until_due of 0 or 1) and overdue once the due date
+    has passed.
+    """
+
+    @staticmethod
+    def annotate(queryset, now=None):
+        """
+        Annotate a Product queryset with:
+            active_order_id, active_order_start, active_order_due - latest active rental order
+            rental_is_rented - whether the product is out on rent
+            rental_due - the due date the state is based on
+            rental_state - 'overdue', 'almost_due', 'rented' or the product's rental_status
+        """
+        now = now or timezone.now()
+        active_items = OrderItem.objects.filter(
+            product_id=OuterRef('pk'),
+            order__order_type__in=RENTAL_ORDER_TYPES,
+            order__status__in=ACTIVE_RENTAL_STATUSES,
+        ).order_by('-order__created_at', '-order_id')
+
+        return queryset.annotate(
+            active_order_id=Subquery(active_items.values('order_id')[:1]),
+            active_order_start=Subquery(active_items.values('order__created_at')[:1]),
+            active_order_due=Subquery(active_items.values('order__due_date')[:1]),
+        ).annotate(
+            rental_is_rented=Case(
+                When(
+                    Q(active_order_id__isnull=False)
+                    | Q(current_rental_order__isnull=False)
+                    | Q(rental_status='rented'),
+                    then=Value(True),
+                ),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            rental_due=Case(
+                When(active_order_id__isnull=False, then=F('active_order_due')),
+                default=F('rental_due_date'),
+            ),
+        ).annotate(
+            rental_state=Case(
+                When(rental_is_rented=True, rental_due__lt=now, then=Value('overdue')),
+                When(rental_is_rented=True, rental_due__lt=now + timedelta(days=2), then=Value('almost_due')),
+                When(rental_is_rented=True, then=Value('rented')),
+                default=F('rental_status'),
+                output_field=CharField(),
+            ),
+        )
+
+    @staticmethod
+    def resolve(queryset=None, now=None):
+        """
+        Return {product_id: status dict} for active, unarchived rental products
+        (or the given Product queryset), in the shape API endpoints expect
+        """
+        if queryset is None:
+            queryset = Product.objects.filter(is_active=True, is_archived=False, product_type='rental')
+        rows = RentalStatusResolver.annotate(queryset, now=now).values(
+            'id', 'name', 'rental_status', 'current_rental_order_id', 'rental_start_date', 'rental_due_date',
+            'active_order_id', 'active_order_start', 'rental_is_rented', 'rental_due', 'rental_state',
+        )
+
+        status_data = {}
+        for row in rows:
+            is_active_order = row['active_order_id'] is not None
+            is_overdue = row['rental_state'] in ['overdue', 'almost_due']
+            if is_overdue:
+                # Almost due is shown as overdue
+                rental_status = 'overdue'
+            elif row['rental_is_rented']:
+                rental_status = 'rented'
+            else:
+                rental_status = row['rental_status']
+            start = row['active_order_start'] if is_active_order else row['rental_start_date']
+            due = row['rental_due'] or row['rental_due_date']
+
+            status_data[row['id']] = {
+                'product_id': row['id'],
+                'product_name': row['name'],
+                'rental_status': rental_status,
+                'has_current_order': is_active_order or row['current_rental_order_id'] is not None,
+                'current_order_id': row['active_order_id'] or row['current_rental_order_id'],
+                'rental_start_date': start.isoformat() if start else None,
+                'rental_due_date': due.isoformat() if due else None,
+                'is_overdue': is_overdue,
+                'is_almost_due': row['rental_state'] == 'almost_due',
+                'is_rented': row['rental_is_rented'],
+            }
+        return status_data
+
+
 class RentalStatusManager:
     """
     Comprehensive rental status management system
@@ -158,134 +260,7 @@ class RentalStatusManager:
         Used by API endpoints to provide real-time status
         """
         try:
-            rental_products = Product.objects.filter(
-                is_active=True,
-                is_archived=False,
-                product_type='rental'
-            ).select_related('category', 'current_rental_order')
-            
-            status_data = {}
-            
-            for product in rental_products:
-                # Determine rental status using multiple methods
-                # PRIORITY: Check active orders first (most reliable source of truth)
-                is_rented = False
-                rental_info = {
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'rental_status': product.rental_status,
-                    'has_current_order': bool(product.current_rental_order),
-                    'current_order_id': product.current_rental_order.id if product.current_rental_order else None,
-                    'rental_start_date': product.rental_start_date.isoformat() if product.rental_start_date else None,
-                    'rental_due_date': product.rental_due_date.isoformat() if product.rental_due_date else None,
-                    'is_overdue': False
-                }
-                
-                # FIRST: Check for active rental orders containing this product (most reliable)
-                # Check both through OrderItems and through direct order filtering
-                # Active rental orders are those that haven't been returned, completed, or cancelled
-                
-                # Method 1: Check through OrderItems (most direct)
-                from .models import OrderItem
-                active_order_items = OrderItem.objects.filter(
-                    product=product,
-                    order__order_type__in=['rent', 'rental'],
-                    order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-                ).select_related('order').first()
-                
-                # Log if we found an order item
-                if active_order_items:
-                    logger.debug(f"[RENTAL_MANAGER] Product {product.name} (ID: {product.id}) found in active order {active_order_items.order.order_identifier}")
-                
-                # Method 2: Check through Order reverse relation (backup)
-                active_rental_order = None
-                if active_order_items:
-                    active_rental_order = active_order_items.order
-                else:
-                    active_rental_order = Order.objects.filter(
-                        order_type__in=['rent', 'rental'],
-                        status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress'],
-                        items__product=product
-                    ).distinct().first()
-                
-                if active_rental_order:
-                    is_rented = True
-                    rental_info['rental_status'] = 'rented'
-                    rental_info['has_current_order'] = True
-                    rental_info['current_order_id'] = active_rental_order.id
-                    
-                    # Get rental dates from order if available
-                    # Order has due_date, Product has rental_start_date and rental_due_date
-                    if active_rental_order.created_at:
-                        rental_info['rental_start_date'] = active_rental_order.created_at.isoformat()
-                    if active_rental_order.due_date:
-                        rental_info['rental_due_date'] = active_rental_order.due_date.isoformat()
-                        # Check if overdue or almost due
-                        now = timezone.now()
-                        time_until_due = active_rental_order.due_date - now
-                        days_until_due = time_until_due.days
-                        
-                        if now > active_rental_order.due_date:
-                            # Overdue
-                            rental_info['is_overdue'] = True
-                            rental_info['is_almost_due'] = False
-                            rental_info['rental_status'] = 'overdue'
-                        elif days_until_due == 0 or days_until_due == 1 or (time_until_due.total_seconds() > 0 and time_until_due.total_seconds() <= 86400):
-                            # Almost due (1 day before or on due date, or within 24 hours)
-                            rental_info['is_overdue'] = True  # Treat almost due as overdue for display
-                            rental_info['is_almost_due'] = True
-                            rental_info['rental_status'] = 'overdue'
-                
-                # SECOND: Check current_rental_order field
-                elif product.current_rental_order:
-                    is_rented = True
-                    rental_info['rental_status'] = 'rented'
-                    rental_info['has_current_order'] = True
-                    rental_info['current_order_id'] = product.current_rental_order.id
-                    # Check if overdue or almost due
-                    if product.rental_due_date:
-                        now = timezone.now()
-                        time_until_due = product.rental_due_date - now
-                        days_until_due = time_until_due.days
-                        
-                        if now > product.rental_due_date:
-                            # Overdue
-                            rental_info['is_overdue'] = True
-                            rental_info['is_almost_due'] = False
-                            rental_info['rental_status'] = 'overdue'
-                        elif days_until_due == 0 or days_until_due == 1 or (time_until_due.total_seconds() > 0 and time_until_due.total_seconds() <= 86400):
-                            # Almost due (1 day before or on due date, or within 24 hours)
-                            rental_info['is_overdue'] = True  # Treat almost due as overdue for display
-                            rental_info['is_almost_due'] = True
-                            rental_info['rental_status'] = 'overdue'
-                
-                # THIRD: Check product.rental_status field (may be out of sync)
-                elif product.rental_status == 'rented':
-                    is_rented = True
-                    # Check if overdue or almost due
-                    if product.rental_due_date:
-                        now = timezone.now()
-                        time_until_due = product.rental_due_date - now
-                        days_until_due = time_until_due.days
-                        
-                        if now > product.rental_due_date:
-                            # Overdue
-                            rental_info['is_overdue'] = True
-                            rental_info['is_almost_due'] = False
-                            rental_info['rental_status'] = 'overdue'
-                        elif days_until_due == 0 or days_until_due == 1 or (time_until_due.total_seconds() > 0 and time_until_due.total_seconds() <= 86400):
-                            # Almost due (1 day before or on due date, or within 24 hours)
-                            rental_info['is_overdue'] = True  # Treat almost due as overdue for display
-                            rental_info['is_almost_due'] = True
-                            rental_info['rental_status'] = 'overdue'
-                
-                rental_info['is_rented'] = is_rented
-                status_data[product.id] = rental_info
-                
-                # Log rented products for debugging
-                if is_rented:
-                    logger.info(f"[RENTAL_MANAGER] Product {product.name} (ID: {product.id}) marked as RENTED")
-            
+            status_data = RentalStatusResolver.resolve()
             rented_count = sum(1 for info in status_data.values() if info.get('is_rented', False))
             logger.info(f"[RENTAL_MANAGER] Generated status for {len(status_data)} products, {rented_count} are rented")
             return status_data
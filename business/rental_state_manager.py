@@ -0,0 +1,266 @@
+"""
+Rental state engine
+===================
+Moves rental orders through almost_due -> due -> overdue as their due date
+approaches, and keeps each rental product's ``rental_status`` in line with
+the active rental orders holding it.
+
+Every transition is a single set-based UPDATE. The engine runs on a
+schedule - the ``update_rental_statuses`` command from cron, or the
+optional in-process thread enabled with ``RENTAL_STATE_INTERVAL`` - so the
+list views and APIs only read and never write while serving GET requests.
+"""
+
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .change_feed_manager import ChangeFeed
+from .models import Order, OrderItem, Product, RentalStateTick
+from .rollup_manager import SalesRollupManager, _local_day
+
+logger = logging.getLogger(__name__)
+
+RENTAL_ORDER_TYPES = ['rent', 'rental']
+
+# Order statuses that mean the rented items are still out with the customer
+ACTIVE_RENTAL_STATUSES = ['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
+
+CLOSED_ORDER_STATUSES = ['completed', 'returned', 'cancelled']
+
+LOCK_PATH = os.path.join(tempfile.gettempdir(), 'topstyle_rental_state.lock')
+
+# A lock file older than this is left over from a crashed run
+LOCK_STALE_AFTER = 600
+
+# Tick history kept in RentalStateTick
+TICK_HISTORY_DAYS = 30
+
+
+class RentalStateManager:
+    """
+    Set-based rental order and rental product status transitions
+    """
+
+    _scheduler = None
+    _scheduler_stop = None
+
+    @staticmethod
+    def order_transitions(now):
+        """Return (new_status, queryset) pairs of the rental orders due a status change"""
+        rentals = Order.objects.filter(
+            order_type__in=RENTAL_ORDER_TYPES,
+            is_archived=False,
+            due_date__isnull=False,
+        ).exclude(status__in=CLOSED_ORDER_STATUSES)
+        one_day = timedelta(days=1)
+
+        return [
+            # Past the due date
+            ('overdue', rentals.filter(due_date__lt=now).exclude(status='overdue')),
+            # Less than a day left (Order.is_due_today)
+            ('due', rentals.filter(
+                due_date__gte=now,
+                due_date__lt=now + one_day,
+            ).exclude(status__in=['due', 'overdue'])),
+            # One to two days left (Order.is_one_day_before_due)
+            ('almost_due', rentals.filter(
+                due_date__gte=now + one_day,
+                due_date__lt=now + 2 * one_day,
+            ).exclude(status__in=['almost_due', 'due', 'overdue'])),
+        ]
+
+    @staticmethod
+    def _active_rental_items():
+        """OrderItems of active rental orders for the product in the outer query"""
+        return OrderItem.objects.filter(
+            product_id=OuterRef('pk'),
+            order__order_type__in=RENTAL_ORDER_TYPES,
+            order__status__in=ACTIVE_RENTAL_STATUSES,
+        ).order_by('-order__created_at')
+
+    @staticmethod
+    def products_to_mark_rented():
+        """Rental products held by an active rental order but not marked rented"""
+        return Product.objects.filter(product_type='rental').filter(
+            Exists(RentalStateManager._active_rental_items())
+        ).exclude(rental_status='rented')
+
+    @staticmethod
+    def products_to_release():
+        """Rental products marked rented although no active rental order holds them"""
+        return Product.objects.filter(product_type='rental', rental_status='rented').exclude(
+            Exists(RentalStateManager._active_rental_items())
+        )
+
+    @staticmethod
+    def tick(dry_run=False, now=None):
+        """
+        Apply every pending transition and return what changed.
+
+        With ``dry_run`` the rows that would change are only counted.
+        """
+        started_at = now or timezone.now()
+        started = time.perf_counter()
+        stats = {}
+        touched_days = set()
+
+        with transaction.atomic():
+            for status, queryset in RentalStateManager.order_transitions(started_at):
+                if dry_run:
+                    stats[f'orders_{status}'] = queryset.count()
+                    continue
+                affected = list(queryset.values_list('pk', 'created_at'))
+                stats[f'orders_{status}'] = queryset.filter(
+                    pk__in=[pk for pk, _ in affected]
+                ).update(status=status, updated_at=started_at) if affected else 0
+                touched_days.update(_local_day(created_at) for _, created_at in affected)
+                ChangeFeed.record(Order, [pk for pk, _ in affected])
+
+            to_rent = RentalStateManager.products_to_mark_rented()
+            to_release = RentalStateManager.products_to_release()
+            if dry_run:
+                stats['products_rented'] = to_rent.count()
+                stats['products_released'] = to_release.count()
+            else:
+                active_items = RentalStateManager._active_rental_items()
+                # The ids first, for the change feed; the updates re-check the conditions
+                rent_pks = list(to_rent.values_list('pk', flat=True))
+                release_pks = list(to_release.values_list('pk', flat=True))
+                stats['products_rented'] = to_rent.filter(pk__in=rent_pks).update(
+                    rental_status='rented',
+                    current_rental_order=Subquery(active_items.values('order_id')[:1]),
+                    rental_start_date=Coalesce(
+                        F('rental_start_date'), Subquery(active_items.values('order__created_at')[:1])
+                    ),
+                    rental_due_date=Coalesce(
+                        F('rental_due_date'), Subquery(active_items.values('order__due_date')[:1])
+                    ),
+                    updated_at=started_at,
+                )
+                stats['products_released'] = to_release.filter(pk__in=release_pks).update(
+                    rental_status='available',
+                    current_rental_order=None,
+                    rental_start_date=None,
+                    rental_due_date=None,
+                    updated_at=started_at,
+                )
+                ChangeFeed.record(Product, rent_pks + release_pks)
+
+            # Bulk UPDATEs skip the Order signals, so refresh the status
+            # rollups of the days whose orders moved
+            for day in touched_days:
+                SalesRollupManager.refresh_order_day(day)
+
+        orders_changed = sum(count for key, count in stats.items() if key.startswith('orders_'))
+        products_changed = stats['products_rented'] + stats['products_released']
+        duration_ms = int((time.perf_counter() - started) * 1000)
+
+        if not dry_run:
+            RentalStateTick.objects.create(
+                started_at=started_at,
+                duration_ms=duration_ms,
+                orders_changed=orders_changed,
+                products_changed=products_changed,
+                details=stats,
+            )
+            RentalStateTick.objects.filter(
+                started_at__lt=started_at - timedelta(days=TICK_HISTORY_DAYS)
+            ).delete()
+
+        logger.info(
+            f"[RENTAL_STATE] {'Dry run: ' if dry_run else ''}{orders_changed} order(s), "
+            f"{products_changed} product(s) changed in {duration_ms}ms {stats}"
+        )
+        return {
+            **stats,
+            'orders_changed': orders_changed,
+            'products_changed': products_changed,
+            'duration_ms': duration_ms,
+        }
+
+    @staticmethod
+    @contextmanager
+    def tick_lock():
+        """Yield True if this process holds the engine lock, False if another run does"""
+        try:
+            fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                stale = time.time() - os.path.getmtime(LOCK_PATH) > LOCK_STALE_AFTER
+            except OSError:
+                stale = False
+            if not stale:
+                yield False
+                return
+            logger.warning(f"[RENTAL_STATE] Removing stale lock {LOCK_PATH}")
+            os.remove(LOCK_PATH)
+            fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield True
+        finally:
+            try:
+                os.remove(LOCK_PATH)
+            except OSError:
+                pass
+
+    @staticmethod
+    def run_tick(dry_run=False):
+        """Run one tick under the engine lock; return None if another run holds it"""
+        with RentalStateManager.tick_lock() as acquired:
+            if not acquired:
+                logger.info("[RENTAL_STATE] Another tick is running, skipping")
+                return None
+            return RentalStateManager.tick(dry_run=dry_run)
+
+    @staticmethod
+    def start_scheduler(interval):
+        """Run a tick every ``interval`` seconds on a daemon thread"""
+        if RentalStateManager._scheduler and RentalStateManager._scheduler.is_alive():
+            return RentalStateManager._scheduler
+
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    RentalStateManager.run_tick()
+                except Exception as e:
+                    logger.error(f"[RENTAL_STATE] Scheduled tick failed: {e}")
+                finally:
+                    close_old_connections()
+
+        thread = threading.Thread(target=loop, name='rental-state-engine', daemon=True)
+        RentalStateManager._scheduler = thread
+        RentalStateManager._scheduler_stop = stop
+        thread.start()
+        logger.info(f"[RENTAL_STATE] Scheduler started, ticking every {interval}s")
+        return thread
+
+    @staticmethod
+    def stop_scheduler():
+        """Stop the in-process scheduler thread, if running"""
+        if RentalStateManager._scheduler_stop:
+            RentalStateManager._scheduler_stop.set()
+        RentalStateManager._scheduler = None
+        RentalStateManager._scheduler_stop = None
+
+    @staticmethod
+    def should_autostart():
+        """Only start the thread in the web server, not in other manage.py commands"""
+        if os.path.basename(sys.argv[0]) != 'manage.py':
+            return True
+        return len(sys.argv) > 1 and sys.argv[1] in ('runserver', 'runserver_quiet', 'start_system')
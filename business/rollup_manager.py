@@ -0,0 +1,264 @@
+"""
+Daily order and sales rollups
+=============================
+Keeps DailyOrderRollup / DailySalesRollup in step with the Order and Sales
+tables so the dashboard, orders list and reports read a handful of
+pre-summed rows instead of scanning every order on each page load.
+
+Buckets are local calendar days. Any write to an order or sale refreshes
+only the day it belongs to, with one GROUP BY query and one upsert.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyOrderRollup, DailySalesRollup, Order, Sales
+
+logger = logging.getLogger(__name__)
+
+
+def _local_day(value):
+    """Return the local calendar date of an aware datetime"""
+    if value is None:
+        return timezone.localdate()
+    return timezone.localtime(value).date()
+
+
+def _day_bounds(day):
+    """Return the aware [start, end) datetimes covering a local day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+class SalesRollupManager:
+    """
+    Maintains and reads the daily order/sales rollup tables
+    """
+
+    @staticmethod
+    def refresh_order_day(day):
+        """Recompute every DailyOrderRollup row for one local day"""
+        start, end = _day_bounds(day)
+        buckets = Order.objects.filter(
+            created_at__gte=start,
+            created_at__lt=end,
+        ).values('order_type', 'status', 'is_archived').annotate(
+            order_count=Count('id'),
+            amount=Sum('total_amount'),
+        ).order_by()
+
+        rows = [
+            DailyOrderRollup(
+                date=day,
+                order_type=bucket['order_type'],
+                status=bucket['status'],
+                is_archived=bucket['is_archived'],
+                order_count=bucket['order_count'],
+                total_amount=bucket['amount'] or Decimal('0'),
+            )
+            for bucket in buckets
+        ]
+
+        with transaction.atomic():
+            stale = DailyOrderRollup.objects.filter(date=day)
+            for row in rows:
+                stale = stale.exclude(order_type=row.order_type, status=row.status, is_archived=row.is_archived)
+            stale.delete()
+            if rows:
+                DailyOrderRollup.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['date', 'order_type', 'status', 'is_archived'],
+                    update_fields=['order_count', 'total_amount', 'updated_at'],
+                )
+
+    @staticmethod
+    def refresh_sales_day(day):
+        """Recompute every DailySalesRollup row for one local day"""
+        start, end = _day_bounds(day)
+        buckets = Sales.objects.filter(
+            created_at__gte=start,
+            created_at__lt=end,
+            order__status='completed',
+        ).values('order__order_type').annotate(
+            sales_count=Count('id'),
+            amount=Sum('amount'),
+        ).order_by()
+
+        rows = [
+            DailySalesRollup(
+                date=day,
+                order_type=bucket['order__order_type'],
+                sales_count=bucket['sales_count'],
+                revenue=bucket['amount'] or Decimal('0'),
+            )
+            for bucket in buckets
+        ]
+
+        with transaction.atomic():
+            DailySalesRollup.objects.filter(date=day).exclude(
+                order_type__in=[row.order_type for row in rows]
+            ).delete()
+            if rows:
+                DailySalesRollup.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['date', 'order_type'],
+                    update_fields=['sales_count', 'revenue', 'updated_at'],
+                )
+
+    @staticmethod
+    def order_changed(order):
+        """Refresh the buckets touched by a saved or deleted order"""
+        try:
+            SalesRollupManager.refresh_order_day(_local_day(order.created_at))
+            # A status change moves the order's sale in or out of the
+            # completed-sales rollup, so refresh the sale's day as well
+            sale_created_at = Sales.objects.filter(order_id=order.pk).values_list('created_at', flat=True).first()
+            if sale_created_at:
+                SalesRollupManager.refresh_sales_day(_local_day(sale_created_at))
+        except Exception as e:
+            logger.error(f"[ROLLUPS] Failed to refresh rollups for order {order.pk}: {e}")
+
+    @staticmethod
+    def sales_changed(sale):
+        """Refresh the bucket touched by a saved or deleted sale"""
+        try:
+            SalesRollupManager.refresh_sales_day(_local_day(sale.created_at))
+        except Exception as e:
+            logger.error(f"[ROLLUPS] Failed to refresh rollups for sale {sale.pk}: {e}")
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild_all():
+        """
+        Rebuild both rollup tables from the Order and Sales tables.
+
+        Returns:
+            Tuple of (order rollup rows, sales rollup rows) written
+        """
+        DailyOrderRollup.objects.all().delete()
+        DailySalesRollup.objects.all().delete()
+
+        order_rows = [
+            DailyOrderRollup(
+                date=bucket['day'],
+                order_type=bucket['order_type'],
+                status=bucket['status'],
+                is_archived=bucket['is_archived'],
+                order_count=bucket['order_count'],
+                total_amount=bucket['amount'] or Decimal('0'),
+            )
+            for bucket in Order.objects.annotate(day=TruncDate('created_at')).values(
+                'day', 'order_type', 'status', 'is_archived'
+            ).annotate(order_count=Count('id'), amount=Sum('total_amount')).order_by()
+        ]
+        DailyOrderRollup.objects.bulk_create(order_rows, batch_size=1000)
+
+        sales_rows = [
+            DailySalesRollup(
+                date=bucket['day'],
+                order_type=bucket['order__order_type'],
+                sales_count=bucket['sales_count'],
+                revenue=bucket['amount'] or Decimal('0'),
+            )
+            for bucket in Sales.objects.filter(order__status='completed').annotate(
+                day=TruncDate('created_at')
+            ).values('day', 'order__order_type').annotate(
+                sales_count=Count('id'), amount=Sum('amount')
+            ).order_by()
+        ]
+        DailySalesRollup.objects.bulk_create(sales_rows, batch_size=1000)
+
+        logger.info(f"[ROLLUPS] Rebuilt {len(order_rows)} order rows and {len(sales_rows)} sales rows")
+        return len(order_rows), len(sales_rows)
+
+    # ------------------------------------------------------------------
+    # Readers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def order_rollups(order_type=None, include_archived=True, since=None):
+        """
+        Queryset of order rollup rows matching the filters.
+
+        Args:
+            order_type: Restrict to one order type ('rental' is mapped to 'rent')
+            include_archived: Include archived orders
+            since: Only count days on or after this date
+        """
+        rows = DailyOrderRollup.objects.all()
+        if order_type:
+            rows = rows.filter(order_type='rent' if order_type == 'rental' else order_type)
+        if not include_archived:
+            rows = rows.filter(is_archived=False)
+        if since is not None:
+            rows = rows.filter(date__gte=since)
+        return rows
+
+    @staticmethod
+    def order_status_counts(order_type=None, include_archived=True, since=None):
+        """Return {status: order count} from the rollups"""
+        rows = SalesRollupManager.order_rollups(order_type, include_archived, since)
+        return {
+            row['status']: row['count'] or 0
+            for row in rows.values('status').annotate(count=Sum('order_count')).order_by()
+        }
+
+    @staticmethod
+    def order_type_counts(include_archived=True):
+        """Return {order_type: order count} from the rollups"""
+        rows = SalesRollupManager.order_rollups(include_archived=include_archived)
+        return {
+            row['order_type']: row['count'] or 0
+            for row in rows.values('order_type').annotate(count=Sum('order_count')).order_by()
+        }
+
+    @staticmethod
+    def order_amount_totals(order_type=None, include_archived=True, windows=None):
+        """
+        Sum order total_amount over several date windows in one query.
+
+        Args:
+            windows: Mapping of name -> start date (None for all time)
+
+        Returns:
+            Mapping of name -> Decimal total
+        """
+        windows = windows or {'total': None}
+        rows = SalesRollupManager.order_rollups(order_type, include_archived)
+        aggregates = {
+            name: Sum('total_amount', filter=Q(date__gte=start) if start else None)
+            for name, start in windows.items()
+        }
+        totals = rows.aggregate(**aggregates)
+        return {name: totals[name] or Decimal('0') for name in windows}
+
+    @staticmethod
+    def sales_totals(since=None):
+        """Return {'total_sales', 'sales_count'} for completed-order sales"""
+        rows = DailySalesRollup.objects.all()
+        if since is not None:
+            rows = rows.filter(date__gte=since)
+        totals = rows.aggregate(total=Sum('revenue'), count=Sum('sales_count'))
+        return {
+            'total_sales': totals['total'] or Decimal('0'),
+            'sales_count': totals['count'] or 0,
+        }
+
+    @staticmethod
+    def sales_by_day(since, until=None):
+        """Return {date: revenue} for completed-order sales"""
+        rows = DailySalesRollup.objects.filter(date__gte=since)
+        if until is not None:
+            rows = rows.filter(date__lt=until)
+        return {
+            row['date']: row['total'] or Decimal('0')
+            for row in rows.values('date').annotate(total=Sum('revenue')).order_by()
+        }
@@ -1,7 +1,18 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import Order, Sales, Product
+from .models import (
+    Category, Customer, InventoryTransaction, LandingPageImage, MaterialPricing, MaterialType, Order, OrderItem,
+    Product, Sales, StaffProfile, SystemSettings,
+)
+from .catalog_cache_manager import CatalogCache
+from .change_feed_manager import ChangeFeed
+from .customer_search_manager import CustomerSearch
+from .image_rendition_manager import ImageRenditions
+from .reference_data_manager import ReferenceData
+from .material_catalog_manager import MaterialCatalogManager
+from .order_category_manager import OrderCategoryManager
+from .rollup_manager import SalesRollupManager
 from decimal import Decimal
 
 
@@ -92,18 +103,154 @@ def auto_update_rental_products(sender, instance, created, **kwargs):
                 print(f"[AUTO-FIX] Product '{item.product.name}' marked as rented")
 
 
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def refresh_order_rollups(sender, instance, **kwargs):
+    """Keep the daily order/sales rollups in step with the order"""
+    SalesRollupManager.order_changed(instance)
+
+
+@receiver(post_save, sender=Sales)
+@receiver(post_delete, sender=Sales)
+def refresh_sales_rollups(sender, instance, **kwargs):
+    """Keep the daily sales rollup in step with the sale"""
+    SalesRollupManager.sales_changed(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def touch_order_customer(sender, instance, created=False, **kwargs):
+    """A new or deleted order changes the customer's order count in the customers API"""
+    if (created or kwargs['signal'] is post_delete) and instance.customer_id:
+        Customer.objects.filter(pk=instance.customer_id).update(updated_at=timezone.now())
+        ChangeFeed.record(Customer, [instance.customer_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Order)
+def record_change(sender, instance, **kwargs):
+    """Offline clients pull written rows from the change feed"""
+    ChangeFeed.record(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Order)
+def record_deletion(sender, instance, **kwargs):
+    """Offline clients drop deleted rows when the change feed says so"""
+    ChangeFeed.record(sender, [instance.pk], action='delete')
+
+
+@receiver(post_save, sender=Order)
+def refresh_order_category_summary(sender, instance, created, update_fields=None, **kwargs):
+    """Recompute the orders-list category summary when notes or type change"""
+    if update_fields and not {'notes', 'order_type'} & set(update_fields):
+        return
+    OrderCategoryManager.schedule_refresh(instance.pk)
 
 
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_item_category_summary(sender, instance, **kwargs):
+    """Recompute the orders-list category summary when items change"""
+    OrderCategoryManager.schedule_refresh(instance.order_id)
 
 
+@receiver(post_save, sender=InventoryTransaction)
+def refresh_deduction_category_summary(sender, instance, created, **kwargs):
+    """Material deduction notes name the repair type, so refresh on new deductions"""
+    if created and instance.reference_order_id:
+        OrderCategoryManager.schedule_refresh(instance.reference_order_id)
 
 
+@receiver(post_save, sender=Product)
+def refresh_material_catalog(sender, instance, **kwargs):
+    """Drop the cached material catalog when a material's attributes change"""
+    MaterialCatalogManager.product_changed(instance)
 
 
+@receiver(post_delete, sender=Product)
+def refresh_material_catalog_on_delete(sender, instance, **kwargs):
+    """Drop the cached material catalog when a listed material is deleted"""
+    MaterialCatalogManager.product_changed(instance, deleted=True)
 
 
+@receiver(post_save, sender=MaterialType)
+def refresh_material_kinds(sender, instance, created, **kwargs):
+    """A renamed material type can change its products' kind"""
+    if not created:
+        MaterialCatalogManager.material_type_changed(instance)
 
 
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def refresh_catalog_cache(sender, instance, **kwargs):
+    """Material stock, prices or images changed: drop the cached picker lists"""
+    if instance.product_type == 'material':
+        CatalogCache.changed()
 
 
+@receiver(post_save, sender=MaterialType)
+@receiver(post_delete, sender=MaterialType)
+@receiver(post_save, sender=MaterialPricing)
+@receiver(post_delete, sender=MaterialPricing)
+def refresh_catalog_cache_on_material_change(sender, instance, **kwargs):
+    """The pickers select materials by type, so any type or pricing change drops them"""
+    CatalogCache.changed()
 
+
+@receiver(post_save, sender=SystemSettings)
+@receiver(post_delete, sender=SystemSettings)
+@receiver(post_save, sender=LandingPageImage)
+@receiver(post_delete, sender=LandingPageImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=MaterialType)
+@receiver(post_delete, sender=MaterialType)
+def refresh_reference_data(sender, instance, **kwargs):
+    """Rebuild the shared reference data snapshot after any change to its tables"""
+    ReferenceData.bump()
+
+
+@receiver(post_migrate)
+def drop_reference_data(sender, **kwargs):
+    """Migrations and flushes change the tables without model signals"""
+    ReferenceData.invalidate()
+
+
+@receiver(post_migrate)
+def install_customer_search(sender, using='default', **kwargs):
+    """SQLite drops the search triggers when a migration rebuilds the customer table"""
+    if sender.name == 'business':
+        CustomerSearch.install(using=using)
+
+
+# Image field of each model with renditions (see image_rendition_manager)
+RENDITION_FIELDS = {
+    Product: 'image',
+    Order: 'customize_image',
+    StaffProfile: 'profile_image',
+    LandingPageImage: 'image',
+}
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=StaffProfile)
+@receiver(pre_save, sender=LandingPageImage)
+def note_uploaded_image(sender, instance, **kwargs):
+    """The file is written during the save, so remember now whether it is a new upload"""
+    field = getattr(instance, RENDITION_FIELDS[sender])
+    instance._image_uploaded = bool(field) and not field._committed
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=StaffProfile)
+@receiver(post_save, sender=LandingPageImage)
+def render_uploaded_image(sender, instance, **kwargs):
+    """Render the thumbnails of a newly uploaded image while it is at hand"""
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        ImageRenditions.generate(getattr(instance, RENDITION_FIELDS[sender]))
@@ -3,6 +3,7 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from decimal import Decimal
 from .models import Order, Customer, Product, OrderItem, Category
+from .customer_search_manager import CustomerSearch
 
 @login_required
 def create_rental_order_simple(request):
@@ -20,15 +21,15 @@ def create_rental_order_simple(request):
             customer_name = data.get('customer_name', 'Unknown Customer')
             customer_phone = data.get('customer_phone', '')
             
-            # Create or get customer
-            customer, created = Customer.objects.get_or_create(
-                phone=customer_phone,
-                defaults={
-                    'name': customer_name,
-                    'email': '',
-                    'address': ''
-                }
-            )
+            # Create or get customer, matched on the normalized phone
+            customer = CustomerSearch.by_phone(customer_phone)
+            if customer is None:
+                customer = Customer.objects.create(
+                    phone=customer_phone,
+                    name=customer_name,
+                    email='',
+                    address=''
+                )
             print(f"[SIMPLE_RENTAL] Customer: {customer.name} (ID: {customer.id})")
             
             # Get selected rental products from the brochure
@@ -0,0 +1,283 @@
+"""
+SMS outbox
+==========
+``send_sms`` used to call the SMS gateway inline - a fresh connection, no
+timeout - holding the request worker for the whole round trip, and
+``send_sms_notification`` only wrote a row that claimed to be sent.
+
+Both now enqueue an SMSNotification with status ``queued`` and return.
+SMSOutbox drains the queue: it claims due rows (``sending``), posts them
+to the gateway over one pooled requests.Session from a bounded thread
+pool - messages with the same text share a request, since the gateway
+takes a list of phone numbers - and marks them ``sent``, or schedules a
+retry with exponential backoff until SMS_OUTBOX_MAX_ATTEMPTS is reached
+and the row is ``failed``.
+
+The queue is drained by a background thread woken on commit of each
+enqueue (SMS_OUTBOX_WORKER) or by the ``process_sms_outbox`` command.
+Until SMS_GATEWAY_URL and SMS_GATEWAY_PASSWORD are set nothing is sent:
+messages stay queued and go out once the gateway is configured.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import random
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import SMSNotification
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts of one message
+MAX_RETRY_DELAY = 3600
+
+# A message in flight for longer than this was abandoned by a crashed worker
+CLAIM_LEASE_SECONDS = 300
+
+# Gateway answers that will not change on retry
+RETRYABLE_CLIENT_ERRORS = [408, 429]
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SMSOutbox:
+    """
+    Durable SMS queue on SMSNotification, sent in batches by a background worker
+    """
+
+    _session = None
+    _session_lock = threading.Lock()
+    _worker = None
+    _worker_lock = threading.Lock()
+    _wake = threading.Event()
+
+    @staticmethod
+    def enqueue(order, phone_number, message):
+        """Queue an SMS and return its SMSNotification; sending happens after commit"""
+        sms = SMSNotification.objects.create(
+            order=order,
+            phone_number=phone_number,
+            message=message,
+            status='queued',
+            next_attempt_at=timezone.now(),
+        )
+        transaction.on_commit(SMSOutbox.wake)
+        return sms
+
+    @staticmethod
+    def wake():
+        """Have the background worker look at the queue now"""
+        if not _setting('SMS_OUTBOX_WORKER', True):
+            return
+        SMSOutbox._ensure_worker()
+        SMSOutbox._wake.set()
+
+    @staticmethod
+    def configured():
+        """Whether the gateway address and credentials are set"""
+        return bool(_setting('SMS_GATEWAY_URL', '') and _setting('SMS_GATEWAY_PASSWORD', ''))
+
+    @staticmethod
+    def session():
+        """The shared gateway session; its pool holds one connection per concurrent send"""
+        with SMSOutbox._session_lock:
+            if SMSOutbox._session is None:
+                concurrency = _setting('SMS_OUTBOX_CONCURRENCY', 4)
+                session = requests.Session()
+                session.auth = (
+                    _setting('SMS_GATEWAY_USERNAME', ''),
+                    _setting('SMS_GATEWAY_PASSWORD', ''),
+                )
+                # Retries are the outbox's job, not urllib3's
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                SMSOutbox._session = session
+            return SMSOutbox._session
+
+    @staticmethod
+    def reset_session():
+        """Drop the pooled session, e.g. after the gateway settings changed"""
+        with SMSOutbox._session_lock:
+            if SMSOutbox._session is not None:
+                SMSOutbox._session.close()
+            SMSOutbox._session = None
+
+    @staticmethod
+    def claim(limit, now=None):
+        """Move up to ``limit`` due queued messages in flight and return them"""
+        now = now or timezone.now()
+        released = SMSNotification.objects.filter(
+            status='sending',
+            claimed_at__lt=now - timedelta(seconds=CLAIM_LEASE_SECONDS),
+        ).update(status='queued', claim_token='')
+        if released:
+            logger.warning(f"[SMS_OUTBOX] Requeued {released} message(s) abandoned in flight")
+
+        due = list(SMSNotification.objects.filter(status='queued').filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+        ).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:limit])
+        if not due:
+            return []
+
+        # The status condition makes the claim safe against a second worker
+        token = uuid.uuid4().hex
+        SMSNotification.objects.filter(pk__in=due, status='queued').update(
+            status='sending', claimed_at=now, claim_token=token
+        )
+        return list(SMSNotification.objects.filter(claim_token=token, status='sending').order_by('pk'))
+
+    @staticmethod
+    def batches(messages):
+        """Group messages with the same text into gateway requests of SMS_OUTBOX_BATCH_SIZE numbers"""
+        size = max(1, _setting('SMS_OUTBOX_BATCH_SIZE', 20))
+        by_text = {}
+        for sms in messages:
+            by_text.setdefault(sms.message, []).append(sms)
+        return [
+            group[start:start + size]
+            for group in by_text.values()
+            for start in range(0, len(group), size)
+        ]
+
+    @staticmethod
+    def send_batch(batch):
+        """POST one batch to the gateway; return (delivered, error, permanent)"""
+        payload = {
+            'textMessage': {'text': batch[0].message},
+            'phoneNumbers': [sms.phone_number for sms in batch],
+        }
+        try:
+            response = SMSOutbox.session().post(
+                _setting('SMS_GATEWAY_URL', ''),
+                json=payload,
+                timeout=_setting('SMS_GATEWAY_TIMEOUT', 10),
+            )
+        except requests.RequestException as e:
+            return False, str(e), False
+
+        if response.status_code < 300:
+            return True, '', False
+        permanent = 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS
+        return False, f'HTTP {response.status_code}: {response.text[:200]}', permanent
+
+    @staticmethod
+    def retry_delay(attempts):
+        """Seconds before attempt ``attempts + 1``: exponential with a little jitter"""
+        base = _setting('SMS_OUTBOX_RETRY_DELAY', 30)
+        delay = min(base * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+        return delay + random.uniform(0, delay * 0.1)
+
+    @staticmethod
+    def process(limit=None, now=None):
+        """Claim one round of due messages, send them concurrently and record the outcome"""
+        concurrency = max(1, _setting('SMS_OUTBOX_CONCURRENCY', 4))
+        limit = limit or concurrency * max(1, _setting('SMS_OUTBOX_BATCH_SIZE', 20))
+        stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        if not SMSOutbox.configured():
+            logger.warning("[SMS_OUTBOX] SMS gateway not configured (SMS_GATEWAY_URL, SMS_GATEWAY_PASSWORD); messages stay queued")
+            return stats
+
+        claimed = SMSOutbox.claim(limit, now=now)
+        if not claimed:
+            return stats
+        stats['claimed'] = len(claimed)
+
+        batches = SMSOutbox.batches(claimed)
+        # Worker threads only talk HTTP; all database writes stay in this thread
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            results = list(pool.map(SMSOutbox.send_batch, batches))
+
+        finished_at = timezone.now()
+        max_attempts = _setting('SMS_OUTBOX_MAX_ATTEMPTS', 5)
+        delivered = []
+        unsent = []
+        for batch, (ok, error, permanent) in zip(batches, results):
+            if ok:
+                delivered.extend(sms.pk for sms in batch)
+                continue
+            logger.warning(f"[SMS_OUTBOX] Batch of {len(batch)} failed: {error}")
+            for sms in batch:
+                sms.attempts += 1
+                sms.last_error = error
+                sms.claim_token = ''
+                if permanent or sms.attempts >= max_attempts:
+                    sms.status = 'failed'
+                    stats['failed'] += 1
+                else:
+                    sms.status = 'queued'
+                    sms.next_attempt_at = finished_at + timedelta(seconds=SMSOutbox.retry_delay(sms.attempts))
+                    stats['retried'] += 1
+                unsent.append(sms)
+
+        if delivered:
+            stats['sent'] = SMSNotification.objects.filter(pk__in=delivered).update(
+                status='sent',
+                sent_at=finished_at,
+                attempts=F('attempts') + 1,
+                last_error='',
+                claim_token='',
+            )
+        if unsent:
+            SMSNotification.objects.bulk_update(
+                unsent, ['status', 'attempts', 'last_error', 'claim_token', 'next_attempt_at']
+            )
+
+        logger.info(f"[SMS_OUTBOX] {stats}")
+        return stats
+
+    @staticmethod
+    def drain(now=None):
+        """Process rounds until no due message is left; return the summed stats"""
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        while True:
+            stats = SMSOutbox.process(now=now)
+            for key, value in stats.items():
+                totals[key] += value
+            if not stats['claimed']:
+                return totals
+
+    @staticmethod
+    def _ensure_worker():
+        with SMSOutbox._worker_lock:
+            if SMSOutbox._worker and SMSOutbox._worker.is_alive():
+                return SMSOutbox._worker
+            SMSOutbox._worker = threading.Thread(
+                target=SMSOutbox._run_worker,
+                name='sms-outbox',
+                daemon=True,
+            )
+            SMSOutbox._worker.start()
+            return SMSOutbox._worker
+
+    @staticmethod
+    def _run_worker():
+        # Wake on enqueue, or periodically to pick up scheduled retries
+        poll_interval = max(1, _setting('SMS_OUTBOX_RETRY_DELAY', 30))
+        while True:
+            SMSOutbox._wake.wait(poll_interval)
+            SMSOutbox._wake.clear()
+            try:
+                SMSOutbox.drain()
+            except Exception as e:
+                logger.error(f"[SMS_OUTBOX] Worker round failed: {e}")
+            finally:
+                close_old_connections()
+
+    @staticmethod
+    def start_worker():
+        """Start the background worker, e.g. to resume a queue left by a restart"""
+        if _setting('SMS_OUTBOX_WORKER', True):
+            SMSOutbox._ensure_worker()
+            SMSOutbox._wake.set()
@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from business.image_rendition_manager import ImageRenditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field, sizes='100vw', largest='large', loading='lazy', **attrs):
+    """
+    <img> for an image field with its WebP renditions as srcset, e.g.
+    {% responsive_image product.image sizes="56px" largest="thumb" alt=product.name class="product-image" %}
+    Any other keyword becomes an attribute (``class_`` may stand in for ``class``).
+    """
+    image = ImageRenditions.attributes(field, largest)
+    if not image:
+        return ''
+    if 'srcset' in image:
+        image['sizes'] = sizes
+    image['loading'] = loading
+    image['decoding'] = 'async'
+    for name, value in attrs.items():
+        image[name.rstrip('_').replace('_', '-')] = value
+    return format_html('<img {}>', format_html_join(' ', '{}="{}"', image.items()))
+
+
+@register.filter
+def rendition_url(field, label='medium'):
+    """URL of an image field's rendition: {{ product.image|rendition_url:"thumb" }}"""
+    return ImageRenditions.url(field, label) or ''
@@ -1,8 +1,13 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Customer, Product, Order, Category
+from .models import (
+    Customer, Product, Order, OrderItem, Category, Sales,
+    DailyOrderRollup, DailySalesRollup, OrderCategorySummary, RentalStateTick,
+    ActivityLog, InventoryTransaction,
+)
 from decimal import Decimal
+import io
 
 
 class BusinessModelTests(TestCase):
@@ -201,8 +206,2223 @@ class BusinessAPITests(TestCase):
         self.assertIn('out_of_stock', data)
 
 
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        self.customer = Customer.objects.create(
+            name='Rollup Customer',
+            phone='09171234567'
+        )
+
+    def test_order_save_updates_order_rollup(self):
+        """Saving orders keeps the daily order rollup in step"""
+        from django.db.models import Sum
+
+        Order.objects.create(customer=self.customer, order_type='repair', total_amount=Decimal('150.00'))
+        Order.objects.create(customer=self.customer, order_type='repair', total_amount=Decimal('50.00'))
+
+        rows = DailyOrderRollup.objects.filter(order_type='repair', status='pending')
+        self.assertEqual(rows.aggregate(total=Sum('order_count'))['total'], 2)
+        self.assertEqual(rows.aggregate(total=Sum('total_amount'))['total'], Decimal('200.00'))
+
+    def test_completed_order_updates_sales_rollup(self):
+        """Completing an order moves its sale into the sales rollup"""
+        order = Order.objects.create(customer=self.customer, order_type='customize', total_amount=Decimal('300.00'))
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+        order.status = 'completed'
+        order.save()
+
+        self.assertTrue(Sales.objects.filter(order=order).exists())
+        row = DailySalesRollup.objects.get(order_type='customize')
+        self.assertEqual(row.sales_count, 1)
+        self.assertEqual(row.revenue, Decimal('300.00'))
+        self.assertFalse(DailyOrderRollup.objects.filter(status='pending').exists())
+
+        order.delete()
+        self.assertFalse(DailySalesRollup.objects.exists())
+        self.assertFalse(DailyOrderRollup.objects.exists())
+
+    def test_rebuild_rollups_command(self):
+        """The rebuild command recreates rollups from the order tables"""
+        from django.core.management import call_command
+
+        order = Order.objects.create(customer=self.customer, order_type='repair', total_amount=Decimal('80.00'))
+        order.status = 'completed'
+        order.save()
+        DailyOrderRollup.objects.all().delete()
+        DailySalesRollup.objects.all().delete()
+
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+        self.assertEqual(DailyOrderRollup.objects.get(status='completed').order_count, 1)
+        self.assertEqual(DailySalesRollup.objects.get(order_type='repair').revenue, Decimal('80.00'))
+
+
+class OrderCategorySummaryTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.customer = Customer.objects.create(
+            name='Summary Customer',
+            phone='09171234567'
+        )
+        self.zipper_service = Product.objects.create(
+            name='Repair - Zipper',
+            product_type='service',
+            price=Decimal('150.00')
+        )
+
+    def _create_repair_order(self):
+        order = Order.objects.create(customer=self.customer, order_type='repair', total_amount=Decimal('300.00'))
+        OrderItem.objects.create(order=order, product=self.zipper_service, quantity=2, unit_price=Decimal('150.00'))
+        return order
+
+    def test_item_changes_refresh_summary(self):
+        """Adding items stores the category summary once the transaction commits"""
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self._create_repair_order()
+
+        summary = OrderCategorySummary.objects.get(order=order)
+        self.assertEqual(summary.categories_display, 'Zipper (2)')
+        self.assertEqual(summary.quantity_display, 2)
+
+    def test_backfill_command(self):
+        """update_order_categories rebuilds missing summaries"""
+        from django.core.management import call_command
+
+        order = self._create_repair_order()
+        self.assertFalse(OrderCategorySummary.objects.filter(order=order).exists())
+
+        call_command('update_order_categories', stdout=io.StringIO())
+
+        self.assertEqual(OrderCategorySummary.objects.get(order=order).categories_display, 'Zipper (2)')
+
+    def test_orders_list_uses_summary(self):
+        """The orders list shows the stored summary for orders on the page"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_repair_order()
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Zipper (2)')
+
+
+class IdentifierSequenceConcurrencyTests(TransactionTestCase):
+    """
+    Parallel order entry from several counters must never collide. On SQLite
+    the test database is a file (see DATABASES in settings), so the workers
+    really write at once, waiting on the busy timeout; on PostgreSQL they run
+    fully in parallel.
+    """
+
+    THREADS = 8
+    ORDERS_PER_THREAD = 250
+
+    def setUp(self):
+        """Set up test data"""
+        self.customer = Customer.objects.create(
+            name='Counter Customer',
+            phone='09171234567'
+        )
+
+    def test_parallel_order_creation_has_no_collisions(self):
+        """Thousands of orders created in parallel get unique, gap-free identifiers"""
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+        import time
+
+        def create_orders(_):
+            latencies = []
+            try:
+                for _ in range(self.ORDERS_PER_THREAD):
+                    started = time.perf_counter()
+                    Order.objects.create(customer_id=self.customer.id, order_type='repair')
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            return latencies
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            latencies = [value for chunk in executor.map(create_orders, range(self.THREADS)) for value in chunk]
+
+        total = self.THREADS * self.ORDERS_PER_THREAD
+        identifiers = list(Order.objects.values_list('order_identifier', flat=True))
+        self.assertEqual(len(identifiers), total)
+        self.assertEqual(len(set(identifiers)), total)
+        self.assertEqual(
+            set(identifiers),
+            {f"TS01REP-O{number:02d}" for number in range(1, total + 1)}
+        )
+        latencies.sort()
+        self.assertLess(latencies[int(len(latencies) * 0.99)], 1.0)
+
+
+class RentalStateManagerTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        from django.utils import timezone
+
+        self.now = timezone.now()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.customer = Customer.objects.create(
+            name='Rental Customer',
+            phone='09171234567'
+        )
+        self.gown = Product.objects.create(name='Gown', product_type='rental', price=Decimal('1500.00'))
+        self.suit = Product.objects.create(
+            name='Suit', product_type='rental', price=Decimal('1500.00'), rental_status='rented'
+        )
+
+    def _create_rental(self, due_in, product=None):
+        order = Order.objects.create(customer=self.customer, order_type='rent')
+        Order.objects.filter(pk=order.pk).update(due_date=self.now + due_in)
+        if product:
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=Decimal('1500.00'))
+        return order
+
+    def test_tick_applies_transitions_in_bulk(self):
+        """One tick moves orders by due date, reconciles products and records the run"""
+        from datetime import timedelta
+        from .rental_state_manager import RentalStateManager
+
+        overdue = self._create_rental(timedelta(hours=-1), product=self.gown)
+        due = self._create_rental(timedelta(hours=2))
+        almost_due = self._create_rental(timedelta(hours=30))
+        later = self._create_rental(timedelta(days=5))
+
+        stats = RentalStateManager.tick(now=self.now)
+
+        self.assertEqual(Order.objects.get(pk=overdue.pk).status, 'overdue')
+        self.assertEqual(Order.objects.get(pk=due.pk).status, 'due')
+        self.assertEqual(Order.objects.get(pk=almost_due.pk).status, 'almost_due')
+        self.assertEqual(Order.objects.get(pk=later.pk).status, 'rented')
+
+        self.gown.refresh_from_db()
+        self.suit.refresh_from_db()
+        self.assertEqual(self.gown.rental_status, 'rented')
+        self.assertEqual(self.gown.current_rental_order_id, overdue.pk)
+        self.assertEqual(self.suit.rental_status, 'available')
+
+        self.assertEqual(stats['orders_changed'], 3)
+        self.assertEqual(stats['products_changed'], 2)
+        tick = RentalStateTick.objects.get()
+        self.assertEqual((tick.orders_changed, tick.products_changed), (3, 2))
+        self.assertEqual(
+            DailyOrderRollup.objects.get(order_type='rent', status='overdue').order_count, 1
+        )
+
+        # A second tick has nothing left to do
+        self.assertEqual(RentalStateManager.tick(now=self.now)['orders_changed'], 0)
+
+    def test_list_views_do_not_write(self):
+        """GET list views and APIs leave order and product statuses alone"""
+        from datetime import timedelta
+
+        overdue = self._create_rental(timedelta(hours=-1))
+
+        self.client.login(username='testuser', password='testpass123')
+        for name in ('orders', 'inventory', 'api_products_list'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+        self.assertEqual(Order.objects.get(pk=overdue.pk).status, 'rented')
+        self.suit.refresh_from_db()
+        self.assertEqual(self.suit.rental_status, 'rented')
+
+        products = self.client.get(reverse('api_products_list')).json()['products']
+        self.assertEqual({p['name']: p['rental_status'] for p in products}['Suit'], 'available')
+
+    def test_dry_run_command_changes_nothing(self):
+        """update_rental_statuses --dry-run only counts"""
+        from datetime import timedelta
+        from django.core.management import call_command
+
+        overdue = self._create_rental(timedelta(hours=-1))
+        out = io.StringIO()
+        call_command('update_rental_statuses', '--dry-run', stdout=out)
+
+        self.assertIn('Orders updated to "overdue": 1', out.getvalue())
+        self.assertEqual(Order.objects.get(pk=overdue.pk).status, 'rented')
+        self.assertFalse(RentalStateTick.objects.exists())
+
+
+class ActivityLogWriterModeTests(TransactionTestCase):
+    def test_entries_written_once_on_commit(self):
+        """Entries of a committed transaction wait for the commit and are inserted with one query"""
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+
+        customer = Customer.objects.create(name='Log Customer', phone='09171234567')
+        ActivityLog.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                order = Order.objects.create(customer=customer, order_type='repair')
+                order.notes = 'Zipper'
+                order.save()
+                Product.objects.create(name='Thread', product_type='material', price=Decimal('10.00'))
+                try:
+                    with transaction.atomic():
+                        Product.objects.create(name='Dropped', product_type='material', price=Decimal('1.00'))
+                        raise ValueError
+                except ValueError:
+                    pass
+                Product.objects.create(name='Needle', product_type='material', price=Decimal('2.00'))
+                Product.objects.create(name='Button', product_type='material', price=Decimal('3.00'))
+                self.assertFalse(ActivityLog.objects.exists())
+
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "business_activitylog"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            sorted(ActivityLog.objects.values_list('activity_type', flat=True)),
+            ['order_created', 'order_updated', 'product_added', 'product_added', 'product_added'],
+        )
+        self.assertFalse(ActivityLog.objects.filter(metadata__product_name='Dropped').exists())
+        self.assertEqual(
+            ActivityLog.objects.get(activity_type='order_created').metadata['order_identifier'],
+            order.order_identifier,
+        )
+
+    def test_rolled_back_savepoint_drops_its_entries(self):
+        """Entries recorded in a rolled-back savepoint are not written"""
+        from django.db import transaction
+
+        with transaction.atomic():
+            Customer.objects.create(name='Kept', phone='09170000001')
+            try:
+                with transaction.atomic():
+                    Customer.objects.create(name='Dropped', phone='09170000002')
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(
+            list(ActivityLog.objects.values_list('metadata__customer_name', flat=True)),
+            ['Kept'],
+        )
+
+    def test_released_savepoint_rolled_back_with_its_transaction(self):
+        """Entries of a savepoint that was released are still dropped when the transaction rolls back"""
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                with transaction.atomic():
+                    Customer.objects.create(name='Released', phone='09170000005')
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            with transaction.atomic():
+                Customer.objects.create(name='Nested', phone='09170000006')
+
+        self.assertEqual(list(ActivityLog.objects.values_list('metadata__customer_name', flat=True)), ['Nested'])
+
+    def test_rolled_back_transaction_writes_nothing(self):
+        """A rolled-back transaction leaves no entries behind for the next one"""
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                Customer.objects.create(name='Gone', phone='09170000003')
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            Customer.objects.create(name='Stays', phone='09170000004')
+
+        self.assertEqual(list(ActivityLog.objects.values_list('metadata__customer_name', flat=True)), ['Stays'])
+
+    def test_request_entries_flushed_with_one_insert(self):
+        """Autocommit saves during a request are written together at the end"""
+        from django.db import connection
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.test.utils import CaptureQueriesContext
+        from .middleware.activity_log_middleware import ActivityLogMiddleware
+
+        def view(request):
+            for index in range(3):
+                Customer.objects.create(name=f'Walk-in {index}', phone=f'0917000000{index}')
+            self.assertFalse(ActivityLog.objects.exists())
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as queries:
+            ActivityLogMiddleware(view)(RequestFactory().post('/'))
+
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "business_activitylog"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ActivityLog.objects.filter(activity_type='customer_created').count(), 3)
+
+    def test_background_mode_writes_from_queue(self):
+        """With ACTIVITY_LOG_ASYNC the background thread writes the entries"""
+        from django.test import override_settings
+        from .activity_log_manager import ActivityLogWriter
+
+        with override_settings(ACTIVITY_LOG_ASYNC=True):
+            Customer.objects.create(name='Queued', phone='09170000009')
+            ActivityLogWriter.drain()
+
+        self.assertTrue(ActivityLog.objects.filter(metadata__customer_name='Queued').exists())
+
+
+class MaterialCatalogTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        from .material_catalog_manager import MaterialCatalogManager
+        from .models import MaterialType
+
+        MaterialCatalogManager.invalidate()
+        self.thread_type = MaterialType.objects.create(name='Thread', unit_of_measurement='meters')
+        self.garter_type = MaterialType.objects.create(name='Garter', unit_of_measurement='inches')
+        self.white = self._material(self.thread_type, 'Coats White', 'Brand: Coats; Color: White; Length: 500m', 50)
+        self.red = self._material(self.thread_type, 'Coats Red', 'Brand: Coats; Color: Dark_Red; Length: 500m', 40)
+        self.garter_small = self._material(self.garter_type, 'Garter 1in', 'Garter length: 100 inch', 100)
+        self.garter_big = self._material(self.garter_type, 'Garter 2in', 'Garter length: 300 inch', 300)
+
+    def _material(self, material_type, name, description, quantity):
+        return Product.objects.create(
+            name=name,
+            product_type='material',
+            material_type=material_type,
+            description=description,
+            price=Decimal('5.00'),
+            quantity=quantity,
+        )
+
+    def test_attributes_parsed_on_save(self):
+        """The description's labelled values land in the structured columns"""
+        self.red.refresh_from_db()
+        self.assertEqual(self.red.material_kind, 'thread')
+        self.assertEqual(self.red.material_brand, 'coats')
+        self.assertEqual(self.red.material_color, 'dark red')
+
+    def test_lookups_use_cached_catalog(self):
+        """Attribute lookups cost one primary-key query once the catalog is built"""
+        from .views import _find_garter, _find_thread_by_brand_and_color, find_thread_by_color
+
+        self.assertEqual(find_thread_by_color('dark-red'), self.red)
+        with self.assertNumQueries(1):
+            self.assertEqual(_find_thread_by_brand_and_color('Coats', 'DARK RED'), self.red)
+        with self.assertNumQueries(1):
+            # No exact color match: first available thread, as before
+            self.assertEqual(find_thread_by_color('purple'), self.white)
+        self.assertEqual(_find_garter(), self.garter_big)
+
+    def test_catalog_invalidated_on_attribute_change(self):
+        """Editing a material's attributes is seen by the next lookup; stock changes are not rebuilds"""
+        from .material_catalog_manager import MaterialCatalogManager
+        from .views import find_thread_by_color
+
+        self.assertEqual(find_thread_by_color('white'), self.white)
+
+        self.white.quantity = 10
+        self.white.save()
+        self.assertIsNotNone(MaterialCatalogManager._index)
+
+        self.red.description = 'Brand: Coats; Color: White; Length: 500m'
+        self.red.save()
+        self.white.is_archived = True
+        self.white.save()
+        self.assertEqual(find_thread_by_color('white'), self.red)
+
+
+class RentalStatusResolverTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        from django.utils import timezone
+
+        self.now = timezone.now()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.customer = Customer.objects.create(
+            name='Rental Customer',
+            phone='09171234567'
+        )
+
+    def _rented_product(self, name, due_in):
+        product = Product.objects.create(name=name, product_type='rental', price=Decimal('1500.00'))
+        if due_in is not None:
+            order = Order.objects.create(customer=self.customer, order_type='rent')
+            Order.objects.filter(pk=order.pk).update(status='rented', due_date=self.now + due_in)
+            OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=Decimal('1500.00'))
+        return product
+
+    def test_resolve_derives_states_in_one_query(self):
+        """Overdue, almost due, rented and available come from a single query"""
+        from datetime import timedelta
+        from .rental_manager import RentalStatusManager, RentalStatusResolver
+
+        overdue = self._rented_product('Overdue Gown', timedelta(hours=-1))
+        almost_due = self._rented_product('Almost Due Gown', timedelta(hours=30))
+        rented = self._rented_product('Rented Gown', timedelta(days=5))
+        available = self._rented_product('Available Gown', None)
+
+        with self.assertNumQueries(1):
+            status = RentalStatusResolver.resolve(now=self.now)
+
+        self.assertEqual(status[overdue.pk]['rental_status'], 'overdue')
+        self.assertFalse(status[overdue.pk]['is_almost_due'])
+        self.assertEqual(status[almost_due.pk]['rental_status'], 'overdue')
+        self.assertTrue(status[almost_due.pk]['is_almost_due'])
+        self.assertEqual(status[rented.pk]['rental_status'], 'rented')
+        self.assertFalse(status[rented.pk]['is_overdue'])
+        self.assertTrue(status[rented.pk]['has_current_order'])
+        self.assertEqual(status[available.pk]['rental_status'], 'available')
+        self.assertFalse(status[available.pk]['is_rented'])
+
+        # The same state is available as a queryset annotation
+        states = dict(RentalStatusResolver.annotate(Product.objects.all(), now=self.now).values_list(
+            'name', 'rental_state'
+        ))
+        self.assertEqual(states['Almost Due Gown'], 'almost_due')
+        self.assertEqual(states['Available Gown'], 'available')
+        self.assertEqual(RentalStatusManager.get_rental_status_for_all_products().keys(), status.keys())
+
+    def test_products_api_query_count_is_constant(self):
+        """api_products_list does not query per product"""
+        from datetime import timedelta
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.login(username='testuser', password='testpass123')
+        self._rented_product('Gown 1', timedelta(days=5))
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('api_products_list'))
+
+        for i in range(2, 8):
+            self._rented_product(f'Gown {i}', timedelta(hours=i * 10 - 20))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('api_products_list'))
+
+        self.assertEqual(len(many), len(few))
+        products = {p['name']: p for p in response.json()['products']}
+        self.assertEqual(products['Gown 1']['rental_status'], 'rented')
+        self.assertTrue(products['Gown 2']['is_overdue'])
+        self.assertTrue(products['Gown 3']['is_almost_due'])
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            is_staff=True
+        )
+        self.customer = Customer.objects.create(
+            name='Export Customer',
+            phone='09171234567'
+        )
+        orders = Order.objects.bulk_create([
+            Order(customer=self.customer, order_identifier=f'EXP-{i}', order_type='repair',
+                  status='completed', total_amount=Decimal('100.00'), assigned_staff=self.user)
+            for i in range(120)
+        ])
+        Sales.objects.bulk_create([
+            Sales(order=order, sales_identifier=f'EXP-S-{i}', amount=Decimal('100.00'))
+            for i, order in enumerate(orders)
+        ])
+        self.client.login(username='testuser', password='testpass123')
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_sales_exports_stream_in_every_format(self):
+        """Sales exports stream every row as CSV, XLSX and paginated PDF"""
+        import csv
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from openpyxl import load_workbook
+
+        with CaptureQueriesContext(connection) as queries:
+            content = self._content(self.client.get(reverse('csv_report', args=['sales'])))
+        # Session, user and one chunked sales query; no per-row lookups
+        self.assertLess(len(queries), 6)
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(sum(1 for row in rows if row[1:2] == ['Export Customer']), 120)
+
+        response = self.client.get(reverse('excel_report', args=['sales']))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales_report.xlsx"')
+        ws = load_workbook(io.BytesIO(self._content(response))).active
+        self.assertEqual(sum(1 for row in ws.iter_rows(values_only=True) if row[1] == 'Export Customer'), 120)
+
+        pdf = self._content(self.client.get(reverse('pdf_report', args=['sales'])))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # 120 rows do not fit on one page
+        self.assertGreater(pdf.count(b'/Type /Page\n'), 1)
+
+    def test_staff_report_exports(self):
+        """Staff reports list each staff member's completed orders"""
+        from openpyxl import load_workbook
+
+        content = self._content(self.client.get(reverse('staff_report_csv'))).decode('utf-8-sig')
+        self.assertIn('Total Completed Orders:,120', content)
+        self.assertEqual(content.count('Export Customer'), 120)
+
+        wb = load_workbook(io.BytesIO(self._content(self.client.get(reverse('staff_report_excel')))))
+        self.assertEqual(wb.sheetnames, ['Summary', 'testuser'])
+        self.assertTrue(self._content(self.client.get(reverse('staff_report_pdf'))).startswith(b'%PDF'))
+
+
+class SMSOutboxTests(TestCase):
+    def setUp(self):
+        """Start a stub SMS gateway on localhost"""
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from .sms_outbox_manager import SMSOutbox
+
+        self.requests = []
+        self.responses = []
+        test = self
+
+        class StubGateway(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                test.requests.append((self.headers.get('Authorization'), json.loads(body)))
+                self.send_response(test.responses.pop(0) if test.responses else 202)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGateway)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.settings_override = self.settings(
+            SMS_GATEWAY_URL=f'http://127.0.0.1:{self.server.server_port}/message',
+            SMS_GATEWAY_PASSWORD='stub-password',
+            SMS_OUTBOX_WORKER=False,
+            SMS_OUTBOX_BATCH_SIZE=2,
+            SMS_OUTBOX_MAX_ATTEMPTS=2,
+        )
+        self.settings_override.enable()
+        SMSOutbox.reset_session()
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(name='SMS Customer', phone='09171234567')
+        self.order = Order.objects.create(customer=self.customer, order_type='repair')
+
+    def tearDown(self):
+        from .sms_outbox_manager import SMSOutbox
+
+        SMSOutbox.reset_session()
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_view_only_enqueues(self):
+        """send_sms returns before the gateway is contacted"""
+        import json
+        from .models import SMSNotification
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.post(reverse('send_sms'), json.dumps({
+            'phone_number': '09171234567', 'message': 'Ready for pickup', 'order_id': self.order.id,
+        }), content_type='application/json')
+
+        self.assertEqual(response.json()['status'], 'queued')
+        sms = SMSNotification.objects.get(pk=response.json()['sms_id'])
+        self.assertEqual((sms.status, sms.phone_number), ('queued', '+639171234567'))
+        self.assertEqual(self.requests, [])
+
+    def test_drain_batches_same_text_and_retries_with_backoff(self):
+        """Equal messages share a request; failures back off, then fail for good"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import SMSNotification
+        from .sms_outbox_manager import SMSOutbox
+
+        for phone in ['+639170000001', '+639170000002', '+639170000003']:
+            SMSOutbox.enqueue(self.order, phone, 'Sale today')
+        unlucky = SMSOutbox.enqueue(self.order, '+639170000004', 'Your order is ready')
+        # One of the three requests hits a gateway error
+        self.responses = [202, 202, 503]
+
+        stats = SMSOutbox.drain()
+
+        self.assertEqual(len(self.requests), 3)
+        self.assertTrue(all(auth and auth.startswith('Basic ') for auth, _ in self.requests))
+        self.assertEqual(sorted(len(body['phoneNumbers']) for _, body in self.requests), [1, 1, 2])
+        self.assertEqual(stats['claimed'], 4)
+        self.assertEqual(stats['sent'] + stats['retried'], 4)
+
+        retried = SMSNotification.objects.filter(status='queued')
+        self.assertTrue(retried.exists())
+        for sms in retried:
+            self.assertEqual(sms.attempts, 1)
+            self.assertIn('503', sms.last_error)
+            self.assertGreater(sms.next_attempt_at, timezone.now())
+
+        # Not due yet; once due, a second failure exhausts SMS_OUTBOX_MAX_ATTEMPTS
+        self.assertEqual(SMSOutbox.drain()['claimed'], 0)
+        self.responses = [500, 500]
+        later = timezone.now() + timedelta(hours=2)
+        SMSOutbox.drain(now=later)
+        self.assertFalse(SMSNotification.objects.filter(status__in=['queued', 'sending']).exists())
+        for sms in retried:
+            sms.refresh_from_db()
+            self.assertEqual((sms.status, sms.attempts), ('failed', 2))
+        unlucky.refresh_from_db()
+        self.assertIn(unlucky.status, ['sent', 'failed'])
+
+    def test_client_error_fails_without_retry(self):
+        """A 4xx rejection is permanent"""
+        from .sms_outbox_manager import SMSOutbox
+
+        sms = SMSOutbox.enqueue(self.order, '+639170000001', 'Hello')
+        self.responses = [400]
+        SMSOutbox.drain()
+
+        sms.refresh_from_db()
+        self.assertEqual((sms.status, sms.attempts), ('failed', 1))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_unconfigured_gateway_keeps_messages_queued(self):
+        """Without a gateway password nothing is sent or claimed"""
+        from .sms_outbox_manager import SMSOutbox
+
+        sms = SMSOutbox.enqueue(self.order, '+639170000001', 'Hello')
+        with self.settings(SMS_GATEWAY_PASSWORD=''):
+            self.assertEqual(SMSOutbox.drain()['claimed'], 0)
+
+        sms.refresh_from_db()
+        self.assertEqual((sms.status, sms.attempts), ('queued', 0))
+        self.assertEqual(self.requests, [])
+
+
+class QRCodeCacheTests(TestCase):
+    def setUp(self):
+        """Set up test data in a throwaway media directory"""
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.settings_override = self.settings(MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.customer = Customer.objects.create(name='QR Customer', phone='09171234567')
+        self.order = Order.objects.create(
+            customer=self.customer, order_type='repair', total_amount=Decimal('500.00')
+        )
+
+    def test_unchanged_payload_skips_encoding_and_writes(self):
+        """A QR code is re-encoded only after its payload, e.g. the balance, changed"""
+        from unittest import mock
+        from django.core.files.storage import default_storage
+        from .qr_code_manager import QRCodeManager, render_qr_png
+
+        with mock.patch('business.qr_code_manager.render_qr_png', wraps=render_qr_png) as render:
+            first = QRCodeManager.ensure(self.order)
+            with mock.patch.object(default_storage, 'save') as save:
+                again = QRCodeManager.ensure(self.order)
+            save.assert_not_called()
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(again.qr_code_image.name, first.qr_code_image.name)
+            self.assertEqual(first.qr_code_image.name, f'qr_codes/{first.payload_hash}.png')
+
+            self.order.balance = Decimal('200.00')
+            updated = QRCodeManager.ensure(self.order)
+            self.assertEqual(render.call_count, 2)
+            self.assertNotEqual(updated.payload_hash, first.payload_hash)
+            self.assertTrue(default_storage.exists(updated.qr_code_image.name))
+
+        # The superseded image is pruned once old enough
+        self.assertEqual(QRCodeManager.prune(min_age=-60), 1)
+        self.assertTrue(default_storage.exists(updated.qr_code_image.name))
+
+    def test_receipt_generates_code_lazily(self):
+        """Serving a receipt creates the missing QR code"""
+        from .models import QRCode
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('order_receipt', args=[self.order.id]))
+
+        self.assertEqual(response.status_code, 200)
+        qr_code = QRCode.objects.get(order=self.order)
+        self.assertEqual(response.context['qr_code'], qr_code)
+        self.assertTrue(qr_code.payload_hash)
+
+    def test_bulk_command_fills_missing_codes(self):
+        """generate_qr_codes encodes missing codes and then has nothing left to do"""
+        from django.core.management import call_command
+        from .models import QRCode
+
+        for _ in range(3):
+            Order.objects.create(customer=self.customer, order_type='repair', total_amount=Decimal('80.00'))
+
+        out = io.StringIO()
+        call_command('generate_qr_codes', '--processes', '2', stdout=out)
+        self.assertIn('Updated 4 QR code(s), encoded 4 new image(s)', out.getvalue())
+        self.assertEqual(QRCode.objects.exclude(payload_hash='').count(), 4)
+
+        out = io.StringIO()
+        call_command('generate_qr_codes', '--processes', '2', stdout=out)
+        self.assertIn('Updated 0 QR code(s), encoded 0 new image(s)', out.getvalue())
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Query budgets of the main views, counted by QueryInstrumentationMiddleware
+    (session and auth lookups included). A view going over budget usually
+    grew a per-row query: fix the view, or raise its budget in the same
+    change and say why.
+    """
+
+    # url name -> most queries one GET may run with the fixture below
+    QUERY_BUDGETS = {
+        'dashboard': 18,
+        'orders': 26,
+        'inventory': 20,
+        'rental_management': 16,
+        'materials_management': 12,
+        'sales': 23,
+        'reports': 21,
+        'staff_management': 20,
+        'api_products_list': 5,
+        'api_customers_list': 5,
+    }
+
+    # Views whose query count must not grow with the number of orders.
+    # orders and sales still look up a few details per row on the page
+    FLAT_VIEWS = [
+        'dashboard', 'inventory', 'rental_management', 'materials_management', 'api_products_list',
+        'api_customers_list',
+    ]
+
+    def setUp(self):
+        """Set up a small shop: staff, rental/material products and orders of each type"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            is_staff=True,
+            is_superuser=True
+        )
+        self.customer = Customer.objects.create(name='Budget Customer', phone='09171234567')
+        self.category = Category.objects.create(name='Gowns')
+        self.gowns = [
+            Product.objects.create(name=f'Gown {i}', product_type='rental', price=Decimal('1500.00'),
+                                   category=self.category)
+            for i in range(5)
+        ]
+        self.materials = [
+            Product.objects.create(name=f'Thread {i}', product_type='material', price=Decimal('20.00'),
+                                   quantity=50)
+            for i in range(5)
+        ]
+        self._add_orders(3)
+        self.client.login(username='testuser', password='testpass123')
+
+    def _add_orders(self, per_type):
+        for i in range(per_type):
+            for order_type in ['rent', 'repair', 'customize']:
+                order = Order.objects.create(
+                    customer=self.customer,
+                    order_type=order_type,
+                    total_amount=Decimal('500.00'),
+                    assigned_staff=self.user,
+                )
+                product = self.gowns[i % len(self.gowns)] if order_type == 'rent' else self.materials[i % 5]
+                OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=Decimal('500.00'))
+                if i % 2:
+                    order.status = 'completed'
+                    order.save()
+
+    def _query_count(self, name):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200, name)
+        # sql;dur=1.23;desc="27 queries", app;dur=...
+        return int(response['Server-Timing'].split('desc="')[1].split(' ')[0])
+
+    def test_main_views_stay_within_query_budget(self):
+        """Each main view runs at most its budgeted number of queries"""
+        for name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(view=name):
+                count = self._query_count(name)
+                self.assertLessEqual(count, budget, f'{name} ran {count} queries, budget is {budget}')
+
+    def test_list_views_do_not_query_per_row(self):
+        """Doubling the orders does not add queries to the list views"""
+        # The first render loads the reference data snapshot
+        self._query_count('dashboard')
+        before = {name: self._query_count(name) for name in self.FLAT_VIEWS}
+        self._add_orders(3)
+        for name in self.FLAT_VIEWS:
+            with self.subTest(view=name):
+                self.assertEqual(self._query_count(name), before[name])
+
+    def test_stats_endpoint_reports_recent_requests(self):
+        """api/query-stats lists per-view counts to staff only"""
+        from .query_stats_manager import QueryStats
+
+        QueryStats.reset()
+        self.client.get(reverse('orders'))
+        stats = self.client.get(reverse('api_query_stats')).json()
+        orders = next(view for view in stats['views'] if view['view'] == 'orders')
+        self.assertEqual(orders['requests'], 1)
+        self.assertGreater(orders['max_queries'], 0)
+
+        User.objects.create_user(username='clerk', password='testpass123')
+        self.client.login(username='clerk', password='testpass123')
+        self.assertEqual(self.client.get(reverse('api_query_stats')).status_code, 403)
+
+    def test_timings_header_only_for_staff(self):
+        """Anonymous visitors and non-staff users get no Server-Timing header"""
+        self.assertIn('Server-Timing', self.client.get(reverse('orders')))
+
+        self.client.logout()
+        self.assertNotIn('Server-Timing', self.client.get('/'))
+        User.objects.create_user(username='clerk', password='testpass123')
+        self.client.login(username='clerk', password='testpass123')
+        self.assertNotIn('Server-Timing', self.client.get(reverse('orders')))
+
+
+class DatasetBenchmarkTests(TestCase):
+    """Seeded dataset generator and the view benchmark runner"""
+
+    def _generate(self, seed, now=None):
+        from django.utils import timezone
+        from .dataset_manager import DatasetGenerator
+
+        now = now or timezone.now().replace(microsecond=0)
+        return DatasetGenerator(orders=120, seed=seed, rental_products=10, material_products=7,
+                                staff=2, batch_size=50, now=now).generate(), now
+
+    def _snapshot(self):
+        return list(Order.objects.order_by('order_identifier').values_list(
+            'order_identifier', 'order_type', 'status', 'total_amount', 'paid_amount', 'created_at'
+        ))
+
+    def test_same_seed_gives_same_dataset(self):
+        """Regenerating with a seed reproduces the orders; another seed does not"""
+        from django.db import transaction
+        from django.utils import timezone
+
+        class Rollback(Exception):
+            pass
+
+        now = timezone.now().replace(microsecond=0)
+        snapshots = []
+        for seed in [3, 3, 4]:
+            try:
+                with transaction.atomic():
+                    self._generate(seed, now=now)
+                    snapshots.append(self._snapshot())
+                    raise Rollback()
+            except Rollback:
+                pass
+
+        first, second, other = snapshots
+        self.assertEqual(len(first), 120)
+        self.assertEqual(first, second)
+        self.assertNotEqual([row[:2] for row in first], [row[:2] for row in other])
+
+    def test_dataset_is_consistent(self):
+        """Identifiers, sequences, sales, summaries and rollups line up with the orders"""
+        from .models import IdentifierSequence
+
+        counts, now = self._generate(5)
+        self.assertEqual(counts['orders'], 120)
+        self.assertEqual(Order.objects.filter(created_at__gt=now).count(), 0)
+        self.assertEqual(Sales.objects.count(), Order.objects.filter(status='completed').count())
+        self.assertEqual(OrderCategorySummary.objects.count(), 120)
+        self.assertEqual(
+            sum(DailyOrderRollup.objects.values_list('order_count', flat=True)), 120
+        )
+
+        # Every material stock entry carries its balance, ending at the current stock
+        from .inventory_ledger_manager import InventoryLedger
+
+        stock_entries = InventoryTransaction.objects.filter(product__product_type='material')
+        self.assertTrue(stock_entries.exists())
+        self.assertEqual(counts['ledger_balances'], stock_entries.count())
+        self.assertFalse(stock_entries.filter(balance_after__isnull=True).exists())
+        latest = stock_entries.order_by('-created_at', '-pk').select_related('product').first()
+        self.assertEqual(latest.balance_after, latest.product.quantity)
+        self.assertEqual(InventoryLedger.stock_at(latest.product, latest.created_at), latest.product.quantity)
+
+        # New orders continue the generated numbering
+        rentals = Order.objects.filter(order_type='rent').count()
+        self.assertEqual(IdentifierSequence.objects.get(key='TS01RENT').last_value, rentals)
+        order = Order.objects.create(customer=Customer.objects.first(), order_type='rent')
+        self.assertEqual(order.order_identifier, f'TS01RENT-O{rentals + 1:02d}')
+
+    def test_benchmark_reports_latency_and_queries(self):
+        """The runner times each view through the client and the report compares across runs"""
+        import json
+        from .benchmark_manager import BENCHMARK_TARGETS, ViewBenchmark, compare
+
+        self._generate(6)
+        user = User.objects.create_user(username='bench', password='testpass123', is_staff=True, is_superuser=True)
+        targets = [target for target in BENCHMARK_TARGETS if target[0] in ['dashboard', 'api_products_list']]
+        report = ViewBenchmark(user, targets=targets, repeat=3, warmup=1).run()
+        report = json.loads(json.dumps(report))
+
+        self.assertEqual(report['dataset']['orders'], 120)
+        for label in ['dashboard', 'api_products_list']:
+            result = report['views'][label]
+            self.assertEqual(result['status'], [200])
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+        slower = json.loads(json.dumps(report))
+        slower['views']['dashboard']['p50_ms'] *= 2
+        slower['views']['api_products_list']['queries'] += 1
+        verdicts = {row['view']: row['verdict'] for row in compare(report, slower)}
+        self.assertEqual(verdicts, {'dashboard': 'slower', 'api_products_list': 'slower'})
+        verdicts = {row['view']: row['verdict'] for row in compare(slower, report)}
+        self.assertEqual(verdicts['dashboard'], 'faster')
+
+
+class CatalogCacheTests(TestCase):
+    """Material picker APIs served from the versioned catalog cache"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import MaterialType
+
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123', is_staff=True)
+        self.zipper_type = MaterialType.objects.create(name='Zipper', unit_of_measurement='inches')
+        self.zipper = Product.objects.create(
+            name='Nylon Zipper', product_type='material', material_type=self.zipper_type,
+            price=Decimal('15.00'), quantity=120, unit_of_measurement='inches',
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def _catalog_queries(self, url, **headers):
+        """Response and the queries it ran against material tables"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        return response, [
+            query['sql'] for query in queries
+            if 'business_product' in query['sql'] or 'business_materialtype' in query['sql']
+        ]
+
+    def test_repeat_calls_skip_the_database(self):
+        """The second call is answered from the cache without touching material tables"""
+        url = reverse('api_zippers_list')
+        first, queries = self._catalog_queries(url)
+        self.assertTrue(queries)
+        self.assertEqual(first.json()['zippers'][0]['quantity'], 120)
+
+        second, queries = self._catalog_queries(url)
+        self.assertEqual(queries, [])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_if_none_match_returns_not_modified(self):
+        """A client holding the current ETag gets a bodyless 304"""
+        url = reverse('api_buttons_list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_material_changes_invalidate(self):
+        """Saving a material product or type serves a fresh list with a new ETag"""
+        url = reverse('api_zippers_list')
+        before = self.client.get(url)
+
+        self.zipper.quantity = 80
+        self.zipper.save()
+        after, queries = self._catalog_queries(url, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertTrue(queries)
+        self.assertEqual(after.json()['zippers'][0]['quantity'], 80)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+
+        self.zipper_type.description = 'YKK'
+        self.zipper_type.save()
+        self.assertTrue(self._catalog_queries(url)[1])
+
+        # Rental products are not in any picker and leave the cache alone
+        Product.objects.create(name='Gown', product_type='rental', price=Decimal('1500.00'))
+        self.assertEqual(self._catalog_queries(url)[1], [])
+
+    def test_rebuild_before_commit_goes_stale_on_commit(self):
+        """A list cached between a material save and its commit is not served afterwards"""
+        from .catalog_cache_manager import CatalogCache
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zipper.quantity = 80
+            self.zipper.save()
+            # What a concurrent request would cache from the old committed rows
+            during = CatalogCache.version()
+        self.assertNotEqual(CatalogCache.version(), during)
+
+    def test_thread_availability_is_cached_per_color(self):
+        """Each colour has its own entry"""
+        Product.objects.create(
+            name='Red Thread', product_type='material', price=Decimal('5.00'), quantity=30,
+            unit_of_measurement='meters', description='Color: Red',
+        )
+        url = reverse('api_thread_availability')
+        red = self.client.get(url, {'color': 'Red'})
+        self.assertEqual(red.json()['color'], 'Red')
+        self.assertEqual(self._catalog_queries(url + '?color=Red')[1], [])
+        self.assertEqual(self.client.get(url, {'color': 'Blue'}).json()['color'], 'Blue')
+        self.assertEqual(self.client.get(url).json()['success'], False)
+
+
+class ReferenceDataTests(TransactionTestCase):
+    """
+    Process-wide reference data snapshot. TransactionTestCase: saves commit
+    as in a normal request, so the shared snapshot is used
+    """
+
+    REFERENCE_TABLES = ['business_systemsettings', 'business_landingpageimage', 'business_category',
+                        'business_materialtype']
+
+    def setUp(self):
+        from .reference_data_manager import ReferenceData
+
+        ReferenceData.invalidate()
+        self.user = User.objects.create_user(username='testuser', password='testpass123', is_staff=True)
+        self.client.login(username='testuser', password='testpass123')
+
+    def tearDown(self):
+        from .reference_data_manager import ReferenceData
+
+        ReferenceData.invalidate()
+
+    def _reference_queries(self, func):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        tables = [table for query in queries for table in self.REFERENCE_TABLES if table in query['sql']]
+        return result, tables
+
+    def test_page_renders_skip_reference_queries(self):
+        """After the first render, the context processor and landing page query no reference table"""
+        from .models import SystemSettings
+
+        SystemSettings.objects.create(is_active=True)
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('landing'))
+
+        response, tables = self._reference_queries(lambda: self.client.get(reverse('dashboard')))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context['system_settings'])
+        self.assertEqual(tables, [])
+        response, tables = self._reference_queries(lambda: self.client.get(reverse('landing')))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(tables, [])
+
+    def test_saves_bump_the_snapshot(self):
+        """Saving a reference row is visible at the next access"""
+        from .models import MaterialType
+        from .reference_data_manager import ReferenceData
+
+        self.assertIsNone(ReferenceData.material_type_containing('zip'))
+        zipper = MaterialType.objects.create(name='Zipper', unit_of_measurement='inches')
+        self.assertEqual(ReferenceData.material_type_containing('ZIP'), zipper)
+
+        zipper.name = 'Zippers'
+        zipper.save()
+        found, tables = self._reference_queries(lambda: ReferenceData.material_type_containing('zip'))
+        self.assertEqual(found.name, 'Zippers')
+        self.assertTrue(tables)
+        self.assertEqual(self._reference_queries(lambda: ReferenceData.material_type_containing('zip'))[1], [])
+
+    def test_category_lookup_creates_once(self):
+        """category() answers existing names from the snapshot and creates missing ones"""
+        from .reference_data_manager import ReferenceData
+
+        created = ReferenceData.category('Repair Services', 'Repair service products')
+        self.assertEqual(created.description, 'Repair service products')
+        # The insert bumped the snapshot; the next access rebuilds it once
+        ReferenceData.categories()
+        found, tables = self._reference_queries(lambda: ReferenceData.category('Repair Services'))
+        self.assertEqual(found.pk, created.pk)
+        self.assertEqual(tables, [])
+        self.assertEqual(Category.objects.filter(name='Repair Services').count(), 1)
+
+    def test_rolled_back_rows_never_enter_the_snapshot(self):
+        """Uncommitted rows are only seen by their own transaction"""
+        from django.db import transaction
+        from .reference_data_manager import ReferenceData
+
+        class Rollback(Exception):
+            pass
+
+        try:
+            with transaction.atomic():
+                ReferenceData.category('Ghost')
+                self.assertIn('Ghost', [category.name for category in ReferenceData.categories()])
+                raise Rollback()
+        except Rollback:
+            pass
+        self.assertNotIn('Ghost', [category.name for category in ReferenceData.categories()])
+
+
+class CustomerSearchTests(TestCase):
+    """Normalized phone keys, the name index and the typeahead API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.maria = Customer.objects.create(name='Maria Santos', phone='0917 123 4567')
+        self.mario = Customer.objects.create(name='Mario Reyes', phone='+63 928 111 2222')
+        self.jose = Customer.objects.create(name='Jose Cruz', phone='09051234567', email='marquez.j@example.com')
+
+    def _search(self, term):
+        from .customer_search_manager import CustomerSearch
+
+        return set(CustomerSearch.filter(Customer.objects.all(), term).values_list('name', flat=True))
+
+    def test_phone_is_stored_normalized(self):
+        """save() keeps phone_normalized in E.164, also when only the phone is saved"""
+        self.assertEqual(self.maria.phone_normalized, '+639171234567')
+        self.maria.phone = '0918-765-4321'
+        self.maria.save(update_fields=['phone'])
+        self.maria.refresh_from_db()
+        self.assertEqual(self.maria.phone_normalized, '+639187654321')
+
+    def test_search_by_word_prefixes_and_phone_prefixes(self):
+        """Name and email words match by prefix; partial numbers match in any format"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._search('mar san'), {'Maria Santos'})
+        if connection.vendor == 'sqlite':
+            self.assertIn('business_customer_fts', queries[0]['sql'])
+        self.assertEqual(self._search('mar'), {'Maria Santos', 'Mario Reyes', 'Jose Cruz'})
+        self.assertEqual(self._search('0917'), {'Maria Santos'})
+        self.assertEqual(self._search('917 123'), {'Maria Santos'})
+        self.assertEqual(self._search('+63928'), {'Mario Reyes'})
+        self.assertEqual(self._search('zzz'), set())
+
+    def test_index_follows_renames_and_deletes(self):
+        """The name index is updated with the customer rows"""
+        self.maria.name = 'Ana Lim'
+        self.maria.save()
+        self.assertEqual(self._search('santos'), set())
+        self.assertEqual(self._search('ana'), {'Ana Lim'})
+        self.maria.delete()
+        self.assertEqual(self._search('ana'), set())
+
+    def test_typeahead_is_bounded(self):
+        """The typeahead returns at most the requested (and allowed) number of matches"""
+        from .customer_search_manager import TYPEAHEAD_LIMIT, TYPEAHEAD_MAX_LIMIT
+
+        Customer.objects.bulk_create(
+            Customer(name=f'Marites {index}', phone=f'0920{index:07d}', phone_normalized=f'+63920{index:07d}')
+            for index in range(30)
+        )
+        url = reverse('api_customer_typeahead')
+        response = self.client.get(url, {'q': 'mari'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), TYPEAHEAD_LIMIT)
+        response = self.client.get(url, {'q': 'mari', 'limit': 500})
+        self.assertEqual(len(response.json()['results']), TYPEAHEAD_MAX_LIMIT)
+        response = self.client.get(url, {'q': '0917'})
+        self.assertEqual(response.json()['results'][0]['id'], self.maria.pk)
+        self.assertEqual(self.client.get(url, {'q': 'm'}).json()['results'], [])
+
+    def test_order_entry_matches_customer_by_normalized_phone(self):
+        """The same number typed differently finds the existing customer"""
+        from .customer_search_manager import CustomerSearch
+
+        self.assertEqual(CustomerSearch.by_phone('+639171234567'), self.maria)
+        self.assertEqual(CustomerSearch.by_phone('(0917) 123-4567'), self.maria)
+        self.assertIsNone(CustomerSearch.by_phone('09990000000'))
+
+    def test_install_restores_missing_triggers(self):
+        """Reinstalling after the triggers were dropped rebuilds the index"""
+        from django.db import connection
+        from .customer_search_manager import FTS_TABLE, CustomerSearch
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 index is SQLite only')
+        self.assertFalse(CustomerSearch.install())
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {FTS_TABLE}_ai')
+        Customer.objects.create(name='Lorna Dizon', phone='09170000001')
+        self.assertTrue(CustomerSearch.install())
+        self.assertEqual(self._search('lorna'), {'Lorna Dizon'})
+
+
+class CustomersAPIPaginationTests(TestCase):
+    """Keyset pages, delta fetches and conditional GETs of the customers API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.customers = [
+            Customer.objects.create(name=f'Customer {index:02d}', phone=f'0917{index:07d}')
+            for index in range(25)
+        ]
+        for _ in range(3):
+            Order.objects.create(customer=self.customers[0], order_type='repair', total_amount=Decimal('100.00'))
+        self.url = reverse('api_customers_list')
+
+    def _all_pages(self, **params):
+        names, cursor, pages = [], None, 0
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            data = self.client.get(self.url, query).json()
+            names.extend(customer['name'] for customer in data['customers'])
+            pages += 1
+            cursor = data['next_cursor']
+            if not cursor:
+                return names, pages
+
+    def test_pages_cover_every_customer_once(self):
+        """Following next_cursor lists every customer exactly once, by name"""
+        names, pages = self._all_pages(limit=10)
+        self.assertEqual(names, [customer.name for customer in self.customers])
+        self.assertEqual(pages, 3)
+
+    def test_order_counts_are_annotated(self):
+        """Order counts come from the page query, not one query per customer"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url, {'limit': 25}).json()
+        counts = {customer['name']: customer['order_count'] for customer in data['customers']}
+        self.assertEqual(counts['Customer 00'], 3)
+        self.assertEqual(counts['Customer 01'], 0)
+        customer_queries = [query for query in queries if 'business_customer' in query['sql']]
+        self.assertEqual(len(customer_queries), 2)
+
+    def test_updated_since_returns_changes_only(self):
+        """A delta fetch lists customers changed since the given time, including new orders"""
+        from django.utils import timezone
+
+        since = timezone.now()
+        renamed = self.customers[5]
+        renamed.name = 'Renamed Customer'
+        renamed.save()
+        Order.objects.create(customer=self.customers[7], order_type='repair', total_amount=Decimal('50.00'))
+
+        names, _ = self._all_pages(updated_since=since.isoformat())
+        self.assertEqual(names, ['Renamed Customer', 'Customer 07'])
+        response = self.client.get(self.url, {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_get(self):
+        """A current ETag or Last-Modified gets a 304 until a customer changes"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        Customer.objects.create(name='New Customer', phone='09181234567')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tampered_cursor_is_rejected(self):
+        """A cursor that was edited or belongs to another ordering is a 400"""
+        cursor = self.client.get(self.url, {'limit': 5}).json()['next_cursor']
+        self.assertEqual(self.client.get(self.url, {'cursor': cursor + 'x'}).status_code, 400)
+        response = self.client.get(self.url, {'cursor': cursor, 'updated_since': '2020-01-01T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderTrackingTests(TestCase):
+    """Canonical tracking keys, the one-query lookup and the public page's limits"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.customer = Customer.objects.create(name='Tracking Customer', phone='09171234567')
+        self.order = Order.objects.create(
+            customer=self.customer, order_type='repair', order_identifier='TS01REP-O07',
+            total_amount=Decimal('300.00'),
+        )
+        self.url = reverse('public_track_order')
+
+    def test_tracking_key_folds_spellings(self):
+        """Case, spaces, the O marker and zero padding do not matter"""
+        from .order_tracking_manager import tracking_key
+
+        self.assertEqual(self.order.tracking_key, 'TS01REP-7')
+        for spelling in ['TS01REP-O07', 'ts01rep-o7', 'TS01REP-007', ' TS01REP - 7 ']:
+            with self.subTest(spelling=spelling):
+                self.assertEqual(tracking_key(spelling), 'TS01REP-7')
+
+    def test_lookup_is_one_query(self):
+        """Every accepted spelling and the UUID resolve with a single query"""
+        from .order_tracking_manager import OrderTracking
+
+        for spelling in ['TS01REP-O07', 'ts01rep-007', str(self.order.order_id)]:
+            with self.subTest(spelling=spelling), self.assertNumQueries(1):
+                self.assertEqual(OrderTracking.find(spelling), self.order)
+        with self.assertNumQueries(1):
+            self.assertIsNone(OrderTracking.find('TS01REP-O99'))
+        self.assertIsNone(OrderTracking.find(str(self.order.pk)))
+        self.assertEqual(OrderTracking.find(str(self.order.pk), include_pk=True), self.order)
+
+    def test_public_page_finds_orders_but_not_partial_ids(self):
+        """The public page resolves identifiers but not primary keys or fragments"""
+        response = self.client.post(self.url, {'order_id': 'ts01rep-7'})
+        self.assertTemplateUsed(response, 'business/public_track_result.html')
+        self.assertEqual(response.context['order'], self.order)
+        for guess in [str(self.order.pk), 'TS01REP']:
+            with self.subTest(guess=guess):
+                response = self.client.post(self.url, {'order_id': guess})
+                self.assertTemplateUsed(response, 'business/public_track_order.html')
+
+    def test_repeated_lookup_is_answered_from_cache(self):
+        """A client repeating a lookup does not search the orders again"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.post(self.url, {'order_id': 'TS01REP-O99'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'order_id': 'TS01REP-099'})
+        self.assertFalse([query for query in queries if 'business_order' in query['sql']])
+
+    def test_public_page_is_rate_limited_per_client(self):
+        """Past the limit a client gets 429s; other clients are unaffected"""
+        from django.test import override_settings
+
+        with override_settings(TRACKING_RATE_LIMIT=3):
+            for _ in range(3):
+                self.assertEqual(self.client.post(self.url, {'order_id': 'TS01REP-O07'}).status_code, 200)
+            self.assertEqual(self.client.post(self.url, {'order_id': 'TS01REP-O07'}).status_code, 429)
+            response = self.client.post(self.url, {'order_id': 'TS01REP-O07'}, REMOTE_ADDR='10.0.0.2')
+            self.assertEqual(response.status_code, 200)
+
+    def test_forged_forwarded_for_does_not_escape_the_limit(self):
+        """Behind a proxy the address it appended counts, not what the client put in front"""
+        from django.test import override_settings
+
+        with override_settings(TRACKING_RATE_LIMIT=3, TRACKING_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+            for number in range(3):
+                response = self.client.post(
+                    self.url, {'order_id': 'TS01REP-O07'}, HTTP_X_FORWARDED_FOR=f'198.51.100.{number}, 203.0.113.9',
+                )
+                self.assertEqual(response.status_code, 200)
+            response = self.client.post(
+                self.url, {'order_id': 'TS01REP-O07'}, HTTP_X_FORWARDED_FOR='198.51.100.99, 203.0.113.9',
+            )
+            self.assertEqual(response.status_code, 429)
+
+
+class ImageFingerprintTests(TestCase):
+    """Image hashes stored at upload time drive customize product de-duplication"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.settings_override = self.settings(MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def _upload(self, name, scale=1, color_shift=0):
+        """PNG of a fixed pattern; scaled copies are the same picture with different bytes"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        image = Image.new('RGB', (36 * scale, 32 * scale))
+        image.putdata([
+            ((x // scale * 29 + y // scale * 7 + color_shift) % 256, (x // scale * 3) % 256, (y // scale * 11) % 256)
+            for y in range(32 * scale) for x in range(36 * scale)
+        ])
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def _product(self, name, upload):
+        return Product.objects.create(name=name, product_type='service', price=Decimal('0.00'), image=upload)
+
+    def _remove_files(self, *products):
+        """Delete the stored files so any attempt to re-read them would come up empty"""
+        for product in products:
+            product.image.storage.delete(product.image.name)
+
+    def test_fingerprints_are_stored_on_upload(self):
+        """Saving an upload stores its SHA-256 and perceptual hash"""
+        import hashlib
+
+        upload = self._upload('jersey.png')
+        content = upload.read()
+        product = self._product('Jersey', upload)
+        self.assertEqual(product.image_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(len(product.image_phash), 16)
+
+        resized = self._product('Jersey large', self._upload('jersey-large.png', scale=3))
+        self.assertNotEqual(resized.image_hash, product.image_hash)
+        self.assertEqual(resized.image_phash, product.image_phash)
+
+    def test_upload_check_uses_stored_hashes(self):
+        """A re-upload of the same picture is caught without reading stored images"""
+        from .customize_product_manager import ensure_no_duplicates
+
+        existing = self._product('Team Shirt', self._upload('shirt.png'))
+        self._remove_files(existing)
+        candidate = Product(product_type='service', name='New Upload', image=self._upload('upload.png', scale=2))
+        self.assertEqual(ensure_no_duplicates(candidate), (True, existing))
+
+        other = Product(product_type='service', name='Other', image=self._upload('other.png', color_shift=101))
+        self.assertEqual(ensure_no_duplicates(other), (False, None))
+
+    def test_duplicate_groups_come_from_stored_hashes(self):
+        """find_duplicate_customize_products groups by the hash columns"""
+        from .customize_product_manager import find_duplicate_customize_products
+
+        first = self._product('Patch A', self._upload('a.png'))
+        second = self._product('Patch B', self._upload('b.png'))
+        resized = self._product('Patch C', self._upload('c.png', scale=2))
+        self._product('Unrelated', self._upload('d.png', color_shift=101))
+        self._remove_files(first, second, resized)
+
+        groups = {info['method']: info['products'] for info in find_duplicate_customize_products().values()}
+        self.assertEqual(set(groups['hash']), {first, second})
+        self.assertEqual(set(groups['perceptual_hash']), {first, second, resized})
+
+    def test_saves_leave_stored_images_unread(self):
+        """Only an upload or a different file is hashed; other saves never open the image"""
+        from unittest import mock
+
+        product = self._product('Old Upload', self._upload('old.png'))
+        other = self._product('Other Upload', self._upload('other.png', color_shift=101))
+        Product.objects.filter(pk=product.pk).update(image_hash='', image_phash='')
+
+        product = Product.objects.get(pk=product.pk)
+        with mock.patch('business.customize_product_manager.read_image_bytes') as read:
+            product.name = 'Old Upload (renamed)'
+            product.save()
+            Product.objects.get(pk=product.pk).save(update_fields=['name'])
+        read.assert_not_called()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, '')
+
+        product.image = other.image.name
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, other.image_hash)
+
+    def test_backfill_command_hashes_existing_images(self):
+        """backfill_image_fingerprints fills in hashes of images stored without them"""
+        from django.core.management import call_command
+
+        product = self._product('Old Upload', self._upload('old.png'))
+        expected = (product.image_hash, product.image_phash)
+        Product.objects.filter(pk=product.pk).update(image_hash='', image_phash='')
+
+        out = io.StringIO()
+        call_command('backfill_image_fingerprints', workers=2, stdout=out)
+        product.refresh_from_db()
+        self.assertEqual((product.image_hash, product.image_phash), expected)
+        self.assertIn('Stored fingerprints for 1 image(s)', out.getvalue())
+
+
+class ImageRenditionTests(TestCase):
+    """Uploaded images are served as resized WebP renditions"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from .image_rendition_manager import ImageRenditions
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.settings_override = self.settings(MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        # Manifests are remembered per process by file name
+        ImageRenditions.forget()
+        self.addCleanup(ImageRenditions.forget)
+
+    def _upload(self, name, size=(1000, 800), mode='RGB'):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        image = Image.new(mode, size)
+        image.putdata([
+            (x % 256, y % 256, (x * y) % 256, 128)[:len(mode)]
+            for y in range(size[1]) for x in range(size[0])
+        ])
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def _product(self, upload):
+        return Product.objects.create(name='Barong', product_type='rental', price=Decimal('1500.00'), image=upload)
+
+    def test_upload_renders_renditions(self):
+        """Saving an upload writes WebP widths up to the source's and a JPEG fallback"""
+        from django.core.files.storage import default_storage
+        from .image_rendition_manager import ImageRenditions, rendition_dir
+
+        product = self._product(self._upload('barong.png'))
+        manifest = ImageRenditions.manifest(product.image, generate=False)
+        self.assertEqual(
+            {label: width for label, (name, width, height) in manifest['renditions'].items()},
+            {'thumb': 160, 'medium': 480, 'large': 1000},
+        )
+        self.assertEqual(manifest['fallback'], ['480w.jpg', 480, 384])
+
+        directory = rendition_dir(product.image.name)
+        thumb = f'{directory}/160w.webp'
+        self.assertTrue(default_storage.exists(thumb))
+        self.assertLess(default_storage.size(thumb), default_storage.size(product.image.name) / 10)
+        self.assertEqual(ImageRenditions.url(product.image, 'thumb'), default_storage.url(thumb))
+
+    def test_transparent_image_falls_back_to_png(self):
+        from .image_rendition_manager import ImageRenditions
+
+        product = self._product(self._upload('patch.png', size=(300, 300), mode='RGBA'))
+        manifest = ImageRenditions.manifest(product.image, generate=False)
+        self.assertEqual(manifest['fallback'], ['300w.png', 300, 300])
+        self.assertEqual(manifest['renditions']['medium'][0], '300w.webp')
+
+    def test_template_tag_emits_srcset(self):
+        """responsive_image lists the renditions up to ``largest`` and escapes attributes"""
+        from django.template import Context, Template
+
+        product = self._product(self._upload('suit.png'))
+        html = Template(
+            '{% load image_tags %}'
+            '{% responsive_image image sizes="56px" largest="medium" alt=name class="product-image" %}'
+        ).render(Context({'image': product.image, 'name': 'Suit <b>'}))
+
+        self.assertIn('160w.webp 160w, ', html)
+        self.assertIn('480w.webp 480w"', html)
+        self.assertNotIn('1000w.webp', html)
+        self.assertIn('sizes="56px"', html)
+        self.assertIn('alt="Suit &lt;b&gt;"', html)
+        self.assertIn('class="product-image"', html)
+        self.assertIn('src="/media/derived/products/suit', html)
+
+    def test_missing_renditions_are_rendered_lazily(self):
+        """Images without renditions get them on first view, or keep the original when lazy rendering is off"""
+        from .image_rendition_manager import ImageRenditions
+
+        product = self._product(self._upload('vest.png'))
+        ImageRenditions.delete(product.image.name)
+
+        with self.settings(IMAGE_RENDITIONS_LAZY=False):
+            self.assertEqual(ImageRenditions.url(product.image, 'thumb'), product.image.url)
+            self.assertEqual(ImageRenditions.attributes(product.image), {'src': product.image.url})
+
+        self.assertTrue(ImageRenditions.url(product.image, 'thumb').endswith('/160w.webp'))
+        self.assertIsNotNone(ImageRenditions.manifest(product.image, generate=False))
+
+    def test_command_renders_missing_and_prunes_orphans(self):
+        """generate_image_renditions fills in missing renditions and removes those of deleted images"""
+        from django.core.management import call_command
+        from .image_rendition_manager import ImageRenditions
+
+        kept = self._product(self._upload('kept.png', size=(200, 100)))
+        gone = self._product(self._upload('gone.png', size=(200, 100)))
+        ImageRenditions.delete(kept.image.name)
+        gone.image.storage.delete(gone.image.name)
+        Product.objects.filter(pk=gone.pk).update(image='')
+
+        out = io.StringIO()
+        call_command('generate_image_renditions', workers=2, prune=True, stdout=out)
+        self.assertIn('Rendered 1 image(s)', out.getvalue())
+        self.assertIn('Pruned renditions of 1 removed image(s)', out.getvalue())
+        ImageRenditions.forget()
+        self.assertIsNotNone(ImageRenditions.manifest(kept.image, generate=False))
+        self.assertEqual(ImageRenditions.rendered_sources(), [kept.image.name])
+
+
+class InventoryLedgerTests(TestCase):
+    """Stock changes are conditional single-statement updates recorded in the ledger"""
+
+    def setUp(self):
+        self.thread = Product.objects.create(
+            name='Black Thread', product_type='material', price=Decimal('5.00'), quantity=10,
+        )
+
+    def test_deduction_is_conditional_and_recorded(self):
+        """A deduction larger than the stock changes nothing; others record the balance they leave"""
+        from .catalog_cache_manager import CatalogCache
+        from .inventory_ledger_manager import InventoryLedger
+
+        version = CatalogCache.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = InventoryLedger.deduct(self.thread, Decimal('2.5'), notes='Hem')
+        self.assertEqual((entry.quantity, entry.balance_after, entry.transaction_type), (-3, 7, 'out'))
+        self.assertEqual(self.thread.quantity, 7)
+        self.assertNotEqual(CatalogCache.version(), version)
+
+        self.assertIsNone(InventoryLedger.deduct(self.thread, 8))
+        self.thread.refresh_from_db()
+        self.assertEqual((self.thread.quantity, self.thread.current_quantity_in_stock), (7, 7))
+        self.assertEqual(InventoryTransaction.objects.filter(product=self.thread).count(), 1)
+
+    def test_stale_instances_do_not_lose_updates(self):
+        """Two copies of the product loaded before either change both count"""
+        from .inventory_ledger_manager import InventoryLedger
+
+        first = Product.objects.get(pk=self.thread.pk)
+        second = Product.objects.get(pk=self.thread.pk)
+        InventoryLedger.deduct(first, 3)
+        InventoryLedger.add(second, 5)
+        self.assertEqual(second.quantity, 12)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.quantity, 12)
+
+    def test_adjust_stock_api_clamps_at_zero(self):
+        """Taking more than is on hand through the adjust API records what was actually taken"""
+        User.objects.create_user(username='stock', password='pass12345')
+        self.client.login(username='stock', password='pass12345')
+
+        response = self.client.post(
+            f'/api/product/{self.thread.pk}/adjust-stock/', data='{"adjustment": -25}', content_type='application/json'
+        )
+        self.assertEqual(response.json()['old_quantity'], 10)
+        self.assertEqual(response.json()['new_quantity'], 0)
+        entry = InventoryTransaction.objects.get(product=self.thread)
+        self.assertEqual((entry.quantity, entry.balance_after), (-10, 0))
+
+    def test_stock_at_reads_the_nearest_balance(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .inventory_ledger_manager import InventoryLedger
+
+        now = timezone.now()
+        for days_ago, delta in ((5, -4), (3, 6), (1, -2)):
+            entry = InventoryLedger.adjust(self.thread, delta, 'adjustment')
+            InventoryTransaction.objects.filter(pk=entry.pk).update(created_at=now - timedelta(days=days_ago))
+
+        self.assertEqual(InventoryLedger.stock_at(self.thread, now - timedelta(days=6)), 10)
+        self.assertEqual(InventoryLedger.stock_at(self.thread, now - timedelta(days=4)), 6)
+        self.assertEqual(InventoryLedger.stock_at(self.thread, now - timedelta(days=2)), 12)
+        self.assertEqual(InventoryLedger.stock_at(self.thread, now), 10)
+        with self.assertNumQueries(1):
+            InventoryLedger.stock_at(self.thread, now)
+
+
+class InventoryLedgerConcurrencyTests(TransactionTestCase):
+    """Counters deducting the same material at once never lose or oversell stock"""
+
+    THREADS = 8
+    DEDUCTIONS_PER_THREAD = 40
+    STOCK = 250
+
+    def test_parallel_deductions_are_exact(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+        from django.db.models import Sum
+        from .inventory_ledger_manager import InventoryLedger
+
+        material = Product.objects.create(
+            name='Zipper 7in', product_type='material', price=Decimal('12.00'), quantity=self.STOCK,
+        )
+
+        # Every worker holds its own copy of the product, loaded before any
+        # deduction - what lost updates under the old read-modify-save code -
+        # and deducts with no coordination beyond the database's own locks
+        # (a file-backed test database on SQLite, see DATABASES in settings)
+        def deduct(_):
+            taken = 0
+            try:
+                product = Product.objects.get(pk=material.pk)
+                for _ in range(self.DEDUCTIONS_PER_THREAD):
+                    if InventoryLedger.deduct(product, 1):
+                        taken += 1
+            finally:
+                connection.close()
+            return taken
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            taken = sum(executor.map(deduct, range(self.THREADS)))
+
+        material.refresh_from_db()
+        entries = InventoryTransaction.objects.filter(product=material)
+        self.assertEqual(taken, self.STOCK)
+        self.assertEqual(material.quantity, 0)
+        self.assertEqual(entries.aggregate(total=Sum('quantity'))['total'], -self.STOCK)
+        self.assertEqual(sorted(entries.values_list('balance_after', flat=True)), list(range(self.STOCK)))
+
+
+class MaterialDeductionPlannerTests(TestCase):
+    """Repair and customize materials are resolved and deducted together"""
+
+    def setUp(self):
+        from .material_catalog_manager import MaterialCatalogManager
+        from .models import MaterialType
+
+        MaterialCatalogManager.invalidate()
+        types = {
+            name: MaterialType.objects.create(name=name, unit_of_measurement=unit)
+            for name, unit in (('Zipper', 'inches'), ('Thread', 'meters'), ('Button', 'groups'), ('Fabric', 'meters'))
+        }
+        self.zipper = self._material(types['Zipper'], 'Zipper 7in', 'Color: Black', 'inches', 20)
+        self.black = self._material(types['Thread'], 'Coats Black', 'Brand: Coats; Color: Black', 'meters', 10)
+        self.gutermann = self._material(types['Thread'], 'Gutermann Black', 'Brand: Gutermann; Color: Black', 'meters', 10)
+        self.buttons = self._material(types['Button'], 'Plain Buttons', 'Button Type: Plain; Color: White', 'groups', 3)
+        self.fabric = self._material(types['Fabric'], 'Cotton Blue', 'Type of Fabric: Cotton; Color: Blue', 'meters', 10)
+        customer = Customer.objects.create(name='Planner Customer', phone='09170000021')
+        self.repair = Order.objects.create(customer=customer, order_type='repair', total_amount=Decimal('150.00'))
+        self.customize = Order.objects.create(customer=customer, order_type='customize', total_amount=Decimal('900.00'))
+
+    def _material(self, material_type, name, description, unit, quantity):
+        return Product.objects.create(
+            name=name, product_type='material', material_type=material_type, description=description,
+            unit_of_measurement=unit, price=Decimal('5.00'), quantity=quantity,
+        )
+
+    def _zipper_repair(self, inches):
+        return {
+            'repair_type': 'zipper_replacement', 'selected_zipper_id': str(self.zipper.pk),
+            'selected_zipper_inches_used': inches, 'thread_color': 'black',
+        }
+
+    def test_repair_materials_deducted_in_one_plan(self):
+        """The zipper and its thread cost one lookup query and, per round, one UPDATE and one INSERT (and the change feed's)"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .material_catalog_manager import MaterialCatalogManager
+        from .material_deduction_manager import MaterialDeductionPlanner
+
+        MaterialCatalogManager.candidates('thread')  # build the catalog index
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            summaries = MaterialDeductionPlanner.apply(self.repair, self._zipper_repair('7'))
+
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'UPDATE', 'INSERT', 'INSERT', 'UPDATE', 'INSERT', 'INSERT'])
+        self.assertEqual(summaries, ['Zipper: 7 inches', 'Thread: 0.44m (black)'])
+        entries = {entry.product_id: entry for entry in InventoryTransaction.objects.filter(reference_order=self.repair)}
+        self.assertEqual((entries[self.zipper.pk].quantity, entries[self.zipper.pk].balance_after), (-7, 13))
+        self.assertEqual((entries[self.black.pk].quantity, entries[self.black.pk].balance_after), (-1, 9))
+        self.assertTrue(ActivityLog.objects.filter(activity_type='inventory_transaction', order=self.repair).exists())
+
+    def test_thread_follows_its_material(self):
+        """No zipper deducted (too little stock) means no thread either"""
+        from .material_deduction_manager import MaterialDeductionPlanner
+
+        self.assertEqual(MaterialDeductionPlanner.apply(self.repair, self._zipper_repair('25')), [])
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+    def test_customize_units_converted_per_product(self):
+        """Yards go out of a fabric kept in meters, pieces out of buttons kept in groups, thread by brand"""
+        from .material_deduction_manager import MaterialDeductionPlanner
+
+        MaterialDeductionPlanner.apply(self.customize, {
+            'customize_type': 'polo', 'customize_quantity': '2',
+            'customize_fabric': 'Cotton', 'customize_fabric_color': 'Blue', 'customize_fabric_yards': '1.5',
+            'customize_thread_brand': 'Gutermann', 'customize_thread_color': 'Black', 'customize_thread_meters': '3',
+            'uniform_button_type': 'Plain', 'uniform_button_color': 'White', 'uniform_buttons_needed': '6',
+        })
+
+        taken = dict(InventoryTransaction.objects.filter(reference_order=self.customize).values_list('product', 'quantity'))
+        # 3 yards = 2.74 m, 12 pieces = 1.5 groups, both rounded up
+        self.assertEqual(taken, {self.fabric.pk: -3, self.gutermann.pk: -6, self.buttons.pk: -2})
+
+    def test_availability_api_is_a_dry_run(self):
+        """The check reports the shortfall in the product's unit and writes nothing"""
+        User.objects.create_user(username='planner', password='pass12345')
+        self.client.login(username='planner', password='pass12345')
+
+        response = self.client.post('/api/orders/check-materials/', data={
+            'orderType': 'repair', 'repair_type': 'buttons', 'selected_button_id': self.buttons.pk,
+            'selected_button_quantity_used': 32,
+        }, content_type='application/json')
+        self.assertFalse(response.json()['available'])
+        shortfall = response.json()['unavailable_materials'][0]
+        self.assertEqual((shortfall['needed'], shortfall['available']), (4, 3))
+
+        response = self.client.post('/api/orders/check-materials/', data=self._zipper_repair('7'),
+                                    content_type='application/json')
+        self.assertTrue(response.json()['available'])
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+
+class OrderCreationServiceTests(TestCase):
+    """Orders are created whole or not at all, once per idempotency key"""
+
+    def setUp(self):
+        User.objects.create_user(username='counter', password='pass12345')
+        self.client.login(username='counter', password='pass12345')
+        self.hem = Product.objects.create(name='Repair - Hem', product_type='service', price=Decimal('120.00'), quantity=0)
+        self.gown = Product.objects.create(
+            name='Gown A', product_type='rental', price=Decimal('1500.00'), quantity=1, rental_status='available',
+        )
+        self.barong = Product.objects.create(
+            name='Barong B', product_type='rental', price=Decimal('1500.00'), quantity=1, rental_status='rented',
+        )
+
+    def _payload(self, order_type, items, key=None):
+        payload = {
+            'customerName': 'Idem Customer', 'mobileNumber': '09170000022', 'orderType': order_type,
+            'totalCost': 0, 'items': items,
+        }
+        if key:
+            payload['idempotencyKey'] = key
+        return payload
+
+    def _post(self, payload, **headers):
+        import json
+
+        return self.client.post(
+            '/api/orders/create/', data=json.dumps(payload), content_type='application/json', **headers
+        ).json()
+
+    def test_items_resolved_and_priced_in_one_order(self):
+        """Items match services by their name formats; a service without a price takes the page's cost"""
+        Product.objects.create(name='Repair - Zipper (Class B)', product_type='service', price=Decimal('0'), quantity=0)
+        items = [
+            {'name': 'hem', 'quantity': 2, 'cost': 999},
+            {'name': 'zipper', 'quantity': 1, 'cost': 80, 'class': 'B'},
+        ]
+        result = self._post(self._payload('repair', items, key='order-1'))
+
+        order = Order.objects.get(pk=result['order_id'])
+        self.assertEqual(order.idempotency_key, 'order-1')
+        prices = list(order.items.order_by('pk').values_list('product__name', 'total_price'))
+        self.assertEqual(prices, [('Repair - Hem', Decimal('240.00')), ('Repair - Zipper (Class B)', Decimal('80.00'))])
+        self.assertEqual((order.total_amount, order.balance), (Decimal('320.00'), Decimal('0')))
+
+    def test_missing_service_created_once(self):
+        items = [{'name': 'Polo Uniform', 'quantity': 1, 'cost': 450}] * 2
+        result = self._post(self._payload('customize', items))
+
+        self.assertTrue(result['success'])
+        self.assertEqual(Product.objects.filter(name='Polo Uniform', product_type='service').count(), 1)
+        self.assertEqual(OrderItem.objects.filter(order_id=result['order_id']).count(), 2)
+
+    def test_customize_item_charged_its_page_cost_above_base_price(self):
+        """A customization priced above the base product is charged in full, at the base unit price"""
+        base = Product.objects.create(name='Custom Gown Base', product_type='service', price=Decimal('100.00'), quantity=0)
+        payload = self._payload('customize', [{'name': 'Custom Gown', 'quantity': 1, 'cost': 350}])
+        payload['customize_product_id'] = base.pk
+        result = self._post(payload)
+
+        order = Order.objects.get(pk=result['order_id'])
+        item = order.items.get()
+        self.assertEqual((item.product_id, item.unit_price, item.total_price), (base.pk, Decimal('100.00'), Decimal('350.00')))
+        self.assertEqual(order.total_amount, Decimal('350.00'))
+
+    def test_retry_returns_the_original_order(self):
+        """The same key - in the body or the header - never creates a second order"""
+        payload = self._payload('repair', [{'name': 'hem', 'quantity': 1}], key='retry-me')
+        first = self._post(payload)
+        second = self._post(payload)
+        third = self._post(dict(payload, idempotencyKey=None), HTTP_IDEMPOTENCY_KEY='retry-me')
+
+        self.assertEqual(first['order_id'], second['order_id'])
+        self.assertEqual(first['order_id'], third['order_id'])
+        self.assertEqual((first['duplicate'], second['duplicate']), (False, True))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_racing_retry_gets_the_winner(self):
+        """A retry that passes the key check while the original commits returns the original"""
+        from unittest import mock
+        from .order_creation_manager import OrderCreationService
+
+        payload = self._payload('repair', [{'name': 'hem', 'quantity': 1}])
+        winner, _ = OrderCreationService.create(payload, idempotency_key='race')
+
+        real_filter = Order.objects.filter
+        lookups = []
+
+        def miss_first_lookup(*args, **kwargs):
+            # The retry's first lookup runs before the winner committed
+            lookups.append(kwargs)
+            return Order.objects.none() if len(lookups) == 1 else real_filter(*args, **kwargs)
+
+        with mock.patch.object(Order.objects, 'filter', side_effect=miss_first_lookup):
+            order, created = OrderCreationService.create(payload, idempotency_key='race')
+        self.assertEqual((order.pk, created), (winner.pk, False))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failure_leaves_nothing_behind(self):
+        """An unavailable second gown rolls back the order, its customer and the first gown"""
+        items = [{'name': 'Gown A', 'quantity': 1}, {'name': 'Barong B', 'quantity': 1}]
+        result = self._post(self._payload('rent', items, key='rent-1'))
+
+        self.assertFalse(result['success'])
+        self.assertIn('not available', result['error'])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Customer.objects.filter(phone='09170000022').exists())
+        self.gown.refresh_from_db()
+        self.assertEqual(self.gown.rental_status, 'available')
+
+    def test_rental_order_rents_out_its_products(self):
+        result = self._post(self._payload('rent', [{'name': 'Gown A', 'quantity': 1}]))
+
+        self.gown.refresh_from_db()
+        self.assertEqual((self.gown.rental_status, self.gown.current_rental_order_id), ('rented', result['order_id']))
+        self.assertTrue(InventoryTransaction.objects.filter(product=self.gown, transaction_type='rental_out').exists())
+
+
+class BatchSyncTests(TestCase):
+    """The offline app's queue is applied in one request, each operation on its own"""
+
+    def setUp(self):
+        User.objects.create_user(username='counter', password='pass12345')
+        self.client.login(username='counter', password='pass12345')
+        Product.objects.create(name='Repair - Hem', product_type='service', price=Decimal('120.00'), quantity=0)
+
+    def _sync(self, operations):
+        import json
+
+        return self.client.post(
+            '/api/sync/batch/', data=json.dumps({'operations': operations}), content_type='application/json'
+        )
+
+    def _order(self, key):
+        return {
+            'type': 'order', 'key': key,
+            'data': {
+                'customerName': 'Offline Customer', 'mobileNumber': '09170000023', 'orderType': 'repair',
+                'items': [{'name': 'hem', 'quantity': 1, 'cost': 120}], 'sync_status': 'pending',
+            },
+        }
+
+    def test_operations_applied_in_order_and_failures_isolated(self):
+        operations = [
+            {'id': 0, **self._order('order-a')},
+            {'id': 1, 'type': 'customer', 'key': 'customer-a', 'data': {'name': '', 'phone': '09170000024'}},
+            {'id': 2, 'type': 'customer', 'key': 'customer-b', 'data': {'name': 'Walk In', 'phone': '0917 000 0024'}},
+            {'id': 3, 'type': 'invoice', 'key': 'x', 'data': {}},
+        ]
+        response = self._sync(operations)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['applied', 'failed', 'applied', 'failed'])
+        self.assertEqual([result['id'] for result in results], [0, 1, 2, 3])
+        self.assertIn('name', results[1]['error'])
+        self.assertEqual(Order.objects.get().pk, results[0]['order_id'])
+        self.assertEqual(Customer.objects.get(phone='0917 000 0024').pk, results[2]['customer_id'])
+
+    def test_resent_batch_applies_nothing_twice(self):
+        from .models import SyncReceipt
+
+        operations = [
+            {'id': 0, **self._order('order-b')},
+            {'id': 1, 'type': 'customer', 'key': 'customer-c', 'data': {'name': 'Walk In', 'phone': '09170000025'}},
+        ]
+        first = self._sync(operations).json()['results']
+        again = self._sync(operations).json()['results']
+
+        self.assertEqual([result['status'] for result in again], ['duplicate', 'duplicate'])
+        self.assertEqual(again[0]['order_id'], first[0]['order_id'])
+        self.assertEqual(again[1]['customer_id'], first[1]['customer_id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Customer.objects.filter(phone='09170000025').count(), 1)
+        self.assertEqual(SyncReceipt.objects.count(), 2)
+
+    def test_queued_requests_replayed_through_their_views(self):
+        """A queued form post reaches its view; a refused API call is rolled back and reported"""
+        operations = [
+            {'id': 0, 'type': 'request', 'key': 'form-a', 'data': {
+                'url': 'http://testserver/customers/add/', 'method': 'POST',
+                'content_type': 'application/x-www-form-urlencoded',
+                'body': {'name': 'Form Customer', 'phone': '09170000026', 'email': '', 'address': ''},
+            }},
+            {'id': 1, 'type': 'request', 'key': 'form-b', 'data': {
+                'url': '/api/orders/create/', 'method': 'POST', 'content_type': 'application/json',
+                'body': {'customerName': 'No Items', 'mobileNumber': '09170000027', 'orderType': 'repair', 'items': []},
+            }},
+            {'id': 2, 'type': 'request', 'data': {'url': 'https://elsewhere.example/customers/add/', 'body': {}}},
+        ]
+        results = self._sync(operations).json()['results']
+
+        self.assertEqual(results[0]['status'], 'applied')
+        self.assertEqual(results[0]['status_code'], 302)
+        self.assertTrue(Customer.objects.filter(name='Form Customer').exists())
+        self.assertEqual(results[1]['status'], 'failed')
+        self.assertIn('item', results[1]['error'])
+        self.assertEqual(results[2]['status'], 'failed')
+        self.assertFalse(Order.objects.exists())
+
+    def test_oversized_batch_refused(self):
+        from django.test import override_settings
+
+        with override_settings(OFFLINE_SYNC_BATCH_LIMIT=1):
+            response = self._sync([self._order('order-c'), self._order('order-d')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class ChangeFeedTests(TestCase):
+    """Offline clients pull only the rows changed since their cursor"""
+
+    def setUp(self):
+        from .change_feed_manager import ChangeFeed
+
+        User.objects.create_user(username='counter', password='pass12345')
+        self.client.login(username='counter', password='pass12345')
+        self.thread = Product.objects.create(name='Thread Red', product_type='material', price=Decimal('5'), quantity=10)
+        self.customer = Customer.objects.create(name='Feed Customer', phone='09170000024')
+        self.cursor = ChangeFeed.head()
+
+    def _pull(self, since, **params):
+        params['since'] = since
+        return self.client.get('/api/changes/', params).json()
+
+    def test_changes_since_cursor_once_each_with_tombstones(self):
+        from .inventory_ledger_manager import InventoryLedger
+
+        # The ledger's conditional UPDATE sends no signals; it records itself
+        InventoryLedger.deduct(self.thread, 3)
+        self.customer.name = 'Renamed Customer'
+        self.customer.save()
+        self.customer.save()
+        gone = Customer.objects.create(name='Gone', phone='09170000025')
+        gone_id = gone.pk
+        gone.delete()
+
+        page = self._pull(self.cursor)
+
+        self.assertFalse(page['reset'])
+        changes = {(change['model'], change['id']): change for change in page['changes']}
+        self.assertEqual(len(page['changes']), 3)
+        self.assertEqual(changes[('product', self.thread.pk)]['data']['quantity'], 7)
+        self.assertEqual(changes[('customer', self.customer.pk)]['data']['name'], 'Renamed Customer')
+        self.assertEqual(changes[('customer', gone_id)], {'model': 'customer', 'id': gone_id, 'op': 'delete'})
+        self.assertEqual(self._pull(page['cursor'])['changes'], [])
+
+    def test_pages_follow_the_cursor(self):
+        for number in range(3):
+            Customer.objects.create(name=f'Paged {number}', phone=f'0917000010{number}')
+
+        first = self._pull(self.cursor, limit=2)
+        second = self._pull(first['cursor'], limit=2)
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        names = [change['data']['name'] for change in first['changes'] + second['changes']]
+        self.assertEqual(names, ['Paged 0', 'Paged 1', 'Paged 2'])
+
+    def test_clients_without_history_reset(self):
+        """No cursor, or one older than the entries kept, reloads the lists"""
+        from django.utils import timezone
+        from .change_feed_manager import ChangeFeed
+        from .models import ChangeLogEntry
+
+        head = ChangeFeed.head()
+        self.assertEqual(self.client.get('/api/changes/').json(), {
+            'success': True, 'changes': [], 'cursor': head, 'has_more': False, 'reset': True,
+        })
+
+        ChangeLogEntry.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        Customer.objects.create(name='Recent', phone='09170000026')
+        # The product and customer of setUp
+        self.assertEqual(ChangeFeed.prune(30), 2)
+        self.assertTrue(self._pull(1)['reset'])
+        self.assertFalse(self._pull(head)['reset'])
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'x'}).status_code, 400)
+
+    def test_page_waits_for_a_gap_that_commits_late(self):
+        """An entry committed after a higher one is still delivered, however old the higher one is"""
+        from django.core.cache import cache
+        from django.utils import timezone
+        from .models import ChangeLogEntry
+
+        cache.clear()
+        # The entry after the gap is old: a long transaction still holds the id before it
+        ChangeLogEntry.objects.create(
+            id=self.cursor + 2, model='customer', object_id=self.customer.pk,
+            created_at=timezone.now() - timezone.timedelta(minutes=10),
+        )
+        self.assertEqual(self._pull(self.cursor)['cursor'], self.cursor)
+
+        # The long transaction commits
+        ChangeLogEntry.objects.create(id=self.cursor + 1, model='product', object_id=self.thread.pk)
+        page = self._pull(self.cursor)
+        self.assertEqual(page['cursor'], self.cursor + 2)
+        self.assertEqual([change['model'] for change in page['changes']], ['product', 'customer'])
+
+    def test_gap_open_past_the_timeout_is_skipped(self):
+        """A gap nothing filled for CHANGE_FEED_GAP_TIMEOUT seconds was a rolled-back write"""
+        import time
+        from django.core.cache import cache
+        from .models import ChangeLogEntry
+
+        cache.clear()
+        ChangeLogEntry.objects.create(id=self.cursor + 2, model='customer', object_id=self.customer.pk)
+        self.assertEqual(self._pull(self.cursor)['cursor'], self.cursor)
+
+        with self.settings(CHANGE_FEED_GAP_TIMEOUT=300):
+            cache.set(f'change_feed:gap:{self.cursor + 1}', time.time() - 301)
+            self.assertEqual(self._pull(self.cursor)['cursor'], self.cursor + 2)
+
+
+class FormDraftTests(TestCase):
+    """Auto-save syncs keep one draft per form instead of logging activity"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='counter', password='pass12345')
+        self.client.login(username='counter', password='pass12345')
+
+    def _sync(self, data, deleted=None):
+        import json
+
+        return self.client.post(
+            '/api/autosave/sync/', data=json.dumps({'data': data, 'deleted': deleted or []}),
+            content_type='application/json',
+        ).json()
+
+    def test_sync_upserts_drafts_and_skips_unchanged(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .form_draft_manager import FormDrafts
+        from .models import FormDraft
+
+        form = {'customerName': 'Draft Customer', 'password': 'secret', 'csrfmiddlewaretoken': 'token'}
+        first = self._sync({'topstyle_autosave_form_order': form, 'topstyle_autosave_state_tab': 'items'})
+        self.assertEqual((first['saved'], first['unchanged']), (2, 0))
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = FormDrafts.sync(self.user, {
+                'topstyle_autosave_form_order': {**form, 'customerName': 'Changed'},
+                'topstyle_autosave_state_tab': 'items',
+            })
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'INSERT', 'DELETE'])
+        self.assertEqual((stats['saved'], stats['unchanged']), (1, 1))
+
+        draft = FormDraft.objects.get(user=self.user, key='topstyle_autosave_form_order')
+        self.assertEqual(draft.data, {'customerName': 'Changed'})
+        self.assertEqual(FormDraft.objects.count(), 2)
+        self.assertFalse(ActivityLog.objects.filter(metadata__model_name='AutoSave').exists())
 
+    def test_cleared_and_expired_drafts_removed(self):
+        from django.utils import timezone
+        from .form_draft_manager import FormDrafts
+        from .models import FormDraft
 
+        self._sync({'topstyle_autosave_form_a': {'x': '1'}, 'topstyle_autosave_form_b': {'x': '2'}, 'addStaffForm': {}})
+        FormDraft.objects.filter(key='topstyle_autosave_form_b').update(expires_at=timezone.now())
 
+        result = self._sync({}, deleted=['topstyle_autosave_form_a'])
 
+        self.assertEqual(result['deleted'], 2)
+        self.assertFalse(FormDraft.objects.exists())
 
+        other = User.objects.create_user(username='away', password='pass12345')
+        FormDrafts.sync(other, {'topstyle_autosave_form_c': {'x': '3'}})
+        FormDraft.objects.update(expires_at=timezone.now())
+        self.assertEqual(FormDrafts.prune(), 1)
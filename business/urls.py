@@ -61,8 +61,10 @@ urlpatterns = [
     path('api/sales-calculation/', views.api_sales_calculation, name='api_sales_calculation'),
     path('api/order-tracking/', views.api_order_tracking, name='api_order_tracking'),
     path('api/customers/', views.api_customers_list, name='api_customers_list'),
+    path('api/customers/typeahead/', views.api_customer_typeahead, name='api_customer_typeahead'),
     path('api/customers/<int:customer_id>/', views.api_customer_detail, name='api_customer_detail'),
     path('api/products/', views.api_products_list, name='api_products_list'),
+    path('api/changes/', views.api_changes, name='api_changes'),
     path('api/zippers/', views.api_zippers_list, name='api_zippers_list'),
     path('api/buttons/', views.api_buttons_list, name='api_buttons_list'),
     path('api/patches/', views.api_patches_list, name='api_patches_list'),
@@ -128,6 +130,7 @@ urlpatterns = [
     # Reports
     path('reports/pdf/<str:report_type>/', views.generate_pdf_report, name='pdf_report'),
     path('reports/excel/<str:report_type>/', views.generate_excel_report, name='excel_report'),
+    path('reports/csv/<str:report_type>/', views.generate_csv_report, name='csv_report'),
     
     # Track Order
     path('track/result/', views.track_result, name='track_result'),
@@ -166,6 +169,7 @@ urlpatterns = [
     
     # Order identifier management
     path('api/fix-order-identifiers/', views.api_fix_order_identifiers, name='api_fix_order_identifiers'),
+    path('api/query-stats/', views.api_query_stats, name='api_query_stats'),
     
     # Static order data management
     path('api/fix-static-orders/', views.api_fix_static_orders, name='api_fix_static_orders'),
@@ -199,11 +203,15 @@ urlpatterns = [
     
     # Auto-Save API
     path('api/autosave/sync/', views.api_autosave_sync, name='api_autosave_sync'),
+
+    # Offline sync: queued operations applied in batches
+    path('api/sync/batch/', views.api_sync_batch, name='api_sync_batch'),
     
     # Staff Management
     path('staff/', views.staff_management, name='staff_management'),
     path('staff/report/pdf/', views.staff_report_pdf, name='staff_report_pdf'),
     path('staff/report/excel/', views.staff_report_excel, name='staff_report_excel'),
+    path('staff/report/csv/', views.staff_report_csv, name='staff_report_csv'),
     path('staff/<int:staff_id>/salary/', views.staff_salary, name='staff_salary'),
     path('staff/<int:staff_id>/withdraw/', views.withdraw_staff_revenue, name='withdraw_staff_revenue'),
     path('staff/<int:staff_id>/withdrawal-history/', views.staff_withdrawal_history, name='staff_withdrawal_history'),
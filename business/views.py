@@ -4,15 +4,12 @@ import logging
 import re
 from datetime import datetime, timedelta
 
-import qrcode
-import requests
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
 from django.core.mail import send_mail
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
@@ -26,15 +23,14 @@ from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie, csrf_exempt
 from django.views.decorators.http import require_http_methods
-from openpyxl import Workbook
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from requests.auth import HTTPBasicAuth
 from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 
 from .forms import *
 from .models import *
+from .customer_search_manager import TYPEAHEAD_LIMIT, CustomerSearch, normalize_phone_number
+from .inventory_ledger_manager import InventoryLedger
+from .material_deduction_manager import MaterialDeductionPlanner, calculate_thread_for_zipper
 
 
 def offline_view(request):
@@ -48,16 +44,10 @@ def chrome_devtools_handler(request):
 
 def landing_page(request):
     """Landing page view with image support"""
-    from .models import LandingPageImage
-    
-    # Get all active images
-    images = {}
-    for img_type, _ in LandingPageImage.IMAGE_TYPE_CHOICES:
-        try:
-            img = LandingPageImage.objects.get(image_type=img_type, is_active=True)
-            images[img_type] = img
-        except LandingPageImage.DoesNotExist:
-            images[img_type] = None
+    from .reference_data_manager import ReferenceData
+
+    # Active image per image type (None where none is set)
+    images = ReferenceData.landing_images()
     
     context = {
         'hero_image': images.get('hero'),
@@ -84,9 +74,15 @@ def landing_page(request):
 def public_track_order(request):
     """Public track order view - no login required"""
     from .models import Order
-    from django.core.exceptions import ValidationError
     
     if request.method == 'POST':
+        from .order_tracking_manager import OrderTracking
+
+        # Public endpoint: bound how many lookups (and QR decodes) one client can make
+        if OrderTracking.throttled(request):
+            messages.error(request, 'Too many tracking requests. Please wait a minute and try again.')
+            return render(request, 'business/public_track_order.html', status=429)
+        
         order_id = request.POST.get('order_id', '').strip()
         decoded_order_id = request.POST.get('decoded_order_id', '').strip()
         qr_image = request.FILES.get('qr_image')
@@ -134,83 +130,20 @@ def public_track_order(request):
             messages.error(request, 'Please enter an Order ID or upload a QR code image.')
             return render(request, 'business/public_track_order.html')
         
-        # Search for order (same logic as track_order view)
+        # One indexed lookup on the canonical identifier (or UUID); answers
+        # are remembered per client for a minute
+        order_pk = OrderTracking.find_cached(request, order_id)
         order = None
-        search_variants = [order_id]
-        
-        if '-' in order_id:
-            parts = order_id.split('-')
-            if len(parts) == 2:
-                prefix = parts[0]
-                number_part = parts[1]
-                number_without_leading_zeros = str(int(number_part)) if number_part.isdigit() else number_part
-                
-                if not 'O' in parts[1].upper() and number_part.isdigit():
-                    search_variants.append(f"{prefix}-O{number_part}")
-                    search_variants.append(f"{prefix}-O{number_without_leading_zeros}")
-                    if len(number_without_leading_zeros) == 1:
-                        search_variants.append(f"{prefix}-O0{number_without_leading_zeros}")
-                    elif len(number_without_leading_zeros) == 2:
-                        search_variants.append(f"{prefix}-O{number_without_leading_zeros}")
-                elif 'O' in parts[1].upper() and number_part.replace('O', '').replace('o', '').isdigit():
-                    number_only = number_part.replace('O', '').replace('o', '')
-                    search_variants.append(f"{prefix}-{number_only}")
-                    if len(number_only) == 2:
-                        search_variants.append(f"{prefix}-0{number_only}")
-                    elif len(number_only) == 1:
-                        search_variants.append(f"{prefix}-00{number_only}")
-        
-        for variant in search_variants:
-            try:
-                order = Order.objects.get(order_identifier=variant)
-                break
-            except Order.DoesNotExist:
-                continue
-        
-        if not order:
-            for variant in search_variants:
-                try:
-                    order = Order.objects.get(order_identifier__iexact=variant)
-                    break
-                except Order.DoesNotExist:
-                    continue
-        
-        if not order:
-            try:
-                order = Order.objects.get(order_id=order_id)
-            except (Order.DoesNotExist, ValidationError):
-                try:
-                    if order_id.isdigit():
-                        order = Order.objects.get(id=int(order_id))
-                    else:
-                        orders = Order.objects.filter(order_identifier__icontains=order_id)
-                        if orders.exists():
-                            for variant in search_variants:
-                                exact_match = orders.filter(order_identifier__iexact=variant).first()
-                                if exact_match:
-                                    order = exact_match
-                                    break
-                            if not order:
-                                for variant in search_variants:
-                                    starts_match = orders.filter(order_identifier__istartswith=variant).first()
-                                    if starts_match:
-                                        order = starts_match
-                                        break
-                            if not order:
-                                order = orders.order_by('-created_at').first()
-                        else:
-                            raise Order.DoesNotExist
-                except (Order.DoesNotExist, ValueError):
-                    messages.error(request, f'Order "{order_id}" not found. Please check your Order ID and try again.')
-                    return render(request, 'business/public_track_order.html', {'order_id': order_id})
+        if order_pk:
+            # Load order with related data
+            order = Order.objects.select_related('customer').prefetch_related(
+                'items__product', 'items__product__category'
+            ).filter(id=order_pk).first()
         
         if not order:
             messages.error(request, f'Order "{order_id}" not found. Please check your Order ID and try again.')
             return render(request, 'business/public_track_order.html', {'order_id': order_id})
         
-        # Load order with related data
-        order = Order.objects.select_related('customer').prefetch_related('items__product', 'items__product__category').get(id=order.id)
-        
         return render(request, 'business/public_track_result.html', {
             'order': order,
             'found': True,
@@ -465,35 +398,37 @@ def logout_view(request):
 
 @login_required
 def dashboard(request):
+    from .rollup_manager import SalesRollupManager
+
     # Get real-time statistics using database connection functions
     inventory_status = get_inventory_status()
-    sales_data = calculate_actual_sales()
-    
-    # Get order statistics
-    total_orders = Order.objects.count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    completed_orders = Order.objects.filter(status='completed').count()
-    in_progress_orders = Order.objects.filter(status='in_progress').count()
+    sales_data = SalesRollupManager.sales_totals()
+    
+    # Get order statistics from the daily rollups
+    status_counts = SalesRollupManager.order_status_counts()
+    total_orders = sum(status_counts.values())
+    pending_orders = status_counts.get('pending', 0)
+    completed_orders = status_counts.get('completed', 0)
+    in_progress_orders = status_counts.get('in_progress', 0)
     total_products = inventory_status['total_products']
     low_stock_products = inventory_status['low_stock']
     
     # Sales data for the last 30 days (only completed orders)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_sales = Sales.objects.filter(
-        created_at__gte=thirty_days_ago,
-        order__status='completed'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    today = timezone.localdate()
+    recent_sales = SalesRollupManager.sales_totals(since=today - timedelta(days=30))['total_sales']
     
     # Monthly sales data for chart (only completed orders)
-    monthly_sales = []
+    month_windows = []
     for i in range(12):
-        month_start = timezone.now().replace(day=1) - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        month_sales = Sales.objects.filter(
-            created_at__gte=month_start,
-            created_at__lt=month_end,
-            order__status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        month_start = today.replace(day=1) - timedelta(days=30*i)
+        month_windows.append((month_start, month_start + timedelta(days=30)))
+    daily_sales = SalesRollupManager.sales_by_day(since=month_windows[-1][0])
+    monthly_sales = []
+    for month_start, month_end in month_windows:
+        month_sales = sum(
+            (amount for day, amount in daily_sales.items() if month_start <= day < month_end),
+            0
+        )
         monthly_sales.append({
             'month': month_start.strftime('%b'),
             'amount': float(month_sales)
@@ -542,7 +477,7 @@ def orders_list(request):
     
     # Base queryset with related data for better performance (exclude archived orders)
     # Custom ordering: Pending orders first, then active orders, then completed at bottom
-    orders = Order.objects.filter(is_archived=False).select_related('customer', 'sales').prefetch_related('items__product', 'items__product__category').annotate(
+    orders = Order.objects.filter(is_archived=False).select_related('customer', 'sales', 'assigned_staff', 'category_summary').prefetch_related('items__product', 'items__product__category').annotate(
         status_priority=Case(
             # Pending orders get priority 1 (appear first)
             When(status='pending', then=1),
@@ -565,57 +500,48 @@ def orders_list(request):
         else:
             orders = orders.filter(order_type=order_type_filter)
     
-    # Calculate statistics for pie chart
-    completed_orders = orders.filter(status='completed').count()
-    pending_orders = orders.filter(status='pending').count()
-    in_progress_orders = orders.filter(status='in_progress').count()
-    cancelled_orders = orders.filter(status='cancelled').count()
-    
-    # Calculate revenue statistics
+    # Calculate statistics for pie chart from the daily rollups
     from datetime import timedelta
 
-    from django.db.models import Sum
-    
-    total_revenue = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    # Monthly revenue (current month) - use timezone-aware datetime
-    current_month = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    monthly_revenue = orders.filter(
-        created_at__gte=current_month
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    # Daily revenue (today) - use timezone-aware datetime
-    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    daily_revenue = orders.filter(
-        created_at__gte=today_start
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    # Weekly revenue (this week - Monday to Sunday) - use timezone-aware datetime
-    today_date = timezone.now().date()
-    days_since_monday = today_date.weekday()  # Monday is 0, Sunday is 6
-    start_of_week_date = today_date - timedelta(days=days_since_monday)
-    start_of_week_datetime = timezone.make_aware(
-        datetime.combine(start_of_week_date, datetime.min.time())
+    from .rollup_manager import SalesRollupManager
+
+    rollup_type = None if order_type_filter == 'all' else order_type_filter
+    status_counts = SalesRollupManager.order_status_counts(order_type=rollup_type, include_archived=False)
+    completed_orders = status_counts.get('completed', 0)
+    pending_orders = status_counts.get('pending', 0)
+    in_progress_orders = status_counts.get('in_progress', 0)
+    cancelled_orders = status_counts.get('cancelled', 0)
+    
+    # Calculate revenue statistics (all time, year, month, week - Monday to Sunday - and today)
+    today_date = timezone.localdate()
+    start_of_week_date = today_date - timedelta(days=today_date.weekday())  # Monday is 0, Sunday is 6
+    revenue_totals = SalesRollupManager.order_amount_totals(
+        order_type=rollup_type,
+        include_archived=False,
+        windows={
+            'total': None,
+            'yearly': today_date.replace(month=1, day=1),
+            'monthly': today_date.replace(day=1),
+            'weekly': start_of_week_date,
+            'daily': today_date,
+        }
     )
-    weekly_revenue = orders.filter(
-        created_at__gte=start_of_week_datetime
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    # Yearly revenue (current year) - use timezone-aware datetime
-    current_year = timezone.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    yearly_revenue = orders.filter(
-        created_at__gte=current_year
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
+    total_revenue = revenue_totals['total']
+    yearly_revenue = revenue_totals['yearly']
+    monthly_revenue = revenue_totals['monthly']
+    weekly_revenue = revenue_totals['weekly']
+    daily_revenue = revenue_totals['daily']
     
     # Calculate order type statistics - get total counts before pagination
     # Note: Model uses 'rent' not 'rental' as the order_type value
-    all_orders_count = Order.objects.filter(is_archived=False).count()
-    rental_orders = Order.objects.filter(order_type='rent', is_archived=False).count()
-    repair_orders = Order.objects.filter(order_type='repair', is_archived=False).count()
-    customize_orders = Order.objects.filter(order_type='customize', is_archived=False).count()
+    type_counts = SalesRollupManager.order_type_counts(include_archived=False)
+    all_orders_count = sum(type_counts.values())
+    rental_orders = type_counts.get('rent', 0)
+    repair_orders = type_counts.get('repair', 0)
+    customize_orders = type_counts.get('customize', 0)
     
     # Get filtered order count for active filter (total count before pagination)
-    filtered_order_count = orders.count()
+    filtered_order_count = sum(status_counts.values())
     
     # Get inventory status for order-related products
     inventory_status = get_inventory_status()
@@ -636,536 +562,11 @@ def orders_list(request):
         activity_type__in=['order_created', 'order_updated', 'order_completed']
     ).order_by('-created_at')[:5]
     
-    # Aggregate categories for each order (before pagination)
-    # Convert queryset to list first to avoid multiple DB queries during iteration
-    orders_list = list(orders)
-    
-    # Check and update overdue status for rent orders
-    now = timezone.now()
-    for order in orders_list:
-        if order.order_type in ['rent', 'rental'] and order.status not in ['completed', 'returned', 'cancelled']:
-            if order.due_date:
-                # Check if order is overdue
-                if now > order.due_date and order.status != 'overdue':
-                    # Mark as overdue
-                    order.status = 'overdue'
-                    order.save(update_fields=['status'])
-                # Check if order is due today
-                elif order.is_due_today and order.status not in ['due', 'overdue']:
-                    order.status = 'due'
-                    order.save(update_fields=['status'])
-                # Check if order is almost due (1 day before)
-                elif order.is_one_day_before_due and order.status not in ['almost_due', 'due', 'overdue']:
-                    order.status = 'almost_due'
-                    order.save(update_fields=['status'])
-    
-    for order in orders_list:
-        if order.order_type == 'repair':
-            # Aggregate repair categories
-            categories = []
-            quantities = []
-            
-            # Helper function to format repair type name (must be defined before use)
-            def format_repair_type(repair_type_str):
-                """Format repair type from snake_case to Title Case"""
-                if not repair_type_str:
-                    return None
-                # Remove "Repair - " prefix if present
-                if "Repair - " in repair_type_str:
-                    repair_type_str = repair_type_str[10:].strip()
-                # Remove "repair - " prefix if present (lowercase)
-                if "repair - " in repair_type_str.lower():
-                    repair_type_str = repair_type_str[repair_type_str.lower().find("repair - ") + 9:].strip()
-                # Remove "Repair Service" if present (shouldn't be, but just in case)
-                repair_type_str = repair_type_str.replace("Repair Service", "").replace("repair service", "").strip()
-                # Remove class suffix like "(Class standard)"
-                if " (Class " in repair_type_str:
-                    repair_type_str = repair_type_str.split(" (Class ")[0].strip()
-                # Handle common repair types
-                repair_type_lower = repair_type_str.lower().strip()
-                # If it's empty after cleaning, return None
-                if not repair_type_lower:
-                    return None
-                repair_type_map = {
-                    'zipper': 'Zipper',
-                    'zipper_repair': 'Zipper',
-                    'zipper_replacement': 'Zipper',
-                    'buttons': 'Buttons',
-                    'button': 'Buttons',
-                    'buttons_repair': 'Buttons',
-                    'patch': 'Patch',
-                    'patches': 'Patch',
-                    'patch_repair': 'Patch',
-                    'lock': 'Lock',
-                    'locks': 'Lock',
-                    'lock_repair': 'Lock',
-                    'garter': 'Garter',
-                    'garter_repair': 'Garter',
-                    'elastic': 'Elastic',
-                    'elastic_repair': 'Elastic',
-                    'bewang': 'Bewang',
-                    'bewang_repair': 'Bewang',
-                    'putol': 'Putol',
-                    'baston': 'Baston',
-                    'suklot': 'Suklot',
-                    'baston_suklot': 'Baston Suklot',
-                    'baston_putol': 'Baston Putol',
-                    'ambel': 'Ambel',
-                    'pasada': 'Pasada',
-                }
-                if repair_type_lower in repair_type_map:
-                    return repair_type_map[repair_type_lower]
-                # Check if it contains any of the repair types
-                for key, value in repair_type_map.items():
-                    if key in repair_type_lower:
-                        return value
-                # Replace underscores with spaces and title case
-                formatted = repair_type_str.replace('_', ' ').title().strip()
-                # Return the formatted string (don't return "Repair Service" - that's a fallback)
-                if formatted and formatted.lower() != "repair service" and formatted.lower() != "service":
-                    return formatted
-                # If it's empty or just "Service", return None so we can try other methods
-                return None
-            
-            # FIRST: Try to extract repair type from inventory transaction notes (most reliable for historical data)
-            repair_type_from_transactions = None
-            try:
-                from .models import InventoryTransaction
-                transactions = InventoryTransaction.objects.filter(reference_order=order).order_by('-created_at')[:5]
-                for transaction in transactions:
-                    if transaction.notes:
-                        notes_lower = transaction.notes.lower()
-                        # Look for patterns like "used for zipper repair" or "for zipper repair"
-                        repair_types_in_transactions = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                        for repair_type in repair_types_in_transactions:
-                            if repair_type in notes_lower:
-                                repair_type_from_transactions = repair_type
-                                break
-                        if repair_type_from_transactions:
-                            break
-            except Exception:
-                repair_type_from_transactions = None
-            
-            # Format the extracted repair type
-            if repair_type_from_transactions:
-                repair_type_from_transactions = format_repair_type(repair_type_from_transactions)
-            
-            # SECOND: Try to extract repair type from order notes
-            repair_type_from_notes = None
-            if order.notes:
-                notes_lower = order.notes.lower()
-                # Check for common repair types in notes
-                repair_types_in_notes = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                for repair_type in repair_types_in_notes:
-                    if repair_type in notes_lower:
-                        repair_type_from_notes = format_repair_type(repair_type)
-                        break
-            
-            for item in order.items.all():
-                category_name = None
-                
-                # METHOD 1: Try to extract from inventory transactions first (most reliable)
-                if repair_type_from_transactions:
-                    category_name = repair_type_from_transactions
-                # METHOD 2: Try to extract from order notes
-                elif repair_type_from_notes:
-                    category_name = repair_type_from_notes
-                else:
-                    # METHOD 2: Try to get repair type from product name
-                    if item.product and item.product.name:
-                        product_name = item.product.name
-                        product_name_lower = product_name.lower()
-                        
-                        # Check for "Repair - " or "repair - " prefix
-                        if "Repair - " in product_name or "repair - " in product_name_lower:
-                            # Extract the repair type part
-                            if "Repair - " in product_name:
-                                repair_part = product_name.split("Repair - ")[1].strip()
-                            else:
-                                repair_part = product_name.split("repair - ")[1].strip()
-                            # Remove class suffix if present
-                            if " (Class " in repair_part:
-                                repair_part = repair_part.split(" (Class ")[0].strip()
-                            # Remove timestamp if present
-                            if " - " in repair_part and len(repair_part.split(" - ")[-1]) > 10:
-                                repair_part = repair_part.split(" - ")[0].strip()
-                            category_name = format_repair_type(repair_part)
-                        else:
-                            # Check if product name itself is a repair type (common repair types)
-                            repair_types_in_name = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                            for repair_type in repair_types_in_name:
-                                if repair_type in product_name_lower:
-                                    category_name = format_repair_type(repair_type)
-                                    break
-                            
-                            # If not found, try to format the entire product name (might be just the repair type)
-                            if not category_name:
-                                # Remove common prefixes/suffixes and format
-                                cleaned_name = product_name.strip()
-                                # Remove "Repair Service" if present
-                                cleaned_name = cleaned_name.replace("Repair Service", "").replace("repair service", "").strip()
-                                # Remove "Service" if at the end
-                                if cleaned_name.lower().endswith(" service"):
-                                    cleaned_name = cleaned_name[:-8].strip()
-                                if cleaned_name:
-                                    category_name = format_repair_type(cleaned_name)
-                                else:
-                                    category_name = format_repair_type(product_name)
-                    
-                    # METHOD 3: If still not found, try product description
-                    if not category_name or category_name == "Repair Service":
-                        if item.product and item.product.description:
-                            desc = item.product.description.lower()
-                            # Check for repair type in description
-                            repair_types = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                            for repair_type in repair_types:
-                                if repair_type in desc:
-                                    category_name = format_repair_type(repair_type)
-                                    break
-                    
-                    # METHOD 4: Try product category
-                    if not category_name or category_name == "Repair Service":
-                        if item.product and item.product.category:
-                            cat_name = item.product.category.name
-                            # Check if category name contains repair type
-                            cat_name_lower = cat_name.lower()
-                            repair_types = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                            for repair_type in repair_types:
-                                if repair_type in cat_name_lower:
-                                    category_name = format_repair_type(repair_type)
-                                    break
-                            if not category_name or category_name == "Repair Service":
-                                category_name = format_repair_type(cat_name)
-                    
-                    # METHOD 5: Check order notes if not already checked
-                    if (not category_name or category_name == "Repair Service") and order.notes:
-                        notes_lower = order.notes.lower()
-                        repair_types = ['zipper', 'buttons', 'button', 'patch', 'patches', 'lock', 'locks', 'garter', 'elastic', 'bewang', 'zipper_replacement', 'button_repair', 'lock_repair', 'putol', 'baston', 'suklot', 'ambel', 'pasada', 'general_repair', 'general_tshirt_repair']
-                        for repair_type in repair_types:
-                            if repair_type in notes_lower:
-                                category_name = format_repair_type(repair_type)
-                                break
-                
-                # Final fallback - try to extract from product name directly
-                if not category_name or category_name == "Repair Service":
-                    if item.product and item.product.name:
-                        product_name = item.product.name
-                        # Try to extract anything after "Repair - " or "repair - "
-                        if "Repair - " in product_name:
-                            extracted = product_name.split("Repair - ")[1].strip()
-                            # Remove class suffix and timestamp
-                            if " (Class " in extracted:
-                                extracted = extracted.split(" (Class ")[0].strip()
-                            if " - " in extracted and len(extracted.split(" - ")[-1]) > 10:
-                                extracted = extracted.split(" - ")[0].strip()
-                            if extracted and extracted != "Repair Service":
-                                category_name = format_repair_type(extracted)
-                        elif "repair - " in product_name.lower():
-                            extracted = product_name.lower().split("repair - ")[1].strip()
-                            if " (class " in extracted:
-                                extracted = extracted.split(" (class ")[0].strip()
-                            if " - " in extracted and len(extracted.split(" - ")[-1]) > 10:
-                                extracted = extracted.split(" - ")[0].strip()
-                            if extracted and extracted != "repair service":
-                                category_name = format_repair_type(extracted)
-                
-                # Only use "Repair Service" as absolute last resort
-                if not category_name:
-                    category_name = "Repair Service"
-                
-                if category_name:
-                    # Group by category and sum quantities
-                    found = False
-                    for i, cat in enumerate(categories):
-                        if cat == category_name:
-                            quantities[i] += item.quantity
-                            found = True
-                            break
-                    if not found:
-                        categories.append(category_name)
-                        quantities.append(item.quantity)
-            
-            # Format as "Category1 (qty), Category2 (qty)"
-            if categories:
-                category_parts = []
-                for cat, qty in zip(categories, quantities):
-                    if qty > 1:
-                        category_parts.append(f"{cat} ({qty})")
-                    else:
-                        category_parts.append(cat)
-                order.repair_categories_display = ", ".join(category_parts)
-                order.repair_quantity_display = sum(quantities)
-            else:
-                order.repair_categories_display = "Repair Service"
-                order.repair_quantity_display = 1
-        
-        elif order.order_type == 'customize':
-            # Aggregate customize categories
-            categories = []
-            quantities = []
-            
-            # Helper function to format customize type name (must be defined before use)
-            def format_customize_type(customize_type_str):
-                """Format customize type name"""
-                if not customize_type_str:
-                    return None
-                # Remove "Customize - " prefix if present
-                if "Customize - " in customize_type_str:
-                    customize_type_str = customize_type_str[11:].strip()
-                # Remove "customize - " prefix if present (lowercase)
-                if "customize - " in customize_type_str.lower():
-                    customize_type_str = customize_type_str[customize_type_str.lower().find("customize - ") + 12:].strip()
-                # Remove "Customize Service" if present (shouldn't be, but just in case)
-                customize_type_str = customize_type_str.replace("Customize Service", "").replace("customize service", "").strip()
-                # Remove class suffix like "(Class standard)"
-                if " (Class " in customize_type_str:
-                    customize_type_str = customize_type_str.split(" (Class ")[0].strip()
-                # Remove timestamp suffix if present (e.g., " - 20251117 121237")
-                if " - " in customize_type_str and len(customize_type_str.split(" - ")[-1]) > 10:
-                    customize_type_str = customize_type_str.split(" - ")[0].strip()
-                # Handle common customize types
-                customize_type_lower = customize_type_str.lower().strip()
-                # If it's empty after cleaning, return None
-                if not customize_type_lower:
-                    return None
-                customize_type_map = {
-                    'polo': 'Polo',
-                    'polo_shirt': 'Polo Shirt',
-                    'blouse': 'Blouse',
-                    'pants': 'Pants',
-                    'shorts': 'Shorts',
-                    'skirt_palda': 'Skirt/Palda',
-                    'skirt': 'Skirt/Palda',
-                    'palda': 'Skirt/Palda',
-                    'uniform': 'Uniform',
-                    'pe': 'PE',
-                }
-                if customize_type_lower in customize_type_map:
-                    return customize_type_map[customize_type_lower]
-                # Check if it contains any of the customize types
-                for key, value in customize_type_map.items():
-                    if key in customize_type_lower:
-                        return value
-                # Replace underscores with spaces and title case
-                formatted = customize_type_str.replace('_', ' ').title().strip()
-                # Return the formatted string (don't return "Customize Service" - that's a fallback)
-                if formatted and formatted.lower() != "customize service" and formatted.lower() != "service":
-                    return formatted
-                # If it's empty or just "Service", return None so we can try other methods
-                return None
-            
-            # FIRST: Try to extract customize type from order notes
-            customize_type_from_notes = None
-            if order.notes:
-                notes_lower = order.notes.lower()
-                # Check for common customize types in notes
-                customize_types_in_notes = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
-                for customize_type in customize_types_in_notes:
-                    if customize_type in notes_lower:
-                        customize_type_from_notes = format_customize_type(customize_type)
-                        break
-            
-            for item in order.items.all():
-                category_name = None
-                
-                # METHOD 1: Try to extract from order notes first
-                if customize_type_from_notes:
-                    category_name = customize_type_from_notes
-                else:
-                    # METHOD 2: Try to get customize type from product name
-                    if item.product and item.product.name:
-                        product_name = item.product.name
-                        product_name_lower = product_name.lower()
-                        
-                        # Check for "Customize - " or "customize - " prefix
-                        if "Customize - " in product_name or "customize - " in product_name_lower:
-                            # Extract the customize type part
-                            if "Customize - " in product_name:
-                                customize_part = product_name.split("Customize - ")[1].strip()
-                            else:
-                                customize_part = product_name.split("customize - ")[1].strip()
-                            # Remove class suffix if present
-                            if " (Class " in customize_part:
-                                customize_part = customize_part.split(" (Class ")[0].strip()
-                            # Remove timestamp suffix if present
-                            if " - " in customize_part and len(customize_part.split(" - ")[-1]) > 10:
-                                customize_part = customize_part.split(" - ")[0].strip()
-                            category_name = format_customize_type(customize_part)
-                        else:
-                            # Check if product name itself contains customize type
-                            customize_types_in_name = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
-                            for customize_type in customize_types_in_name:
-                                if customize_type in product_name_lower:
-                                    category_name = format_customize_type(customize_type)
-                                    break
-                            
-                            # If not found, try to format the entire product name (might be just the customize type)
-                            if not category_name:
-                                # Remove common prefixes/suffixes and format
-                                cleaned_name = product_name.strip()
-                                # Remove "Customize Service" if present
-                                cleaned_name = cleaned_name.replace("Customize Service", "").replace("customize service", "").strip()
-                                # Remove "Service" if at the end
-                                if cleaned_name.lower().endswith(" service"):
-                                    cleaned_name = cleaned_name[:-8].strip()
-                                if cleaned_name:
-                                    category_name = format_customize_type(cleaned_name)
-                                else:
-                                    category_name = format_customize_type(product_name)
-                    
-                    # METHOD 3: Try product description
-                    if not category_name or category_name == "Customize Service":
-                        if item.product and item.product.description:
-                            desc = item.product.description.lower()
-                            # Check for "Type: " in description
-                            if "type: " in desc or "type:" in desc:
-                                if "type: uniform" in desc:
-                                    category_name = "Uniform"
-                                elif "type: pe" in desc or "type:pe" in desc:
-                                    category_name = "PE"
-                                else:
-                                    # Try to extract type from description
-                                    customize_types = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
-                                    for customize_type in customize_types:
-                                        if customize_type in desc:
-                                            category_name = format_customize_type(customize_type)
-                                            break
-                    
-                    # METHOD 4: Try product category
-                    if not category_name or category_name == "Customize Service":
-                        if item.product and item.product.category:
-                            cat_name = item.product.category.name
-                            cat_name_lower = cat_name.lower()
-                            # Check if category name contains customize type
-                            customize_types = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
-                            for customize_type in customize_types:
-                                if customize_type in cat_name_lower:
-                                    category_name = format_customize_type(customize_type)
-                                    break
-                            if not category_name or category_name == "Customize Service":
-                                category_name = format_customize_type(cat_name)
-                    
-                    # METHOD 5: Check order notes if not already checked
-                    if (not category_name or category_name == "Customize Service") and order.notes:
-                        notes_lower = order.notes.lower()
-                        customize_types = ['polo', 'polo_shirt', 'blouse', 'pants', 'shorts', 'skirt', 'palda', 'skirt_palda', 'uniform', 'pe']
-                        for customize_type in customize_types:
-                            if customize_type in notes_lower:
-                                category_name = format_customize_type(customize_type)
-                                break
-                
-                # Final fallback - try to extract from product name directly
-                if not category_name or category_name == "Customize Service":
-                    if item.product and item.product.name:
-                        product_name = item.product.name
-                        # Try to extract anything after "Customize - " or "customize - "
-                        if "Customize - " in product_name:
-                            extracted = product_name.split("Customize - ")[1].strip()
-                            # Remove class suffix and timestamp
-                            if " (Class " in extracted:
-                                extracted = extracted.split(" (Class ")[0].strip()
-                            if " - " in extracted and len(extracted.split(" - ")[-1]) > 10:
-                                extracted = extracted.split(" - ")[0].strip()
-                            if extracted and extracted != "Customize Service":
-                                category_name = format_customize_type(extracted)
-                        elif "customize - " in product_name.lower():
-                            extracted = product_name.lower().split("customize - ")[1].strip()
-                            if " (class " in extracted:
-                                extracted = extracted.split(" (class ")[0].strip()
-                            if " - " in extracted and len(extracted.split(" - ")[-1]) > 10:
-                                extracted = extracted.split(" - ")[0].strip()
-                            if extracted and extracted != "customize service":
-                                category_name = format_customize_type(extracted)
-                
-                # Only use "Customize Service" as absolute last resort
-                if not category_name:
-                    category_name = "Customize Service"
-                
-                if category_name:
-                    # Group by category and sum quantities
-                    found = False
-                    for i, cat in enumerate(categories):
-                        if cat == category_name:
-                            quantities[i] += item.quantity
-                            found = True
-                            break
-                    if not found:
-                        categories.append(category_name)
-                        quantities.append(item.quantity)
-            
-            # Format as "Category1 (qty), Category2 (qty)"
-            if categories:
-                category_parts = []
-                for cat, qty in zip(categories, quantities):
-                    if qty > 1:
-                        category_parts.append(f"{cat} ({qty})")
-                    else:
-                        category_parts.append(cat)
-                order.customize_categories_display = ", ".join(category_parts)
-                order.customize_quantity_display = sum(quantities)
-            else:
-                order.customize_categories_display = "Customize Service"
-                order.customize_quantity_display = 1
-        
-        elif order.order_type == 'rent' or order.order_type == 'rental':
-            # Aggregate rental categories from actual order items
-            categories = []
-            quantities = []
-            
-            for item in order.items.all():
-                category_name = None
-                
-                # Get category from product
-                if item.product and item.product.category:
-                    category_name = item.product.category.name
-                elif item.product and item.product.name:
-                    # Try to infer from product name
-                    product_name = item.product.name
-                    # Check if it's a rental product with category info
-                    if item.product.product_type == 'rental':
-                        # Use product name as fallback
-                        category_name = product_name
-                    else:
-                        category_name = "Rental Service"
-                else:
-                    category_name = "Rental Service"
-                
-                # Ensure category_name is never None or empty
-                if not category_name or category_name.strip() == '' or category_name == 'N/A':
-                    category_name = "Rental Service"
-                
-                # Group by category and sum quantities
-                found = False
-                for i, cat in enumerate(categories):
-                    if cat == category_name:
-                        quantities[i] += item.quantity
-                        found = True
-                        break
-                if not found:
-                    categories.append(category_name)
-                    quantities.append(item.quantity)
-            
-            # Format as "Category1, Category2" or "Category1 (qty), Category2 (qty)"
-            if categories:
-                category_parts = []
-                for cat, qty in zip(categories, quantities):
-                    if qty > 1:
-                        category_parts.append(f"{cat} ({qty})")
-                    else:
-                        category_parts.append(cat)
-                order.rental_categories_display = ", ".join(category_parts)
-                order.rental_quantity_display = sum(quantities)
-            else:
-                # Fallback: check if order has any items at all
-                if order.items.exists():
-                    order.rental_categories_display = "Rental Service"
-                    order.rental_quantity_display = sum(item.quantity for item in order.items.all())
-                else:
-                    order.rental_categories_display = "Rental Service"
-                    order.rental_quantity_display = 1
+    # Rental due/overdue statuses are moved by the rental state engine
+    # (rental_state_manager), so this view only reads
     
-    # Pagination for orders
-    paginator = Paginator(orders_list, 10)  # Show 10 orders per page
+    # Pagination for orders - filtered, sorted and sliced in the database
+    paginator = Paginator(orders, 10)  # Show 10 orders per page
     page = request.GET.get('page')
     try:
         orders = paginator.page(page)
@@ -1174,6 +575,12 @@ def orders_list(request):
     except EmptyPage:
         orders = paginator.page(paginator.num_pages)
     
+    # Category/quantity display data is precomputed on OrderCategorySummary
+    from .order_category_manager import OrderCategoryManager
+
+    for order in orders:
+        OrderCategoryManager.apply(order)
+    
     # Get staff members for assignment (only active staff users)
     from django.contrib.auth.models import User
     staff_members = User.objects.filter(is_staff=True, is_active=True).order_by('first_name', 'username')
@@ -1814,69 +1221,15 @@ def check_inventory_availability(products_data, order_type):
     }
 
 
-def calculate_thread_for_zipper(zipper_inches):
-    """
-    Calculate thread needed for zipper repair.
-    Thread needed = 2.5 × zipper length in meters
-    """
-    from decimal import Decimal
-
-    # Convert inches to meters (1 inch = 0.0254 meters)
-    zipper_meters = Decimal(str(zipper_inches)) * Decimal('0.0254')
-    # Thread needed = 2.5 × zipper length
-    thread_meters = zipper_meters * Decimal('2.5')
-    return float(thread_meters)
-
 def find_thread_by_color(thread_color):
     """
     Find thread material matching the specified color.
     Returns Product object or None.
     """
-    from .models import MaterialType
+    from .material_catalog_manager import MaterialCatalogManager
 
-    # Try to find thread material type
-    thread_type = MaterialType.objects.filter(
-        Q(name__icontains='thread')
-    ).first()
-    
-    if not thread_type:
-        return None
-    
-    # Find thread products
-    thread_products = Product.objects.filter(
-        product_type='material',
-        material_type=thread_type,
-        is_archived=False,
-        is_active=True
-    )
-    
-    if not thread_products.exists():
-        return None
-    
-    # If color specified, try to match
-    if thread_color and thread_color.lower() not in ['', 'n/a', 'none']:
-        # Normalize color name
-        color_lower = thread_color.lower().strip()
-        
-        # Try exact match in name or description
-        for thread in thread_products:
-            name_lower = thread.name.lower() if thread.name else ''
-            desc_lower = thread.description.lower() if thread.description else ''
-            
-            if color_lower in name_lower or color_lower in desc_lower:
-                return thread
-        
-        # Try partial match
-        for thread in thread_products:
-            name_lower = thread.name.lower() if thread.name else ''
-            desc_lower = thread.description.lower() if thread.description else ''
-            
-            # Check if color appears in name/description
-            if any(c in name_lower or c in desc_lower for c in [color_lower[:3], color_lower]):
-                return thread
-    
-    # Return first available thread if no color match
-    return thread_products.first()
+    # Exact color match from the material catalog, else the first available thread
+    return MaterialCatalogManager.find('thread', color=thread_color)
 
 def check_thread_availability(thread_color):
     """
@@ -1902,954 +1255,101 @@ def check_thread_availability(thread_color):
         'unit': thread.unit_of_measurement or 'meters'
     }
 
-def deduct_thread_from_inventory(thread_meters, thread_color, order, repair_type):
+def deduct_repair_materials(order, order_data):
     """
-    Deduct thread from inventory matching the color.
-    Returns True if successful, False otherwise.
+    Automatically deduct materials used in repair orders from inventory:
+    the selected zipper/lock/buttons/garter/patches and the thread for them,
+    planned and deducted together (see MaterialDeductionPlanner).
     """
-    from decimal import Decimal
-    
-    thread = find_thread_by_color(thread_color)
-    if not thread:
-        return False
-    
+    if order.order_type != 'repair':
+        return
+
     try:
-        meters_used = Decimal(str(thread_meters))
-        
-        # Check if thread is stored in meters or other unit
-        if thread.unit_of_measurement == 'meters':
-            if thread.quantity >= meters_used:
-                thread.quantity -= meters_used
-                thread.current_quantity_in_stock = thread.quantity
-                thread.save()
-                
-                InventoryTransaction.objects.create(
-                    product=thread,
-                    transaction_type='out',
-                    quantity=-float(meters_used),
-                    reference_order=order,
-                    notes=f'Used {thread_meters:.2f}m {thread_color} thread for {repair_type} - Order {order.order_identifier}'
-                )
-                return True
-        else:
-            # Convert meters to the unit stored (assuming cm if not meters)
-            if thread.unit_of_measurement in ['cm', 'centimeters']:
-                cm_used = float(meters_used * 100)
-                if thread.quantity >= cm_used:
-                    thread.quantity -= int(cm_used)
-                    thread.current_quantity_in_stock = thread.quantity
-                    thread.save()
-                    
-                    InventoryTransaction.objects.create(
-                        product=thread,
-                        transaction_type='out',
-                        quantity=-int(cm_used),
-                        reference_order=order,
-                        notes=f'Used {thread_meters:.2f}m ({cm_used}cm) {thread_color} thread for {repair_type} - Order {order.order_identifier}'
-                    )
-                    return True
-            else:
-                # Try direct deduction
-                if thread.quantity >= float(meters_used):
-                    thread.quantity -= float(meters_used)
-                    thread.current_quantity_in_stock = thread.quantity
-                    thread.save()
-                    
-                    InventoryTransaction.objects.create(
-                        product=thread,
-                        transaction_type='out',
-                        quantity=-float(meters_used),
-                        reference_order=order,
-                        notes=f'Used {thread_meters:.2f}m {thread_color} thread for {repair_type} - Order {order.order_identifier}'
-                    )
-                    return True
+        MaterialDeductionPlanner.apply(order, order_data)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
-        logger.error(f'Error deducting thread: {str(e)}')
-    
-    return False
+        logger.error(f'Error deducting materials for order {order.order_identifier}: {str(e)}')
+        import traceback
+        traceback.print_exc()
 
-def deduct_repair_materials(order, order_data):
+
+def _find_material_by_type(type_name):
+    from .reference_data_manager import ReferenceData
+    mt = ReferenceData.material_type_containing(type_name)
+    if not mt:
+        return None
+    qs = Product.objects.filter(product_type='material', material_type=mt, is_archived=False, is_active=True).order_by('-quantity')
+    return qs.first() if qs.exists() else None
+
+def _find_thread_by_brand_and_color(thread_brand, thread_color):
     """
-    Automatically deduct materials used in repair orders from inventory.
-    Implements comprehensive material deduction based on repair type with thread calculations.
+    Find thread material by brand (Type Of Thread) and color.
+    Returns Product object or None.
     """
-    if order.order_type != 'repair':
-        return
-    
-    repair_type = order_data.get('repair_type')
-    if not repair_type:
+    from .material_catalog_manager import MaterialCatalogManager
+
+    # Matches the "Brand" / "Color" attributes; falls back to the first available thread
+    return MaterialCatalogManager.find('thread', brand=thread_brand, color=thread_color)
+
+def _find_garter():
+    """
+    Find garter material (no attributes needed).
+    Returns Product object or None.
+    """
+    from .material_catalog_manager import MaterialCatalogManager
+
+    return MaterialCatalogManager.best_stocked('garter')
+
+def _parse_measurements_from_product(product):
+    m = {}
+    desc = product.description or ''
+    if 'Measurements:' in desc:
+        s = desc.find('Measurements:')
+        js = desc[s + len('Measurements:'):].strip()
+        try:
+            m = json.loads(js)
+        except Exception:
+            import re
+            mm = re.search(r'\{[\s\S]*\}', js, re.MULTILINE | re.DOTALL)
+            if mm:
+                try:
+                    m = json.loads(mm.group())
+                except Exception:
+                    m = {}
+    if not isinstance(m, dict):
+        m = {}
+    return {k.strip().lower().replace(' ', '_'): (str(v).strip() if v is not None else '') for k, v in m.items()}
+
+def deduct_customize_materials(order, order_data=None):
+    """
+    Deduct materials from inventory for customization orders.
+    Matches materials by their attributes (type, color, brand) and deducts
+    the correct amounts, all together (see MaterialDeductionPlanner).
+    """
+    if order.order_type != 'customize':
         return
-    
-    materials_deducted = []
-    from decimal import Decimal
-    
+
     try:
-        # ========== ZIPPER REPLACEMENT ==========
-        if repair_type == 'zipper_replacement':
-            zipper_provided = order_data.get('zipper_provided', 'no')
-            if zipper_provided != 'yes':
-                selected_zipper_id = order_data.get('selected_zipper_id')
-                selected_zipper_inches = order_data.get('selected_zipper_inches_used')
-                # Get thread color from zipper modal or repair thread details
-                thread_color = order_data.get('thread_color') or order_data.get('selected_thread_color') or order_data.get('threadColor', '')
-                
-                if selected_zipper_id and selected_zipper_inches:
-                    try:
-                        zipper = Product.objects.get(
-                            id=selected_zipper_id,
-                            product_type='material',
-                            is_archived=False
-                        )
-                        inches_used = float(selected_zipper_inches)
-                        
-                        # Deduct zipper (stored in inches)
-                        if zipper.quantity >= inches_used:
-                            zipper.quantity -= Decimal(str(inches_used))
-                            zipper.current_quantity_in_stock = zipper.quantity
-                            zipper.save()
-                            
-                            InventoryTransaction.objects.create(
-                                product=zipper,
-                                transaction_type='out',
-                                quantity=-float(inches_used),
-                                reference_order=order,
-                                notes=f'Used {inches_used} inches zipper for repair - Order {order.order_identifier}'
-                            )
-                            materials_deducted.append(f'Zipper: {inches_used} inches')
-                            
-                            # Use thread meters from form (auto-calculated) or calculate if not provided
-                            thread_meters_input = order_data.get('thread_meters')
-                            if thread_meters_input:
-                                try:
-                                    thread_meters = float(thread_meters_input)
-                                except (ValueError, TypeError):
-                                    thread_meters = calculate_thread_for_zipper(inches_used)
-                            else:
-                                thread_meters = calculate_thread_for_zipper(inches_used)
-                            
-                            if thread_meters > 0 and thread_color:
-                                if deduct_thread_from_inventory(thread_meters, thread_color, order, repair_type):
-                                    materials_deducted.append(f'Thread: {thread_meters:.2f}m ({thread_color})')
-                    except Product.DoesNotExist:
-                        pass
-        
-        # ========== LOCK/KAWIT REPAIR ==========
-        elif repair_type == 'lock_repair':
-            selected_lock_id = order_data.get('selected_lock_id')
-            selected_lock_groups = order_data.get('selected_lock_groups_used')
-            # Get thread color from lock modal or thread details section
-            thread_color = order_data.get('thread_color') or order_data.get('threadColor') or order_data.get('selected_thread_color_locks', '')
-            
-            if selected_lock_id and selected_lock_groups:
-                try:
-                    lock = Product.objects.get(
-                        id=selected_lock_id,
-                        product_type='material',
-                        is_archived=False
-                    )
-                    groups_used = int(selected_lock_groups)
-                    
-                    # Deduct locks/kawit (stored in groups)
-                    if lock.quantity >= groups_used:
-                        lock.quantity -= groups_used
-                        lock.current_quantity_in_stock = lock.quantity
-                        lock.save()
-                        
-                        InventoryTransaction.objects.create(
-                            product=lock,
-                            transaction_type='out',
-                            quantity=-groups_used,
-                            reference_order=order,
-                            notes=f'Used {groups_used} groups locks/kawit for repair - Order {order.order_identifier}'
-                        )
-                        materials_deducted.append(f'Lock/Kawit: {groups_used} groups')
-                        
-                        # Use thread meters from form (auto-calculated) or calculate if not provided
-                        thread_meters_input = order_data.get('thread_meters')
-                        if thread_meters_input:
-                            try:
-                                thread_meters_total = float(thread_meters_input)
-                            except (ValueError, TypeError):
-                                # Calculate: 0.25 m × 8 = 2 meters per group
-                                thread_meters_per_group = 2.0
-                                thread_meters_total = groups_used * thread_meters_per_group
-                        else:
-                            # Calculate: 0.25 m × 8 = 2 meters per group
-                            thread_meters_per_group = 2.0
-                            thread_meters_total = groups_used * thread_meters_per_group
-                        
-                        if thread_meters_total > 0 and thread_color:
-                            if deduct_thread_from_inventory(thread_meters_total, thread_color, order, repair_type):
-                                materials_deducted.append(f'Thread: {thread_meters_total:.2f}m ({thread_color})')
-                except Product.DoesNotExist:
-                    pass
-        
-        # ========== BUTTON REPAIR ==========
-        elif repair_type == 'buttons':
-            buttons_provided = order_data.get('buttons_provided', 'no')
-            if buttons_provided != 'yes':
-                selected_button_id = order_data.get('selected_button_id')
-                selected_button_quantity = order_data.get('selected_button_quantity_used')
-                # Get thread color from button modal or thread details section
-                thread_color = order_data.get('thread_color') or order_data.get('threadColor') or order_data.get('selected_thread_color_buttons', '')
-                
-                if selected_button_id and selected_button_quantity:
-                    try:
-                        button = Product.objects.get(
-                            id=selected_button_id,
-                            product_type='material',
-                            is_archived=False
-                        )
-                        # Button quantity is in pieces, 1 group = 8 pieces
-                        pieces_used = int(selected_button_quantity)
-                        groups_used = pieces_used / 8.0
-                        
-                        # Deduct buttons
-                        if button.quantity >= pieces_used:
-                            button.quantity -= pieces_used
-                            button.current_quantity_in_stock = button.quantity
-                            button.save()
-                            
-                            InventoryTransaction.objects.create(
-                                product=button,
-                                transaction_type='out',
-                                quantity=-pieces_used,
-                                reference_order=order,
-                                notes=f'Used {pieces_used} pieces ({groups_used:.1f} groups) buttons for repair - Order {order.order_identifier}'
-                            )
-                            materials_deducted.append(f'Buttons: {pieces_used} pieces ({groups_used:.1f} groups)')
-                            
-                            # Use thread meters from form (auto-calculated) or calculate if not provided
-                            thread_meters_input = order_data.get('thread_meters')
-                            if thread_meters_input:
-                                try:
-                                    thread_meters_total = float(thread_meters_input)
-                                except (ValueError, TypeError):
-                                    # Calculate: 2–2.4 meters per 8 pieces (1 group), use average: 2.2 meters per group
-                                    thread_meters_per_group = 2.2
-                                    thread_meters_total = groups_used * thread_meters_per_group
-                            else:
-                                # Calculate: 2–2.4 meters per 8 pieces (1 group), use average: 2.2 meters per group
-                                thread_meters_per_group = 2.2
-                                thread_meters_total = groups_used * thread_meters_per_group
-                            
-                            if thread_meters_total > 0 and thread_color:
-                                if deduct_thread_from_inventory(thread_meters_total, thread_color, order, repair_type):
-                                    materials_deducted.append(f'Thread: {thread_meters_total:.2f}m ({thread_color})')
-                    except Product.DoesNotExist:
-                        pass
-        
-        # ========== GARTER REPAIR (Bewang) ==========
-        elif repair_type == 'bewang':
-            selected_garter_id = order_data.get('selected_garter_id')
-            selected_garter_inches = order_data.get('selected_garter_inches_used')
-            thread_color = order_data.get('thread_color') or order_data.get('threadColor', '')
-            
-            if selected_garter_id and selected_garter_inches:
-                try:
-                    garter = Product.objects.get(
-                        id=selected_garter_id,
-                        product_type='material',
-                        is_archived=False
-                    )
-                    inches_used = float(selected_garter_inches)
-                    
-                    # Deduct garter (stored in inches)
-                    if garter.quantity >= inches_used:
-                        garter.quantity -= Decimal(str(inches_used))
-                        garter.current_quantity_in_stock = garter.quantity
-                        garter.save()
-                        
-                        InventoryTransaction.objects.create(
-                            product=garter,
-                            transaction_type='out',
-                            quantity=-float(inches_used),
-                            reference_order=order,
-                            notes=f'Used {inches_used} inches garter for bewang repair - Order {order.order_identifier}'
-                        )
-                        materials_deducted.append(f'Garter: {inches_used} inches')
-                        
-                        # Use thread meters from form (auto-calculated) or calculate if not provided
-                        thread_meters_input = order_data.get('thread_meters')
-                        if thread_meters_input:
-                            try:
-                                thread_meters = float(thread_meters_input)
-                            except (ValueError, TypeError):
-                                thread_meters = 5.0  # Default average
-                        else:
-                            thread_meters = 5.0  # Default average
-                        
-                        if thread_meters > 0 and thread_color:
-                            if deduct_thread_from_inventory(thread_meters, thread_color, order, repair_type):
-                                materials_deducted.append(f'Thread: {thread_meters:.2f}m ({thread_color})')
-                except Product.DoesNotExist:
-                    pass
-        
-        # ========== ELASTIC REPAIR ==========
-        elif repair_type == 'elastic':
-            selected_garter_id = order_data.get('selected_garter_id') or order_data.get('selected_garter_id_elastic')
-            selected_garter_inches = order_data.get('selected_garter_inches_used') or order_data.get('selected_garter_inches_used_elastic')
-            thread_color = order_data.get('thread_color') or order_data.get('threadColor', '')
-            
-            if selected_garter_id and selected_garter_inches:
-                try:
-                    garter = Product.objects.get(
-                        id=selected_garter_id,
-                        product_type='material',
-                        is_archived=False
-                    )
-                    inches_used = float(selected_garter_inches)
-                    
-                    # Deduct garter/elastic (stored in inches)
-                    if garter.quantity >= inches_used:
-                        garter.quantity -= Decimal(str(inches_used))
-                        garter.current_quantity_in_stock = garter.quantity
-                        garter.save()
-                        
-                        InventoryTransaction.objects.create(
-                            product=garter,
-                            transaction_type='out',
-                            quantity=-float(inches_used),
-                            reference_order=order,
-                            notes=f'Used {inches_used} inches garter/elastic for elastic repair - Order {order.order_identifier}'
-                        )
-                        materials_deducted.append(f'Garter/Elastic: {inches_used} inches')
-                        
-                        # Use thread meters from form (auto-calculated) or calculate if not provided
-                        thread_meters_input = order_data.get('thread_meters')
-                        if thread_meters_input:
-                            try:
-                                thread_meters = float(thread_meters_input)
-                            except (ValueError, TypeError):
-                                thread_meters = 5.0  # Default average
-                        else:
-                            thread_meters = 5.0  # Default average
-                        
-                        if thread_meters > 0 and thread_color:
-                            if deduct_thread_from_inventory(thread_meters, thread_color, order, repair_type):
-                                materials_deducted.append(f'Thread: {thread_meters:.2f}m ({thread_color})')
-                except Product.DoesNotExist:
-                    pass
-        
-        # ========== PATCH REPAIR ==========
-        elif repair_type == 'patches':
-            patch_provided = order_data.get('patch_provided', 'no')
-            if patch_provided != 'yes':
-                selected_patch_id = order_data.get('selected_patch_id')
-                selected_patch_quantity = order_data.get('selected_patch_quantity_used')
-                # Get thread color and length from patch section
-                thread_color = order_data.get('thread_color') or order_data.get('selected_thread_color_patches', '')
-                thread_color_other = order_data.get('thread_color_other') or order_data.get('selected_thread_color_other_patches', '')
-                final_thread_color = thread_color_other if thread_color == 'other' else thread_color
-                thread_length = float(order_data.get('thread_length') or order_data.get('selected_patch_thread_length') or 0)
-                
-                if selected_patch_id and selected_patch_quantity:
-                    try:
-                        patch = Product.objects.get(
-                            id=selected_patch_id,
-                            product_type='material',
-                            is_archived=False
-                        )
-                        qty_used = int(selected_patch_quantity)
-                        
-                        # Deduct patches (stored in pieces)
-                        if patch.quantity >= qty_used:
-                            patch.quantity -= qty_used
-                            patch.current_quantity_in_stock = patch.quantity
-                            patch.save()
-                            
-                            InventoryTransaction.objects.create(
-                                product=patch,
-                                transaction_type='out',
-                                quantity=-qty_used,
-                                reference_order=order,
-                                notes=f'Used {qty_used} pieces patches for repair - Order {order.order_identifier}'
-                            )
-                            materials_deducted.append(f'Patches: {qty_used} pieces ({patch.name})')
-                            
-                            # Deduct thread using the provided thread length (from auto-calculated field)
-                            # thread_length comes from selectedPatchThreadLength which is auto-calculated
-                            if thread_length > 0 and final_thread_color:
-                                if deduct_thread_from_inventory(thread_length, final_thread_color, order, repair_type):
-                                    materials_deducted.append(f'Thread: {thread_length:.2f}m ({final_thread_color})')
-                    except Product.DoesNotExist:
-                        pass
-                    except Exception as e:
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.error(f'Error deducting patches: {str(e)} - Order {order.order_identifier}')
-        
-        # ========== OTHER REPAIR TYPES (Thread only) ==========
-        thread_required_types = [
-            'ambel', 'baston', 'baston_suklot', 'baston_putol', 
-            'putol', 'suklot', 'pasada', 'bewang', 'elastic',
-            'general_repair', 'general_tshirt_repair'
-        ]
-        
-        if repair_type in thread_required_types:
-            # Prioritize thread_meters from form (auto-calculated)
-            thread_meters_input = order_data.get('thread_meters') or order_data.get('threadMeters')
-            thread_color = order_data.get('thread_color') or order_data.get('threadColor', '')
-            thread_color_other = order_data.get('thread_color_other') or order_data.get('threadColorOther', '')
-            final_thread_color = thread_color_other if thread_color == 'other' else thread_color
-            
-            # If thread meters not provided, calculate based on repair type
-            if not thread_meters_input or thread_meters_input == '' or thread_meters_input == 'N/A':
-                thread_meters_ranges = {
-                    'ambel': (1.5, 3.0),  # Average: 2.25
-                    'baston': (2.0, 4.0),  # Average: 3.0
-                    'baston_suklot': (3.0, 5.0),  # Average: 4.0
-                    'baston_putol': (4.0, 6.0),  # Average: 5.0
-                    'putol': (0.5, 3.0),  # Average: 1.75
-                    'bewang': (3.0, 6.0),  # Average: 4.5
-                    'general_repair': (1.0, 3.0),  # Average: 2.0
-                    'general_tshirt_repair': (1.0, 2.0),  # Average: 1.5
-                    'suklot': (2.0, 4.0),  # Average: 3.0 (similar to baston)
-                    'pasada': (2.0, 4.0),  # Average: 3.0 (similar to baston)
-                    'elastic': (4.0, 6.0),  # Average: 5.0 (same as bewang)
-                }
-                
-                if repair_type in thread_meters_ranges:
-                    min_meters, max_meters = thread_meters_ranges[repair_type]
-                    thread_meters = (min_meters + max_meters) / 2.0  # Use average
-                else:
-                    thread_meters = 2.0  # Default
-            else:
-                try:
-                    thread_meters = float(thread_meters_input)
-                except (ValueError, TypeError):
-                    thread_meters = 2.0  # Default
-            
-            # Deduct thread using the calculated or provided thread meters
-            if thread_meters > 0 and final_thread_color:
-                if deduct_thread_from_inventory(thread_meters, final_thread_color, order, repair_type):
-                    materials_deducted.append(f'Thread: {thread_meters:.2f}m ({final_thread_color})')
-        
-        # Log materials deducted
-        if materials_deducted:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f'Materials deducted for order {order.order_identifier}: {", ".join(materials_deducted)}')
-            
-    except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f'Error deducting materials for order {order.order_identifier}: {str(e)}')
-        import traceback
-        traceback.print_exc()
-
-
-def _find_material_by_type(type_name):
-    from .models import MaterialType
-    mt = MaterialType.objects.filter(Q(name__icontains=type_name)).first()
-    if not mt:
-        return None
-    qs = Product.objects.filter(product_type='material', material_type=mt, is_archived=False, is_active=True).order_by('-quantity')
-    return qs.first() if qs.exists() else None
-
-def _find_fabric_by_type_and_color(fabric_type, fabric_color):
-    """
-    Find fabric material by type and color.
-    Returns Product object or None.
-    """
-    from .models import MaterialType
-
-    # Find fabric material type
-    fabric_material_type = MaterialType.objects.filter(
-        Q(name__icontains='fabric')
-    ).first()
-    
-    if not fabric_material_type:
-        return None
-    
-    # Find fabric products
-    fabric_products = Product.objects.filter(
-        product_type='material',
-        material_type=fabric_material_type,
-        is_archived=False,
-        is_active=True
-    )
-    
-    if not fabric_products.exists():
-        return None
-    
-    # Normalize search terms
-    fabric_type_lower = (fabric_type or '').lower().strip()
-    fabric_color_lower = (fabric_color or '').lower().strip()
-    
-    # Try to match by description (contains "Type of Fabric: {type}" and "Color: {color}")
-    for fabric in fabric_products:
-        desc_lower = (fabric.description or '').lower()
-        name_lower = (fabric.name or '').lower()
-        
-        # Check if fabric type matches
-        type_match = False
-        if fabric_type_lower:
-            # Check in description: "Type of Fabric: {type}"
-            if f'type of fabric: {fabric_type_lower}' in desc_lower or \
-               f'type of fabric:{fabric_type_lower}' in desc_lower or \
-               fabric_type_lower in desc_lower or \
-               fabric_type_lower in name_lower:
-                type_match = True
-        else:
-            type_match = True  # If no type specified, match any
-        
-        # Check if color matches
-        color_match = False
-        if fabric_color_lower:
-            # Check in description: "Color: {color}"
-            if f'color: {fabric_color_lower}' in desc_lower or \
-               f'color:{fabric_color_lower}' in desc_lower or \
-               fabric_color_lower in desc_lower or \
-               fabric_color_lower in name_lower:
-                color_match = True
-        else:
-            color_match = True  # If no color specified, match any
-        
-        if type_match and color_match:
-            return fabric
-    
-    # If no exact match, return first available fabric
-    return fabric_products.first()
-
-def _find_thread_by_brand_and_color(thread_brand, thread_color):
-    """
-    Find thread material by brand (Type Of Thread) and color.
-    Returns Product object or None.
-    """
-    from .models import MaterialType
-
-    # Find thread material type
-    thread_material_type = MaterialType.objects.filter(
-        Q(name__icontains='thread')
-    ).first()
-    
-    if not thread_material_type:
-        return None
-    
-    # Find thread products
-    thread_products = Product.objects.filter(
-        product_type='material',
-        material_type=thread_material_type,
-        is_archived=False,
-        is_active=True
-    )
-    
-    if not thread_products.exists():
-        return None
-    
-    # Normalize search terms
-    thread_brand_lower = (thread_brand or '').lower().strip()
-    thread_color_lower = (thread_color or '').lower().strip()
-    
-    # Try to match by description or name
-    for thread in thread_products:
-        desc_lower = (thread.description or '').lower()
-        name_lower = (thread.name or '').lower()
-        
-        # Check if brand (Type Of Thread) matches
-        brand_match = False
-        if thread_brand_lower:
-            # Check in description or name for brand
-            if thread_brand_lower in desc_lower or thread_brand_lower in name_lower:
-                brand_match = True
-        else:
-            brand_match = True  # If no brand specified, match any
-        
-        # Check if color matches
-        color_match = False
-        if thread_color_lower:
-            # Check in description: "Color: {color}" or in name
-            if f'color: {thread_color_lower}' in desc_lower or \
-               f'color:{thread_color_lower}' in desc_lower or \
-               thread_color_lower in desc_lower or \
-               thread_color_lower in name_lower:
-                color_match = True
-        else:
-            color_match = True  # If no color specified, match any
-        
-        if brand_match and color_match:
-            return thread
-    
-    # If no exact match, return first available thread
-    return thread_products.first()
-
-def _find_button_by_type_and_color(button_type, button_color):
-    """
-    Find button material by type and color.
-    Returns Product object or None.
-    """
-    from .models import MaterialType
-
-    # Find button material type
-    button_material_type = MaterialType.objects.filter(
-        Q(name__icontains='button')
-    ).first()
-    
-    if not button_material_type:
-        return None
-    
-    # Find button products
-    button_products = Product.objects.filter(
-        product_type='material',
-        material_type=button_material_type,
-        is_archived=False,
-        is_active=True
-    )
-    
-    if not button_products.exists():
-        return None
-    
-    # Normalize search terms
-    button_type_lower = (button_type or '').lower().strip()
-    button_color_lower = (button_color or '').lower().strip()
-    
-    # Try to match by description or name
-    for button in button_products:
-        desc_lower = (button.description or '').lower()
-        name_lower = (button.name or '').lower()
-        
-        # Check if button type matches
-        type_match = False
-        if button_type_lower:
-            # Check in description or name for type
-            if button_type_lower in desc_lower or button_type_lower in name_lower:
-                type_match = True
-        else:
-            type_match = True  # If no type specified, match any
-        
-        # Check if color matches
-        color_match = False
-        if button_color_lower:
-            # Check in description: "Color: {color}" or in name
-            if f'color: {button_color_lower}' in desc_lower or \
-               f'color:{button_color_lower}' in desc_lower or \
-               button_color_lower in desc_lower or \
-               button_color_lower in name_lower:
-                color_match = True
-        else:
-            color_match = True  # If no color specified, match any
-        
-        if type_match and color_match:
-            return button
-    
-    # If no exact match, return first available button
-    return button_products.first()
-
-def _find_garter():
-    """
-    Find garter material (no attributes needed).
-    Returns Product object or None.
-    """
-    from .models import MaterialType
-
-    # Find garter material type
-    garter_material_type = MaterialType.objects.filter(
-        Q(name__icontains='garter') | Q(name__icontains='elastic')
-    ).first()
-    
-    if not garter_material_type:
-        return None
-    
-    # Find garter products
-    garter_products = Product.objects.filter(
-        product_type='material',
-        material_type=garter_material_type,
-        is_archived=False,
-        is_active=True
-    ).order_by('-quantity')
-    
-    return garter_products.first() if garter_products.exists() else None
-
-def _find_locks():
-    """
-    Find locks/kawit material (no attributes needed).
-    Returns Product object or None.
-    """
-    from .models import MaterialType
-
-    # Find locks material type
-    locks_material_type = MaterialType.objects.filter(
-        Q(name__icontains='lock') | Q(name__icontains='kawit')
-    ).first()
-    
-    if not locks_material_type:
-        return None
-    
-    # Find locks products
-    locks_products = Product.objects.filter(
-        product_type='material',
-        material_type=locks_material_type,
-        is_archived=False,
-        is_active=True
-    ).order_by('-quantity')
-    
-    return locks_products.first() if locks_products.exists() else None
-
-def _deduct_material_amount(product, amount, unit, order, note):
-    from decimal import Decimal
-    if not product or amount <= 0:
-        return False
-    amt = Decimal(str(amount))
-    
-    # Handle unit conversions
-    if unit == 'meters' and product.unit_of_measurement and 'yard' in product.unit_of_measurement.lower():
-        amt = amt * Decimal('1.09361')
-    elif unit == 'yards' and product.unit_of_measurement and 'meter' in product.unit_of_measurement.lower():
-        amt = amt * Decimal('0.9144')
-    elif unit == 'inches' and product.unit_of_measurement and 'cm' in product.unit_of_measurement.lower():
-        # Convert inches to cm (1 inch = 2.54 cm)
-        amt = amt * Decimal('2.54')
-    elif unit == 'cm' and product.unit_of_measurement and 'inch' in product.unit_of_measurement.lower():
-        # Convert cm to inches (1 cm = 0.393701 inches)
-        amt = amt * Decimal('0.393701')
-    elif unit == 'groups':
-        # Groups are handled directly - no conversion needed
-        # The product's unit_of_measurement should already be 'group' or 'groups'
-        pass
-    
-    # Check if product has enough quantity
-    if product.quantity >= amt:
-        product.quantity -= amt
-        product.current_quantity_in_stock = product.quantity
-        product.save()
-        InventoryTransaction.objects.create(product=product, transaction_type='out', quantity=-float(amt), reference_order=order, notes=note)
-        return True
-    else:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.warning(f'Insufficient stock for {product.name}: Need {amt}, Have {product.quantity} - Order {order.order_identifier}')
-    return False
-
-def _parse_measurements_from_product(product):
-    m = {}
-    desc = product.description or ''
-    if 'Measurements:' in desc:
-        s = desc.find('Measurements:')
-        js = desc[s + len('Measurements:'):].strip()
-        try:
-            m = json.loads(js)
-        except Exception:
-            import re
-            mm = re.search(r'\{[\s\S]*\}', js, re.MULTILINE | re.DOTALL)
-            if mm:
-                try:
-                    m = json.loads(mm.group())
-                except Exception:
-                    m = {}
-    if not isinstance(m, dict):
-        m = {}
-    return {k.strip().lower().replace(' ', '_'): (str(v).strip() if v is not None else '') for k, v in m.items()}
-
-def deduct_customize_materials(order, order_data=None):
-    """
-    Deduct materials from inventory for customization orders.
-    Matches materials by their attributes (type, color, brand) and deducts the correct amounts.
-    """
-    if order.order_type != 'customize':
-        return
-    
-    if not order_data:
-        order_data = {}
-    
-    # Get customization type from order_data or product
-    customize_type = order_data.get('customize_type') or order_data.get('type_of_customize', '').lower()
-    
-    # If not in order_data, try to extract from order items
-    if not customize_type:
-        items = list(order.items.select_related('product'))
-        for it in items:
-            p = it.product
-            if p.product_type != 'service':
-                continue
-            name = (p.name or '').lower()
-            cat = p.category.name.lower() if p.category and p.category.name else ''
-            
-            if any(x in cat for x in ['polo', 'polo_shirt']) or any(x in name for x in ['polo', 'polo shirt']):
-                customize_type = 'polo' if 'polo_shirt' not in cat and 'polo shirt' not in name else 'polo_shirt'
-            elif 'blouse' in cat or 'blouse' in name:
-                customize_type = 'blouse'
-            elif any(x in cat for x in ['pants', 'pe_pants']) or 'pants' in name:
-                customize_type = 'pants'
-            elif 'short' in cat or 'short' in name:
-                customize_type = 'shorts'
-            elif 'skirt' in cat or 'palda' in cat or 'skirt' in name or 'palda' in name:
-                customize_type = 'skirt_palda'
-            break
-    
-    if not customize_type:
-        customize_type = 'polo'  # Default fallback
-    
-    # Get quantity
-    qty = max(1, int(order_data.get('customize_quantity', 1) or 1))
-    
-    # Extract material information from order_data
-    fabric_type = order_data.get('customize_fabric', '').strip()
-    fabric_color = order_data.get('customize_fabric_color', '').strip()  # May not be in form, try to extract
-    fabric_yards = order_data.get('customize_fabric_yards', 0)
-    
-    thread_brand = order_data.get('customize_thread_brand', '').strip() or order_data.get('thread_brand', '').strip()  # Type Of Thread
-    thread_color = order_data.get('customize_thread_color', '').strip() or order_data.get('thread_color', '').strip()
-    thread_meters = order_data.get('customize_thread_meters', 0) or order_data.get('thread_meters', 0)
-    
-    button_type = order_data.get('uniform_button_type', '').strip()
-    button_color = order_data.get('uniform_button_color', '').strip()  # May not be in form
-    button_quantity = order_data.get('uniform_buttons_needed', 0) or 0
-    
-    garter_inches = order_data.get('selected_garter_inches_used', 0) or order_data.get('garter_cm', 0) or 0
-    # Convert cm to inches if needed (1 cm = 0.393701 inches)
-    try:
-        if garter_inches and float(garter_inches) > 100:  # Likely in cm if > 100
-            garter_inches = float(garter_inches) * 0.393701
-        else:
-            garter_inches = float(garter_inches) if garter_inches else 0
-    except (ValueError, TypeError):
-        garter_inches = 0
-    
-    lock_groups = order_data.get('selected_lock_groups_used', 0) or order_data.get('lock_groups', 0) or 0
-    try:
-        lock_groups = int(lock_groups) if lock_groups else 0
-    except (ValueError, TypeError):
-        lock_groups = 0
-    
-    materials_deducted = []
-    
-    # ========== DEDUCT FABRIC ==========
-    # For all customization types: Polo, Polo Shirt, Blouse, Pants, Shorts, Skirt/Palda
-    if fabric_type and fabric_yards:
-        try:
-            fabric_yards_float = float(fabric_yards) * qty
-            fabric = _find_fabric_by_type_and_color(fabric_type, fabric_color)
-            if fabric:
-                if _deduct_material_amount(fabric, fabric_yards_float, 'yards', order, 
-                    f'Fabric ({fabric_type} {fabric_color or ""}) used for customize {customize_type} - {fabric_yards_float} yards - Order {order.order_identifier}'):
-                    materials_deducted.append(f'Fabric: {fabric_yards_float} yards ({fabric_type} {fabric_color or ""})')
-            else:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f'Fabric not found: Type={fabric_type}, Color={fabric_color} - Order {order.order_identifier}')
-        except (ValueError, TypeError) as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f'Error deducting fabric: {e} - Order {order.order_identifier}')
-    
-    # ========== DEDUCT THREAD ==========
-    # For all customization types: Polo, Polo Shirt, Blouse, Pants, Shorts, Skirt/Palda
-    if thread_color and thread_meters:
-        try:
-            thread_meters_float = float(thread_meters) * qty
-            thread = _find_thread_by_brand_and_color(thread_brand, thread_color)
-            if thread:
-                # Use the existing deduct_thread_from_inventory function which handles meters/cm conversion
-                if deduct_thread_from_inventory(thread_meters_float, thread_color, order, 'customize'):
-                    materials_deducted.append(f'Thread: {thread_meters_float}m ({thread_brand or ""} {thread_color})')
-            else:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f'Thread not found: Brand={thread_brand}, Color={thread_color} - Order {order.order_identifier}')
-        except (ValueError, TypeError) as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f'Error deducting thread: {e} - Order {order.order_identifier}')
-    
-    # ========== DEDUCT BUTTONS ==========
-    # Only for Polo, Polo Shirt, Blouse
-    if customize_type in ['polo', 'polo_shirt', 'blouse'] and button_type and button_quantity:
-        try:
-            button_qty_int = int(button_quantity) * qty
-            # Button quantity is in pieces, 1 group = 8 pieces
-            groups_used = button_qty_int / 8.0
-            
-            button = _find_button_by_type_and_color(button_type, button_color)
-            if button:
-                # Check button unit_of_measurement to determine if we deduct by groups or pieces
-                if button.unit_of_measurement and 'group' in button.unit_of_measurement.lower():
-                    # Deduct by groups
-                    if _deduct_material_amount(button, groups_used, 'groups', order,
-                        f'Buttons ({button_type} {button_color or ""}) used for customize {customize_type} - {groups_used} groups ({button_qty_int} pieces) - Order {order.order_identifier}'):
-                        materials_deducted.append(f'Buttons: {groups_used} groups ({button_qty_int} pieces) ({button_type} {button_color or ""})')
-                else:
-                    # Deduct by pieces
-                    if _deduct_material_amount(button, button_qty_int, 'pieces', order,
-                        f'Buttons ({button_type} {button_color or ""}) used for customize {customize_type} - {button_qty_int} pieces - Order {order.order_identifier}'):
-                        materials_deducted.append(f'Buttons: {button_qty_int} pieces ({button_type} {button_color or ""})')
-            else:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f'Button not found: Type={button_type}, Color={button_color} - Order {order.order_identifier}')
-        except (ValueError, TypeError) as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f'Error deducting buttons: {e} - Order {order.order_identifier}')
-    
-    # ========== DEDUCT GARTER ==========
-    # Only for Pants, Shorts, Skirt/Palda
-    if customize_type in ['pants', 'shorts', 'skirt_palda'] and garter_inches > 0:
-        try:
-            garter = _find_garter()
-            if garter:
-                # Garter is measured in inches or cm
-                # Check unit_of_measurement
-                if garter.unit_of_measurement and 'cm' in garter.unit_of_measurement.lower():
-                    # Convert inches to cm (1 inch = 2.54 cm)
-                    garter_amount = garter_inches * 2.54
-                    unit = 'cm'
-                else:
-                    garter_amount = garter_inches
-                    unit = 'inches'
-                
-                if _deduct_material_amount(garter, garter_amount, unit, order,
-                    f'Garter used for customize {customize_type} - {garter_amount} {unit} - Order {order.order_identifier}'):
-                    materials_deducted.append(f'Garter: {garter_amount} {unit}')
-            else:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f'Garter not found - Order {order.order_identifier}')
-        except (ValueError, TypeError) as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f'Error deducting garter: {e} - Order {order.order_identifier}')
-    
-    # ========== DEDUCT LOCKS/KAWIT ==========
-    # Only for Skirt/Palda
-    if customize_type == 'skirt_palda' and lock_groups > 0:
-        try:
-            locks = _find_locks()
-            if locks:
-                # Locks are measured in groups (1 group = 5 locks)
-                if _deduct_material_amount(locks, lock_groups, 'groups', order,
-                    f'Locks/Kawit used for customize {customize_type} - {lock_groups} groups ({lock_groups * 5} pieces) - Order {order.order_identifier}'):
-                    materials_deducted.append(f'Locks/Kawit: {lock_groups} groups ({lock_groups * 5} pieces)')
-            else:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f'Locks/Kawit not found - Order {order.order_identifier}')
-        except (ValueError, TypeError) as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f'Error deducting locks: {e} - Order {order.order_identifier}')
-    
-    # Log materials deducted
-    if materials_deducted:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f'Materials deducted for customize order {order.order_identifier} ({customize_type}): {", ".join(materials_deducted)}')
-
-def ensure_materials_recorded_for_order(order, order_data=None):
-    """
-    Ensure all materials used in an order are recorded as InventoryTransaction records.
-    This function is called after order creation to verify completeness.
-    Note: This is a verification function - actual material deduction happens in deduct_repair_materials/deduct_customize_materials
-    """
-    try:
-        # Check if order already has material transactions
-        existing_transactions = InventoryTransaction.objects.filter(
-            reference_order=order,
-            transaction_type='out',
-            product__product_type='material'
-        ).count()
+        MaterialDeductionPlanner.apply(order, order_data)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f'Error deducting materials for customize order {order.order_identifier}: {e}')
+
+def ensure_materials_recorded_for_order(order, order_data=None):
+    """
+    Ensure all materials used in an order are recorded as InventoryTransaction records.
+    This function is called after order creation to verify completeness.
+    Note: This is a verification function - actual material deduction happens in deduct_repair_materials/deduct_customize_materials
+    """
+    try:
+        # Check if order already has material transactions
+        existing_transactions = InventoryTransaction.objects.filter(
+            reference_order=order,
+            transaction_type='out',
+            product__product_type='material'
+        ).count()
         
         # Log if no transactions found for repair/customize orders (for debugging)
         if existing_transactions == 0 and order.order_type in ['repair', 'customize']:
@@ -2883,22 +1383,14 @@ def update_inventory_for_order(product, quantity, order, order_type):
             reference_order=order,
             notes=f'Rented out for order {order.order_identifier}'
         )
+        product.save()
         
     else:
-        # For repair/customize orders, deduct from inventory
-        if product.quantity >= quantity:
-            product.quantity -= quantity
-            
-            # Create inventory transaction
-            InventoryTransaction.objects.create(
-                product=product,
-                transaction_type='out',
-                quantity=-quantity,  # Negative for stock out
-                reference_order=order,
-                notes=f'Used for {order_type} order {order.order_identifier}'
-            )
-    
-    product.save()
+        # For repair/customize orders, deduct from inventory if enough is in stock
+        InventoryLedger.deduct(
+            product, quantity, reference_order=order,
+            notes=f'Used for {order_type} order {order.order_identifier}'
+        )
 
 
 def update_dashboard_statistics():
@@ -3105,6 +1597,7 @@ def api_check_repair_materials_availability(request):
     if request.method == 'POST':
         try:
             import json
+
             data = json.loads(request.body)
             
             order_type = data.get('orderType') or data.get('service_type')
@@ -3112,201 +1605,9 @@ def api_check_repair_materials_availability(request):
             
             unavailable_materials = []
             
-            # For repair orders, check specific materials based on repair type
+            # For repair orders, dry-run the deduction the order would make
             if order_type == 'repair' and repair_type:
-                # Check zipper availability for zipper_replacement
-                if repair_type == 'zipper_replacement':
-                    zipper_provided = data.get('zipper_provided', 'no')
-                    # Only check if zipper is NOT provided by customer
-                    if zipper_provided != 'yes':
-                        selected_zipper_id = data.get('selected_zipper_id')
-                        selected_zipper_inches = data.get('selected_zipper_inches_used')
-                        
-                        if selected_zipper_id and selected_zipper_inches:
-                            try:
-                                selected_zipper = Product.objects.get(
-                                    id=selected_zipper_id,
-                                    product_type='material',
-                                    is_archived=False,
-                                    is_active=True
-                                )
-                                available_inches = float(selected_zipper.quantity) if selected_zipper.quantity else 0
-                                inches_needed = float(selected_zipper_inches)
-                                
-                                if inches_needed > available_inches:
-                                    unavailable_materials.append({
-                                        'material': f'Zipper - {selected_zipper.name}',
-                                        'needed': inches_needed,
-                                        'available': available_inches,
-                                        'message': f'Insufficient zipper length. Need {inches_needed} inches, but only {available_inches} inches available.'
-                                    })
-                            except Product.DoesNotExist:
-                                unavailable_materials.append({
-                                    'material': 'Selected Zipper',
-                                    'needed': selected_zipper_inches,
-                                    'available': 0,
-                                    'message': 'Selected zipper not found in inventory.'
-                                })
-                        elif not selected_zipper_id:
-                            # If no zipper is selected, try to find any available zipper
-                            zippers = Product.objects.filter(
-                                product_type='material',
-                                is_archived=False,
-                                is_active=True
-                            )
-                            # Check if product name contains "zipper" (case-insensitive)
-                            zippers = [z for z in zippers if 'zipper' in z.name.lower() or (z.material_type and 'zipper' in z.material_type.name.lower())]
-                            if not zippers or all(z.quantity == 0 for z in zippers):
-                                unavailable_materials.append({
-                                    'material': 'Zipper',
-                                    'needed': 1,
-                                    'available': 0,
-                                    'message': 'No zippers available in inventory. Please select a zipper or mark as provided.'
-                                })
-                
-                # Check button availability for buttons repair
-                elif repair_type == 'buttons':
-                    buttons_provided = data.get('buttons_provided', 'no')
-                    # Only check if buttons are NOT provided by customer
-                    if buttons_provided != 'yes':
-                        selected_button_id = data.get('selected_button_id')
-                        selected_button_quantity = data.get('selected_button_quantity_used')
-                        
-                        if selected_button_id and selected_button_quantity:
-                            try:
-                                selected_button = Product.objects.get(
-                                    id=selected_button_id,
-                                    product_type='material',
-                                    is_archived=False,
-                                    is_active=True
-                                )
-                                available_qty = int(selected_button.quantity) if selected_button.quantity else 0
-                                qty_needed = int(selected_button_quantity)
-                                
-                                if qty_needed > available_qty:
-                                    unavailable_materials.append({
-                                        'material': f'Button - {selected_button.name}',
-                                        'needed': qty_needed,
-                                        'available': available_qty,
-                                        'message': f'Insufficient buttons. Need {qty_needed} pieces, but only {available_qty} pieces available.'
-                                    })
-                            except Product.DoesNotExist:
-                                unavailable_materials.append({
-                                    'material': 'Selected Button',
-                                    'needed': selected_button_quantity,
-                                    'available': 0,
-                                    'message': 'Selected button not found in inventory.'
-                                })
-                        elif not selected_button_id:
-                            # If no button is selected, try to find any available button
-                            buttons = Product.objects.filter(
-                                product_type='material',
-                                is_archived=False,
-                                is_active=True
-                            )
-                            # Check if product name or material type contains "button" (case-insensitive)
-                            buttons = [b for b in buttons if 'button' in b.name.lower() or (b.material_type and 'button' in b.material_type.name.lower())]
-                            if not buttons or all(b.quantity == 0 for b in buttons):
-                                unavailable_materials.append({
-                                    'material': 'Button',
-                                    'needed': 4,  # Default: 4 pieces for repair
-                                    'available': 0,
-                                    'message': 'No buttons available in inventory. Please select a button or mark as provided.'
-                                })
-                
-                # Check lock availability for lock_repair
-                elif repair_type == 'lock_repair':
-                    selected_lock_id = data.get('selected_lock_id')
-                    selected_lock_groups = data.get('selected_lock_groups_used')
-                    
-                    if selected_lock_id and selected_lock_groups:
-                        try:
-                            selected_lock = Product.objects.get(
-                                id=selected_lock_id,
-                                product_type='material',
-                                is_archived=False,
-                                is_active=True
-                            )
-                            available_groups = int(selected_lock.quantity) if selected_lock.quantity else 0
-                            groups_needed = int(selected_lock_groups)
-                            
-                            if groups_needed > available_groups:
-                                unavailable_materials.append({
-                                    'material': f'Lock/Kawit - {selected_lock.name}',
-                                    'needed': groups_needed,
-                                    'available': available_groups,
-                                    'message': f'Insufficient lock/kawit groups. Need {groups_needed} groups, but only {available_groups} groups available.'
-                                })
-                        except Product.DoesNotExist:
-                            unavailable_materials.append({
-                                'material': 'Selected Lock/Kawit',
-                                'needed': selected_lock_groups,
-                                'available': 0,
-                                'message': 'Selected lock/kawit not found in inventory.'
-                            })
-                    elif not selected_lock_id:
-                        # If no lock is selected, try to find any available lock
-                        locks = Product.objects.filter(
-                            product_type='material',
-                            is_archived=False,
-                            is_active=True
-                        )
-                        # Check if product name or material type contains "lock" or "kawit" (case-insensitive)
-                        locks = [l for l in locks if 'lock' in l.name.lower() or 'kawit' in l.name.lower() or (l.material_type and ('lock' in l.material_type.name.lower() or 'kawit' in l.material_type.name.lower()))]
-                        if not locks or all(l.quantity == 0 for l in locks):
-                            unavailable_materials.append({
-                                'material': 'Lock/Kawit',
-                                'needed': 1,  # Default: 1 group
-                                'available': 0,
-                                'message': 'No locks/kawit available in inventory. Please select a lock/kawit.'
-                            })
-                
-                # Check garter availability for bewang
-                elif repair_type == 'bewang':
-                    selected_garter_id = data.get('selected_garter_id')
-                    selected_garter_inches = data.get('selected_garter_inches_used')
-                    
-                    if selected_garter_id and selected_garter_inches:
-                        try:
-                            selected_garter = Product.objects.get(
-                                id=selected_garter_id,
-                                product_type='material',
-                                is_archived=False,
-                                is_active=True
-                            )
-                            available_inches = float(selected_garter.quantity) if selected_garter.quantity else 0
-                            inches_needed = float(selected_garter_inches)
-                            
-                            if inches_needed > available_inches:
-                                unavailable_materials.append({
-                                    'material': f'Garter - {selected_garter.name}',
-                                    'needed': inches_needed,
-                                    'available': available_inches,
-                                    'message': f'Insufficient garter length. Need {inches_needed} inches, but only {available_inches} inches available.'
-                                })
-                        except Product.DoesNotExist:
-                            unavailable_materials.append({
-                                'material': 'Selected Garter',
-                                'needed': selected_garter_inches,
-                                'available': 0,
-                                'message': 'Selected garter not found in inventory.'
-                            })
-                    elif not selected_garter_id:
-                        # If no garter is selected, try to find any available garter
-                        garters = Product.objects.filter(
-                            product_type='material',
-                            is_archived=False,
-                            is_active=True
-                        )
-                        # Check if product name or material type contains "garter" (case-insensitive)
-                        garters = [g for g in garters if 'garter' in g.name.lower() or (g.material_type and 'garter' in g.material_type.name.lower())]
-                        if not garters or all(g.quantity == 0 for g in garters):
-                            unavailable_materials.append({
-                                'material': 'Garter',
-                                'needed': 0.85,  # Default: approximately 0.85 meters (converted to inches in actual use)
-                                'available': 0,
-                                'message': 'No garters available in inventory. Please select a garter.'
-                            })
+                unavailable_materials = MaterialDeductionPlanner.check('repair', data)
             
             # Return availability status
             if unavailable_materials:
@@ -3438,667 +1739,124 @@ def api_order_tracking(request):
             order_identifier = data.get('order_identifier')
             
             if order_identifier:
-                tracking_data = get_order_tracking_data(order_identifier)
-                if tracking_data:
-                    return JsonResponse({
-                        'success': True,
-                        'data': tracking_data
-                    })
-                else:
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Order not found'
-                    })
-            else:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Order identifier required'
-                })
-                
-        except json.JSONDecodeError:
-            return JsonResponse({
-                'success': False,
-                'error': 'Invalid JSON data'
-            })
-    
-    return JsonResponse({'error': 'Invalid request method'})
-
-
-@login_required
-def order_receipt_new(request):
-    return render(request, 'business/order_receipt_new.html')
-
-
-@login_required
-def create_order_from_session(request):
-    def safe_json(data):
-        """Helper function to safely serialize JSON with Decimal support"""
-        import json as json_module
-        from decimal import Decimal
-        
-        def convert_decimals(obj):
-            """Recursively convert Decimal values to float in nested structures"""
-            if isinstance(obj, Decimal):
-                return float(obj)
-            elif isinstance(obj, dict):
-                return {str(key): convert_decimals(value) for key, value in obj.items()}
-            elif isinstance(obj, (list, tuple)):
-                return [convert_decimals(item) for item in obj]
-            elif isinstance(obj, (str, int, float, bool, type(None))):
-                return obj
-            elif hasattr(obj, '__dict__'):
-                try:
-                    return convert_decimals(obj.__dict__)
-                except:
-                    return str(obj)
-            else:
-                try:
-                    return str(obj)
-                except:
-                    return None
-        
-        def decimal_default(obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            try:
-                return str(obj)
-            except:
-                return None
-        
-        try:
-            # Convert all Decimals in the data structure first
-            converted_data = convert_decimals(data)
-            # Test serialization
-            json_module.dumps(converted_data, default=decimal_default)
-            return JsonResponse(converted_data, json_dumps_params={'default': decimal_default})
-        except Exception as e:
-            # Fallback: use string conversion for everything
-            return JsonResponse({
-                'success': False,
-                'error': f'Serialization error: {str(e)}'
-            }, json_dumps_params={'default': str})
-    if request.method == 'POST':
-        try:
-            import json
-            from decimal import Decimal
-
-            from django.utils import timezone
-
-            # Get order data from request
-            try:
-                order_data = json.loads(request.body)
-            except json.JSONDecodeError as e:
-                return safe_json({
-                    'success': False,
-                    'error': f'Invalid JSON data: {str(e)}'
-                })
-            
-            # Validate required fields
-            if not order_data.get('customerName'):
-                return safe_json({
-                    'success': False,
-                    'error': 'Customer name is required.'
-                })
-            
-            if not order_data.get('mobileNumber'):
-                return safe_json({
-                    'success': False,
-                    'error': 'Customer mobile number is required.'
-                })
-            
-            if not order_data.get('orderType'):
-                return safe_json({
-                    'success': False,
-                    'error': 'Order type is required.'
-                })
-            
-            if not order_data.get('items') or len(order_data.get('items', [])) == 0:
-                return safe_json({
-                    'success': False,
-                    'error': 'At least one item is required to create an order.'
-                })
-            
-            # Create or get customer - handle duplicates by using filter().first()
-            # If multiple customers exist with same phone, get the first one
-            customer = Customer.objects.filter(phone=order_data['mobileNumber']).first()
-            if not customer:
-                # No customer found, create new one
-                customer = Customer.objects.create(
-                    phone=order_data['mobileNumber'],
-                    name=order_data['customerName'],
-                    email=f"{order_data['customerName'].lower().replace(' ', '')}@example.com"
-                )
-            else:
-                # Customer exists, update name if provided and different
-                if order_data.get('customerName') and customer.name != order_data['customerName']:
-                    customer.name = order_data['customerName']
-                    customer.save()
-            
-            # Build order notes for repair orders
-            notes_parts = []
-            if order_data['orderType'] == 'repair':
-                if order_data.get('repair_urgency'):
-                    urgency_display = 'Urgent' if order_data.get('repair_urgency') == 'urgent' else 'Not Urgent'
-                    notes_parts.append(f'Urgency: {urgency_display}')
-                if order_data.get('sewing_style'):
-                    sewing_style_display = 'Straight Stitch' if order_data.get('sewing_style') == 'straight_stitch' else 'Zigzag Stitch'
-                    notes_parts.append(f'Sewing Style: {sewing_style_display}')
-            
-            order_notes = '; '.join(notes_parts) if notes_parts else ''
-            
-            # Create order
-            # Get payment method from order_data, default to 'cash'
-            payment_method = order_data.get('payment_method', order_data.get('paymentMethod', 'cash'))
-            order = Order.objects.create(
-                customer=customer,
-                order_type=order_data['orderType'],
-                status='pending',
-                total_amount=Decimal(str(order_data['totalCost'])),
-                paid_amount=Decimal(str(order_data['totalCost'])),
-                balance=Decimal('0'),
-                payment_method=payment_method,
-                notes=order_notes
-            )
-            
-            # Generate unique identifier
-            order.generate_order_identifier()
-            order.save()
-            
-            # Create order items
-            for item in order_data['items']:
-                # Get the product ID, name and class from the item
-                product_id = item.get('id') or item.get('product_id')
-                product_name = item.get('name', f"{order_data['orderType']} Service")
-                item_class = item.get('class', 'standard')
-                
-                # For rental orders, find the exact product that was selected
-                if order_data['orderType'] in ['rent', 'rental']:
-                    # First try to find by product ID (most reliable)
-                    if product_id:
-                        try:
-                            product = Product.objects.get(
-                                id=int(product_id),
-                                product_type='rental',
-                                is_active=True
-                            )
-                        except (Product.DoesNotExist, ValueError, TypeError):
-                            product = None
-                    else:
-                        product = None
-                    
-                    # If not found by ID, try to find by exact name
-                    if not product:
-                        try:
-                            product = Product.objects.get(
-                                name=product_name,
-                                product_type='rental',
-                                is_active=True
-                            )
-                        except Product.DoesNotExist:
-                            # Try partial match as last resort
-                            product = Product.objects.filter(
-                                product_type='rental',
-                                name__icontains=product_name,
-                                rental_status='available',
-                                is_active=True
-                            ).first()
-                    
-                    # If still not found, validate that product must exist (do not auto-create)
-                    if not product:
-                        # Try alternative name format
-                        alternative_name = f"Rental - {product_name} (Class {item_class})"
-                        validation = validate_products_exist(
-                            [product_name, alternative_name],
-                            product_type='rental',
-                            order_type='rent'
-                        )
-                        
-                        if not validation['valid']:
-                            return safe_json({
-                                'success': False,
-                                'error': f'Rental product "{product_name}" not found in database. Please add it to inventory first.',
-                                'missing_products': validation['missing_products']
-                            })
-                        
-                        # Try to get by alternative name if original didn't work
-                        try:
-                            product = Product.objects.get(
-                                name=alternative_name,
-                                product_type='rental',
-                                is_archived=False,
-                                is_active=True
-                            )
-                        except Product.DoesNotExist:
-                            return safe_json({
-                                'success': False,
-                                'error': f'Rental product "{product_name}" not found in database. Please add it to inventory first.'
-                            })
-                    
-                    # Check if product is available for rental
-                    if product.rental_status != 'available':
-                        return safe_json({
-                            'success': False, 
-                            'error': f'Product {product.name} is not available for rental (status: {product.rental_status})'
-                        })
-                    
-                    # Update product rental status IMMEDIATELY
-                    product.rental_status = 'rented'
-                    product.current_rental_order = order
-                    product.rental_start_date = timezone.now()
-                    # Set due date (3 days from now for rental)
-                    product.rental_due_date = timezone.now() + timezone.timedelta(days=3)
-                    product.save()
-                    
-                    # Also use update_inventory_for_order for consistency
-                    update_inventory_for_order(product, item.get('quantity', 1), order, 'rent')
-                    
-                else:
-                    # For repair/customize orders, products must exist in inventory
-                    # NO AUTO-CREATION - prevents static data
-                    
-                    # First, try to use customize_product_id if provided (for customize orders)
-                    product = None
-                    if order_data.get('orderType') == 'customize' and order_data.get('customize_product_id'):
-                        try:
-                            product = Product.objects.get(
-                                id=order_data.get('customize_product_id'),
-                                product_type='service',
-                                is_archived=False,
-                                is_active=True
-                            )
-                        except (Product.DoesNotExist, ValueError):
-                            product = None
-                    
-                    # If no product found by ID, try to find by name
-                    if not product:
-                        # For repair orders, try repair-specific formats first
-                        if order_data.get('orderType') == 'repair':
-                            repair_type = product_name.lower().strip()
-                            # Try multiple formats for repair orders
-                            repair_name_formats = [
-                                f"Repair - {repair_type.title()} (Class {item_class})",
-                                f"repair - {repair_type.title()} (Class {item_class})",
-                                f"Repair - {repair_type.title()}",
-                                f"repair - {repair_type.title()}",
-                                f"Repair - {repair_type} (Class {item_class})",
-                                f"repair - {repair_type} (Class {item_class})",
-                                f"{order_data['orderType']} - {product_name} (Class {item_class})",
-                                product_name,  # Try exact name as fallback
-                            ]
-                            
-                            for repair_name_format in repair_name_formats:
-                                try:
-                                    product = Product.objects.get(
-                                        name=repair_name_format,
-                                        product_type='service',
-                                        is_archived=False,
-                                        is_active=True
-                                    )
-                                    break
-                                except Product.DoesNotExist:
-                                    continue
-                            
-                            # If still not found, try case-insensitive search
-                            if not product:
-                                try:
-                                    product = Product.objects.get(
-                                        name__icontains=f"Repair - {repair_type}",
-                                        product_type='service',
-                                        is_archived=False,
-                                        is_active=True
-                                    )
-                                except (Product.DoesNotExist, Product.MultipleObjectsReturned):
-                                    # Try just the repair type in product name
-                                    try:
-                                        product = Product.objects.filter(
-                                            name__icontains=repair_type,
-                                            product_type='service',
-                                            is_archived=False,
-                                            is_active=True
-                                        ).first()
-                                    except:
-                                        pass
-                            
-                            # If still not found, try to use a generic "Repair Service" product as fallback
-                            if not product:
-                                try:
-                                    # Try to find a generic "Repair Service" product
-                                    generic_repair_names = [
-                                        "Repair Service",
-                                        "repair service",
-                                        "Repair - General",
-                                        "repair - general",
-                                        "General Repair Service",
-                                        "general repair service"
-                                    ]
-                                    for generic_name in generic_repair_names:
-                                        try:
-                                            product = Product.objects.get(
-                                                name=generic_name,
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            )
-                                            break
-                                        except Product.DoesNotExist:
-                                            continue
-                                    
-                                    # If generic name not found, try case-insensitive search
-                                    if not product:
-                                        try:
-                                            product = Product.objects.filter(
-                                                name__icontains="repair service",
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            ).first()
-                                        except:
-                                            pass
-                                    
-                                    # Last resort: find ANY active repair service product
-                                    if not product:
-                                        try:
-                                            product = Product.objects.filter(
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True,
-                                                name__icontains="repair"
-                                            ).first()
-                                        except:
-                                            pass
-                                    
-                                    # Auto-create service product if it doesn't exist
-                                    if not product:
-                                        try:
-                                            # Get or create a category for repair services
-                                            from .models import Category
-                                            repair_category, _ = Category.objects.get_or_create(
-                                                name='Repair Services',
-                                                defaults={'description': 'Repair service products'}
-                                            )
-                                            
-                                            # Create the service product
-                                            product = Product.objects.create(
-                                                name=f"Repair - {product_name.title()}",
-                                                product_type='service',
-                                                category=repair_category,
-                                                description=f"Repair service: {product_name}",
-                                                price=Decimal('0'),
-                                                cost=Decimal('0'),
-                                                quantity=0,
-                                                is_active=True,
-                                                is_archived=False
-                                            )
-                                        except Exception as create_error:
-                                            import logging
-                                            logger = logging.getLogger(__name__)
-                                            logger.error(f"Error auto-creating repair service product: {create_error}")
-                                            return safe_json({
-                                                'success': False,
-                                                'error': f'Repair service product "{product_name}" not found in inventory and could not be auto-created. Please add a service product for this repair type to inventory first before creating orders.',
-                                                'missing_products': [product_name]
-                                            })
-                                except Exception as e:
-                                    # Log but don't fail - we'll handle error below
-                                    import logging
-                                    logger = logging.getLogger(__name__)
-                                    logger.warning(f"Error finding generic repair service: {e}")
-                        else:
-                            # For non-repair orders, use standard format
-                            product_name_to_find = f"{order_data['orderType']} - {product_name} (Class {item_class})"
-                            
-                            # Try to find existing product
-                            try:
-                                product = Product.objects.get(
-                                    name=product_name_to_find,
-                                    product_type='service',
-                                    is_archived=False,
-                                    is_active=True
-                                )
-                            except Product.DoesNotExist:
-                                # Try alternative name formats for customize orders
-                                if order_data.get('orderType') == 'customize':
-                                    # Try multiple formats for customize orders
-                                    customize_name_formats = [
-                                        f"Customize - {product_name.title()} (Class {item_class})",
-                                        f"customize - {product_name.title()} (Class {item_class})",
-                                        f"Customize - {product_name.title()}",
-                                        f"customize - {product_name.title()}",
-                                        f"{order_data['orderType']} - {product_name} (Class {item_class})",
-                                        product_name,  # Try exact name as fallback
-                                    ]
-                                    
-                                    for customize_name_format in customize_name_formats:
-                                        try:
-                                            product = Product.objects.get(
-                                                name=customize_name_format,
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            )
-                                            break
-                                        except Product.DoesNotExist:
-                                            continue
-                                    
-                                    # Try case-insensitive search
-                                    if not product:
-                                        try:
-                                            product = Product.objects.filter(
-                                                name__icontains=f"Customize - {product_name}",
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            ).first()
-                                        except:
-                                            pass
-                                    
-                                    # For PE orders, try to find by PE type
-                                    if not product and order_data.get('type_of_customize') == 'pe' and order_data.get('pe_type'):
-                                        pe_type = order_data.get('pe_type', '').title()
-                                        try:
-                                            # Try "PE - {pe_type}" format
-                                            product = Product.objects.filter(
-                                                name__icontains=f"PE - {pe_type}",
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            ).first()
-                                        except:
-                                            # Try just the pe_type
-                                            try:
-                                                product = Product.objects.filter(
-                                                    name__icontains=pe_type,
-                                                    product_type='service',
-                                                    is_archived=False,
-                                                    is_active=True
-                                                ).first()
-                                            except:
-                                                pass
-                                    
-                                    # Try to find any customize service product as fallback
-                                    if not product:
-                                        try:
-                                            product = Product.objects.filter(
-                                                name__icontains="customize",
-                                                product_type='service',
-                                                is_archived=False,
-                                                is_active=True
-                                            ).first()
-                                        except:
-                                            pass
-                                else:
-                                    # For non-customize orders, try alternative name format
-                                    try:
-                                        product = Product.objects.get(
-                                            name=product_name,
-                                            product_type='service',
-                                            is_archived=False,
-                                            is_active=True
-                                        )
-                                    except Product.DoesNotExist:
-                                        pass
-                    
-                    # Final check - ensure product was found before creating OrderItem
-                    if not product:
-                        # Auto-create customize or repair products if they don't exist
-                        if order_data.get('orderType') == 'customize':
-                            try:
-                                from .models import Category
-                                service_category, _ = Category.objects.get_or_create(
-                                    name='Customize Services',
-                                    defaults={'description': 'Customize service products'}
-                                )
-                                
-                                product = Product.objects.create(
-                                    name=product_name,
-                                    product_type='service',
-                                    category=service_category,
-                                    description=f"Customize Service: {product_name}",
-                                    price=Decimal('0'),
-                                    cost=Decimal('0'),
-                                    quantity=0,
-                                    is_active=True,
-                                    is_archived=False
-                                )
-                            except Exception as create_error:
-                                import logging
-                                logger = logging.getLogger(__name__)
-                                logger.error(f"Error auto-creating customize product: {create_error}")
-                                return safe_json({
-                                    'success': False,
-                                    'error': f'Error creating customize service product "{product_name}": {str(create_error)}'
-                                })
-                        elif order_data.get('orderType') == 'repair':
-                            # Auto-create repair product
-                            try:
-                                from .models import Category
-                                service_category, _ = Category.objects.get_or_create(
-                                    name='Repair Services',
-                                    defaults={'description': 'Repair service products'}
-                                )
-                                
-                                suggested_name = f"Repair - {product_name.title()}"
-                                product = Product.objects.create(
-                                    name=suggested_name,
-                                    product_type='service',
-                                    category=service_category,
-                                    description=f"Repair Service: {product_name}",
-                                    price=Decimal('0'),
-                                    cost=Decimal('0'),
-                                    quantity=0,
-                                    is_active=True,
-                                    is_archived=False
-                                )
-                            except Exception as create_error:
-                                import logging
-                                logger = logging.getLogger(__name__)
-                                logger.error(f"Error auto-creating repair product: {create_error}")
-                                return safe_json({
-                                    'success': False,
-                                    'error': f'Error creating repair service product "{product_name}": {str(create_error)}'
-                                })
-                        else:
-                            # For other order types, try to auto-create as well
-                            try:
-                                from .models import Category
-                                service_category, _ = Category.objects.get_or_create(
-                                    name='Services',
-                                    defaults={'description': 'Service products'}
-                                )
-                                
-                                product = Product.objects.create(
-                                    name=product_name,
-                                    product_type='service',
-                                    category=service_category,
-                                    description=f"Service: {product_name}",
-                                    price=Decimal('0'),
-                                    cost=Decimal('0'),
-                                    quantity=0,
-                                    is_active=True,
-                                    is_archived=False
-                                )
-                            except Exception as create_error:
-                                import logging
-                                logger = logging.getLogger(__name__)
-                                logger.error(f"Error auto-creating service product: {create_error}")
-                                return safe_json({
-                                    'success': False,
-                                    'error': f'Service product "{product_name}" not found in inventory and could not be auto-created. Please add it to inventory first before creating orders.'
-                                })
-                
-                # Only create OrderItem if product is valid
-                if product:
-                    # Always fetch the actual product price from database
-                    # Refresh product from database to ensure we have latest price
-                    product.refresh_from_db()
-                    
-                    # Get actual unit price from product database
-                    # Use product.price if available, otherwise fall back to frontend cost
-                    actual_unit_price = product.price if product.price and product.price > 0 else Decimal(str(item.get('cost', 0)))
-                    
-                    # Calculate total price based on actual unit price and quantity
-                    quantity = int(item.get('quantity', 1))
-                    actual_total_price = actual_unit_price * quantity
-                    
-                    # For customize orders, add any additional costs from frontend if product base price is being used
-                    if order_data['orderType'] == 'customize' and product.price and product.price > 0:
-                        # If frontend cost is higher than base product price, it might include additional costs
-                        frontend_cost = Decimal(str(item.get('cost', 0)))
-                        if frontend_cost > actual_total_price:
-                            # Add the difference as additional cost
-                            additional_cost = frontend_cost - actual_total_price
-                            actual_total_price += additional_cost
-                    
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_price=actual_unit_price,
-                        total_price=actual_total_price
-                    )
+                tracking_data = get_order_tracking_data(order_identifier)
+                if tracking_data:
+                    return JsonResponse({
+                        'success': True,
+                        'data': tracking_data
+                    })
                 else:
-                    # This should not happen due to the check above, but add as safety
-                    return safe_json({
+                    return JsonResponse({
                         'success': False,
-                        'error': f'Failed to find product for order item. Product name: "{product_name}"'
+                        'error': 'Order not found'
                     })
+            else:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Order identifier required'
+                })
+                
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON data'
+            })
+    
+    return JsonResponse({'error': 'Invalid request method'})
+
+
+@login_required
+def order_receipt_new(request):
+    return render(request, 'business/order_receipt_new.html')
+
+
+@login_required
+def create_order_from_session(request):
+    def safe_json(data):
+        """Helper function to safely serialize JSON with Decimal support"""
+        import json as json_module
+        from decimal import Decimal
+        
+        def convert_decimals(obj):
+            """Recursively convert Decimal values to float in nested structures"""
+            if isinstance(obj, Decimal):
+                return float(obj)
+            elif isinstance(obj, dict):
+                return {str(key): convert_decimals(value) for key, value in obj.items()}
+            elif isinstance(obj, (list, tuple)):
+                return [convert_decimals(item) for item in obj]
+            elif isinstance(obj, (str, int, float, bool, type(None))):
+                return obj
+            elif hasattr(obj, '__dict__'):
+                try:
+                    return convert_decimals(obj.__dict__)
+                except:
+                    return str(obj)
+            else:
+                try:
+                    return str(obj)
+                except:
+                    return None
+        
+        def decimal_default(obj):
+            if isinstance(obj, Decimal):
+                return float(obj)
+            try:
+                return str(obj)
+            except:
+                return None
+        
+        try:
+            # Convert all Decimals in the data structure first
+            converted_data = convert_decimals(data)
+            # Test serialization
+            json_module.dumps(converted_data, default=decimal_default)
+            return JsonResponse(converted_data, json_dumps_params={'default': decimal_default})
+        except Exception as e:
+            # Fallback: use string conversion for everything
+            return JsonResponse({
+                'success': False,
+                'error': f'Serialization error: {str(e)}'
+            }, json_dumps_params={'default': str})
+    if request.method == 'POST':
+        try:
+            import json
+
+            from .order_creation_manager import OrderCreationError, OrderCreationService
+
+            # Get order data from request
+            try:
+                order_data = json.loads(request.body)
+            except json.JSONDecodeError as e:
+                return safe_json({
+                    'success': False,
+                    'error': f'Invalid JSON data: {str(e)}'
+                })
             
-            # Deduct materials and ensure all are recorded
-            if order_data['orderType'] == 'repair':
-                deduct_repair_materials(order, order_data)
-            elif order_data['orderType'] == 'customize':
-                deduct_customize_materials(order, order_data)
-            
-            # Ensure all materials used are recorded in transactions
-            # This is a safety check to ensure completeness
-            ensure_materials_recorded_for_order(order, order_data)
-            
-            # Recalculate order total based on actual item prices from database
-            from django.db.models import Sum
-            actual_total = order.items.aggregate(total=Sum('total_price'))['total'] or Decimal('0')
+            # The page sends a key per order, so a retried submission returns the first order
+            idempotency_key = request.headers.get('Idempotency-Key') or order_data.get('idempotencyKey')
+            try:
+                order, created = OrderCreationService.create(order_data, idempotency_key=idempotency_key)
+            except OrderCreationError as e:
+                response = {
+                    'success': False,
+                    'error': str(e)
+                }
+                if e.missing_products:
+                    response['missing_products'] = e.missing_products
+                return safe_json(response)
             
-            # Update order with actual total amount
-            order.total_amount = actual_total
-            order.paid_amount = actual_total  # For now, assume full payment
-            order.balance = Decimal('0')
-            order.save()
+            if created:
+                # Ensure all materials used are recorded in transactions
+                ensure_materials_recorded_for_order(order, order_data)
             
             # Note: Sales record will be created automatically when order status changes to 'completed'
-            
-            # Generate QR code
-            qr_data = {
-                'order_id': order.id,
-                'customer_name': customer.name,
-                'total_amount': str(order.total_amount),
-                'order_type': order.order_type,
-                'date': order.created_at.isoformat()
-            }
-            
             return safe_json({
                 'success': True,
                 'order_id': order.id,
                 'order_identifier': order.order_identifier,
-                'message': 'Order created successfully'
+                'duplicate': not created,
+                'message': 'Order created successfully' if created else 'Order was already created'
             })
             
         except Exception as e:
@@ -4142,6 +1900,14 @@ def order_items(request, order_id):
                 messages.error(request, f'Only {product.quantity} {product.name} available in stock.')
                 return redirect('order_items', order_id=order_id)
         
+        # Take stock items first; the deduction is refused if the stock ran out meanwhile
+        customize_service = order.order_type == 'customize' and product.product_type == 'service'
+        if product.product_type != 'rental' and not customize_service:
+            if not InventoryLedger.deduct(product, quantity, reference_order=order, notes=f'Order {order.order_id}'):
+                product.refresh_from_db(fields=['quantity'])
+                messages.error(request, f'Only {product.quantity} {product.name} available in stock.')
+                return redirect('order_items', order_id=order_id)
+        
         # Create order item
         OrderItem.objects.create(
             order=order,
@@ -4159,19 +1925,8 @@ def order_items(request, order_id):
                 reference_order=order,
                 notes=f'Rental order {order.order_id}'
             )
-        else:
-            if order.order_type == 'customize' and product.product_type == 'service':
-                deduct_customize_materials(order)
-            else:
-                InventoryTransaction.objects.create(
-                    product=product,
-                    transaction_type='out',
-                    quantity=-quantity,
-                    reference_order=order,
-                    notes=f'Order {order.order_id}'
-                )
-                product.quantity -= quantity
-                product.save()
+        elif customize_service:
+            deduct_customize_materials(order)
         
         # Update order total
         from decimal import Decimal
@@ -4222,54 +1977,25 @@ def update_order_item(request, order_id, item_id):
                         messages.error(request, f'Only {product.quantity} {product.name} available in stock.')
                         return redirect('order_items', order_id=order_id)
             
-            # Update order item
-            order_item.quantity = new_quantity
-            order_item.save()
-            
-            # Update inventory
+            # Update inventory first; an increase is refused if the stock ran out meanwhile
             if quantity_diff != 0:
                 if product.product_type == 'rental':
                     # For rentals, adjust the rental status
-                    if quantity_diff > 0:
-                        InventoryTransaction.objects.create(
-                            product=product,
-                            transaction_type='rental_out',
-                            quantity=-quantity_diff,
-                            reference_order=order,
-                            notes=f'Updated rental order {order.order_id} - increased quantity'
-                        )
-                        product.quantity -= quantity_diff
-                    else:
-                        InventoryTransaction.objects.create(
-                            product=product,
-                            transaction_type='rental_in',
-                            quantity=abs(quantity_diff),
-                            reference_order=order,
-                            notes=f'Updated rental order {order.order_id} - decreased quantity'
-                        )
-                        product.quantity += abs(quantity_diff)
+                    transaction_type = 'rental_out' if quantity_diff > 0 else 'rental_in'
+                    notes = f'Updated rental order {order.order_id}'
                 else:
                     # For non-rental items
-                    if quantity_diff > 0:
-                        InventoryTransaction.objects.create(
-                            product=product,
-                            transaction_type='out',
-                            quantity=-quantity_diff,
-                            reference_order=order,
-                            notes=f'Updated order {order.order_id} - increased quantity'
-                        )
-                        product.quantity -= quantity_diff
-                    else:
-                        InventoryTransaction.objects.create(
-                            product=product,
-                            transaction_type='in',
-                            quantity=abs(quantity_diff),
-                            reference_order=order,
-                            notes=f'Updated order {order.order_id} - decreased quantity'
-                        )
-                        product.quantity += abs(quantity_diff)
-                
-                product.save()
+                    transaction_type = 'out' if quantity_diff > 0 else 'in'
+                    notes = f'Updated order {order.order_id}'
+                notes += ' - increased quantity' if quantity_diff > 0 else ' - decreased quantity'
+                if not InventoryLedger.adjust(product, -quantity_diff, transaction_type, reference_order=order, notes=notes):
+                    product.refresh_from_db(fields=['quantity'])
+                    messages.error(request, f'Only {product.quantity} {product.name} available.')
+                    return redirect('order_items', order_id=order_id)
+            
+            # Update order item
+            order_item.quantity = new_quantity
+            order_item.save()
             
             # Update order total
             from decimal import Decimal
@@ -4299,11 +2025,8 @@ def delete_order_item(request, order_id, item_id):
             
             # Restore inventory
             if product.product_type == 'rental':
-                InventoryTransaction.objects.create(
-                    product=product,
-                    transaction_type='rental_in',
-                    quantity=quantity,
-                    reference_order=order,
+                InventoryLedger.add(
+                    product, quantity, reference_order=order, transaction_type='rental_in',
                     notes=f'Removed from rental order {order.order_id}'
                 )
                 # Restore rental status if this was the only rental
@@ -4318,19 +2041,9 @@ def delete_order_item(request, order_id, item_id):
                     product.current_rental_order = None
                     product.rental_start_date = None
                     product.rental_due_date = None
-                
-                product.quantity += quantity
+                    product.save(update_fields=['rental_status', 'current_rental_order', 'rental_start_date', 'rental_due_date'])
             else:
-                InventoryTransaction.objects.create(
-                    product=product,
-                    transaction_type='in',
-                    quantity=quantity,
-                    reference_order=order,
-                    notes=f'Removed from order {order.order_id}'
-                )
-                product.quantity += quantity
-            
-            product.save()
+                InventoryLedger.add(product, quantity, reference_order=order, notes=f'Removed from order {order.order_id}')
             
             # Delete order item
             product_name = order_item.product.name
@@ -4391,8 +2104,15 @@ def order_payment(request, order_id):
 
 @login_required
 def order_receipt(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    qr_code = QRCode.objects.filter(order=order).first()
+    from .qr_code_manager import QRCodeManager
+
+    order = get_object_or_404(Order.objects.select_related('customer'), id=order_id)
+    # Generated on first view, and again only after the encoded details changed
+    try:
+        qr_code = QRCodeManager.ensure(order)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"[QR_CODE] Could not generate QR code for order {order.pk}: {str(e)}")
+        qr_code = QRCode.objects.filter(order=order).first()
     
     return render(request, 'business/order_receipt.html', {
         'order': order,
@@ -4498,11 +2218,18 @@ def archive_completed_orders(request):
     """Archive all completed orders - hide them from orders list but keep in reports"""
     if request.method == 'POST':
         # Get all completed orders that are not yet archived
+        from django.db import transaction
+
+        from .change_feed_manager import ChangeFeed
+
         completed_orders = Order.objects.filter(status='completed', is_archived=False)
-        count = completed_orders.count()
+        archived = list(completed_orders.values_list('pk', flat=True))
+        count = len(archived)
         
         # Archive all completed orders
-        completed_orders.update(is_archived=True)
+        with transaction.atomic():
+            Order.objects.filter(pk__in=archived).update(is_archived=True)
+            ChangeFeed.record(Order, archived)
         
         if count > 0:
             messages.success(request, f'Successfully archived {count} completed order(s). They will be hidden from the orders list but remain available in reports.')
@@ -4538,58 +2265,8 @@ def inventory_list(request):
     # else: 'all' - already filtered to exclude service products above
     # Service/customize products are shown in a separate table below, not in these tabs
     
-    # FIX: Check active rental orders to ensure rental products show correct status
-    # Get all products that are in active rental orders (source of truth)
-    from .models import Order, OrderItem
-    active_rental_orders = Order.objects.filter(
-        order_type__in=['rent', 'rental'],
-        status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-    ).prefetch_related('items__product')
-    
-    # Build a set of product IDs that are actually rented (from active orders)
-    actually_rented_product_ids = set()
-    for order in active_rental_orders:
-        for item in order.items.filter(product__product_type='rental'):
-            actually_rented_product_ids.add(item.product.id)
-    
-    # Update rental_status for products that are in active orders but have wrong status
-    # AND fix products that have rental_status='rented' but are NOT in any active order
-    for product in products.filter(product_type='rental'):
-        if product.id in actually_rented_product_ids:
-            # Product is in an active order, ensure it's marked as rented
-            if product.rental_status != 'rented':
-                product.rental_status = 'rented'
-                # Get the order for this product
-                order_item = OrderItem.objects.filter(
-                    product=product,
-                    order__order_type__in=['rent', 'rental'],
-                    order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-                ).select_related('order').first()
-                if order_item and order_item.order:
-                    product.current_rental_order = order_item.order
-                    if not product.rental_start_date:
-                        product.rental_start_date = order_item.order.created_at
-                    if not product.rental_due_date and order_item.order.due_date:
-                        product.rental_due_date = order_item.order.due_date
-                product.save()
-        else:
-            # Product is NOT in any active order, but might still have rental_status='rented'
-            # This happens when orders are returned/completed but product status wasn't updated
-            if product.rental_status == 'rented':
-                # Check if there's any active order for this product
-                has_active_order = OrderItem.objects.filter(
-                    product=product,
-                    order__order_type__in=['rent', 'rental'],
-                    order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-                ).exists()
-                
-                if not has_active_order:
-                    # No active order found, mark as available
-                    product.rental_status = 'available'
-                    product.current_rental_order = None
-                    product.rental_start_date = None
-                    product.rental_due_date = None
-                    product.save()
+    # Rental product statuses are reconciled with active rental orders by the
+    # rental state engine (rental_state_manager), so this view only reads
     
     # Calculate product type statistics - EXCLUDE service products from counts
     rental_products_count = Product.objects.filter(
@@ -4780,10 +2457,9 @@ def add_product_from_estimator(request):
             data = json.loads(request.body)
             
             # Get or create category
-            category, created = Category.objects.get_or_create(
-                name=data.get('category', 'General'),
-                defaults={'description': f'Category for {data.get("category", "General")} products'}
-            )
+            from .reference_data_manager import ReferenceData
+            category_name = data.get('category', 'General')
+            category = ReferenceData.category(category_name, f'Category for {category_name} products')
             
             # Create product
             product = Product.objects.create(
@@ -4873,8 +2549,8 @@ def create_order_from_estimator(request):
             
             data = json.loads(request.body)
             
-            # Create or get customer - handle duplicates by using filter().first()
-            customer = Customer.objects.filter(phone=data.get('mobile_number', '00000000000')).first()
+            # Match the customer on the normalized phone
+            customer = CustomerSearch.by_phone(data.get('mobile_number', '00000000000'))
             if not customer:
                 # No customer found, create new one
                 customer = Customer.objects.create(
@@ -5049,11 +2725,8 @@ def create_order_from_estimator(request):
                         if not product:
                             try:
                                 # Get or create a category for repair services
-                                from .models import Category
-                                repair_category, _ = Category.objects.get_or_create(
-                                    name='Repair Services',
-                                    defaults={'description': 'Repair service products'}
-                                )
+                                from .reference_data_manager import ReferenceData
+                                repair_category = ReferenceData.category('Repair Services', 'Repair service products')
                                 
                                 # Get the repair type or product name from data
                                 repair_type = data.get('repair_type', data.get('repairType', 'repair service'))
@@ -5143,11 +2816,8 @@ def create_order_from_estimator(request):
                 # Auto-create customize product if not found
                 if not product:
                     try:
-                        from .models import Category
-                        service_category, _ = Category.objects.get_or_create(
-                            name='Customize Services',
-                            defaults={'description': 'Customize service products'}
-                        )
+                        from .reference_data_manager import ReferenceData
+                        service_category = ReferenceData.category('Customize Services', 'Customize service products')
                         
                         product = Product.objects.create(
                             name=customize_type,
@@ -5445,101 +3115,15 @@ def track_order(request):
             messages.error(request, 'Please enter an Order ID')
             return render(request, 'business/track_order.html')
         
-        # Try multiple search methods (case-insensitive, includes archived orders)
-        order = None
-        
-        # Normalize the search input - handle variations in format
-        # Convert "TS01REP-037" to also try "TS01REP-O37" and "TS01REP-O037"
-        search_variants = [order_id]
-        
-        # If the format is like "TS01REP-037" (without O), also try "TS01REP-O37" and "TS01REP-O037"
-        if '-' in order_id:
-            parts = order_id.split('-')
-            if len(parts) == 2:
-                prefix = parts[0]
-                number_part = parts[1]
-                
-                # Remove leading zeros from number part for matching
-                number_without_leading_zeros = str(int(number_part)) if number_part.isdigit() else number_part
-                
-                # If the format doesn't have "O" (like "TS01REP-037"), try with "O"
-                if not 'O' in parts[1].upper() and number_part.isdigit():
-                    # Try with O prefix and original number: TS01REP-O037
-                    search_variants.append(f"{prefix}-O{number_part}")
-                    # Try with O prefix and without leading zeros: TS01REP-O37
-                    search_variants.append(f"{prefix}-O{number_without_leading_zeros}")
-                    # Try with O prefix and 2-digit format: TS01REP-O37 (padded)
-                    if len(number_without_leading_zeros) == 1:
-                        search_variants.append(f"{prefix}-O0{number_without_leading_zeros}")
-                    elif len(number_without_leading_zeros) == 2:
-                        search_variants.append(f"{prefix}-O{number_without_leading_zeros}")
-                
-                # If the format has "O" (like "TS01REP-O37"), also try without "O"
-                elif 'O' in parts[1].upper() and number_part.replace('O', '').replace('o', '').isdigit():
-                    number_only = number_part.replace('O', '').replace('o', '')
-                    # Try without O: TS01REP-37
-                    search_variants.append(f"{prefix}-{number_only}")
-                    # Try without O with leading zeros: TS01REP-037
-                    if len(number_only) == 2:
-                        search_variants.append(f"{prefix}-0{number_only}")
-                    elif len(number_only) == 1:
-                        search_variants.append(f"{prefix}-00{number_only}")
-        
-        # Method 1: Try exact match on order_identifier (case-sensitive first for speed)
-        for variant in search_variants:
-            try:
-                order = Order.objects.get(order_identifier=variant)
-                break
-            except Order.DoesNotExist:
-                continue
-        
-        if not order:
-            # Method 2: Try case-insensitive match on order_identifier
-            for variant in search_variants:
-                try:
-                    order = Order.objects.get(order_identifier__iexact=variant)
-                    break
-                except Order.DoesNotExist:
-                    continue
+        from .order_tracking_manager import OrderTracking
+
+        # Any spelling of the identifier ("TS01REP-037", "ts01rep-o37"), the
+        # UUID or the numeric id, in one indexed query (includes archived orders)
+        order = OrderTracking.find(order_id, include_pk=True)
         
         if not order:
-            # Method 3: Try order_id field (UUID) - exact match
-            try:
-                order = Order.objects.get(order_id=order_id)
-            except (Order.DoesNotExist, ValidationError):
-                # Method 4: Try by numeric ID if it's a number
-                try:
-                    if order_id.isdigit():
-                        order = Order.objects.get(id=int(order_id))
-                    else:
-                        # Method 5: Try case-insensitive contains search on order_identifier
-                        # This handles partial matches like "TS01REP" matching "TS01REP-O37"
-                        orders = Order.objects.filter(order_identifier__icontains=order_id)
-                        if orders.exists():
-                            # If multiple matches, prefer exact or closest match
-                            # Try all variants for exact match first
-                            for variant in search_variants:
-                                exact_match = orders.filter(order_identifier__iexact=variant).first()
-                                if exact_match:
-                                    order = exact_match
-                                    break
-                            
-                            # If no exact match, try starts with
-                            if not order:
-                                for variant in search_variants:
-                                    starts_match = orders.filter(order_identifier__istartswith=variant).first()
-                                    if starts_match:
-                                        order = starts_match
-                                        break
-                            
-                            # If still no match, get the first match (most recent)
-                            if not order:
-                                order = orders.order_by('-created_at').first()
-                        else:
-                            raise Order.DoesNotExist
-                except (Order.DoesNotExist, ValueError):
-                    messages.error(request, f'Order "{order_id}" not found. Please check your Order ID and try again.')
-                    return render(request, 'business/track_order.html', {'order_id': order_id})
+            # Partial identifiers like "TS01REP" match the most recent such order
+            order = Order.objects.filter(order_identifier__icontains=order_id).order_by('-created_at').first()
         
         if not order:
             messages.error(request, f'Order "{order_id}" not found. Please check your Order ID and try again.')
@@ -5603,142 +3187,95 @@ def track_result(request):
 
 
 def generate_qr_code(order):
-    """Generate QR code with complete order details"""
-    import json
-
-    from django.utils import timezone
+    """Make sure the order has a QR code for its current details; only re-encodes when they changed"""
+    from .qr_code_manager import QRCodeManager, qr_payload
 
-    # Ensure balance is calculated
-    if not hasattr(order, 'balance') or order.balance is None:
-        order.balance = order.total_amount - order.paid_amount
-    
-    # Prepare order details for QR code (simplified for easier scanning)
-    qr_data = {
-        'id': str(order.order_identifier) if order.order_identifier else str(order.order_id),  # Shortened key
-        'type': order.get_order_type_display() if hasattr(order, 'get_order_type_display') else str(order.order_type),  # Shortened key
-        'customer': order.customer.name if order.customer else 'N/A',  # Shortened key
-        'date': order.created_at.strftime('%Y-%m-%d') if order.created_at else timezone.now().strftime('%Y-%m-%d'),  # Shortened key and format
-        'balance': float(order.balance)  # Keep balance as requested
-    }
-    
-    # Convert to JSON string
-    qr_json = json.dumps(qr_data)
-    
-    # Generate QR code with order details
-    # Use auto version to handle any amount of data
-    # Use higher error correction for better scanning reliability
-    qr = qrcode.QRCode(
-        version=None,  # Auto-select version based on data size
-        box_size=12,  # Slightly larger for better scanning
-        border=4,  # Standard border
-        error_correction=qrcode.constants.ERROR_CORRECT_H  # High error correction for reliability
-    )
-    qr.add_data(qr_json)
-    qr.make(fit=True)
-    
-    # Create image with higher quality
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to file
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    
-    qr_code_obj, created = QRCode.objects.get_or_create(order=order)
-    qr_code_obj.qr_code_image.save(
-        f'qr_{order.order_id}.png',
-        ContentFile(buffer.getvalue()),
-        save=True
-    )
-    
-    return qr_json  # Return the JSON data for debugging/verification
+    QRCodeManager.ensure(order)
+    return qr_payload(order)  # Return the JSON data for debugging/verification
 
 
 def send_sms_notification(order):
-    # This is a placeholder for SMS functionality
-    # In a real implementation, you would integrate with an SMS service
-    SMSNotification.objects.create(
-        order=order,
-        phone_number=order.customer.phone,
-        message=f"Your order {order.order_id} has been confirmed. Total: ₱{order.total_amount}",
-        status='sent'
+    """Queue the order confirmation SMS for the outbox worker"""
+    from .sms_outbox_manager import SMSOutbox
+
+    message = f"Your order {order.order_id} has been confirmed. Total: ₱{order.total_amount}"
+    phone_number = normalize_phone_number(order.customer.phone)
+    if not phone_number.startswith('+'):
+        # The gateway needs a country code; keep a record of the skipped message
+        SMSNotification.objects.create(
+            order=order,
+            phone_number=order.customer.phone[:20],
+            message=message,
+            status='failed',
+            last_error='Phone number has no country code',
+        )
+        return None
+    return SMSOutbox.enqueue(order, phone_number, message)
+
+
+def _report_date_range(request):
+    """Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD filter of the report links"""
+    def parse(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+        except ValueError:
+            return None
+    return parse(request.GET.get('from')), parse(request.GET.get('to'))
+
+
+def _report_sheets(request, report_type):
+    """Sheets of a reports-page export; rows are streamed from the database"""
+    from .export_manager import export_rows, export_section
+
+    if report_type != 'sales':
+        return [(f"{report_type.title()} Report", [])]
+
+    sales = Sales.objects.select_related('order__customer').only(
+        'amount', 'created_at', 'order__order_id', 'order__customer__name'
+    ).order_by('created_at', 'pk')
+    date_from, date_to = _report_date_range(request)
+    if date_from:
+        sales = sales.filter(created_at__date__gte=date_from)
+    if date_to:
+        sales = sales.filter(created_at__date__lte=date_to)
+
+    rows = export_rows(sales, lambda sale: [
+        str(sale.order.order_id),
+        sale.order.customer.name,
+        float(sale.amount),
+        sale.created_at.strftime('%Y-%m-%d'),
+    ])
+    return [("Sales Report", [export_section(
+        headers=['Order ID', 'Customer', 'Amount', 'Date'],
+        rows=rows,
+        widths=[38, 30, 14, 14],
+    )])]
+
+
+def _report_export(request, report_type, export_format):
+    from .export_manager import ExportManager
+
+    return ExportManager.response(
+        export_format,
+        f'{report_type}_report',
+        f"{report_type.title()} Report",
+        _report_sheets(request, report_type),
     )
 
 
 @login_required
 def generate_pdf_report(request, report_type):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{report_type}_report.pdf"'
-    
-    p = canvas.Canvas(response, pagesize=letter)
-    p.drawString(100, 750, f"{report_type.title()} Report")
-    p.drawString(100, 730, f"Generated on: {timezone.now().strftime('%Y-%m-%d %H:%M')}")
-    
-    if report_type == 'sales':
-        sales = Sales.objects.all()
-        y = 700
-        for sale in sales:
-            p.drawString(100, y, f"Order: {sale.order.order_id} - Amount: ₱{sale.amount}")
-            y -= 20
-    
-    p.showPage()
-    p.save()
-    return response
+    return _report_export(request, report_type, 'pdf')
 
 
 @login_required
 def generate_excel_report(request, report_type):
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{report_type}_report.xlsx"'
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"{report_type.title()} Report"
-    
-    if report_type == 'sales':
-        ws['A1'] = 'Order ID'
-        ws['B1'] = 'Customer'
-        ws['C1'] = 'Amount'
-        ws['D1'] = 'Date'
-        
-        row = 2
-        for sale in Sales.objects.all():
-            ws[f'A{row}'] = str(sale.order.order_id)
-            ws[f'B{row}'] = sale.order.customer.name
-            ws[f'C{row}'] = float(sale.amount)
-            ws[f'D{row}'] = sale.created_at.strftime('%Y-%m-%d')
-            row += 1
-    
-    wb.save(response)
-    return response
+    return _report_export(request, report_type, 'xlsx')
 
 
-def normalize_phone_number(raw_phone: str) -> str:
-    """Convert common phone formats to E.164 (+countrycode) when possible."""
-    if not raw_phone:
-        return ''
-    
-    cleaned = ''.join(ch for ch in raw_phone.strip() if ch.isdigit() or ch == '+')
-    if not cleaned:
-        return ''
-    
-    if cleaned.startswith('+'):
-        return cleaned
-    
-    if cleaned.startswith('00'):
-        return '+' + cleaned[2:]
-    
-    if cleaned.startswith('63'):
-        return '+' + cleaned
-    
-    if cleaned.startswith('0') and len(cleaned) in (10, 11):
-        # Assume PH local format (09XXXXXXXXX)
-        return '+63' + cleaned.lstrip('0')
-    
-    if not cleaned.startswith('+'):
-        return '+' + cleaned
-    
-    return cleaned
+@login_required
+def generate_csv_report(request, report_type):
+    return _report_export(request, report_type, 'csv')
 
 
 # ==================== CUSTOMER MANAGEMENT VIEWS ====================
@@ -5750,11 +3287,7 @@ def customer_list(request):
     customers = Customer.objects.all()
     
     if search_query:
-        customers = customers.filter(
-            Q(name__icontains=search_query) |
-            Q(phone__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
+        customers = CustomerSearch.filter(customers, search_query)
     
     # Get customer statistics
     total_customers = customers.count()
@@ -5901,57 +3434,124 @@ def customer_detail(request, customer_id):
         'monthly_spending': monthly_spending,
     }
     
-    return render(request, 'business/customer_detail.html', context)
+    return render(request, 'business/customer_detail.html', context)
+
+
+# ==================== CUSTOMER API VIEWS ====================
+
+@login_required
+def api_customers_list(request):
+    """
+    API endpoint to list customers a page at a time, by name.
+
+    ?limit=<n> sets the page size (default 200, at most 1000) and
+    ?cursor=<next_cursor> continues after the previous page. With
+    ?updated_since=<ISO timestamp> only customers changed at or after that
+    time are listed, oldest change first, so a client can fetch deltas and
+    keep the largest updated_at it saw for the next call. Responses carry
+    ETag and Last-Modified; a matching conditional request gets a 304.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    
+    from django.utils.dateparse import parse_datetime
+
+    from .keyset_manager import InvalidCursor, KeysetPaginator, conditional_json
+
+    customers = Customer.objects.all()
+    ordering = ('name', 'id')
+    updated_since = request.GET.get('updated_since')
+    if updated_since:
+        try:
+            since = parse_datetime(updated_since)
+        except ValueError:
+            since = None
+        if since is None:
+            return JsonResponse({'success': False, 'error': 'updated_since must be an ISO 8601 timestamp'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        customers = customers.filter(updated_at__gte=since)
+        ordering = ('updated_at', 'id')
+    
+    paginator = KeysetPaginator(
+        customers.annotate(order_count=Count('order')).values(
+            'id', 'name', 'phone', 'email', 'address', 'created_at', 'updated_at', 'order_count'
+        ),
+        ordering,
+        limit=request.GET.get('limit'),
+    )
+
+    def build():
+        rows, next_cursor = paginator.page(request.GET.get('cursor'))
+        return {
+            'success': True,
+            'customers': [
+                {
+                    **row,
+                    'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+                    'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None,
+                }
+                for row in rows
+            ],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        }
+
+    try:
+        return conditional_json(request, customers, build)
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e), 'customers': []}, status=400)
+    except Exception as e:
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error in api_customers_list: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'error': f'Error loading customers: {str(e)}',
+            'customers': []
+        }, status=500)
+
+
+@login_required
+def api_customer_typeahead(request):
+    """API endpoint for customer lookup during order entry: ?q=<name, email or phone>&limit=<n>"""
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    
+    try:
+        limit = int(request.GET.get('limit', TYPEAHEAD_LIMIT))
+    except ValueError:
+        limit = TYPEAHEAD_LIMIT
+    
+    try:
+        results = CustomerSearch.typeahead(request.GET.get('q', ''), limit=limit)
+    except Exception as e:
+        logger = logging.getLogger(__name__)
+        logger.error(f"[CUSTOMER_SEARCH] Typeahead failed: {str(e)}")
+        return JsonResponse({'success': False, 'error': 'Error searching customers', 'results': []}, status=500)
+    
+    return JsonResponse({'success': True, 'results': results})
 
 
-# ==================== CUSTOMER API VIEWS ====================
-
 @login_required
-def api_customers_list(request):
-    """API endpoint to get list of customers"""
-    if request.method == 'GET':
-        try:
-            customers = Customer.objects.all().order_by('name')
-            customers_data = []
-            
-            for customer in customers:
-                try:
-                    created_at = customer.created_at.isoformat() if customer.created_at else None
-                    order_count = customer.order_set.count() if hasattr(customer, 'order_set') else 0
-                    
-                    customers_data.append({
-                        'id': customer.id,
-                        'name': customer.name or '',
-                        'phone': customer.phone or '',
-                        'email': customer.email or '',
-                        'address': customer.address or '',
-                        'created_at': created_at,
-                        'order_count': order_count
-                    })
-                except Exception as e:
-                    # Skip problematic customer and continue
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error processing customer {customer.id}: {str(e)}")
-                    continue
-            
-            return JsonResponse({
-                'success': True,
-                'customers': customers_data
-            })
-        except Exception as e:
-            import traceback
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error in api_customers_list: {str(e)}")
-            traceback.print_exc()
-            return JsonResponse({
-                'success': False,
-                'error': f'Error loading customers: {str(e)}',
-                'customers': []
-            }, status=500)
-    
-    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+def api_changes(request):
+    """
+    API endpoint for offline clients to pull product, customer and order
+    changes: ?since=<cursor>&limit=<n> lists rows written or deleted after
+    the cursor, each once with its current data or as a tombstone, and the
+    cursor to send next. ``reset`` means the client must reload its lists.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+
+    from .change_feed_manager import ChangeFeed
+
+    since = request.GET.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'since must be a cursor from an earlier response'}, status=400)
+
+    return JsonResponse({'success': True, **ChangeFeed.changes(since, limit=request.GET.get('limit'))})
 
 
 @login_required
@@ -5991,80 +3591,43 @@ def api_products_list(request):
     """API endpoint to get list of rental products (excludes customize/service products)"""
     if request.method == 'GET':
         try:
-            from .models import OrderItem
-            from .rental_manager import RentalStatusManager
+            from .image_rendition_manager import ImageRenditions
+            from .rental_manager import RentalStatusResolver
 
-            # Only return rental products, exclude service/customize products
-            products = Product.objects.filter(
+            # Only return rental products, exclude service/customize products.
+            # The resolver annotates each product with its latest active rental
+            # order and derived state, so this is a single query
+            products = RentalStatusResolver.annotate(Product.objects.filter(
                 product_type='rental',
                 is_active=True,
                 is_archived=False
-            ).select_related('category').order_by('name')
-            
-            # DIRECT APPROACH: Get all products that are in active rental orders
-            # This is the source of truth - check OrderItems directly
-            from .models import Order
-            active_rental_orders = Order.objects.filter(
-                order_type__in=['rent', 'rental'],
-                status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-            ).prefetch_related('items__product')
-            
-            # Build a set of product IDs that are actually rented (from active orders)
-            actually_rented_product_ids = set()
-            for order in active_rental_orders:
-                for item in order.items.filter(product__product_type='rental'):
-                    actually_rented_product_ids.add(item.product.id)
-            
-            # Get accurate rental status for all products (for additional info)
-            rental_status_data = RentalStatusManager.get_rental_status_for_all_products()
+            ).select_related('category').order_by('name'))
             
             products_data = []
             
             for product in products:
-                # Check if product is in active rental orders (DIRECT CHECK - most reliable)
-                is_actually_rented = product.id in actually_rented_product_ids
+                # An active rental order holding the product is the source of truth
+                is_actually_rented = product.active_order_id is not None
                 
-                # FIX: If product has rental_status='rented' but is NOT in any active order,
-                # it means the order was returned but product status wasn't updated
-                # Mark it as available and update the database
+                # A product still marked 'rented' without an active order was
+                # returned but not yet released by the rental state engine;
+                # report it as available without writing from this GET
                 if product.rental_status == 'rented' and not is_actually_rented:
-                    # Double-check: verify there's no active order
-                    has_active_order = OrderItem.objects.filter(
-                        product=product,
-                        order__order_type__in=['rent', 'rental'],
-                        order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-                    ).exists()
-                    
-                    if not has_active_order:
-                        # No active order found, fix the product status
-                        product.rental_status = 'available'
-                        product.current_rental_order = None
-                        product.rental_start_date = None
-                        product.rental_due_date = None
-                        product.save()
-                
-                # Get additional status info from RentalStatusManager
-                product_status = rental_status_data.get(product.id, {})
-                accurate_rental_status = product_status.get('rental_status', product.rental_status or 'available')
-                
-                # Use the direct check result - if it's in an active order, it's rented
-                if is_actually_rented:
-                    accurate_rental_status = 'rented'
-                    is_rented = True
+                    accurate_rental_status = 'available'
+                    is_rented = False
+                    is_overdue = is_almost_due = False
                 else:
-                    # Fall back to RentalStatusManager result
-                    is_rented = product_status.get('is_rented', False) or product.rental_status == 'rented'
-                    if not is_rented:
+                    is_rented = product.rental_is_rented
+                    is_overdue = product.rental_state in ['overdue', 'almost_due']
+                    is_almost_due = product.rental_state == 'almost_due'
+                    if is_overdue:
+                        # Almost due is shown as overdue
+                        accurate_rental_status = 'overdue'
+                    elif is_rented:
+                        accurate_rental_status = 'rented'
+                    else:
                         accurate_rental_status = product.rental_status or 'available'
                 
-                # Check for overdue or almost due status
-                is_overdue = product_status.get('is_overdue', False) or product.is_overdue
-                is_almost_due = product.is_almost_due if hasattr(product, 'is_almost_due') else False
-                
-                # If almost due or overdue, update status
-                if is_overdue or is_almost_due:
-                    accurate_rental_status = 'overdue'
-                
                 # Determine if product is available
                 # For rental items, quantity doesn't matter - they're unique items
                 # Availability is based on rental_status only
@@ -6077,8 +3640,8 @@ def api_products_list(request):
                     'id': product.id,
                     'name': product.name,
                     'price': float(product.price) if product.price else 0.0,
-                    'image': product.image.url if product.image else None,
-                    'image_url': product.image.url if product.image else None,
+                    'image': ImageRenditions.url(product.image, 'medium'),
+                    'image_url': ImageRenditions.url(product.image, 'medium'),
                     'product_type': product.product_type,
                     'quantity': product.quantity,
                     'is_available': is_available,
@@ -6096,35 +3659,27 @@ def api_products_list(request):
         except Exception as e:
             import traceback
             traceback.print_exc()
-            # Fallback to basic product data if RentalStatusManager fails
+            # Fallback to basic product data if the status resolver fails
+            from .models import OrderItem
             products = Product.objects.filter(
                 product_type='rental',
                 is_active=True,
                 is_archived=False
             ).select_related('category').order_by('name')
             
+            # Products in active rental orders, in one query
+            actually_rented_product_ids = set(OrderItem.objects.filter(
+                product__product_type='rental',
+                order__order_type__in=['rent', 'rental'],
+                order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
+            ).values_list('product_id', flat=True))
+            
             products_data = []
             for product in products:
-                # FIX: For rental items, check if they're actually in active orders
-                is_actually_rented = False
-                if product.rental_status == 'rented':
-                    # Check if product is in an active order
-                    from .models import Order, OrderItem
-                    has_active_order = OrderItem.objects.filter(
-                        product=product,
-                        order__order_type__in=['rent', 'rental'],
-                        order__status__in=['rented', 'pending', 'almost_due', 'due', 'overdue', 'in_progress']
-                    ).exists()
-                    
-                    if not has_active_order:
-                        # No active order, fix the status
-                        product.rental_status = 'available'
-                        product.current_rental_order = None
-                        product.rental_start_date = None
-                        product.rental_due_date = None
-                        product.save()
-                    else:
-                        is_actually_rented = True
+                is_actually_rented = product.id in actually_rented_product_ids
+                if product.rental_status == 'rented' and not is_actually_rented:
+                    # No active order; the rental state engine will release it
+                    product.rental_status = 'available'
                 
                 # For rental items, availability is based on rental_status, not quantity
                 if product.product_type == 'rental':
@@ -6136,8 +3691,8 @@ def api_products_list(request):
                     'id': product.id,
                     'name': product.name,
                     'price': float(product.price) if product.price else 0.0,
-                    'image': product.image.url if product.image else None,
-                    'image_url': product.image.url if product.image else None,
+                    'image': ImageRenditions.url(product.image, 'medium'),
+                    'image_url': ImageRenditions.url(product.image, 'medium'),
                     'product_type': product.product_type,
                     'quantity': product.quantity,
                     'is_available': is_available,
@@ -6156,12 +3711,20 @@ def api_products_list(request):
 
 @login_required
 def api_zippers_list(request):
-    """API endpoint to get all zippers from materials for repair brochure"""
+    """API endpoint to get all zippers from materials for repair brochure (cached until materials change)"""
+    from .catalog_cache_manager import CatalogCache
+
+    return CatalogCache.response(request, 'zippers', _zippers_catalog)
+
+
+def _zippers_catalog():
+    """Payload of api_zippers_list"""
     try:
-        from .models import MaterialType
+        from .image_rendition_manager import ImageRenditions
+        from .reference_data_manager import ReferenceData
 
         # Get zipper material type
-        zipper_type = MaterialType.objects.filter(name__icontains='zipper').first()
+        zipper_type = ReferenceData.material_type_containing('zipper')
         
         # Get all active zipper materials
         if zipper_type:
@@ -6202,7 +3765,7 @@ def api_zippers_list(request):
                 image_url = None
                 if zipper.image:
                     try:
-                        image_url = zipper.image.url
+                        image_url = ImageRenditions.url(zipper.image, 'medium')
                     except Exception:
                         # Image field exists but file is missing or inaccessible
                         image_url = None
@@ -6225,31 +3788,39 @@ def api_zippers_list(request):
                 logger.warning(f"Error processing zipper {zipper.id}: {str(item_error)}")
                 continue
         
-        return JsonResponse({
+        return {
             'success': True,
             'zippers': zippers_list,
             'count': len(zippers_list)
-        })
+        }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return JsonResponse({
+        return {
             'success': False,
             'error': str(e),
             'zippers': [],
             'count': 0
-        })
+        }
 
 
 @login_required
 def api_buttons_list(request):
-    """API endpoint to get all buttons from materials for repair brochure"""
+    """API endpoint to get all buttons from materials for repair brochure (cached until materials change)"""
+    from .catalog_cache_manager import CatalogCache
+
+    return CatalogCache.response(request, 'buttons', _buttons_catalog)
+
+
+def _buttons_catalog():
+    """Payload of api_buttons_list"""
     try:
-        from .models import MaterialType
+        from .image_rendition_manager import ImageRenditions
+        from .reference_data_manager import ReferenceData
 
         # Get buttons material type
-        buttons_type = MaterialType.objects.filter(name__icontains='button').first()
+        buttons_type = ReferenceData.material_type_containing('button')
         
         # Get all active button materials
         if buttons_type:
@@ -6289,7 +3860,7 @@ def api_buttons_list(request):
             image_url = None
             if button.image:
                 try:
-                    image_url = button.image.url
+                    image_url = ImageRenditions.url(button.image, 'medium')
                 except Exception:
                     # Image field exists but file is missing or inaccessible
                     image_url = None
@@ -6306,31 +3877,39 @@ def api_buttons_list(request):
                 'cost': float(button.cost) if button.cost else 0.0
             })
         
-        return JsonResponse({
+        return {
             'success': True,
             'buttons': buttons_list,
             'count': len(buttons_list)
-        })
+        }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return JsonResponse({
+        return {
             'success': False,
             'error': str(e),
             'buttons': [],
             'count': 0
-        })
+        }
 
 
 @login_required
 def api_patches_list(request):
-    """API endpoint to get all patches from materials for repair brochure"""
+    """API endpoint to get all patches from materials for repair brochure (cached until materials change)"""
+    from .catalog_cache_manager import CatalogCache
+
+    return CatalogCache.response(request, 'patches', _patches_catalog)
+
+
+def _patches_catalog():
+    """Payload of api_patches_list"""
     try:
-        from .models import MaterialType
+        from .image_rendition_manager import ImageRenditions
+        from .reference_data_manager import ReferenceData
 
         # Get patches material type
-        patches_type = MaterialType.objects.filter(name__icontains='patch').first()
+        patches_type = ReferenceData.material_type_containing('patch')
         
         # Get all active patch materials
         if patches_type:
@@ -6370,7 +3949,7 @@ def api_patches_list(request):
             image_url = None
             if patch.image:
                 try:
-                    image_url = patch.image.url
+                    image_url = ImageRenditions.url(patch.image, 'medium')
                 except Exception:
                     # Image field exists but file is missing or inaccessible
                     image_url = None
@@ -6387,27 +3966,35 @@ def api_patches_list(request):
                 'cost': float(patch.cost) if patch.cost else 0.0
             })
         
-        return JsonResponse({
+        return {
             'success': True,
             'patches': patches_list,
             'count': len(patches_list)
-        })
+        }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return JsonResponse({
+        return {
             'success': False,
             'error': str(e),
             'patches': [],
             'count': 0
-        })
+        }
 
 
 @login_required
 def api_locks_list(request):
-    """API endpoint to get all locks/kawit from materials for repair brochure"""
+    """API endpoint to get all locks/kawit from materials for repair brochure (cached until materials change)"""
+    from .catalog_cache_manager import CatalogCache
+
+    return CatalogCache.response(request, 'locks', _locks_catalog)
+
+
+def _locks_catalog():
+    """Payload of api_locks_list"""
     try:
+        from .image_rendition_manager import ImageRenditions
         from .models import MaterialType
 
         # Get locks/kawit material type - prioritize exact matches and variations
@@ -6486,7 +4073,7 @@ def api_locks_list(request):
             image_url = None
             if lock.image:
                 try:
-                    image_url = lock.image.url
+                    image_url = ImageRenditions.url(lock.image, 'medium')
                 except Exception:
                     # Image field exists but file is missing or inaccessible
                     image_url = None
@@ -6503,31 +4090,39 @@ def api_locks_list(request):
                 'cost': float(lock.cost) if lock.cost else 0.0
             })
         
-        return JsonResponse({
+        return {
             'success': True,
             'locks': locks_list,
             'count': len(locks_list)
-        })
+        }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return JsonResponse({
+        return {
             'success': False,
             'error': str(e),
             'locks': [],
             'count': 0
-        })
+        }
 
 
 @login_required
 def api_garters_list(request):
-    """API endpoint to get all garters from materials for repair brochure"""
+    """API endpoint to get all garters from materials for repair brochure (cached until materials change)"""
+    from .catalog_cache_manager import CatalogCache
+
+    return CatalogCache.response(request, 'garters', _garters_catalog)
+
+
+def _garters_catalog():
+    """Payload of api_garters_list"""
     try:
-        from .models import MaterialType
+        from .image_rendition_manager import ImageRenditions
+        from .reference_data_manager import ReferenceData
 
         # Get garter material type
-        garter_type = MaterialType.objects.filter(name__icontains='garter').first()
+        garter_type = ReferenceData.material_type_containing('garter')
         
         # Get all active garter materials
         if garter_type:
@@ -6567,7 +4162,7 @@ def api_garters_list(request):
             image_url = None
             if garter.image:
                 try:
-                    image_url = garter.image.url
+                    image_url = ImageRenditions.url(garter.image, 'medium')
                 except Exception:
                     # Image field exists but file is missing or inaccessible
                     image_url = None
@@ -6584,21 +4179,21 @@ def api_garters_list(request):
                 'cost': float(garter.cost) if garter.cost else 0.0
             })
         
-        return JsonResponse({
+        return {
             'success': True,
             'garters': garters_list,
             'count': len(garters_list)
-        })
+        }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return JsonResponse({
+        return {
             'success': False,
             'error': str(e),
             'garters': [],
             'count': 0
-        })
+        }
 
 
 @login_required
@@ -6613,16 +4208,20 @@ def api_thread_availability(request):
                 'error': 'Thread color is required'
             })
         
-        availability = check_thread_availability(thread_color)
-        
-        return JsonResponse({
-            'success': True,
-            'available': availability['available'],
-            'quantity': availability['quantity'],
-            'found': availability['found'],
-            'unit': availability.get('unit', 'meters'),
-            'color': thread_color
-        })
+        from .catalog_cache_manager import CatalogCache
+
+        def build():
+            availability = check_thread_availability(thread_color)
+            return {
+                'success': True,
+                'available': availability['available'],
+                'quantity': availability['quantity'],
+                'found': availability['found'],
+                'unit': availability.get('unit', 'meters'),
+                'color': thread_color
+            }
+
+        return CatalogCache.response(request, 'thread_availability', build, variant=thread_color)
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
@@ -6913,10 +4512,8 @@ def add_customize_product(request):
         
         # Get or create category
         if category_name:
-            category_obj, created = Category.objects.get_or_create(
-                name=category_name,
-                defaults={'description': f'Category for {category_name} products'}
-            )
+            from .reference_data_manager import ReferenceData
+            category_obj = ReferenceData.category(category_name, f'Category for {category_name} products')
         
         # Validate required fields manually
         name = request.POST.get('name', '').strip()
@@ -7274,11 +4871,12 @@ def edit_material(request, product_id):
 
     from .forms import MaterialProductForm
     from .models import MaterialType
+    from .reference_data_manager import ReferenceData
     
     product = get_object_or_404(Product, id=product_id, product_type='material')
     
     # Get all material types for the dropdown
-    material_types = MaterialType.objects.exclude(name__iexact='locks').exclude(name__iexact='elastic').order_by('name')
+    material_types = ReferenceData.picker_material_types()
     
     if request.method == 'POST':
         # For editing, we'll update fields directly to preserve user input
@@ -7398,15 +4996,8 @@ def restock_material(request, product_id):
         try:
             restock_quantity = int(restock_quantity)
             if restock_quantity > 0:
-                product.quantity += restock_quantity
-                product.current_quantity_in_stock = product.quantity
-                product.save()
-                
-                # Create inventory transaction
-                InventoryTransaction.objects.create(
-                    product=product,
-                    transaction_type='in',
-                    quantity=restock_quantity,
+                InventoryLedger.add(
+                    product, restock_quantity,
                     notes=f'Restocked {restock_quantity} {product.unit_of_measurement or "units"}'
                 )
                 
@@ -7424,6 +5015,8 @@ def restock_material(request, product_id):
 def api_customize_products_list(request):
     """API endpoint to get list of customize products"""
     if request.method == 'GET':
+        from .image_rendition_manager import ImageRenditions
+
         # Get customize products (service type products with images, excluding repair products)
         # Only products added via "Add Customize Product" or uploaded in order form
         customize_products = Product.objects.filter(
@@ -7444,7 +5037,7 @@ def api_customize_products_list(request):
                 'name': product.name,
                 'description': product.description or '',
                 'price': float(product.price) if product.price else 0.0,
-                'image_url': product.image.url if product.image else None,
+                'image_url': ImageRenditions.url(product.image, 'medium'),
                 'category': product.category.name if product.category else None,
                 'created_at': product.created_at.isoformat() if product.created_at else None
             })
@@ -7531,7 +5124,8 @@ def upload_customize_image_immediate(request):
             # Set category if available
             if type_of_customize == 'uniform' and customize_type:
                 category_name = f"Uniform {customize_type.replace('_', ' ').title()}"
-                category, _ = Category.objects.get_or_create(name=category_name)
+                from .reference_data_manager import ReferenceData
+                category = ReferenceData.category(category_name)
                 product.category = category
                 product.save()
             
@@ -8438,22 +6032,19 @@ def api_adjust_stock(request, product_id):
             adjustment = int(data.get('adjustment', 0))
             notes = data.get('notes', '')
             
-            old_quantity = product.quantity
-            product.quantity = max(0, product.quantity + adjustment)
-            product.save()
-            
-            # Create inventory transaction
-            InventoryTransaction.objects.create(
-                product=product,
-                transaction_type='in' if adjustment > 0 else 'out',
-                quantity=abs(adjustment),
-                notes=notes or f'Stock adjustment: {adjustment:+d}'
+            # Deductions beyond the stock on hand bring it down to 0
+            entry = InventoryLedger.adjust(
+                product, adjustment, 'in' if adjustment > 0 else 'out',
+                notes=notes or f'Stock adjustment: {adjustment:+d}', clamp=True
             )
+            applied = entry.quantity if entry else 0
+            if not entry:
+                product.refresh_from_db(fields=['quantity'])
             
             return JsonResponse({
                 'success': True,
                 'message': 'Stock adjusted successfully',
-                'old_quantity': old_quantity,
+                'old_quantity': product.quantity - applied,
                 'new_quantity': product.quantity,
                 'adjustment': adjustment
             })
@@ -8748,15 +6339,16 @@ def reports_dashboard(request):
     else:
         date_to_display = timezone.now().strftime('%Y-%m-%d')
     
-    # Overall statistics (all time)
-    total_orders = Order.objects.filter(is_archived=False).count()
-    completed_orders = Order.objects.filter(status='completed', is_archived=False).count()
-    pending_orders = Order.objects.filter(status='pending', is_archived=False).count()
+    # Overall statistics (all time) from the daily rollups
+    from .rollup_manager import SalesRollupManager
+
+    status_counts = SalesRollupManager.order_status_counts(include_archived=False)
+    total_orders = sum(status_counts.values())
+    completed_orders = status_counts.get('completed', 0)
+    pending_orders = status_counts.get('pending', 0)
     
     # Total revenue (all time)
-    total_revenue = Sales.objects.filter(order__status='completed').aggregate(
-        total=Sum('amount')
-    )['total'] or 0
+    total_revenue = SalesRollupManager.sales_totals()['total_sales']
     
     # Completed orders in date range
     completed_orders_range = Order.objects.filter(
@@ -9779,56 +7371,16 @@ def send_sms(request):
                     'error': 'Phone number must include the country code (e.g. +639XXXXXXXXX)'
                 }, status=400)
             
-            sms = SMSNotification.objects.create(
-                order=order,
-                phone_number=normalized_phone,
-                message=message,
-                status='pending'
-            )
+            # Sent by the SMS outbox worker; the request does not wait for the gateway
+            from .sms_outbox_manager import SMSOutbox
+            sms = SMSOutbox.enqueue(order, normalized_phone, message)
             
-            try:
-                
-                # twilio_message = client.messages.create(from_=settings.TWILIO_PHONE_NUMBER, to=normalized_phone, body=message)
-                # curl -X POST -u <username>:<password> \
-                # -H "Content-Type: application/json" \
-                # -d '{ "textMessage": { "text": "Hello, world!"}, "phoneNumbers": ["+79990001234", "+79995556677"] }' \
-                # http://<device_local_ip>:8080/message
-
-                url = "http://10.27.63.146:8080/message"
-
-                payload = {
-                    "textMessage": {
-                        "text": message
-                    },
-                    "phoneNumbers": [
-                        normalized_phone,
-                    ]
-                }
-
-                response = requests.post(
-                    url,
-                    json=payload,
-                    auth=HTTPBasicAuth("sms", "Q4L35hBv"),
-                    headers={"Content-Type": "application/json"}
-                )
-
-                print("Status code:", response.status_code)
-                print("Response:", response.text)
-
-                sms.status = 'sent'
-                sms.sent_at = timezone.now()
-                sms.save(update_fields=['status', 'sent_at'])
-                
-                return JsonResponse({
-                    'success': True,
-                    'message': 'SMS sent successfully',
-                    'sms_id': sms.id,
-                    # 'twilio_sid': twilio_message.sid
-                })
-            except Exception as exc:
-                sms.status = 'failed'
-                sms.save(update_fields=['status'])
-                raise exc
+            return JsonResponse({
+                'success': True,
+                'message': 'SMS queued for sending',
+                'sms_id': sms.id,
+                'status': sms.status,
+            })
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -10280,6 +7832,22 @@ def api_fix_order_identifiers(request):
     return JsonResponse({'success': False, 'error': 'Not implemented'})
 
 
+@login_required
+def api_query_stats(request):
+    """Staff-only: rolling per-view SQL query statistics (POST resets them)"""
+    from .query_stats_manager import QueryStats
+
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'success': False, 'error': 'Staff only'}, status=403)
+    if request.method == 'POST':
+        QueryStats.reset()
+    return JsonResponse({
+        'success': True,
+        'window': QueryStats.window,
+        'views': QueryStats.snapshot(),
+    })
+
+
 @login_required
 def api_fix_static_orders(request):
     """API endpoint to fix static orders"""
@@ -10476,14 +8044,16 @@ def quick_nav_check(request):
 @login_required
 def api_autosave_sync(request):
     """
-    API endpoint to sync auto-saved data from frontend to backend.
-    Ensures all changes are persisted.
+    API endpoint to sync auto-saved data from frontend to backend: the
+    drafts of every form and page state changed since the last sync in one
+    request (``data``: key -> contents), and the keys of cleared ones
+    (``deleted``), stored as the user's form drafts.
     """
     if request.method == 'POST':
         try:
             import json
 
-            from .persistence_manager import ChangeTracker
+            from .form_draft_manager import FormDrafts
             
             # Handle empty request body
             if not request.body:
@@ -10494,42 +8064,27 @@ def api_autosave_sync(request):
             except json.JSONDecodeError:
                 return JsonResponse({'success': True, 'synced': 0, 'message': 'Invalid or empty JSON'})
             
-            sync_data = data.get('data', {})
-            timestamp = data.get('timestamp')
+            sync_data = data.get('data') or {}
+            deleted = data.get('deleted') or []
+            if not isinstance(sync_data, dict) or not isinstance(deleted, list):
+                return JsonResponse({'success': False, 'error': 'data must be an object and deleted a list'}, status=400)
             
-            # Process each saved item
-            synced_count = 0
-            logger = logging.getLogger(__name__)
-            for key, value in sync_data.items():
-                try:
-                    # Only track sync for non-modal forms (modal forms are temporary)
-                    # Skip autosave forms from modals to reduce log noise
-                    if 'addStaffForm' in key or 'editStaffForm' in key:
-                        # Skip logging for modal forms - they're temporary
-                        synced_count += 1
-                        continue
-                    
-                    # Log the sync for tracking (only for non-modal forms)
-                    ChangeTracker.track_change(
-                        model_name='AutoSave',
-                        object_id=key,
-                        action='sync',
-                        changes={'data': value, 'timestamp': timestamp}
-                    )
-                    synced_count += 1
-                except Exception as e:
-                    logger.warning(f"Failed to sync item {key}: {str(e)}")
+            stats = FormDrafts.sync(request.user, sync_data, deleted)
+            synced_count = stats['saved'] + stats['unchanged'] + stats['skipped']
             
             return JsonResponse({
                 'success': True,
                 'message': f'Synced {synced_count} items',
                 'synced_count': synced_count,
+                'saved': stats['saved'],
+                'unchanged': stats['unchanged'],
+                'deleted': stats['deleted'],
                 'timestamp': timezone.now().isoformat()
             })
             
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger = logging.getLogger(__name__)
+            logger.exception(f"[FORM_DRAFTS] Auto-save sync failed: {e}")
             return JsonResponse({
                 'success': False,
                 'error': str(e)
@@ -10581,6 +8136,33 @@ def api_autosave_sync(request):
     # return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 
+@login_required
+@require_http_methods(["POST"])
+def api_sync_batch(request):
+    """
+    Apply operations the offline app queued - orders, customers, products
+    and form posts - in one request; one result per operation, in order.
+    """
+    from .offline_sync_manager import BatchSync, BatchSyncError
+
+    try:
+        operations = json.loads(request.body).get('operations')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'}, status=400)
+    try:
+        results = BatchSync.apply(request, operations)
+    except BatchSyncError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'limit': BatchSync.limit()}, status=400)
+
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    return JsonResponse({
+        'success': True,
+        'results': results,
+        'applied': len(results) - failed,
+        'failed': failed,
+    })
+
+
 # ============================================
 # STAFF MANAGEMENT VIEWS
 # ============================================
@@ -10763,416 +8345,153 @@ def staff_management(request):
     return render(request, 'business/staff_management.html', context)
 
 
-@login_required
-def staff_report_pdf(request):
-    """Generate comprehensive PDF report of all staff with detailed information"""
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="staff_detailed_report.pdf"'
-    
-    doc = SimpleDocTemplate(response, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
-    story = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1e3a8a'),
-        spaceAfter=30,
-        alignment=TA_CENTER
+def _staff_report_sheets():
+    """
+    Summary sheet plus one sheet per staff member. Per-staff totals come from
+    two grouped queries; order and withdrawal rows are streamed.
+    """
+    from decimal import Decimal
+    from .export_manager import export_rows, export_section
+    from .models import StaffWithdrawal
+
+    staff_members = list(
+        User.objects.filter(is_staff=True, is_active=True).select_related('staff_profile').order_by('first_name', 'username')
     )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=12,
-        spaceBefore=12
+    completed = Order.objects.filter(status='completed', order_type__in=['repair', 'customize'])
+    order_totals = {
+        row['assigned_staff']: (row['count'], row['total'] or Decimal('0'))
+        for row in completed.filter(assigned_staff__isnull=False).values('assigned_staff').annotate(
+            count=Count('id'), total=Sum('total_amount')
+        ).order_by()
+    }
+    withdrawn_totals = dict(
+        StaffWithdrawal.objects.values('staff').annotate(total=Sum('withdrawal_amount')).order_by().values_list('staff', 'total')
     )
-    
-    # Title
-    story.append(Paragraph("TopStyle Business - Staff Detailed Report", title_style))
-    story.append(Paragraph(f"Generated on: {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Get all staff members
-    staff_members = User.objects.filter(is_staff=True, is_active=True).select_related('staff_profile').order_by('first_name', 'username')
-    
+
+    def totals(staff):
+        count, revenue = order_totals.get(staff.pk, (0, Decimal('0')))
+        withdrawn = withdrawn_totals.get(staff.pk) or Decimal('0')
+        salary = revenue * Decimal('0.4')
+        return {
+            'count': count,
+            'revenue': revenue,
+            'salary': salary,
+            'owner_share': revenue * Decimal('0.6'),
+            'withdrawn': withdrawn,
+            'available': salary - withdrawn,
+        }
+
+    def phone(staff):
+        return staff.staff_profile.phone if hasattr(staff, 'staff_profile') and staff.staff_profile.phone else 'N/A'
+
+    def money(value):
+        return f'₱{float(value):,.2f}'
+
+    summary_rows = []
     for staff in staff_members:
-        # Staff Information Section
-        story.append(Paragraph(f"<b>Staff: {staff.get_full_name() or staff.username}</b>", heading_style))
-        
-        # Staff Details Table
-        staff_data = [
-            ['Username:', staff.username],
-            ['Email:', staff.email or 'N/A'],
-            ['Phone:', staff.staff_profile.phone if hasattr(staff, 'staff_profile') and staff.staff_profile.phone else 'N/A'],
-            ['Status:', 'Active' if staff.is_active else 'Inactive'],
-        ]
-        staff_table = Table(staff_data, colWidths=[2*inch, 4*inch])
-        staff_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8f9fa')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ]))
-        story.append(staff_table)
-        story.append(Spacer(1, 15))
-        
-        # Get completed orders
-        completed_orders = Order.objects.filter(
-            assigned_staff=staff,
-            status='completed',
-            order_type__in=['repair', 'customize']
-        ).select_related('customer').order_by('-created_at')
-        
-        # Calculate totals
-        from django.db.models import Sum
-        from decimal import Decimal
-        total_revenue = completed_orders.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-        staff_salary = total_revenue * Decimal('0.4')
-        owner_share = total_revenue * Decimal('0.6')
-        
-        # Get withdrawals
-        from .models import StaffWithdrawal
-        withdrawals = StaffWithdrawal.objects.filter(staff=staff).order_by('-created_at')
-        total_withdrawn = withdrawals.aggregate(total=Sum('withdrawal_amount'))['total'] or Decimal('0')
-        available_salary = staff_salary - total_withdrawn
-        
-        # Summary Table
-        summary_data = [
-            ['Total Completed Orders:', str(completed_orders.count())],
-            ['Total Revenue:', f'₱{float(total_revenue):,.2f}'],
-            ['Staff Share (40%):', f'₱{float(staff_salary):,.2f}'],
-            ['Owner Share (60%):', f'₱{float(owner_share):,.2f}'],
-            ['Total Withdrawn:', f'₱{float(total_withdrawn):,.2f}'],
-            ['Available Salary:', f'₱{float(available_salary):,.2f}'],
+        staff_totals = totals(staff)
+        summary_rows.append([
+            staff.get_full_name() or staff.username,
+            staff.username,
+            staff.email or 'N/A',
+            staff_totals['count'],
+            float(staff_totals['revenue']),
+            float(staff_totals['salary']),
+            float(staff_totals['withdrawn']),
+            float(staff_totals['available']),
+        ])
+    yield ("Summary", [export_section(
+        headers=['Staff Name', 'Username', 'Email', 'Total Orders', 'Total Revenue', 'Staff Salary', 'Withdrawn', 'Available'],
+        rows=summary_rows,
+        widths=[18] * 8,
+    )])
+
+    for staff in staff_members:
+        staff_totals = totals(staff)
+        sections = [
+            export_section(title=f'Staff: {staff.get_full_name() or staff.username}', info=[
+                ['Username:', staff.username],
+                ['Email:', staff.email or 'N/A'],
+                ['Phone:', phone(staff)],
+                ['Status:', 'Active' if staff.is_active else 'Inactive'],
+            ], widths=[20, 20, 15, 15, 15, 15, 15, 15]),
+            export_section(title='SUMMARY', info=[
+                ['Total Completed Orders:', str(staff_totals['count'])],
+                ['Total Revenue:', money(staff_totals['revenue'])],
+                ['Staff Share (40%):', money(staff_totals['salary'])],
+                ['Owner Share (60%):', money(staff_totals['owner_share'])],
+                ['Total Withdrawn:', money(staff_totals['withdrawn'])],
+                ['Available Salary:', money(staff_totals['available'])],
+            ]),
         ]
-        summary_table = Table(summary_data, colWidths=[2.5*inch, 3.5*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e9ecef')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-        ]))
-        story.append(Paragraph("<b>Summary</b>", styles['Heading3']))
-        story.append(summary_table)
-        story.append(Spacer(1, 15))
-        
-        # Completed Orders Table
-        if completed_orders.exists():
-            story.append(Paragraph("<b>Completed Orders</b>", styles['Heading3']))
-            orders_data = [['Order ID', 'Customer', 'Order Type', 'Amount', 'Created', 'Completed']]
-            
-            for order in completed_orders:
-                orders_data.append([
+
+        if staff_totals['count']:
+            orders = completed.filter(assigned_staff=staff).select_related('customer').order_by('-created_at')
+            sections.append(export_section(
+                title='COMPLETED ORDERS',
+                headers=['Order ID', 'Customer', 'Order Type', 'Amount', 'Created Date', 'Created Time', 'Completed Date', 'Completed Time'],
+                rows=export_rows(orders, lambda order: [
                     order.order_identifier,
                     order.customer.name if order.customer else 'N/A',
                     order.get_order_type_display(),
-                    f'₱{float(order.total_amount):,.2f}',
-                    order.created_at.strftime('%Y-%m-%d %H:%M') if order.created_at else 'N/A',
-                    order.updated_at.strftime('%Y-%m-%d %H:%M') if order.updated_at else 'N/A',
-                ])
-            
-            orders_table = Table(orders_data, colWidths=[1.2*inch, 1.5*inch, 0.8*inch, 1*inch, 1.2*inch, 1.2*inch])
-            orders_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-            ]))
-            story.append(orders_table)
-            story.append(Spacer(1, 15))
-        
-        # Withdrawals Table
-        if withdrawals.exists():
-            story.append(Paragraph("<b>Salary Withdrawals</b>", styles['Heading3']))
-            withdrawals_data = [['Date & Time', 'Amount', 'Total Revenue', 'Owner Share', 'Orders Count', 'Notes']]
-            
-            for withdrawal in withdrawals:
-                withdrawals_data.append([
-                    withdrawal.created_at.strftime('%Y-%m-%d %H:%M') if withdrawal.created_at else 'N/A',
-                    f'₱{float(withdrawal.withdrawal_amount):,.2f}',
-                    f'₱{float(withdrawal.total_revenue):,.2f}',
-                    f'₱{float(withdrawal.owner_share):,.2f}',
-                    str(withdrawal.completed_orders_count),
+                    float(order.total_amount),
+                    order.created_at.strftime('%Y-%m-%d') if order.created_at else 'N/A',
+                    order.created_at.strftime('%H:%M:%S') if order.created_at else 'N/A',
+                    order.updated_at.strftime('%Y-%m-%d') if order.updated_at else 'N/A',
+                    order.updated_at.strftime('%H:%M:%S') if order.updated_at else 'N/A',
+                ]),
+                widths=[12, 14, 9, 9, 10, 8, 10, 8],
+            ))
+
+        if staff.pk in withdrawn_totals:
+            withdrawals = StaffWithdrawal.objects.filter(staff=staff).order_by('-created_at')
+            sections.append(export_section(
+                title='SALARY WITHDRAWALS',
+                headers=['Date', 'Time', 'Amount', 'Total Revenue', 'Owner Share', 'Orders Count', 'Notes'],
+                rows=export_rows(withdrawals, lambda withdrawal: [
+                    withdrawal.created_at.strftime('%Y-%m-%d') if withdrawal.created_at else 'N/A',
+                    withdrawal.created_at.strftime('%H:%M:%S') if withdrawal.created_at else 'N/A',
+                    float(withdrawal.withdrawal_amount),
+                    float(withdrawal.total_revenue),
+                    float(withdrawal.owner_share),
+                    withdrawal.completed_orders_count,
                     withdrawal.notes or 'N/A',
-                ])
-            
-            withdrawals_table = Table(withdrawals_data, colWidths=[1.2*inch, 1*inch, 1*inch, 1*inch, 0.8*inch, 1.5*inch])
-            withdrawals_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-            ]))
-            story.append(withdrawals_table)
-            story.append(Spacer(1, 15))
+                ]),
+                widths=[10, 8, 10, 10, 10, 8, 20],
+            ))
         else:
-            story.append(Paragraph("<b>Salary Withdrawals:</b> No withdrawals recorded", styles['Normal']))
-            story.append(Spacer(1, 10))
-        
-        # Non-withdrawn Salary
-        if available_salary > 0:
-            story.append(Paragraph(f"<b>Available (Non-Withdrawn) Salary:</b> ₱{float(available_salary):,.2f}", styles['Normal']))
-            story.append(Spacer(1, 10))
-        
-        story.append(PageBreak())
-    
-    doc.build(story)
-    return response
+            sections.append(export_section(info=[['Salary Withdrawals:', 'No withdrawals recorded']]))
+
+        yield (staff.username, sections)
+
+
+def _staff_report_export(export_format):
+    from .export_manager import ExportManager
+
+    return ExportManager.response(
+        export_format,
+        'staff_detailed_report',
+        'TopStyle Business - Staff Detailed Report',
+        _staff_report_sheets(),
+    )
+
+
+@login_required
+def staff_report_pdf(request):
+    """Generate comprehensive PDF report of all staff with detailed information"""
+    return _staff_report_export('pdf')
 
 
 @login_required
 def staff_report_excel(request):
     """Generate comprehensive Excel report of all staff with detailed information"""
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="staff_detailed_report.xlsx"'
-    
-    wb = Workbook()
-    
-    # Styles
-    header_fill = PatternFill(start_color='2c3e50', end_color='2c3e50', fill_type='solid')
-    header_font = Font(bold=True, color='FFFFFF', size=11)
-    title_fill = PatternFill(start_color='1e3a8a', end_color='1e3a8a', fill_type='solid')
-    title_font = Font(bold=True, color='FFFFFF', size=14)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    center_align = Alignment(horizontal='center', vertical='center')
-    left_align = Alignment(horizontal='left', vertical='center')
-    
-    # Get all staff members
-    staff_members = User.objects.filter(is_staff=True, is_active=True).select_related('staff_profile').order_by('first_name', 'username')
-    
-    # Create summary sheet
-    summary_ws = wb.active
-    summary_ws.title = "Summary"
-    
-    # Summary header
-    summary_ws['A1'] = 'TopStyle Business - Staff Detailed Report'
-    summary_ws['A1'].font = title_font
-    summary_ws['A1'].fill = title_fill
-    summary_ws['A1'].alignment = center_align
-    summary_ws.merge_cells('A1:H1')
-    summary_ws['A2'] = f'Generated on: {timezone.now().strftime("%B %d, %Y at %I:%M %p")}'
-    summary_ws.merge_cells('A2:H2')
-    summary_ws['A2'].alignment = center_align
-    
-    # Summary headers
-    summary_headers = ['Staff Name', 'Username', 'Email', 'Total Orders', 'Total Revenue', 'Staff Salary', 'Withdrawn', 'Available']
-    for col, header in enumerate(summary_headers, 1):
-        cell = summary_ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = center_align
-    
-    # Summary data
-    from django.db.models import Sum
-    from decimal import Decimal
-    from .models import StaffWithdrawal
-    
-    row = 5
-    for staff in staff_members:
-        completed_orders = Order.objects.filter(
-            assigned_staff=staff,
-            status='completed',
-            order_type__in=['repair', 'customize']
-        )
-        total_revenue = completed_orders.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-        staff_salary = total_revenue * Decimal('0.4')
-        total_withdrawn = StaffWithdrawal.objects.filter(staff=staff).aggregate(
-            total=Sum('withdrawal_amount')
-        )['total'] or Decimal('0')
-        available_salary = staff_salary - total_withdrawn
-        
-        summary_ws.cell(row=row, column=1, value=staff.get_full_name() or staff.username).border = border
-        summary_ws.cell(row=row, column=2, value=staff.username).border = border
-        summary_ws.cell(row=row, column=3, value=staff.email or 'N/A').border = border
-        summary_ws.cell(row=row, column=4, value=completed_orders.count()).border = border
-        summary_ws.cell(row=row, column=5, value=float(total_revenue)).border = border
-        summary_ws.cell(row=row, column=6, value=float(staff_salary)).border = border
-        summary_ws.cell(row=row, column=7, value=float(total_withdrawn)).border = border
-        summary_ws.cell(row=row, column=8, value=float(available_salary)).border = border
-        row += 1
-    
-    # Adjust column widths
-    for col in range(1, 9):
-        summary_ws.column_dimensions[get_column_letter(col)].width = 18
-    
-    # Create detailed sheet for each staff
-    for staff in staff_members:
-        ws = wb.create_sheet(title=staff.username[:31])  # Excel sheet name limit
-        
-        # Title
-        ws['A1'] = f'Staff: {staff.get_full_name() or staff.username}'
-        ws['A1'].font = title_font
-        ws['A1'].fill = title_fill
-        ws.merge_cells('A1:F1')
-        ws['A1'].alignment = center_align
-        
-        ws['A2'] = f'Generated on: {timezone.now().strftime("%B %d, %Y at %I:%M %p")}'
-        ws.merge_cells('A2:F2')
-        ws['A2'].alignment = center_align
-        
-        # Staff Information
-        row = 4
-        ws.cell(row=row, column=1, value='Username:').font = Font(bold=True)
-        ws.cell(row=row, column=2, value=staff.username)
-        row += 1
-        ws.cell(row=row, column=1, value='Email:').font = Font(bold=True)
-        ws.cell(row=row, column=2, value=staff.email or 'N/A')
-        row += 1
-        ws.cell(row=row, column=1, value='Phone:').font = Font(bold=True)
-        ws.cell(row=row, column=2, value=staff.staff_profile.phone if hasattr(staff, 'staff_profile') and staff.staff_profile.phone else 'N/A')
-        row += 1
-        ws.cell(row=row, column=1, value='Status:').font = Font(bold=True)
-        ws.cell(row=row, column=2, value='Active' if staff.is_active else 'Inactive')
-        row += 2
-        
-        # Get data
-        completed_orders = Order.objects.filter(
-            assigned_staff=staff,
-            status='completed',
-            order_type__in=['repair', 'customize']
-        ).select_related('customer').order_by('-created_at')
-        
-        total_revenue = completed_orders.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-        staff_salary = total_revenue * Decimal('0.4')
-        owner_share = total_revenue * Decimal('0.6')
-        
-        withdrawals = StaffWithdrawal.objects.filter(staff=staff).order_by('-created_at')
-        total_withdrawn = withdrawals.aggregate(total=Sum('withdrawal_amount'))['total'] or Decimal('0')
-        available_salary = staff_salary - total_withdrawn
-        
-        # Summary Section
-        row += 1
-        ws.cell(row=row, column=1, value='SUMMARY').font = Font(bold=True, size=12)
-        row += 1
-        summary_info = [
-            ['Total Completed Orders:', str(completed_orders.count())],
-            ['Total Revenue:', f'₱{float(total_revenue):,.2f}'],
-            ['Staff Share (40%):', f'₱{float(staff_salary):,.2f}'],
-            ['Owner Share (60%):', f'₱{float(owner_share):,.2f}'],
-            ['Total Withdrawn:', f'₱{float(total_withdrawn):,.2f}'],
-            ['Available Salary:', f'₱{float(available_salary):,.2f}'],
-        ]
-        for info_row in summary_info:
-            ws.cell(row=row, column=1, value=info_row[0]).font = Font(bold=True)
-            ws.cell(row=row, column=2, value=info_row[1])
-            row += 1
-        
-        row += 2
-        
-        # Completed Orders
-        if completed_orders.exists():
-            ws.cell(row=row, column=1, value='COMPLETED ORDERS').font = Font(bold=True, size=12)
-            row += 1
-            
-            order_headers = ['Order ID', 'Customer', 'Order Type', 'Amount', 'Created Date', 'Created Time', 'Completed Date', 'Completed Time']
-            for col, header in enumerate(order_headers, 1):
-                cell = ws.cell(row=row, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = border
-                cell.alignment = center_align
-            row += 1
-            
-            for order in completed_orders:
-                ws.cell(row=row, column=1, value=order.order_identifier).border = border
-                ws.cell(row=row, column=2, value=order.customer.name if order.customer else 'N/A').border = border
-                ws.cell(row=row, column=3, value=order.get_order_type_display()).border = border
-                ws.cell(row=row, column=4, value=float(order.total_amount)).border = border
-                if order.created_at:
-                    ws.cell(row=row, column=5, value=order.created_at.strftime('%Y-%m-%d')).border = border
-                    ws.cell(row=row, column=6, value=order.created_at.strftime('%H:%M:%S')).border = border
-                else:
-                    ws.cell(row=row, column=5, value='N/A').border = border
-                    ws.cell(row=row, column=6, value='N/A').border = border
-                if order.updated_at:
-                    ws.cell(row=row, column=7, value=order.updated_at.strftime('%Y-%m-%d')).border = border
-                    ws.cell(row=row, column=8, value=order.updated_at.strftime('%H:%M:%S')).border = border
-                else:
-                    ws.cell(row=row, column=7, value='N/A').border = border
-                    ws.cell(row=row, column=8, value='N/A').border = border
-                row += 1
-            
-            row += 1
-        
-        # Withdrawals
-        if withdrawals.exists():
-            ws.cell(row=row, column=1, value='SALARY WITHDRAWALS').font = Font(bold=True, size=12)
-            row += 1
-            
-            withdrawal_headers = ['Date', 'Time', 'Amount', 'Total Revenue', 'Owner Share', 'Orders Count', 'Notes']
-            for col, header in enumerate(withdrawal_headers, 1):
-                cell = ws.cell(row=row, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.border = border
-                cell.alignment = center_align
-            row += 1
-            
-            for withdrawal in withdrawals:
-                if withdrawal.created_at:
-                    ws.cell(row=row, column=1, value=withdrawal.created_at.strftime('%Y-%m-%d')).border = border
-                    ws.cell(row=row, column=2, value=withdrawal.created_at.strftime('%H:%M:%S')).border = border
-                else:
-                    ws.cell(row=row, column=1, value='N/A').border = border
-                    ws.cell(row=row, column=2, value='N/A').border = border
-                ws.cell(row=row, column=3, value=float(withdrawal.withdrawal_amount)).border = border
-                ws.cell(row=row, column=4, value=float(withdrawal.total_revenue)).border = border
-                ws.cell(row=row, column=5, value=float(withdrawal.owner_share)).border = border
-                ws.cell(row=row, column=6, value=withdrawal.completed_orders_count).border = border
-                ws.cell(row=row, column=7, value=withdrawal.notes or 'N/A').border = border
-                row += 1
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 20
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 15
-        ws.column_dimensions['G'].width = 15
-        ws.column_dimensions['H'].width = 15
-    
-    wb.save(response)
-    return response
+    return _staff_report_export('xlsx')
+
+
+@login_required
+def staff_report_csv(request):
+    """Generate comprehensive CSV report of all staff with detailed information"""
+    return _staff_report_export('csv')
 
 
 @login_required
@@ -18,6 +18,7 @@ class AutoSaveService {
         this.syncInterval = 30000; // Sync every 30 seconds
         this.debounceDelay = 2000; // Save 2 seconds after last change
         this.pendingSaves = new Map();
+        this.pendingDeletes = new Set(); // Cleared keys whose server drafts go on the next sync
         this.saveTimers = new Map();
         this.isInitialized = false;
         
@@ -153,6 +154,7 @@ class AutoSaveService {
             
             // Mark for backend sync
             this.pendingSaves.set(key, data);
+            this.pendingDeletes.delete(key);
             
             console.log(`[AUTO-SAVE] Saved form data: ${formId}`);
             
@@ -343,6 +345,7 @@ class AutoSaveService {
             
             localStorage.setItem(stateKey, JSON.stringify(state));
             this.pendingSaves.set(stateKey, value);
+            this.pendingDeletes.delete(stateKey);
             
             console.log(`[AUTO-SAVE] Saved state: ${key}`);
             
@@ -384,6 +387,8 @@ class AutoSaveService {
             localStorage.removeItem(stateKey);
             this.pendingSaves.delete(formKey);
             this.pendingSaves.delete(stateKey);
+            this.pendingDeletes.add(formKey);
+            this.pendingDeletes.add(stateKey);
             
             console.log(`[AUTO-SAVE] Cleared: ${key}`);
             
@@ -439,17 +444,18 @@ class AutoSaveService {
      * Sync saved data with backend
      */
     async syncWithBackend() {
-        if (this.pendingSaves.size === 0) return;
+        if (this.pendingSaves.size === 0 && this.pendingDeletes.size === 0) return;
         
         try {
             // Get CSRF token
             const csrfToken = this.getCSRFToken();
             
-            // Prepare sync data
+            // Prepare sync data: every changed draft and cleared key in one request
             const syncData = {};
             this.pendingSaves.forEach((value, key) => {
                 syncData[key] = value;
             });
+            const deleted = [...this.pendingDeletes];
             
             // Send to backend
             const response = await fetch('/api/autosave/sync/', {
@@ -460,13 +466,17 @@ class AutoSaveService {
                 },
                 body: JSON.stringify({
                     data: syncData,
+                    deleted: deleted,
                     timestamp: new Date().toISOString()
                 })
             });
             
             if (response.ok) {
-                // Clear pending saves on successful sync
-                this.pendingSaves.clear();
+                // Clear what was sent, keeping changes made while the request ran
+                Object.entries(syncData).forEach(([key, value]) => {
+                    if (this.pendingSaves.get(key) === value) this.pendingSaves.delete(key);
+                });
+                deleted.forEach(key => this.pendingDeletes.delete(key));
                 console.log('[AUTO-SAVE] Synced with backend');
             } else {
                 console.warn('[AUTO-SAVE] Backend sync failed:', response.status);
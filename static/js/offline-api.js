@@ -40,6 +40,8 @@ class OfflineAPI {
             '/login/',
             '/logout/',
             '/api/autosave/',
+            '/api/sync/batch/',     // the sync itself; never queue it
+            '/api/changes/',        // change feed pages are never reused; do not cache them
             '/api/send-sms/',       // ensure CSRF/cookies preserved for SMS
         ];
         
@@ -4,6 +4,13 @@
 const DB_NAME = 'TopStyleOfflineDB';
 const DB_VERSION = 1;
 
+// Change feed models and the stores they are cached in
+const CHANGE_FEED_STORES = {
+    product: 'products',
+    customer: 'customers',
+    order: 'orders',
+};
+
 class OfflineDB {
     constructor() {
         this.db = null;
@@ -202,6 +209,116 @@ class OfflineDB {
         return customers.filter(customer => customer.sync_status === 'pending');
     }
 
+    // Bring the cached customers up to date with the server. Only customers
+    // changed since the last refresh are fetched, a page at a time; when
+    // nothing changed the server answers the first request with a 304.
+    async refreshCustomers() {
+        const stateKey = 'sync:customers';
+        const state = (await this.get('api_cache', stateKey)) || { url: stateKey };
+        let cursor = null;
+        let latest = state.updated_since || null;
+        let etag = null;
+        let fetched = 0;
+
+        do {
+            const params = new URLSearchParams({ limit: '1000' });
+            if (state.updated_since) params.set('updated_since', state.updated_since);
+            if (cursor) params.set('cursor', cursor);
+            const headers = {};
+            if (!cursor && state.etag) headers['If-None-Match'] = state.etag;
+
+            const response = await fetch(`/api/customers/?${params}`, { credentials: 'same-origin', headers: headers });
+            if (response.status === 304) {
+                console.log('[OfflineDB] Customers already up to date');
+                return 0;
+            }
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            if (!cursor) etag = response.headers.get('ETag');
+
+            const page = await response.json();
+            for (const customer of page.customers || []) {
+                await this.saveCustomer({ ...customer, sync_status: 'synced' });
+                if (!latest || customer.updated_at > latest) latest = customer.updated_at;
+                fetched++;
+            }
+            cursor = page.next_cursor;
+        } while (cursor);
+
+        // The next refresh asks for changes since the newest one seen here
+        await this.save('api_cache', { ...state, updated_since: latest, etag: latest === state.updated_since ? etag : null });
+        console.log(`[OfflineDB] Refreshed ${fetched} customers`);
+        return fetched;
+    }
+
+    // Bring the cached products, customers and orders up to date from the
+    // server's change feed: each page lists the rows changed since the
+    // stored cursor, with their data, and the ones deleted. Without a
+    // cursor, or with one older than the history the server keeps, the
+    // lists are loaded again first.
+    async pullChanges() {
+        const stateKey = 'sync:changes';
+        const state = (await this.get('api_cache', stateKey)) || { url: stateKey };
+        let cursor = state.cursor ?? null;
+        let applied = 0;
+        let more = true;
+
+        while (more) {
+            const params = new URLSearchParams({ limit: '500' });
+            if (cursor !== null) params.set('since', cursor);
+            const response = await fetch(`/api/changes/?${params}`, { credentials: 'same-origin' });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const page = await response.json();
+
+            if (page.reset) {
+                await this.reloadChangedStores();
+            }
+            for (const change of page.changes || []) {
+                await this.applyChange(change);
+                applied++;
+            }
+            cursor = page.cursor;
+            more = page.has_more;
+            // Saved per page, so an interrupted pull resumes where it stopped
+            await this.save('api_cache', { ...state, cursor: cursor });
+        }
+
+        console.log(`[OfflineDB] Applied ${applied} change(s)`);
+        return applied;
+    }
+
+    async applyChange(change) {
+        const storeName = CHANGE_FEED_STORES[change.model];
+        if (!storeName) return;
+        // A record changed here and not uploaded yet is not overwritten
+        const current = await this.get(storeName, change.id);
+        if (current && current.sync_status === 'pending') return;
+
+        if (change.op === 'delete') {
+            if (current) await this.delete(storeName, change.id);
+        } else {
+            await this.save(storeName, { ...change.data, sync_status: 'synced' });
+        }
+    }
+
+    // Drop what came from the server and load the current lists again
+    async reloadChangedStores() {
+        for (const storeName of Object.values(CHANGE_FEED_STORES)) {
+            for (const record of await this.getAll(storeName)) {
+                if (record.sync_status === 'synced') await this.delete(storeName, record.id);
+            }
+        }
+        await this.delete('api_cache', 'sync:customers');
+        await this.refreshCustomers();
+
+        const response = await fetch('/api/products/', { credentials: 'same-origin' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const data = await response.json();
+        for (const product of data.products || []) {
+            await this.saveProduct({ ...product, sync_status: 'synced' });
+        }
+        console.log('[OfflineDB] Reloaded cached lists');
+    }
+
     // Product operations
     async saveProduct(product) {
         return this.save('products', product);
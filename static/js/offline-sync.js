@@ -1,6 +1,10 @@
 // Offline Sync Manager for TopStyle Business Management System
 // Handles syncing of offline operations when connection is restored
 
+// Operations uploaded per request to /api/sync/batch/ (the server accepts
+// up to OFFLINE_SYNC_BATCH_LIMIT)
+const SYNC_BATCH_SIZE = 25;
+
 class OfflineSyncManager {
     constructor() {
         this.syncInProgress = false;
@@ -69,21 +73,21 @@ class OfflineSyncManager {
         console.log('[OfflineSync] Starting sync...');
 
         try {
-            // Sync queued forms first
-            await this.syncQueuedForms();
-            
-            // Sync offline orders
-            await this.syncOfflineOrders();
-            
-            // Sync offline customers
-            await this.syncOfflineCustomers();
-            
-            // Sync offline products
-            await this.syncOfflineProducts();
+            // Queued forms, orders, customers and products, in batches
+            const failed = await this.syncQueue();
+
+            // Pull product, customer and order changes made on other devices
+            if (window.offlineDB) {
+                await window.offlineDB.pullChanges();
+            }
             
             console.log('[OfflineSync] Sync completed successfully');
             this.retryCount = 0;
-            this.showNotification('All offline data has been synced successfully!', 'success');
+            if (failed) {
+                this.showNotification(`${failed} offline change(s) could not be synced.`, 'warning');
+            } else {
+                this.showNotification('All offline data has been synced successfully!', 'success');
+            }
         } catch (error) {
             console.error('[OfflineSync] Sync error:', error);
             this.retryCount++;
@@ -99,133 +103,128 @@ class OfflineSyncManager {
         }
     }
 
-    async syncQueuedForms() {
-        if (!window.offlineDB) {
-            console.warn('[OfflineSync] offlineDB not available');
-            return;
-        }
+    // Everything waiting in IndexedDB as batch operations, oldest kind first.
+    // Each record keeps the key it was first sent with, so a batch whose
+    // response was lost is answered from the server's receipts when resent.
+    async collectOperations() {
+        const db = window.offlineDB;
+        const entries = [];
 
-        const queuedForms = await window.offlineDB.getQueuedForms();
-        console.log(`[OfflineSync] Syncing ${queuedForms.length} queued forms`);
-
-        for (const form of queuedForms) {
-            try {
-                const response = await fetch(form.url, {
-                    method: form.method || 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.getCSRFToken(),
-                    },
-                    body: JSON.stringify(form.data),
-                });
+        for (const form of await db.getQueuedForms()) {
+            entries.push({ store: 'form_queue', record: form, type: 'request', key: await this.ensureKey('form_queue', form), data: this.requestData(form) });
+        }
+        for (const order of await db.getPendingOrders()) {
+            // Orders carry the key the order page gave them
+            entries.push({ store: 'orders', record: order, type: 'order', key: await this.ensureKey('orders', order, 'idempotencyKey'), data: order });
+        }
+        for (const customer of await db.getPendingCustomers()) {
+            entries.push({ store: 'customers', record: customer, type: 'customer', key: await this.ensureKey('customers', customer), data: customer });
+        }
+        const products = (await db.getAll('products')).filter(p => p.sync_status === 'pending');
+        for (const product of products) {
+            entries.push({ store: 'products', record: product, type: 'product', key: await this.ensureKey('products', product), data: product });
+        }
+        return entries;
+    }
 
-                if (response.ok) {
-                    await window.offlineDB.markFormSynced(form.id);
-                    console.log(`[OfflineSync] Form synced: ${form.url}`);
-                } else {
-                    throw new Error(`HTTP ${response.status}`);
-                }
-            } catch (error) {
-                console.error(`[OfflineSync] Failed to sync form ${form.id}:`, error);
-                // Mark for retry
-                form.retries = (form.retries || 0) + 1;
-                if (form.retries >= this.maxRetries) {
-                    // Move to failed queue or notify user
-                    console.error(`[OfflineSync] Form ${form.id} exceeded max retries`);
-                } else {
-                    await window.offlineDB.save('form_queue', form);
-                }
-            }
+    async ensureKey(storeName, record, field = 'sync_key') {
+        if (!record[field]) {
+            record[field] = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+            await window.offlineDB.save(storeName, record);
         }
+        return record[field];
     }
 
-    async syncOfflineOrders() {
-        if (!window.offlineDB) return;
-
-        const pendingOrders = await window.offlineDB.getPendingOrders();
-        console.log(`[OfflineSync] Syncing ${pendingOrders.length} offline orders`);
-
-        for (const order of pendingOrders) {
-            try {
-                const response = await fetch('/api/orders/create/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.getCSRFToken(),
-                    },
-                    body: JSON.stringify(order),
-                });
+    // A queued request as the server replays it: the page's form fields, or
+    // the body the API interceptor captured with its content type
+    requestData(form) {
+        const data = form.data || {};
+        const captured = typeof data === 'object' && 'url' in data && 'method' in data;
+        const body = captured ? data.body : data;
+        const headers = (captured && data.headers) || {};
+        const contentType = headers['Content-Type'] || headers['content-type'] || '';
+        return {
+            url: form.url,
+            method: form.method || 'POST',
+            body: body === undefined ? null : body,
+            content_type: contentType || (body && typeof body === 'object' ? 'application/x-www-form-urlencoded' : 'application/json'),
+        };
+    }
 
-                if (response.ok) {
-                    const result = await response.json();
-                    await window.offlineDB.updateSyncStatus('orders', order.id, 'synced');
-                    console.log(`[OfflineSync] Order synced: ${order.order_identifier}`);
-                } else {
-                    throw new Error(`HTTP ${response.status}`);
-                }
-            } catch (error) {
-                console.error(`[OfflineSync] Failed to sync order ${order.id}:`, error);
-            }
+    // Upload the queue SYNC_BATCH_SIZE operations per request; returns how
+    // many operations the server refused. A batch that does not reach the
+    // server throws, and the whole sync is retried.
+    async syncQueue() {
+        if (!window.offlineDB) {
+            console.warn('[OfflineSync] offlineDB not available');
+            return 0;
         }
-    }
 
-    async syncOfflineCustomers() {
-        if (!window.offlineDB) return;
-
-        const pendingCustomers = await window.offlineDB.getPendingCustomers();
-        console.log(`[OfflineSync] Syncing ${pendingCustomers.length} offline customers`);
-
-        for (const customer of pendingCustomers) {
-            try {
-                const response = await fetch('/api/customers/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.getCSRFToken(),
-                    },
-                    body: JSON.stringify(customer),
-                });
+        const entries = await this.collectOperations();
+        console.log(`[OfflineSync] Syncing ${entries.length} offline operation(s)`);
+        let failed = 0;
+
+        for (let start = 0; start < entries.length; start += SYNC_BATCH_SIZE) {
+            const batch = entries.slice(start, start + SYNC_BATCH_SIZE);
+            const response = await fetch('/api/sync/batch/', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': this.getCSRFToken(),
+                },
+                body: JSON.stringify({
+                    operations: batch.map((entry, index) => ({
+                        id: start + index,
+                        type: entry.type,
+                        key: entry.key,
+                        data: entry.data,
+                    })),
+                }),
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
 
-                if (response.ok) {
-                    await window.offlineDB.updateSyncStatus('customers', customer.id, 'synced');
-                    console.log(`[OfflineSync] Customer synced: ${customer.name}`);
+            const result = await response.json();
+            for (const outcome of result.results || []) {
+                const entry = entries[outcome.id];
+                if (!entry) continue;
+                if (outcome.status === 'failed') {
+                    failed++;
+                    await this.recordFailure(entry, outcome.error);
                 } else {
-                    throw new Error(`HTTP ${response.status}`);
+                    await this.markSynced(entry, outcome);
                 }
-            } catch (error) {
-                console.error(`[OfflineSync] Failed to sync customer ${customer.id}:`, error);
             }
+            console.log(`[OfflineSync] Batch synced: ${result.applied} applied, ${result.failed} failed`);
         }
+        return failed;
     }
 
-    async syncOfflineProducts() {
-        if (!window.offlineDB) return;
-
-        const pendingProducts = await window.offlineDB.getAll('products');
-        const filtered = pendingProducts.filter(p => p.sync_status === 'pending');
-        console.log(`[OfflineSync] Syncing ${filtered.length} offline products`);
-
-        for (const product of filtered) {
-            try {
-                const response = await fetch('/api/products/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': this.getCSRFToken(),
-                    },
-                    body: JSON.stringify(product),
-                });
+    async markSynced(entry, outcome) {
+        if (entry.store === 'form_queue') {
+            await window.offlineDB.markFormSynced(entry.record.id);
+            return;
+        }
+        if (entry.store === 'orders' && outcome.order_identifier) {
+            entry.record.order_identifier = outcome.order_identifier;
+        }
+        entry.record.sync_status = 'synced';
+        await window.offlineDB.save(entry.store, entry.record);
+    }
 
-                if (response.ok) {
-                    await window.offlineDB.updateSyncStatus('products', product.id, 'synced');
-                    console.log(`[OfflineSync] Product synced: ${product.name}`);
-                } else {
-                    throw new Error(`HTTP ${response.status}`);
-                }
-            } catch (error) {
-                console.error(`[OfflineSync] Failed to sync product ${product.id}:`, error);
-            }
+    async recordFailure(entry, error) {
+        console.error(`[OfflineSync] Failed to sync ${entry.type} ${entry.record.id}:`, error);
+        // Retried with the next sync, and left aside after maxRetries
+        entry.record.retries = (entry.record.retries || 0) + 1;
+        entry.record.sync_error = error;
+        if (entry.record.retries >= this.maxRetries) {
+            console.error(`[OfflineSync] ${entry.type} ${entry.record.id} exceeded max retries`);
+            entry.record.sync_status = 'failed';
         }
+        await window.offlineDB.save(entry.store, entry.record);
     }
 
     registerBackgroundSync() {
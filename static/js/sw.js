@@ -1,11 +1,11 @@
 // Enhanced Service Worker for TopStyle Business Management System
 // Version: 4.0 - Full Offline Support
 
-const CACHE_VERSION = 'topstyle-offline-v4';
-const STATIC_CACHE = 'topstyle-static-v4';
-const DYNAMIC_CACHE = 'topstyle-dynamic-v4';
-const API_CACHE = 'topstyle-api-v4';
-const IMAGES_CACHE = 'topstyle-images-v4';
+const CACHE_VERSION = 'topstyle-offline-v7';
+const STATIC_CACHE = 'topstyle-static-v7';
+const DYNAMIC_CACHE = 'topstyle-dynamic-v7';
+const API_CACHE = 'topstyle-api-v7';
+const IMAGES_CACHE = 'topstyle-images-v7';
 
 // Static assets to cache on install
 const STATIC_ASSETS = [
@@ -115,9 +115,13 @@ self.addEventListener('fetch', function(event) {
         return;
     }
 
-    // Skip admin and authentication endpoints (but allow logout for offline)
+    // Skip admin and authentication endpoints (but allow logout for offline),
+    // the offline sync batches, which must not be queued themselves, and the
+    // change feed, whose every response is new
     if (url.pathname.startsWith('/admin/') || 
-        url.pathname.includes('/api/auth/')) {
+        url.pathname.includes('/api/auth/') ||
+        url.pathname.startsWith('/api/sync/') ||
+        url.pathname.startsWith('/api/changes/')) {
         return;
     }
 
@@ -70,6 +70,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'business.middleware.query_instrumentation_middleware.QueryInstrumentationMiddleware',  # Per-request SQL stats (outermost app layer)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,6 +78,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'business.middleware.persistence_middleware.PersistenceMiddleware',  # Auto-save persistence middleware
+    'business.middleware.activity_log_middleware.ActivityLogMiddleware',  # Batch activity log writes per request
 ]
 
 ROOT_URLCONF = 'topstyle_business.urls'
@@ -108,6 +110,53 @@ DATABASES = {
         config('DATABASE_URL', default=f'sqlite:///{BASE_DIR}/db.sqlite3')
     )
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Concurrent writers queue instead of failing: they wait up to
+    # SQLITE_BUSY_TIMEOUT seconds for the lock, WAL keeps readers out of
+    # their way, and transactions take the write lock when they begin (a
+    # read lock upgraded later fails at once with "database is locked").
+    # Tests run against a file so threads share one database; the in-memory
+    # test database refuses concurrent writers outright.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+        'init_command': 'PRAGMA journal_mode=WAL;',
+        'transaction_mode': 'IMMEDIATE',
+    })
+    DATABASES['default']['TEST'] = {'NAME': str(BASE_DIR / 'test_db.sqlite3')}
+
+# Cache: per-process memory by default. With several worker processes use a
+# shared backend (e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://127.0.0.1:6379/1) so invalidations reach every worker
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='topstyle-business'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+    }
+}
+
+# Material picker APIs: seconds a cached catalog response may be served
+# (changes to products, material types and pricing invalidate it sooner)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+
+# Reference data snapshot (settings, landing images, categories, material
+# types): rebuilt on any save, and at least this often in seconds so other
+# processes on a per-process cache catch up
+REFERENCE_DATA_TTL = config('REFERENCE_DATA_TTL', default=300, cast=int)
+
+# Public order tracking: lookups allowed per client IP per window (seconds),
+# and how long each client's answers are remembered
+TRACKING_RATE_LIMIT = config('TRACKING_RATE_LIMIT', default=20, cast=int)
+TRACKING_RATE_WINDOW = config('TRACKING_RATE_WINDOW', default=60, cast=int)
+TRACKING_RESULT_CACHE_TIMEOUT = config('TRACKING_RESULT_CACHE_TIMEOUT', default=60, cast=int)
+
+# request.META key holding the client address; behind a proxy or on Vercel
+# use HTTP_X_FORWARDED_FOR so clients are not all counted as the proxy.
+# Only the addresses the trusted proxies appended count: the client's one is
+# TRACKING_TRUSTED_PROXIES entries from the right of the list (1 for a
+# single proxy), since anything further left is whatever the client sent
+TRACKING_CLIENT_IP_HEADER = config('TRACKING_CLIENT_IP_HEADER', default='REMOTE_ADDR')
+TRACKING_TRUSTED_PROXIES = config('TRACKING_TRUSTED_PROXIES', default=1, cast=int)
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -158,10 +207,60 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 SMS_API_KEY = config('SMS_API_KEY', default='')
 SMS_SENDER_ID = config('SMS_SENDER_ID', default='TopStyle')
 
+# Rental state engine: seconds between in-process ticks (0 = run the
+# update_rental_statuses command from cron instead)
+RENTAL_STATE_INTERVAL = config('RENTAL_STATE_INTERVAL', default=0, cast=int)
+
+# Activity log: write entries recorded outside a request from a background
+# thread (bounded queue) instead of inline
+ACTIVITY_LOG_ASYNC = config('ACTIVITY_LOG_ASYNC', default=False, cast=bool)
+ACTIVITY_LOG_QUEUE_SIZE = config('ACTIVITY_LOG_QUEUE_SIZE', default=1000, cast=int)
+
+# Query instrumentation: per-request query counts in a Server-Timing header
+# (sent to staff only unless DEBUG) and the staff-only api/query-stats/
+# endpoint; requests running more than QUERY_LOG_THRESHOLD queries are logged
+QUERY_INSTRUMENTATION = config('QUERY_INSTRUMENTATION', default=True, cast=bool)
+QUERY_LOG_THRESHOLD = config('QUERY_LOG_THRESHOLD', default=100, cast=int)
+
+# SMS gateway (SMS Gateway for Android: POST /message with basic auth);
+# the password comes from the environment only - without it the outbox keeps
+# messages queued instead of sending
+SMS_GATEWAY_URL = config('SMS_GATEWAY_URL', default='http://10.27.63.146:8080/message')
+SMS_GATEWAY_USERNAME = config('SMS_GATEWAY_USERNAME', default='sms')
+SMS_GATEWAY_PASSWORD = config('SMS_GATEWAY_PASSWORD', default='')
+SMS_GATEWAY_TIMEOUT = config('SMS_GATEWAY_TIMEOUT', default=10, cast=int)
+
+# SMS outbox: queued messages are sent by a background worker thread
+# (SMS_OUTBOX_WORKER) or the process_sms_outbox command
+SMS_OUTBOX_WORKER = config('SMS_OUTBOX_WORKER', default=True, cast=bool)
+SMS_OUTBOX_CONCURRENCY = config('SMS_OUTBOX_CONCURRENCY', default=4, cast=int)
+SMS_OUTBOX_BATCH_SIZE = config('SMS_OUTBOX_BATCH_SIZE', default=20, cast=int)
+SMS_OUTBOX_MAX_ATTEMPTS = config('SMS_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+SMS_OUTBOX_RETRY_DELAY = config('SMS_OUTBOX_RETRY_DELAY', default=30, cast=int)
+
+# Offline sync: most operations the app may send in one batch to
+# api/sync/batch/ (it sends 25 at a time)
+OFFLINE_SYNC_BATCH_LIMIT = config('OFFLINE_SYNC_BATCH_LIMIT', default=50, cast=int)
+
+# Change feed: days of product/customer/order changes kept for api/changes/
+# (prune_change_feed); offline clients away for longer reload their lists
+CHANGE_FEED_RETENTION_DAYS = config('CHANGE_FEED_RETENTION_DAYS', default=30, cast=int)
+# Seconds a gap in the change feed ids stays open before clients read past
+# it as a rolled-back write (PostgreSQL checks running transactions instead)
+CHANGE_FEED_GAP_TIMEOUT = config('CHANGE_FEED_GAP_TIMEOUT', default=300, cast=int)
+
+# Auto-save drafts: days a form draft is kept after its last change
+# (expired drafts are removed on sync and by prune_form_drafts)
+FORM_DRAFT_TTL_DAYS = config('FORM_DRAFT_TTL_DAYS', default=7, cast=int)
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 
+# Render image thumbnails on first view when they are missing; when off,
+# pages serve the original until generate_image_renditions has run
+IMAGE_RENDITIONS_LAZY = config('IMAGE_RENDITIONS_LAZY', default=True, cast=bool)
+
 # Email Configuration - Gmail SMTP
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'